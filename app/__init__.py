@@ -11,90 +11,34 @@ from app.demurrage_scheduler import daily_demurrage_check
 
 
 def setup_scheduler(app):
-    # Create the scheduler
+    """
+    Setup the validation queue sweeper.
+
+    Validation itself runs in the standalone worker (validation_worker.py);
+    uploads enqueue their own jobs. This only queues pending documents that
+    were created without a job so nothing is left behind.
+    """
     scheduler = BackgroundScheduler()
-    
-    # Function to call the validation endpoint
-    def call_validation_endpoint():
-        """
-        Background scheduler task that validates pending documents and sends emails.
-        
-        Improvements:
-        1. Now handles all validation statuses correctly
-        2. Prevents duplicate emails 
-        3. Better tracking and logging
-        """
+
+    def enqueue_pending_validations():
         with app.app_context():
-            # Import necessary functions
-            from app.models.cha import ShipDocumentEntryAttachment, ShipDocumentEntryMaster
-            from app.customer_portal.routes import process_document_validation, send_document_validation_results_email
-            
+            from app.validation_queue import enqueue_pending_documents
+
             try:
-                # Get all documents that need validation (ai_validated = 0)
-                pending_documents = ShipDocumentEntryAttachment.query.filter_by(ai_validated=0).all()
-                
-                print(f"Found {len(pending_documents)} pending documents for validation")
-                
-                if not pending_documents:
-                    print("No pending documents found")
-                    return
-                
-                validated_count = 0
-                
-                # Track which entries have documents that were validated
-                # We'll use this to determine which entries need email notifications
-                entries_to_notify = set()
-                
-                for document in pending_documents:
-                    print(f"\nProcessing document ID: {document.id}, Description: {document.description}")
-                    
-                    # Process document validation
-                    result = process_document_validation(document)
-                    
-                    # If document was successfully validated with any status, add to notification list
-                    if result.get("success", False):
-                        validated_count += 1
-                        
-                        # Track this entry for notification if we have customer info
-                        if document.shipDocEntryMasterID and document.customer_id:
-                            entries_to_notify.add((document.shipDocEntryMasterID, document.customer_id))
-                
-                # Now handle email notifications - ONE email per entry
-                emails_sent = 0
-                
-                for entry_id, customer_id in entries_to_notify:
-                    # Get entry info
-                    entry = ShipDocumentEntryMaster.query.get(entry_id)
-                    if not entry:
-                        continue
-                    
-                    # Check if all documents in this entry have been validated
-                    total_docs = ShipDocumentEntryAttachment.query.filter_by(
-                        shipDocEntryMasterID=entry_id
-                    ).count()
-                    
-                    validated_docs = ShipDocumentEntryAttachment.query.filter(
-                        ShipDocumentEntryAttachment.shipDocEntryMasterID==entry_id,
-                        ShipDocumentEntryAttachment.ai_validated!=0  # Any non-pending status
-                    ).count()
-                    
-                    # Only send email if all documents have been validated
-                    if validated_docs == total_docs:
-                        # Send email notification with all document results
-                        if send_document_validation_results_email(customer_id, entry_id):
-                            emails_sent += 1
-                
-                print(f"BATCH VALIDATION COMPLETED: {validated_count} of {len(pending_documents)} documents validated")
-                print(f"Email notifications sent for {emails_sent} entries")
-                
+                enqueue_pending_documents()
             except Exception as e:
-                print(f"ERROR in scheduled task: {str(e)}")
+                print(f"ERROR queueing pending documents: {str(e)}")
                 import traceback
                 traceback.print_exc()
 
-
     # Add the job to the scheduler - runs every 5 minutes
-    scheduler.add_job(func=call_validation_endpoint, trigger="interval", minutes=5)
+    scheduler.add_job(
+        func=enqueue_pending_validations,
+        trigger="interval",
+        minutes=5,
+        id="enqueue_pending_validations",
+        max_instances=1
+    )
     
     # Start the scheduler
     scheduler.start()
@@ -123,6 +67,103 @@ def setup_daily_scheduler(app):
         max_instances=1  # Prevent multiple instances running simultaneously
     )
     
+    if app.config.get("DOCUMENT_ALERTS_MATERIALIZED", False):
+        def refresh_document_alerts():
+            with app.app_context():
+                from app.document_alerts import refresh_entry_document_alerts
+
+                try:
+                    refresh_entry_document_alerts()
+                except Exception as e:
+                    print(f"ERROR refreshing document alerts: {str(e)}")
+
+        # Right after the demurrage check (12:15 AM Sri Lanka time)
+        scheduler.add_job(
+            func=refresh_document_alerts,
+            trigger=CronTrigger(hour=18, minute=45, second=0),
+            id='refresh_document_alerts',
+            name='Refresh Document Alerts',
+            replace_existing=True,
+            max_instances=1
+        )
+
+    def sweep_attachments():
+        with app.app_context():
+            from app.attachment_store import sweep_orphaned_attachments
+
+            try:
+                sweep_orphaned_attachments()
+            except Exception as e:
+                print(f"ERROR sweeping orphaned attachments: {str(e)}")
+
+    # 1:30 AM Sri Lanka time
+    scheduler.add_job(
+        func=sweep_attachments,
+        trigger=CronTrigger(hour=20, minute=0, second=0),
+        id='sweep_orphaned_attachments',
+        name='Sweep Orphaned Attachments',
+        replace_existing=True,
+        max_instances=1
+    )
+
+    def prune_validation_results():
+        with app.app_context():
+            from app.validation_result_cache import prune_validation_cache
+
+            try:
+                prune_validation_cache()
+            except Exception as e:
+                print(f"ERROR pruning validation result cache: {str(e)}")
+
+    # 1:35 AM Sri Lanka time
+    scheduler.add_job(
+        func=prune_validation_results,
+        trigger=CronTrigger(hour=20, minute=5, second=0),
+        id='prune_validation_result_cache',
+        name='Prune Validation Result Cache',
+        replace_existing=True,
+        max_instances=1
+    )
+
+    if app.config.get("DASHBOARD_ROLLUPS", False):
+        def refresh_shipment_rollups():
+            with app.app_context():
+                from app.shipment_rollups import rebuild_shipment_rollups
+
+                try:
+                    rebuild_shipment_rollups()
+                except Exception as e:
+                    print(f"ERROR rebuilding shipment rollups: {str(e)}")
+
+        # After the demurrage check's bulk update (12:20 AM Sri Lanka time)
+        scheduler.add_job(
+            func=refresh_shipment_rollups,
+            trigger=CronTrigger(hour=18, minute=50, second=0),
+            id='refresh_shipment_rollups',
+            name='Refresh Shipment Rollups',
+            replace_existing=True,
+            max_instances=1
+        )
+
+        def build_shipment_rollups_if_missing():
+            with app.app_context():
+                from app.shipment_rollups import rollups_built
+
+                try:
+                    if not rollups_built():
+                        refresh_shipment_rollups()
+                except Exception as e:
+                    print(f"ERROR checking shipment rollups: {str(e)}")
+
+        # First start with DASHBOARD_ROLLUPS: build the rollup now (live counts are served meanwhile)
+        scheduler.add_job(
+            func=build_shipment_rollups_if_missing,
+            id='build_shipment_rollups',
+            name='Build Shipment Rollups',
+            replace_existing=True,
+            max_instances=1
+        )
+    
     # Start the scheduler
     scheduler.start()
     print("Daily demurrage scheduler started - will run at 12:01 AM Sri Lanka time daily")
@@ -136,6 +177,9 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    from app.event_broker import check_broker_config
+    check_broker_config(app)
+
     # Get the absolute path to the instance folder
     instance_path = os.path.join(app.root_path, "instance")
     # Create instance folder if it doesn't exist
@@ -207,10 +251,16 @@ def create_app(config_class=Config):
     from app.knowledge_base import kb_bp as knowledge_base_bp
     app.register_blueprint(knowledge_base_bp, url_prefix="/knowledge_base")
 
+    from app.search import bp as search_bp
+    app.register_blueprint(search_bp, url_prefix="/search")
+
     # Register CLI commands
-    from app.commands import create_admin
+    from app.commands import create_admin, reindex_search, rebuild_shipment_rollups, sweep_attachments
 
     app.cli.add_command(create_admin)
+    app.cli.add_command(reindex_search)
+    app.cli.add_command(rebuild_shipment_rollups)
+    app.cli.add_command(sweep_attachments)
 
     @app.context_processor
     def utility_processor():
@@ -224,51 +274,23 @@ def create_app(config_class=Config):
         """Make notifications available globally in templates"""
         from flask_login import current_user
         from .utils_roles import get_all_notifications
-        
-        print(f"\n=== NOTIFICATIONS CONTEXT PROCESSOR ===")
-        print(f"Current user authenticated: {current_user.is_authenticated}")
+        from .notification_store import empty_notifications
         
         if current_user.is_authenticated:
-            print(f"User ID: {current_user.id}, Username: {current_user.username}")
-            try:
-                notifications = get_all_notifications(current_user.id)
-                print(f"Context processor - Total notifications: {notifications['total_count']}")
-                print("=== END NOTIFICATIONS CONTEXT PROCESSOR ===\n")
-                return {'notifications': notifications}
-            except Exception as e:
-                print(f"ERROR in notifications context processor: {str(e)}")
-                import traceback
-                print(f"Full traceback: {traceback.format_exc()}")
-                # Return empty notifications structure
-                empty_notifications = {
-                    'chat_notifications': [],
-                    'questionnaire_reviews': [],
-                    'monthly_safety_reviews': [],
-                    'total_count': 0
-                }
-                print("=== END NOTIFICATIONS CONTEXT PROCESSOR (ERROR) ===\n")
-                return {'notifications': empty_notifications}
-        else:
-            print("User not authenticated, returning empty notifications")
-            # Return empty notifications for non-authenticated users
-            empty_notifications = {
-                'chat_notifications': [],
-                'questionnaire_reviews': [],
-                'monthly_safety_reviews': [],
-                'total_count': 0
-            }
-            print("=== END NOTIFICATIONS CONTEXT PROCESSOR (NOT AUTH) ===\n")
-            return {'notifications': empty_notifications}
+            return {'notifications': get_all_notifications(current_user.id)}
+        # Return empty notifications for non-authenticated users
+        return {'notifications': empty_notifications()}
     
     @app.route("/")
     def root():
         return redirect(url_for("auth.landing"))
     
-    setup_scheduler(app)
+    if app.config.get("ENABLE_SCHEDULERS", True):
+        setup_scheduler(app)
 
-    if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
-        # This prevents the scheduler from running twice in debug mode
-        setup_daily_scheduler(app)
+        if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            # This prevents the scheduler from running twice in debug mode
+            setup_daily_scheduler(app)
 
     return app
 
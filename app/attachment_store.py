@@ -0,0 +1,193 @@
+# attachment_store.py
+"""
+Content-addressed storage of customer document attachments.
+
+An uploaded file is hashed (SHA-256, read in chunks from the upload's spooled
+temp file) and stored at documents/sha256/<hash[:2]>/<hash><ext>, so a file
+uploaded again - by the same customer or any other - is stored once and the
+upload to S3 is skipped. The hash is also kept on the attachment row, where it
+keys the validation result cache.
+
+Since several attachments can share an object, deleting an attachment never
+deletes a content-addressed object inline: between "no other attachment uses
+it" and the delete, a concurrent upload of the same content could find the
+object, skip its upload and reference it. Instead sweep_orphaned_attachments()
+(nightly) removes objects that no attachment references and that have not
+been stored or re-used for ATTACHMENT_SWEEP_GRACE_HOURS. An upload that
+finds its content already stored refreshes the object's Last-Modified with a
+server-side copy, so the sweep leaves it alone while its row is written.
+Files of the older per-attachment layout are not shared and are still
+deleted by release_attachment_file().
+"""
+import os
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from botocore.exceptions import ClientError
+
+from app.models.cha import ShipDocumentEntryAttachment
+from app.utils_cha.s3_utils import delete_file_from_s3, get_s3_client, upload_files_to_s3
+
+SWEEP_BATCH_SIZE = 500
+
+
+def content_hash(file, chunk_size=1024 * 1024):
+    """SHA-256 of a file-like object, read in chunks; leaves it at the start"""
+    sha256 = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(chunk_size), b""):
+        sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest()
+
+
+def _content_prefix():
+    return f"{current_app.config['S3_BASE_FOLDER']}/documents/sha256/"
+
+
+def attachment_key(digest, filename):
+    extension = os.path.splitext(filename)[1].lower()
+    return f"{_content_prefix()}{digest[:2]}/{digest}{extension}"
+
+
+def _is_missing(error):
+    return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+
+def _reuse_object(bucket, key):
+    """
+    True if the object is already stored, after refreshing its Last-Modified
+    (a copy onto itself) so the orphan sweep keeps it; False if it is missing.
+    """
+    s3_client = get_s3_client()
+    try:
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+        s3_client.copy_object(
+            Bucket=bucket,
+            Key=key,
+            CopySource={"Bucket": bucket, "Key": key},
+            MetadataDirective="REPLACE",
+            ContentType=head.get("ContentType", "binary/octet-stream"),
+            Metadata=head.get("Metadata", {}),
+        )
+        return True
+    except ClientError as e:
+        if _is_missing(e):
+            return False
+        raise
+
+
+def store_attachment_files(files):
+    """
+    Store uploaded attachments, given as (file, filename) pairs, under their
+    content-addressed keys. Files not yet in S3 are uploaded in parallel, each
+    distinct content once. Returns (s3_key, content_hash) per file, or
+    (None, None) where the upload failed.
+
+    Objects are not deleted when part of a batch fails: they may already be
+    shared with other attachments. If the caller then saves none of the
+    files, sweep_orphaned_attachments() removes the ones nothing references.
+    """
+    bucket = current_app.config["S3_BUCKET_NAME"]
+    stored = []
+    missing = {}  # s3_key -> file to upload
+    for file, filename in files:
+        digest = content_hash(file)
+        s3_key = attachment_key(digest, filename)
+        stored.append((s3_key, digest))
+        if s3_key in missing:
+            continue
+        try:
+            if _reuse_object(bucket, s3_key):
+                print(f"Attachment content already stored, skipping upload: {s3_key}")
+                continue
+        except ClientError as e:
+            print(f"Error checking S3 for {s3_key}, uploading again: {str(e)}")
+        missing[s3_key] = file
+
+    results = upload_files_to_s3([(file, s3_key) for s3_key, file in missing.items()], bucket)
+    failed = {s3_key for s3_key, uploaded in zip(missing, results) if not uploaded}
+    return [(None, None) if s3_key in failed else (s3_key, digest) for s3_key, digest in stored]
+
+
+def store_attachment_file(file, filename):
+    """store_attachment_files() for a single file: (s3_key, content_hash) or (None, None)"""
+    return store_attachment_files([(file, filename)])[0]
+
+
+def release_attachment_file(s3_key, attachment_ids=()):
+    """
+    Release the S3 object of attachments being removed or replaced
+    (attachment_ids). Content-addressed objects are left to the orphan sweep;
+    an object of the older per-attachment layout is deleted now unless
+    another attachment still uses it. True if the object was deleted.
+    """
+    if not s3_key:
+        return False
+    if s3_key.startswith(_content_prefix()):
+        print(f"Content-addressed S3 object released, the orphan sweep removes it once unused: {s3_key}")
+        return False
+    query = ShipDocumentEntryAttachment.query.filter(ShipDocumentEntryAttachment.attachement_path == s3_key)
+    if attachment_ids:
+        query = query.filter(ShipDocumentEntryAttachment.id.notin_(list(attachment_ids)))
+    if query.first() is not None:
+        print(f"S3 object still used by another attachment, keeping it: {s3_key}")
+        return False
+    return delete_file_from_s3(current_app.config["S3_BUCKET_NAME"], s3_key)
+
+
+def _delete_if_orphaned(s3_client, bucket, key, cutoff):
+    """Delete an unreferenced object unless it was stored or re-used after cutoff"""
+    try:
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if _is_missing(e):
+            return False
+        raise
+    if head["LastModified"] >= cutoff:
+        return False
+    return delete_file_from_s3(bucket, key)
+
+
+def sweep_orphaned_attachments(grace_hours=None):
+    """
+    Delete content-addressed attachment objects that no attachment row
+    references and that were last stored or re-used more than grace_hours
+    ago. Returns the number of objects deleted.
+    """
+    if grace_hours is None:
+        grace_hours = current_app.config.get("ATTACHMENT_SWEEP_GRACE_HOURS", 24)
+    bucket = current_app.config["S3_BUCKET_NAME"]
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=grace_hours)
+    s3_client = get_s3_client()
+
+    deleted = 0
+    candidates = []
+
+    def sweep(keys):
+        referenced = {
+            path for (path,) in ShipDocumentEntryAttachment.query
+            .with_entities(ShipDocumentEntryAttachment.attachement_path)
+            .filter(ShipDocumentEntryAttachment.attachement_path.in_(keys))
+        }
+        # Objects are checked again just before deleting: one re-used since the
+        # listing has a fresh Last-Modified
+        return sum(
+            1 for key in keys
+            if key not in referenced and _delete_if_orphaned(s3_client, bucket, key, cutoff)
+        )
+
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=_content_prefix()):
+        for item in page.get("Contents", []):
+            if item["LastModified"] < cutoff:
+                candidates.append(item["Key"])
+            if len(candidates) >= SWEEP_BATCH_SIZE:
+                deleted += sweep(candidates)
+                candidates = []
+    if candidates:
+        deleted += sweep(candidates)
+
+    print(f"Attachment sweep: {deleted} orphaned objects deleted")
+    return deleted
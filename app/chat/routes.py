@@ -1,5 +1,6 @@
 from flask import (
     Blueprint,
+    Response,
     jsonify,
     request,
     current_app,
@@ -16,6 +17,8 @@ from app.models.cha import (
     EntryAssignmentHistory
 )
 from datetime import datetime
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload
 from werkzeug.utils import secure_filename
 import os
 from app.utils_cha.s3_utils import upload_file_to_s3, delete_file_from_s3, get_s3_url
@@ -25,9 +28,21 @@ from app.utils import get_sri_lanka_time
 from app.email import send_email, send_async_email
 import json
 from app.models.user import User
+from app.notification_store import (
+    record_new_message,
+    refresh_thread_counters,
+    get_unread_count,
+    publish_chat_message,
+    publish_chat_read,
+)
+from app.event_broker import get_broker, iter_sse
+from app.utils_roles import get_all_notifications
 
 chat_bp = Blueprint("chat", __name__)
 
+CHAT_PAGE_SIZE = 50
+CHAT_MAX_PAGE_SIZE = 200
+
 
 @chat_bp.route("/thread/<module_name>/<int:reference_id>", methods=["GET"])
 @login_required
@@ -144,77 +159,99 @@ def get_or_create_thread(module_name, reference_id):
 @chat_bp.route("/messages/<int:thread_id>", methods=["GET"])
 @login_required
 def get_messages(thread_id):
-    print("\n=== GET MESSAGES ===")
-    print(f"Thread ID: {thread_id}")
-    print(f"Current User: {current_user.username} (ID: {current_user.id}, Role: {current_user.role})")
-    
-    # Get the thread
+    """
+    One page of a thread's messages, oldest first.
+
+    Query parameters:
+        limit: page size (default CHAT_PAGE_SIZE, at most CHAT_MAX_PAGE_SIZE)
+        before: message id - the page of messages just older than it
+        after: message id - the messages newer than it
+    Without a cursor the newest page is returned. has_more tells whether
+    older (or, with after, newer) messages remain.
+    """
     thread = ChatThread.query.get_or_404(thread_id)
-    print(f"Thread found: {thread.id}")
-    print(f"Reference ID: {thread.reference_id}")
-    print(f"Module: {thread.module_name}")
-    
-    # Get all messages for this reference_id and module
-    messages = (
-        ChatMessage.query.filter_by(
-            reference_id=thread.reference_id
-        )
-        .order_by(ChatMessage.created_at.asc())
-        .all()
-    )
-    
-    print(f"\nFound {len(messages)} messages:")
-    for msg in messages:
-        print(f"\nMessage ID: {msg.id}")
-        print(f"Reference ID: {msg.reference_id}")
-        print(f"From: {msg.sender.username} (ID: {msg.sender.id}, Role: {msg.sender_role})")
-        print(f"Message: {msg.message[:50]}{'...' if len(msg.message) > 50 else ''}")
-        print(f"Time: {msg.created_at}")
-        print(f"Is Read: {msg.is_read}")
-        if msg.attachments:
-            print(f"Attachments: {len(msg.attachments)}")
-            for att in msg.attachments:
-                print(f"  - {att.file_name} ({att.file_type})")
-
-    print("=== END GET MESSAGES ===\n")
+
+    limit = min(request.args.get("limit", CHAT_PAGE_SIZE, type=int) or CHAT_PAGE_SIZE, CHAT_MAX_PAGE_SIZE)
+    before = request.args.get("before", type=int)
+    after = request.args.get("after", type=int)
+
+    # Sender, parent (with its sender) and attachments come back in the same query
+    query = ChatMessage.query.options(
+        joinedload(ChatMessage.sender),
+        joinedload(ChatMessage.parent_message).joinedload(ChatMessage.sender),
+        joinedload(ChatMessage.attachments),
+    ).filter(ChatMessage.reference_id == thread.reference_id)
+
+    if after is not None:
+        anchor = _message_created_at(after)
+        query = query.filter(
+            or_(ChatMessage.created_at > anchor, and_(ChatMessage.created_at == anchor, ChatMessage.id > after))
+        ).order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc())
+    else:
+        if before is not None:
+            anchor = _message_created_at(before)
+            query = query.filter(
+                or_(ChatMessage.created_at < anchor, and_(ChatMessage.created_at == anchor, ChatMessage.id < before))
+            )
+        query = query.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+
+    messages = query.limit(limit + 1).all()
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if after is None:
+        messages.reverse()
+
     return jsonify({
-        "messages": [
+        "messages": [_serialize_message(msg) for msg in messages],
+        "has_more": has_more,
+        "before": messages[0].id if messages else before,
+        "after": messages[-1].id if messages else after,
+    })
+
+
+def _message_created_at(message_id):
+    """created_at of a cursor message, as a subquery of the page query"""
+    return (
+        db.session.query(ChatMessage.created_at)
+        .filter(ChatMessage.id == message_id)
+        .scalar_subquery()
+    )
+
+
+def _serialize_message(msg):
+    return {
+        "id": msg.id,
+        "reference_id": msg.reference_id,
+        "sender": {
+            "id": msg.sender.id, 
+            "name": msg.sender.name or msg.sender.username,
+            "role": msg.sender_role
+        },
+        "message": msg.message,
+        "message_type": msg.message_type,
+        "created_at": msg.created_at.isoformat(),
+        "is_read": msg.is_read,
+        "parent_message_id": msg.parent_message_id,
+        # Include parent message data if it exists
+        "parent_message": {
+            "id": msg.parent_message.id,
+            "message": msg.parent_message.message,
+            "sender": {
+                "id": msg.parent_message.sender.id,
+                "name": msg.parent_message.sender.name or msg.parent_message.sender.username,
+                "role": msg.parent_message.sender_role
+            }
+        } if msg.parent_message else None,
+        "attachments": [
             {
-                "id": msg.id,
-                "reference_id": msg.reference_id,
-                "sender": {
-                    "id": msg.sender.id, 
-                    "name": msg.sender.name or msg.sender.username,
-                    "role": msg.sender_role
-                },
-                "message": msg.message,
-                "message_type": msg.message_type,
-                "created_at": msg.created_at.isoformat(),
-                "is_read": msg.is_read,
-                "parent_message_id": msg.parent_message_id,
-                # Include parent message data if it exists
-                "parent_message": {
-                    "id": msg.parent_message.id,
-                    "message": msg.parent_message.message,
-                    "sender": {
-                        "id": msg.parent_message.sender.id,
-                        "name": msg.parent_message.sender.name or msg.parent_message.sender.username,
-                        "role": msg.parent_message.sender_role
-                    }
-                } if msg.parent_message else None,
-                "attachments": [
-                    {
-                        "id": att.id,
-                        "file_type": att.file_type,
-                        "file_name": att.file_name,
-                        "file_path": att.file_path,
-                    }
-                    for att in msg.attachments
-                ],
+                "id": att.id,
+                "file_type": att.file_type,
+                "file_name": att.file_name,
+                "file_path": att.file_path,
             }
-            for msg in messages
-        ]
-    })
+            for att in msg.attachments
+        ],
+    }
 
 
 
@@ -286,6 +323,9 @@ def mark_messages_read(module_name, reference_id):
             message.is_read = True
             print(f"Marked message {message.id} from {message.sender.username} ({message.sender.role}) as read")
         
+        read_thread_ids = {message.thread_id for message in unread_messages}
+        affected_users = refresh_thread_counters(read_thread_ids)
+        
         # Update the participant's last read timestamp
         participant = ChatParticipant.query.filter_by(
             thread_id=thread.id,
@@ -298,6 +338,7 @@ def mark_messages_read(module_name, reference_id):
         
         db.session.commit()
         print("Changes committed to database")
+        publish_chat_read(read_thread_ids, affected_users)
         print("=== END MARKING MESSAGES AS READ ===\n")
         
         return jsonify({
@@ -381,6 +422,7 @@ def send_message(module_name, reference_id):
         )
         db.session.add(new_message)
         db.session.flush()
+        recipient_ids = record_new_message(new_message, current_user.role)
         
         print(f"\nCreated new message: {new_message.id}")
         print(f"Reference ID: {new_message.reference_id}")
@@ -438,6 +480,7 @@ def send_message(module_name, reference_id):
 
         db.session.commit()
         print("Message and attachments successfully saved to database")
+        publish_chat_message(new_message, recipient_ids)
         
         # Send email notifications after successful message save
         try:
@@ -704,20 +747,47 @@ def join_thread(thread_id):
 def check_new_notifications():
     """Check if user has new notifications"""
     try:
-        from .utils_roles import get_all_notifications
-        
-        notifications = get_all_notifications(current_user.id)
-        has_new = notifications['total_count'] > 0
+        total_count = get_unread_count(current_user.id)
         
         return jsonify({
             'success': True,
-            'has_new_notifications': has_new,
-            'total_count': notifications['total_count']
+            'has_new_notifications': total_count > 0,
+            'total_count': total_count
         })
     except Exception as e:
         current_app.logger.error(f"Error checking notifications: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@chat_bp.route("/events")
+@login_required
+def events():
+    """
+    Server-Sent Events stream of chat updates: the user's notifications and,
+    for ?thread=<id> parameters, new messages in threads the user takes part in
+    """
+    topics = [f"user:{current_user.id}"]
+    thread_ids = request.args.getlist("thread", type=int)
+    if thread_ids:
+        participant_threads = ChatParticipant.query.with_entities(ChatParticipant.thread_id).filter(
+            ChatParticipant.thread_id.in_(thread_ids),
+            ChatParticipant.user_id == current_user.id
+        ).all()
+        topics += [f"thread:{thread_id}" for (thread_id,) in participant_threads]
+
+    subscription = get_broker().subscribe(topics)
+    # The stream is long-lived - give the DB connection back to the pool now
+    db.session.remove()
+
+    return Response(
+        iter_sse(
+            subscription,
+            heartbeat=current_app.config.get("EVENT_STREAM_HEARTBEAT_SECONDS", 20),
+            max_seconds=current_app.config.get("EVENT_STREAM_MAX_SECONDS", 300),
+        ),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @chat_bp.route("/message/<int:message_id>/mark-read", methods=["POST"])
 @login_required
 def mark_chat_message_read(message_id):
@@ -730,7 +800,9 @@ def mark_chat_message_read(message_id):
         # Only mark as read if the current user is not the sender
         if message.sender_id != current_user.id:
             message.is_read = True
+            affected_users = refresh_thread_counters([message.thread_id])
             db.session.commit()
+            publish_chat_read([message.thread_id], affected_users)
         
         return jsonify({'success': True})
     except Exception as e:
@@ -860,6 +932,9 @@ def ensure_thread_participants(thread, entry):
         print(f"Added user {user_id} as participant to thread {thread.id}")
     
     if participants_to_add:
+        # New participants start with the thread's current unread messages
+        db.session.flush()
+        refresh_thread_counters([thread.id])
         db.session.commit()
         print(f"Added {len(participants_to_add)} new participants to thread {thread.id}")
 
@@ -878,8 +953,6 @@ def debug_notifications(user_id):
 def get_all_notifications_data():
     """Get all notifications data for real-time updates"""
     try:
-        from .utils_roles import get_all_notifications
-        
         notifications = get_all_notifications(current_user.id)
         
         return jsonify({
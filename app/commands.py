@@ -29,3 +29,34 @@ def create_admin():
     click.echo("Email: admin@example.com")
     click.echo("Password: admin123")
     click.echo("Please change these credentials after first login!")
+
+
+@click.command("search-reindex")
+@with_appcontext
+def reindex_search():
+    """Rebuild the search index from the database"""
+    from app.search_index import rebuild_search_index
+
+    written = rebuild_search_index()
+    click.echo(f"Indexed {written} documents")
+
+
+@click.command("shipment-rollups-rebuild")
+@with_appcontext
+def rebuild_shipment_rollups():
+    """Rebuild the dashboard's monthly shipment rollup from the shipments"""
+    from app.shipment_rollups import rebuild_shipment_rollups as rebuild
+
+    rows = rebuild()
+    click.echo(f"Rolled up shipments into {rows} rows")
+
+
+@click.command("attachments-sweep")
+@click.option("--grace-hours", type=int, default=None, help="Keep files stored or re-used this recently")
+@with_appcontext
+def sweep_attachments(grace_hours):
+    """Delete content-addressed attachment files no attachment references"""
+    from app.attachment_store import sweep_orphaned_attachments
+
+    deleted = sweep_orphaned_attachments(grace_hours)
+    click.echo(f"Deleted {deleted} orphaned attachment files")
@@ -26,7 +26,6 @@ from app.models.cha import (
     Terminal,
     Runner,
     WharfProfile,
-    Branch,
     ShipCategory,
     ShipCatDocument,
     Order,
@@ -56,7 +55,7 @@ from app.models.cha import (
     CompanyAssignment,
     ShipmentTypeBase
     )
-from app.models.demurrage import DemurrageRateCard, CompanyDemurrageConfig, DemurrageCalculationDetail, DemurrageReasons, ShipmentDemurrage, ShipmentDemurrageAttachment, ShipmentDemurrageBearer, DemurrageRateCardTier
+from app.models.demurrage import CompanyDemurrageConfig, DemurrageCalculationDetail, DemurrageReasons, ShipmentDemurrage, ShipmentDemurrageAttachment, ShipmentDemurrageBearer, DemurrageRateCardTier
 from app.models.po import PODetail,POHeader, POMaterial, POOrderUnit, POSupplier, ShipmentItem, MaterialHSDocuments
 from app.models.hs import HSCode, HSCodeCategory, HSCodeDocument, HSCodeDocumentAttachment, HSCodeIssueBody, HSDocumentCategory
 from app.models.task_management import Project, Task, TaskVisibility, TaskPriority, ProjectTaskStatus, ProjectMember
@@ -68,18 +67,18 @@ from datetime import datetime, timedelta
 from app.email import send_email, send_async_email
 from werkzeug.utils import secure_filename
 import os
-import boto3
 import uuid
 import tempfile
 from app.utils_cha.s3_utils import (
     upload_file_to_s3,
     get_s3_url,
-    delete_file_from_s3,
     get_s3_client,
+    get_transfer_config,
     get_secure_document_url,
     serve_s3_file
 )
 from decimal import Decimal
+from collections import defaultdict
 
 from app.customer_portal import bp
 from sqlalchemy.sql import and_, or_, cast
@@ -94,6 +93,20 @@ import time
 from botocore.exceptions import ClientError
 import requests
 from app.utils import get_sri_lanka_time
+from app.validation_queue import enqueue_validation
+from app.extraction_cache import get_sample_extraction
+from app.document_rules import get_document_rules
+from app.attachment_store import store_attachment_file, store_attachment_files, release_attachment_file
+from app.validation_result_cache import (
+    sample_version,
+    get_cached_validation,
+    apply_cached_validation,
+    store_validation,
+)
+from app.similarity_index import add_document_to_index
+from app.reference_cache import get_reference_data, get_reference_map
+from app.document_alerts import get_entry_alert_status, entry_ids_from_request
+from app.demurrage_projection import get_projection_engine
 
 def customer_required(f):
     @wraps(f)
@@ -109,14 +122,6 @@ def customer_required(f):
     return decorated_function
 
 
-def get_s3_client():
-    return boto3.client(
-        's3',
-        aws_access_key_id=current_app.config['AWS_ACCESS_KEY'],
-        aws_secret_access_key=current_app.config['AWS_SECRET_KEY'],
-        region_name=current_app.config['AWS_REGION']
-    )
-
 def download_s3_file(file_key):
     """Download file from S3 to a temporary file using the technique from the upload route"""
     try:
@@ -124,21 +129,17 @@ def download_s3_file(file_key):
         temp_dir = os.path.join(current_app.config["UPLOAD_FOLDER"], "temp")
         os.makedirs(temp_dir, exist_ok=True)
         
-        # Create temporary file path
-        temp_file_path = os.path.join(temp_dir, os.path.basename(file_key))
+        # Unique temporary file keeping the extension - attachments with the
+        # same content share one key and may be validated at the same time
+        fd, temp_file_path = tempfile.mkstemp(suffix=os.path.splitext(file_key)[1], dir=temp_dir)
+        os.close(fd)
         
-        # Initialize S3 client with explicit credentials
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=current_app.config["AWS_ACCESS_KEY_ID"],
-            aws_secret_access_key=current_app.config["AWS_SECRET_ACCESS_KEY"]
-        )
-        
-        # Download file from S3 to local temp file
-        s3_client.download_file(
+        # Download file from S3 to local temp file with the shared client
+        get_s3_client().download_file(
             current_app.config["S3_BUCKET_NAME"],
             file_key,
-            temp_file_path
+            temp_file_path,
+            Config=get_transfer_config()
         )
         
         return temp_file_path
@@ -321,6 +322,31 @@ def send_document_validation_results_email(customer_id, entry_id=None):
 # 8 - Document Type Mismatch
 
 
+def notify_entry_validated(document):
+    """Email the customer once every document of the document's entry has been validated"""
+    entry = ShipDocumentEntryMaster.query.get(document.shipDocEntryMasterID)
+    
+    # Check if this document is the last one to be validated in this entry
+    if entry:
+        # Get count of all documents in this entry
+        total_docs = ShipDocumentEntryAttachment.query.filter_by(
+            shipDocEntryMasterID=entry.id
+        ).count()
+        
+        # Get count of documents that have been validated (ai_validated != 0)
+        validated_docs = ShipDocumentEntryAttachment.query.filter(
+            ShipDocumentEntryAttachment.shipDocEntryMasterID==entry.id,
+            ShipDocumentEntryAttachment.ai_validated!=0
+        ).count()
+        
+        print(f"Validation status for entry {entry.id}: {validated_docs} of {total_docs} documents validated")
+        
+        # If all documents have been validated, send the email
+        if validated_docs == total_docs and entry.customer_id:
+            print(f"All documents for entry {entry.id} have been validated. Sending email to customer {entry.customer_id}")
+            send_document_validation_results_email(entry.customer_id, entry.id)
+
+
 def process_document_validation(document):
     """Process validation for a single document with dynamic thresholds"""
     # print("\n" + "="*80)
@@ -365,6 +391,37 @@ def process_document_validation(document):
                 "status": "ai_disabled"
             }
         
+        # Sample text and type come from the extraction cache - the sample is
+        # only downloaded and parsed again when the S3 object changes
+        sample_extraction = get_sample_extraction(sample_document.sample_file_path)
+        
+        if not sample_extraction:
+            print(f"FAILED to download sample document from S3")
+            return {
+                "success": False,
+                "message": f"Failed to download sample document: {sample_document.sample_file_path}"
+            }
+
+        # The same file validated before against this sample reuses that result
+        rules = get_document_rules(sample_document.shipCatid)
+        result_version = sample_version(sample_document, sample_extraction["content_hash"], rules)
+        cached_result = get_cached_validation(document.content_hash, sample_document.id, result_version)
+        if cached_result:
+            print(f"Reusing validation result for content {document.content_hash}")
+            apply_cached_validation(document, cached_result)
+            db.session.commit()
+            notify_entry_validated(document)
+            return {
+                "success": True,
+                "message": "Document validation reused a previous result for the same file",
+                "status": "cached",
+                "results": {
+                    "match_percentage": document.validation_percentage or 0,
+                    "validation_status": document.ai_validated,
+                    "field_validation": json.loads(document.validation_results) if document.validation_results else {},
+                }
+            }
+
         # Download the submitted document from S3
         # print(f"Downloading submitted document from S3: {document.attachement_path}")
         submitted_file_path = download_s3_file(document.attachement_path)
@@ -379,31 +436,11 @@ def process_document_validation(document):
         temp_files.append(submitted_file_path)
         # print(f"Successfully downloaded submitted document to: {submitted_file_path}")
         
-        # Download the sample document from S3
-        # print(f"Downloading sample document from S3: {sample_document.sample_file_path}")
-        sample_file_path = download_s3_file(sample_document.sample_file_path)
-        
-        if not sample_file_path:
-            print(f"FAILED to download sample document from S3")
-            # Clean up temporary files
-            for file_path in temp_files:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    
-            return {
-                "success": False,
-                "message": f"Failed to download sample document: {sample_document.sample_file_path}"
-            }
-        
-        temp_files.append(sample_file_path)
-        # print(f"Successfully downloaded sample document to: {sample_file_path}")
-        
-        # Extract text from both documents
+        # Extract text from the submitted document
         # print(f"Extracting text from submitted document")
         submitted_text = extract_text_from_file(submitted_file_path)
         
-        # print(f"Extracting text from sample document")
-        sample_text = extract_text_from_file(sample_file_path)
+        sample_text = sample_extraction["text"]
         
         # Clean up temporary files early to free space
         for file_path in temp_files:
@@ -445,8 +482,11 @@ def process_document_validation(document):
         
         # Identify document types
         print("Identifying document types...")
-        submitted_doc_type = get_document_type(submitted_text)
-        sample_doc_type = get_document_type(sample_text)
+        submitted_doc_type = get_document_type(submitted_text, rules)
+        # The cached sample type was classified with the default rules
+        sample_doc_type = (
+            sample_extraction["document_type"] if rules.is_default else None
+        ) or get_document_type(sample_text, rules)
         
         print(f"Submitted document type: {submitted_doc_type['type']} with confidence {submitted_doc_type['confidence']:.2%}")
         print(f"Sample document type: {sample_doc_type['type']} with confidence {sample_doc_type['confidence']:.2%}")
@@ -510,6 +550,7 @@ def process_document_validation(document):
             # Commit changes to database
             db.session.commit()
             print(f"Database updated with document type mismatch status")
+            store_validation(document, result_version)
             
             # print("="*80)
             # print(f"VALIDATION STOPPED DUE TO DOCUMENT TYPE MISMATCH FOR DOCUMENT ID: {document.id}")
@@ -537,7 +578,11 @@ def process_document_validation(document):
 
         # Use the existing validate_document function for content comparison with dynamic threshold
         print(f"Starting document content validation with similarity threshold: {content_similarity_threshold}%")
-        validation_result = validate_document(submitted_text, sample_text, sample_document)
+        validation_result = validate_document(
+            submitted_text, sample_text, sample_document,
+            submitted_doc_type=submitted_doc_type, sample_doc_type=sample_doc_type,
+            sample_features=sample_extraction["features"]
+        )
         
         # Extract structured data if needed
         try:
@@ -589,28 +634,17 @@ def process_document_validation(document):
             
         db.session.commit()
         print(f"Database updated successfully")
+        store_validation(document, result_version)
 
-        entry = ShipDocumentEntryMaster.query.get(document.shipDocEntryMasterID)
-        
-        # Check if this document is the last one to be validated in this entry
-        if entry:
-            # Get count of all documents in this entry
-            total_docs = ShipDocumentEntryAttachment.query.filter_by(
-                shipDocEntryMasterID=entry.id
-            ).count()
-            
-            # Get count of documents that have been validated (ai_validated != 0)
-            validated_docs = ShipDocumentEntryAttachment.query.filter(
-                ShipDocumentEntryAttachment.shipDocEntryMasterID==entry.id,
-                ShipDocumentEntryAttachment.ai_validated!=0
-            ).count()
-            
-            print(f"Validation status for entry {entry.id}: {validated_docs} of {total_docs} documents validated")
-            
-            # If all documents have been validated, send the email
-            if validated_docs == total_docs and entry.customer_id:
-                print(f"All documents for entry {entry.id} have been validated. Sending email to customer {entry.customer_id}")
-                send_document_validation_results_email(entry.customer_id, entry.id)
+        # Accepted documents feed the shipment category's similarity index
+        if document.ai_validated == 1:
+            try:
+                add_document_to_index(sample_document.shipCatid, submitted_text)
+            except Exception as index_error:
+                db.session.rollback()
+                print(f"Error updating similarity index: {str(index_error)}")
+
+        notify_entry_validated(document)
 
         
         # print("="*80)
@@ -723,10 +757,7 @@ def index():
     print(f"Total Shipment Entries Found: {len(entries)}")
 
     # --- Shared Logic with Open Shipments ---
-    doc_statuses = {
-        status.docStatusID: status.docStatusName
-        for status in DocumentStatus.query.all()
-    }
+    doc_statuses = get_reference_map("document_statuses", "docStatusName")
 
     # Initialize counters
     open_shipments = 0      # NEW: Open shipments counter
@@ -962,205 +993,123 @@ def index():
 
 
 
-def calculate_tier_based_cost(rate_card, total_days):
+def get_containers_by_shipment(shipments):
+    """Import containers of the given shipments, {ship_doc_entry_id: [container]}, in one query."""
+    entry_ids = {shipment.ship_doc_entry_id for shipment in shipments}
+    containers_by_shipment = defaultdict(list)
+    if not entry_ids:
+        return containers_by_shipment
+
+    containers = ImportContainer.query.options(
+        db.joinedload(ImportContainer.container_size),
+        db.joinedload(ImportContainer.container_type),
+    ).filter(
+        ImportContainer.shipment_id.in_(entry_ids)
+    ).order_by(ImportContainer.id).all()
+
+    for container in containers:
+        containers_by_shipment[container.shipment_id].append(container)
+    return containers_by_shipment
+
+
+def project_container_costs(containers_days):
     """
-    Calculate demurrage cost using tier system.
-    
-    Args:
-        rate_card: DemurrageRateCard object with tiers
-        total_days: Total number of demurrage days
-    
-    Returns:
-        float: Total calculated cost
+    Highest projected cost across all demurrage reasons for [(container, days_in_demurrage)],
+    computed in one pass. Returns [(cost, currency_code, rate card curve or None)].
     """
-    if total_days <= 0:
-        return 0.0
-    
-    try:
-        total_cost = 0.0
-        remaining_days = total_days
-        
-        # Sort tiers by tier_number to ensure correct progression
-        sorted_tiers = sorted(rate_card.tiers, key=lambda x: x.tier_number)
-        
-        print(f"    Calculating cost for {total_days} days using {len(sorted_tiers)} tiers")
-        
-        for i, tier in enumerate(sorted_tiers):
-            if remaining_days <= 0:
-                break
-            
-            # Determine how many days fall into this tier
-            if hasattr(tier, 'max_days') and tier.max_days:
-                # If tier has max_days defined
-                days_in_tier = min(remaining_days, tier.max_days)
-            elif hasattr(tier, 'days_range') and tier.days_range:
-                # If tier has days_range defined
-                days_in_tier = min(remaining_days, tier.days_range)
-            elif i == len(sorted_tiers) - 1:
-                # Last tier takes all remaining days
-                days_in_tier = remaining_days
-            else:
-                # Default: assume each tier covers a reasonable range
-                # You may need to adjust this based on your tier structure
-                default_tier_days = 5  # Assume each tier covers 5 days
-                days_in_tier = min(remaining_days, default_tier_days)
-            
-            # Calculate cost for this tier
-            tier_cost = days_in_tier * tier.rate_amount
-            total_cost += tier_cost
-            remaining_days -= days_in_tier
-            
-            print(f"      Tier {tier.tier_number}: {days_in_tier} days × {tier.rate_amount}/day = {tier_cost}")
-            
-            # If this tier consumed all remaining days, stop
-            if remaining_days <= 0:
-                break
-        
-        print(f"    Total calculated cost: {total_cost}")
-        return total_cost
-        
-    except Exception as e:
-        print(f"    Error calculating tier cost: {str(e)}")
-        # Fallback to simple calculation
-        if rate_card.tiers:
-            fallback_rate = rate_card.tiers[0].rate_amount
-            fallback_cost = total_days * fallback_rate
-            print(f"    Using fallback: {total_days} days × {fallback_rate}/day = {fallback_cost}")
-            return fallback_cost
-        return 0.0
-    
+    return get_projection_engine().highest_costs([
+        (container.container_size_id, container.container_type_id, days)
+        for container, days in containers_days
+    ])
+
 
 def calculate_highest_projected_cost_for_container(container, days_in_demurrage):
     """Calculate highest projected cost across all demurrage reasons for a specific container."""
-    if not container.container_size_id or not container.container_type_id or days_in_demurrage <= 0:
-        return 0.0, "LKR"  # Default to LKR
-    
-    # Get all active demurrage reasons
-    reasons = DemurrageReasons.query.filter_by(is_active=True).all()
-    
-    highest_cost = 0.0
-    best_currency = "LKR"  # Default to LKR
-    
-    for reason in reasons:
-        # Get rate card for this size/type/reason combination
-        rate_card = DemurrageRateCard.query.filter(
-            DemurrageRateCard.container_size_id == container.container_size_id,
-            DemurrageRateCard.container_type_id == container.container_type_id,
-            DemurrageRateCard.demurrage_reason_id == reason.id,
-            DemurrageRateCard.is_active == True
-        ).first()
-        
-        if rate_card and rate_card.tiers:
-            # Calculate tier-based cost for this reason
-            reason_cost = calculate_tier_based_cost(rate_card, days_in_demurrage)
-            if reason_cost > highest_cost:
-                highest_cost = reason_cost
-                if rate_card.currency:
-                    best_currency = rate_card.currency.CurrencyCode
-    
-    return highest_cost, best_currency
+    cost, currency, _ = project_container_costs([(container, days_in_demurrage)])[0]
+    return cost, currency
 
 
-def calculate_projected_cost_if_cleared_today(container, shipment):
-    """Calculate what the cost would be if container is cleared today."""
+def days_in_demurrage_today(shipment):
+    """Days the shipment has been in demurrage as of today (0 if not yet)."""
     from datetime import datetime
     today = datetime.now().date()
-    
+
     if not shipment.demurrage_from or today <= shipment.demurrage_from:
+        return 0
+    return (today - shipment.demurrage_from).days
+
+
+def calculate_projected_cost_if_cleared_today(container, shipment):
+    """Calculate what the cost would be if container is cleared today."""
+    days_in_demurrage = days_in_demurrage_today(shipment)
+    if days_in_demurrage <= 0:
         return 0.0, "LKR"  # Default to LKR
-    
-    days_in_demurrage = (today - shipment.demurrage_from).days
+
     return calculate_highest_projected_cost_for_container(container, days_in_demurrage)
 
 
-def get_timeline_segments_for_container(container, shipment):
-    """Generate timeline segments for interactive graph."""
-    from datetime import datetime, timedelta
-    today = datetime.now().date()
-    
+def get_timeline_segments_for_container(container, shipment, projection=None):
+    """
+    Generate timeline segments for interactive graph.
+
+    projection is the container's (cost, currency, curve) from project_container_costs
+    for today's days in demurrage; it is computed here when not given.
+    """
+    from datetime import timedelta
+
     segments = []
-    
+
     if not shipment.eta or not shipment.demurrage_from:
         return segments
 
+    eta_date = shipment.eta.date() if hasattr(shipment.eta, 'date') else shipment.eta
+
     # Free period segment
     segments.append({
         'type': 'free_period',
-        'start_date': shipment.eta.date() if hasattr(shipment.eta, 'date') else shipment.eta,
+        'start_date': eta_date,
         'end_date': shipment.demurrage_from,
         'color': '#28a745',  # Green
         'cost': 0,
         'description': 'Free Period',
-        'days': (shipment.demurrage_from - (shipment.eta.date() if hasattr(shipment.eta, 'date') else shipment.eta)).days
+        'days': (shipment.demurrage_from - eta_date).days
     })
-    
+
     # Only add demurrage segments if we're past demurrage_from date
-    if today > shipment.demurrage_from:
-        days_in_demurrage = (today - shipment.demurrage_from).days
-        
-        # Get the best rate card for this container
-        best_rate_card = None
-        highest_cost = 0
-        best_currency = "LKR"  # Default to LKR
-        
-        reasons = DemurrageReasons.query.filter_by(is_active=True).all()
-        for reason in reasons:
-            rate_card = DemurrageRateCard.query.filter(
-                DemurrageRateCard.container_size_id == container.container_size_id,
-                DemurrageRateCard.container_type_id == container.container_type_id,
-                DemurrageRateCard.demurrage_reason_id == reason.id,
-                DemurrageRateCard.is_active == True
-            ).first()
-            
-            if rate_card and rate_card.tiers:
-                cost = calculate_tier_based_cost(rate_card, days_in_demurrage)
-                if cost > highest_cost:
-                    highest_cost = cost
-                    best_rate_card = rate_card
-                    # Get actual currency from rate card
-                    if rate_card.currency:
-                        best_currency = rate_card.currency.CurrencyCode
-        
-        # Generate tier segments if we have a rate card
-        if best_rate_card and best_rate_card.tiers:
-            colors = ['#ffc107', '#fd7e14', '#dc3545', '#6f42c1', '#e83e8c']  # Yellow to Red progression
-            current_date = shipment.demurrage_from
-            remaining_days = days_in_demurrage
-            
-            for i, tier in enumerate(sorted(best_rate_card.tiers, key=lambda x: x.tier_number)):
-                if remaining_days <= 0:
-                    break
-                
-                # Determine days in this tier
-                if tier.to_day:
-                    tier_days = min(remaining_days, tier.to_day - tier.from_day + 1)
-                else:
-                    tier_days = remaining_days
-                
-                if tier_days > 0:
-                    end_date = current_date + timedelta(days=tier_days)
-                    
-                    # Calculate accumulated cost up to this point
-                    accumulated_cost = calculate_tier_based_cost(best_rate_card, 
-                                                               (current_date - shipment.demurrage_from).days + tier_days)
-                    
-                    segments.append({
-                        'type': 'demurrage_tier',
-                        'tier_number': tier.tier_number,
-                        'start_date': current_date,
-                        'end_date': end_date,
-                        'color': colors[min(i, len(colors)-1)],
-                        'cost': accumulated_cost,
-                        'rate_per_day': tier.rate_amount,
-                        'days': tier_days,
-                        'description': f'Tier {tier.tier_number} ({best_currency} {tier.rate_amount}/day)',  # Changed this line
-                        'day_range': tier.day_range_display,
-                        'currency': best_currency  # Added currency info
-                    })
-                    
-                    current_date = end_date
-                    remaining_days -= tier_days
-    
+    days_in_demurrage = days_in_demurrage_today(shipment)
+    if days_in_demurrage <= 0:
+        return segments
+
+    if projection is None:
+        projection = project_container_costs([(container, days_in_demurrage)])[0]
+    _, best_currency, curve = projection
+
+    # Generate tier segments from the rate card with the highest projected cost
+    if curve:
+        colors = ['#ffc107', '#fd7e14', '#dc3545', '#6f42c1', '#e83e8c']  # Yellow to Red progression
+        current_date = shipment.demurrage_from
+        charged_days = 0
+
+        for i, tier in enumerate(curve.breakdown(days_in_demurrage)):
+            end_date = current_date + timedelta(days=tier["days"])
+            charged_days += tier["days"]
+
+            segments.append({
+                'type': 'demurrage_tier',
+                'tier_number': tier["tier"],
+                'start_date': current_date,
+                'end_date': end_date,
+                'color': colors[min(i, len(colors)-1)],
+                'cost': curve.cost(charged_days),  # Accumulated cost up to the end of this tier
+                'rate_per_day': tier["rate"],
+                'days': tier["days"],
+                'description': f'Tier {tier["tier"]} ({best_currency} {tier["rate"]}/day)',
+                'day_range': tier["day_range"],
+                'currency': best_currency
+            })
+
+            current_date = end_date
+
     return segments
 
 
@@ -1213,7 +1162,9 @@ def demurrage_snapshots():
         demurrage_container_count = 0
         currency_codes = []
         
-        # Calculate projected costs for demurrage shipments only
+        # Collect containers of demurrage shipments only
+        containers_by_shipment = get_containers_by_shipment(demurrage_shipments)
+        containers_days = []
         for shipment in demurrage_shipments:
             if not shipment.demurrage_from:
                 continue
@@ -1222,25 +1173,17 @@ def demurrage_snapshots():
             if days_in_demurrage <= 0:
                 continue
             
-            # Get containers for this shipment
-            containers = ImportContainer.query.filter_by(
-                shipment_id=shipment.ship_doc_entry_id
-            ).all()
-            
-            print(f"Processing shipment {shipment.id} with {len(containers)} containers, {days_in_demurrage} days in demurrage")
-            
-            for container in containers:
+            for container in containers_by_shipment[shipment.ship_doc_entry_id]:
                 if container.container_size_id and container.container_type_id:
-                    # Calculate highest projected cost across all reasons
-                    projected_cost, currency = calculate_highest_projected_cost_for_container(
-                        container, days_in_demurrage
-                    )
-                    
-                    total_projected_demurrage += projected_cost
-                    demurrage_container_count += 1
-                    currency_codes.append(currency)
-                    
-                    print(f"  Container {container.container_number}: {currency} {projected_cost:.2f}")
+                    containers_days.append((container, days_in_demurrage))
+        
+        # Highest projected cost across all reasons, for all containers at once
+        for projected_cost, currency, _ in project_container_costs(containers_days):
+            total_projected_demurrage += projected_cost
+            demurrage_container_count += 1
+            currency_codes.append(currency)
+        
+        print(f"Projected {demurrage_container_count} demurrage containers: {total_projected_demurrage:.2f}")
         
         # Determine most common currency, default to LKR
         from collections import Counter
@@ -1297,6 +1240,20 @@ def at_risk_shipments():
         demurrage_shipments, free_period_shipments = categorize_shipments_by_risk(customer.id)
         
         shipments_data = []
+        containers_by_shipment = get_containers_by_shipment(demurrage_shipments + free_period_shipments)
+        
+        # Projected costs of all containers in demurrage, in one pass
+        containers_days = []
+        for shipment in demurrage_shipments:
+            days_in_demurrage = (today - shipment.demurrage_from).days if shipment.demurrage_from else 0
+            if days_in_demurrage > 0:
+                for container in containers_by_shipment[shipment.ship_doc_entry_id]:
+                    if container.container_size_id and container.container_type_id:
+                        containers_days.append((container, days_in_demurrage))
+        projected_costs = {
+            container.id: projection[:2]
+            for (container, _), projection in zip(containers_days, project_container_costs(containers_days))
+        }
         
         # Process High Risk shipments (in demurrage)
         for shipment in demurrage_shipments:
@@ -1304,10 +1261,7 @@ def at_risk_shipments():
             if shipment.demurrage_from:
                 days_in_demurrage = (today - shipment.demurrage_from).days
             
-            # Get containers
-            containers = ImportContainer.query.filter_by(
-                shipment_id=shipment.ship_doc_entry_id
-            ).all()
+            containers = containers_by_shipment[shipment.ship_doc_entry_id]
             
             container_details = []
             container_count = len(containers)
@@ -1318,10 +1272,8 @@ def at_risk_shipments():
                 if container.size_type:
                     container_details.append(container.size_type)
                 
-                if container.container_size_id and container.container_type_id and days_in_demurrage > 0:
-                    projected_cost, currency = calculate_highest_projected_cost_for_container(
-                        container, days_in_demurrage
-                    )
+                if container.id in projected_costs:
+                    projected_cost, currency = projected_costs[container.id]
                     total_projected_cost += projected_cost
                     currency_code = currency
             
@@ -1354,10 +1306,7 @@ def at_risk_shipments():
                 days_left = estimated_free_time - days_since_eta
                 status_text = f"Free Period (~{max(0, days_left)} days left)"
             
-            # Get containers
-            containers = ImportContainer.query.filter_by(
-                shipment_id=shipment.ship_doc_entry_id
-            ).all()
+            containers = containers_by_shipment[shipment.ship_doc_entry_id]
             
             container_details = []
             for container in containers:
@@ -1408,41 +1357,45 @@ def critical_timeline_graph():
         demurrage_shipments, _ = categorize_shipments_by_risk(customer.id)
         
         containers_timeline = []
+        containers_by_shipment = get_containers_by_shipment(demurrage_shipments)
         
-        for shipment in demurrage_shipments:
-            # Get containers for this shipment
-            containers = ImportContainer.query.filter_by(
-                shipment_id=shipment.ship_doc_entry_id
-            ).all()
+        # Projected cost if cleared today, for all containers in one pass
+        shipment_containers = [
+            (shipment, container)
+            for shipment in demurrage_shipments
+            for container in containers_by_shipment[shipment.ship_doc_entry_id]
+        ]
+        projections = project_container_costs([
+            (container, days_in_demurrage_today(shipment)) for shipment, container in shipment_containers
+        ])
+        
+        for (shipment, container), projection in zip(shipment_containers, projections):
+            # Generate timeline segments
+            timeline_segments = get_timeline_segments_for_container(container, shipment, projection)
             
-            for container in containers:
-                # Generate timeline segments
-                timeline_segments = get_timeline_segments_for_container(container, shipment)
-                
-                # Calculate projected cost if cleared today
-                projected_cost_today, currency = calculate_projected_cost_if_cleared_today(container, shipment)
-                
-                container_data = {
-                    "container_id": container.id,
-                    "container_number": container.container_number,
-                    "size_type": container.size_type or "Unknown",
-                    "shipment_id": shipment.ship_doc_entry_id,
-                    "job_number": shipment.import_id,
-                    "bl_number": shipment.bl_no,
-                    "eta_date": shipment.eta.isoformat() if shipment.eta else None,
-                    "demurrage_from": shipment.demurrage_from.isoformat() if shipment.demurrage_from else None,
-                    "timeline_segments": [
-                        {
-                            **segment,
-                            "start_date": segment["start_date"].isoformat(),
-                            "end_date": segment["end_date"].isoformat() if segment["end_date"] else None
-                        } for segment in timeline_segments
-                    ],
-                    "projected_cost_today": f"{currency} {projected_cost_today:,.2f}",
-                    "currency": currency
-                }
-                
-                containers_timeline.append(container_data)
+            projected_cost_today, currency, _ = projection
+            
+            container_data = {
+                "container_id": container.id,
+                "container_number": container.container_number,
+                "size_type": container.size_type or "Unknown",
+                "shipment_id": shipment.ship_doc_entry_id,
+                "job_number": shipment.import_id,
+                "bl_number": shipment.bl_no,
+                "eta_date": shipment.eta.isoformat() if shipment.eta else None,
+                "demurrage_from": shipment.demurrage_from.isoformat() if shipment.demurrage_from else None,
+                "timeline_segments": [
+                    {
+                        **segment,
+                        "start_date": segment["start_date"].isoformat(),
+                        "end_date": segment["end_date"].isoformat() if segment["end_date"] else None
+                    } for segment in timeline_segments
+                ],
+                "projected_cost_today": f"{currency} {projected_cost_today:,.2f}",
+                "currency": currency
+            }
+            
+            containers_timeline.append(container_data)
         
         return jsonify({"success": True, "data": containers_timeline})
         
@@ -1477,34 +1430,37 @@ def critical_timeline():
             "demurrage_containers": []
         }
         
-        for shipment in demurrage_shipments:
+        containers_by_shipment = get_containers_by_shipment(demurrage_shipments)
+        shipment_containers = [
+            (shipment, container)
+            for shipment in demurrage_shipments
+            for container in containers_by_shipment[shipment.ship_doc_entry_id]
+        ]
+        
+        # Projected cost if cleared today, for all containers in one pass
+        projections = project_container_costs([
+            (container, days_in_demurrage_today(shipment)) for shipment, container in shipment_containers
+        ])
+        
+        for (shipment, container), (projected_cost, currency, _) in zip(shipment_containers, projections):
             days_in_demurrage = 0
             if shipment.demurrage_from:
                 days_in_demurrage = (today - shipment.demurrage_from).days
             
-            # Get containers
-            containers = ImportContainer.query.filter_by(
-                shipment_id=shipment.ship_doc_entry_id
-            ).all()
+            container_info = {
+                "container_id": container.id,
+                "container_number": container.container_number,
+                "size_type": container.size_type or "Unknown",
+                "job_number": shipment.import_id,
+                "bl_number": shipment.bl_no,
+                "days_in_demurrage": days_in_demurrage,
+                "projected_cost": f"{currency} {projected_cost:.2f}",
+                "eta_date": shipment.eta.isoformat() if shipment.eta else None,
+                "demurrage_from": shipment.demurrage_from.isoformat() if shipment.demurrage_from else None,
+                "timeline_url": f"/customer_portal/api/critical-timeline-graph?container_id={container.id}"
+            }
             
-            for container in containers:
-                # Calculate projected cost
-                projected_cost, currency = calculate_projected_cost_if_cleared_today(container, shipment)
-                
-                container_info = {
-                    "container_id": container.id,
-                    "container_number": container.container_number,
-                    "size_type": container.size_type or "Unknown",
-                    "job_number": shipment.import_id,
-                    "bl_number": shipment.bl_no,
-                    "days_in_demurrage": days_in_demurrage,
-                    "projected_cost": f"{currency} {projected_cost:.2f}",
-                    "eta_date": shipment.eta.isoformat() if shipment.eta else None,
-                    "demurrage_from": shipment.demurrage_from.isoformat() if shipment.demurrage_from else None,
-                    "timeline_url": f"/customer_portal/api/critical-timeline-graph?container_id={container.id}"
-                }
-                
-                timeline_data["demurrage_containers"].append(container_info)
+            timeline_data["demurrage_containers"].append(container_info)
         
         return jsonify({"success": True, "data": timeline_data})
         
@@ -2581,14 +2537,13 @@ def delete_entry(entry_id):
             # Delete related history records first
             ShipDocumentHistory.query.filter_by(attachment_id=attachment.id).delete()
 
-            # Delete the file from S3 if it exists
+            # Delete the file from S3 unless an attachment of another entry shares it
             if attachment.attachement_path:
                 try:
-                    delete_file_from_s3(
-                        current_app.config["S3_BUCKET_NAME"],
+                    release_attachment_file(
                         attachment.attachement_path,
+                        attachment_ids=[att.id for att in attachments],
                     )
-                    print("File deleted successfully from S3")
                 except Exception as e:
                     print(f"Error deleting file from S3: {str(e)}")
 
@@ -3019,12 +2974,13 @@ def customer_order_shipment(order_id):
         print("Fetching dropdown data")
         shipment_types = ShipmentType.query.all()
         customers = Customer.query.filter_by(id=current_user.id).all()  # Only current customer
-        billing_parties = User.query.filter_by(company_id=current_user.company_id).all()
-        sales_people = User.query.filter_by(company_id=current_user.company_id).all()
-        cs_executives = User.query.filter_by(company_id=current_user.company_id).all()
-        wharf_clerks = User.query.filter_by(company_id=current_user.company_id).all()
-        branches = Branch.query.all()
-        currencies = CurrencyMaster.query.all()
+        company_users = get_reference_data("users")
+        billing_parties = company_users
+        sales_people = company_users
+        cs_executives = company_users
+        wharf_clerks = get_reference_data("wharf_clerks")
+        branches = get_reference_data("branches")
+        currencies = get_reference_data("currencies")
         income_expenses = IncomeExpense.query.filter_by(company_id=current_user.company_id, status=True).all()
         demurrages = ShipmentDemurrage.query.filter_by(shipment_id=order_id).all()
 
@@ -3232,7 +3188,8 @@ def upload_documents():
         # Create a map of document IDs for quick lookup
         doc_map = {doc.id: doc for doc in required_docs}
 
-        # Process uploaded files
+        # Process uploaded files: validated first, then uploaded together
+        pending_files = []
         uploaded_files = []
         
         # Iterate through all form data to find file uploads
@@ -3282,61 +3239,76 @@ def upload_documents():
                                 print(f"Skipping document {doc.description} - already exists and multiple not allowed")
                                 continue
 
-                        # Proceed with file upload
-                        filename = secure_filename(file.filename)
-                        # Create S3 key with proper structure
-                        s3_key = f"{current_app.config['S3_BASE_FOLDER']}/documents/{entry_id}/{filename}"
+                        pending_files.append({
+                            'doc': doc,
+                            'file': file,
+                            'filename': secure_filename(file.filename),
+                            'note': request.form.get(note_key, ""),
+                            'expiry_date': expiry_date,
+                        })
+
+        # Upload all files to S3 in parallel under content-addressed keys
+        # (files already stored are skipped)
+        stored_files = store_attachment_files([(pending['file'], pending['filename']) for pending in pending_files])
+
+        for pending, (s3_key, content_hash) in zip(pending_files, stored_files):
+            doc = pending['doc']
+            filename = pending['filename']
+            if not s3_key:
+                # Nothing of this batch is saved. The files that did upload are
+                # content-addressed and possibly shared, so they are not deleted
+                # here: sweep_orphaned_attachments() removes the unreferenced ones
+                db.session.rollback()
+                return (
+                    jsonify(
+                        {
+                            "success": False,
+                            "message": f"Error uploading file {filename} to S3",
+                        }
+                    ),
+                    500,
+                )
 
-                        # Upload to S3
-                        if upload_file_to_s3(
-                            file, current_app.config["S3_BUCKET_NAME"], s3_key
-                        ):
-                            # Create attachment record with S3 path
-                            attachment = ShipDocumentEntryAttachment(
-                                shipDocEntryMasterID=entry_id,
-                                description=doc.description,
-                                isMandatory=doc.isMandatory,
-                                attachement_path=s3_key,  # Store S3 key instead of local path
-                                note=request.form.get(note_key, ""),
-                                expiry_date=expiry_date,  # Add expiry date
-                                user_id=current_user.id,
-                                customer_id=entry.customer_id,
-                                ship_category_id=entry.shipCategory,
-                                ship_cat_document_id=doc.id,
-                                ai_validated=0
-                            )
-                            db.session.add(attachment)
-                            db.session.flush()
-
-                            history_entry = ShipDocumentHistory(
-                                attachment_id=attachment.id,
-                                shipDocEntryMasterID=entry_id,
-                                description=doc.description,
-                                document_path=s3_key,  # Use the same S3 path as the attachment
-                                action="uploaded",
-                                note=request.form.get(note_key, ""),
-                                action_comments=f"Document upload - {'Multiple' if doc.multiple_document == 1 else 'Single'}",
-                                user_id=current_user.id,
-                                customer_id=entry.customer_id,
-                                created_at=get_sri_lanka_time()
-                            )
-                            db.session.add(history_entry)
-                            uploaded_files.append({
-                                'description': doc.description,
-                                'filename': filename,
-                                'multiple_allowed': doc.multiple_document == 1
-                            })
-                            print(f"Created attachment record for {filename} (Doc: {doc.description})")
-                        else:
-                            return (
-                                jsonify(
-                                    {
-                                        "success": False,
-                                        "message": f"Error uploading file {filename} to S3",
-                                    }
-                                ),
-                                500,
-                            )
+            # Create attachment record with S3 path
+            attachment = ShipDocumentEntryAttachment(
+                shipDocEntryMasterID=entry_id,
+                description=doc.description,
+                isMandatory=doc.isMandatory,
+                attachement_path=s3_key,  # Store S3 key instead of local path
+                content_hash=content_hash,
+                note=pending['note'],
+                expiry_date=pending['expiry_date'],  # Add expiry date
+                user_id=current_user.id,
+                customer_id=entry.customer_id,
+                ship_category_id=entry.shipCategory,
+                ship_cat_document_id=doc.id,
+                ai_validated=0
+            )
+            db.session.add(attachment)
+            db.session.flush()
+
+            # Queue AI validation - committed with the attachment below
+            enqueue_validation(attachment.id)
+
+            history_entry = ShipDocumentHistory(
+                attachment_id=attachment.id,
+                shipDocEntryMasterID=entry_id,
+                description=doc.description,
+                document_path=s3_key,  # Use the same S3 path as the attachment
+                action="uploaded",
+                note=pending['note'],
+                action_comments=f"Document upload - {'Multiple' if doc.multiple_document == 1 else 'Single'}",
+                user_id=current_user.id,
+                customer_id=entry.customer_id,
+                created_at=get_sri_lanka_time()
+            )
+            db.session.add(history_entry)
+            uploaded_files.append({
+                'description': doc.description,
+                'filename': filename,
+                'multiple_allowed': doc.multiple_document == 1
+            })
+            print(f"Created attachment record for {filename} (Doc: {doc.description})")
 
         if not uploaded_files:
             return jsonify({"success": False, "message": "No valid files were uploaded"})
@@ -3489,12 +3461,11 @@ def resubmit_document():
         else:
             expiry_date_obj = None
             
-        # Generate S3 key in the same format as upload_documents
+        # Upload to S3 under a content-addressed key, as in upload_documents
         filename = secure_filename(file.filename)
-        s3_key = f"{current_app.config['S3_BASE_FOLDER']}/documents/{entry_id}/{filename}"
+        s3_key, content_hash = store_attachment_file(file, filename)
         
-        # Upload to S3
-        if upload_file_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key):
+        if s3_key:
             # Store old path for logging and history
             old_path = document.attachement_path
             
@@ -3515,6 +3486,7 @@ def resubmit_document():
             
             # Update document record
             document.attachement_path = s3_key  # Now using S3 key format
+            document.content_hash = content_hash
             document.note = note
             document.expiry_date = expiry_date_obj
             document.docAccepted = None  # Reset to pending
@@ -3526,6 +3498,9 @@ def resubmit_document():
             document.validation_percentage = None
             document.extracted_content = None
             
+            # Re-queue AI validation for the new file
+            enqueue_validation(document.id)
+            
             # Log the resubmission
             print(f"Document {doc_id} resubmitted. Old path: {old_path}, New path: {s3_key}")
             
@@ -3827,25 +3802,23 @@ def replace_document():
         if entry.user_id != current_user.id:
             return jsonify({"success": False, "message": "Unauthorized"}), 403
 
-        # Delete the old file from S3 if it exists
-        if attachment.attachement_path:
-            try:
-                delete_file_from_s3(
-                    current_app.config["S3_BUCKET_NAME"], attachment.attachement_path
-                )
-            except Exception as e:
-                print(f"Error deleting old file from S3: {str(e)}")
-
-        # Upload the new file to S3
+        # Upload the new file to S3 under its content-addressed key
         filename = secure_filename(file.filename)
-        s3_key = (
-            f"{current_app.config['S3_BASE_FOLDER']}/documents/{entry_id}/{filename}"
-        )
-        print(f"Uploading file to S3 with key: {s3_key}")
+        s3_key, content_hash = store_attachment_file(file, filename)
+
+        if s3_key:
+            print(f"File stored in S3 with key: {s3_key}")
+            # Delete the old file from S3 unless another attachment (or the new file) uses it
+            old_path = attachment.attachement_path
+            if old_path and old_path != s3_key:
+                try:
+                    release_attachment_file(old_path, attachment_ids=[attachment.id])
+                except Exception as e:
+                    print(f"Error deleting old file from S3: {str(e)}")
 
-        if upload_file_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key):
             # Update the attachment record
             attachment.attachement_path = s3_key
+            attachment.content_hash = content_hash
             attachment.note = note
             db.session.commit()
             print(f"File uploaded successfully to S3: {s3_key}")
@@ -3920,13 +3893,11 @@ def delete_document(doc_id, entry_id):
                     print(f"S3 head_object error: {str(e)}")
                     # Continue with deletion even if head_object fails
 
-                # Delete the file
-                if delete_file_from_s3(
-                    current_app.config["S3_BUCKET_NAME"], attachment.attachement_path
-                ):
+                # Delete the file unless it is shared (the orphan sweep removes shared files)
+                if release_attachment_file(attachment.attachement_path, attachment_ids=[attachment.id]):
                     print("File deleted successfully from S3")
                 else:
-                    print("Failed to delete file from S3")
+                    print("File kept in S3 for the orphan sweep, shared or could not be deleted")
             except Exception as e:
                 print(f"Error deleting file from S3: {str(e)}")
                 # Continue with deletion even if S3 deletion fails
@@ -5840,80 +5811,9 @@ def get_material_document_alerts(material_id, shipment_id):
 @bp.route('/api/all-shipments-alert-status')
 @login_required
 def get_all_shipments_alert_status():
-    """Get alert status for all shipments to highlight rows in sea_import page"""
+    """Get alert status for the shipments on the current page (?entry_ids=...) to highlight rows in sea_import page"""
     try:
-        # Get all entries for the current customer
-        entries = ShipDocumentEntryMaster.query.filter_by(
-            company_id=current_user.company_id
-        ).all()
-        
-        print(f"Found {len(entries)} entries for customer {current_user.company_id}")
-        
-        alert_status = {}
-        
-        for entry in entries:
-            print(f"\nProcessing Entry ID: {entry.id}, DocSerial: {entry.docserial}")
-            
-            # Get the related OrderShipment to check for ETA
-            order_shipment = OrderShipment.query.filter_by(ship_doc_entry_id=entry.id).first()
-            if order_shipment:
-                print(f"  Found OrderShipment with ETA: {order_shipment.eta}")
-            else:
-                print("  No OrderShipment found")
-
-            # Determine the comparison date
-            comparison_date = None
-            if order_shipment and order_shipment.eta:
-                comparison_date = order_shipment.eta
-            elif entry.dealineDate:
-                comparison_date = entry.dealineDate
-            
-            print(f"  Comparison date set to: {comparison_date}")
-            
-            has_alerts = False
-            
-            if comparison_date:
-                # Get all shipment items for this entry
-                shipment_items = db.session.query(ShipmentItem).filter_by(
-                    shipment_id=entry.id
-                ).all()
-                print(f"  Found {len(shipment_items)} shipment items")
-                
-                for item in shipment_items:
-                    print(f"    Processing ShipmentItem ID: {item.id}")
-                    if item.po_detail_id:
-                        po_detail = PODetail.query.get(item.po_detail_id)
-                        if po_detail and po_detail.material_id:
-                            print(f"      Found PODetail with Material ID: {po_detail.material_id}")
-                            
-                            # Check if any documents expire before the comparison date
-                            expiring_docs = MaterialHSDocuments.query.filter(
-                                MaterialHSDocuments.material_id == po_detail.material_id,
-                                MaterialHSDocuments.company_id == current_user.company_id,
-                                MaterialHSDocuments.expiry_date.isnot(None),
-                                MaterialHSDocuments.expiry_date < comparison_date
-                            ).first()
-                            
-                            if expiring_docs:
-                                print(f"      ALERT: Expiring document found with expiry date {expiring_docs.expiry_date}")
-                                has_alerts = True
-                                break
-                            else:
-                                print("      No expiring document found")
-                    
-                    if has_alerts:
-                        break
-            
-            alert_status[entry.id] = {
-                'has_alerts': has_alerts,
-                'entry_id': entry.id,
-                'docserial': entry.docserial
-            }
-            print(f"  Final alert status for entry: {has_alerts}")
-        
-        print("\n--- Final Alert Status Result ---")
-        for eid, status in alert_status.items():
-            print(f"Entry ID: {eid}, Has Alerts: {status['has_alerts']}")
+        alert_status = get_entry_alert_status(entry_ids_from_request(), company_id=current_user.company_id, portal=True)
 
         return jsonify({
             'success': True,
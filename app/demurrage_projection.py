@@ -0,0 +1,222 @@
+# demurrage_projection.py
+"""
+In-memory demurrage projection engine.
+
+All active rate cards and their tiers are loaded in one pass into an index
+keyed by (container size, container type, demurrage reason). Each rate card
+is turned into a cumulative cost curve, so the cost of N chargeable days is
+an array lookup, and a customer's whole container set is projected with one
+numpy pass per size/type.
+
+Tiers are applied in tier_number order over their from_day/to_day ranges (a
+tier without to_day takes all remaining days), as the masters rate
+calculator always did.
+
+The engine is cached per process and rebuilt when the rate card, tier or
+reason tables change (row count or latest updated_at); that check runs once
+per request.
+"""
+import threading
+from collections import defaultdict
+
+import numpy as np
+from flask import g, has_request_context
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.extensions import db
+from app.models.demurrage import DemurrageRateCard, DemurrageRateCardTier, DemurrageReasons
+
+
+DEFAULT_CURRENCY = "LKR"
+
+_engine = None  # (signature, DemurrageProjectionEngine)
+_engine_lock = threading.Lock()
+
+
+class RateCardCurve:
+    """Cumulative cost curve of one rate card"""
+
+    def __init__(self, rate_card):
+        self.rate_card_id = rate_card.id
+        self.rate_card_name = rate_card.rate_card_name
+        self.company_id = rate_card.company_id
+        self.currency_id = rate_card.currency_id
+        self.currency_code = rate_card.currency.CurrencyCode if rate_card.currency else DEFAULT_CURRENCY
+
+        # (tier_number, first_day, last_day or None, rate, day_range): the chargeable
+        # days each tier covers when the days run on without limit
+        self.segments = []
+        current_day = 1
+        for tier in sorted(rate_card.tiers, key=lambda t: t.tier_number):
+            tier_start = tier.from_day
+            if current_day > tier_start:
+                if tier.to_day and current_day > tier.to_day:
+                    continue
+                tier_start = current_day
+
+            if not tier.to_day:
+                self.segments.append((tier.tier_number, current_day, None, tier.rate_amount, tier.day_range_display))
+                break
+
+            length = tier.to_day - tier_start + 1
+            if length > 0:
+                last_day = current_day + length - 1
+                self.segments.append((tier.tier_number, current_day, last_day, tier.rate_amount, tier.day_range_display))
+                current_day = last_day + 1
+
+        # cumulative[d] is the cost of d days up to the last bounded day; beyond it
+        # every day costs tail_rate (0 when the last tier is bounded)
+        self.last_day = current_day - 1
+        self.tail_rate = 0.0
+        self.cumulative = np.zeros(self.last_day + 1)
+        total = 0.0
+        for _, first_day, last_day, rate, _ in self.segments:
+            if last_day is None:
+                self.tail_rate = rate
+                break
+            self.cumulative[first_day:last_day + 1] = total + np.arange(1, last_day - first_day + 2) * rate
+            total += (last_day - first_day + 1) * rate
+
+    @property
+    def has_tiers(self):
+        return bool(self.segments)
+
+    def cost(self, days):
+        """Cost of the given number of chargeable days"""
+        if days <= 0:
+            return 0.0
+        if days <= self.last_day:
+            return float(self.cumulative[days])
+        return float(self.cumulative[self.last_day] + (days - self.last_day) * self.tail_rate)
+
+    def costs(self, days):
+        """cost() for an array of day counts"""
+        days = np.asarray(days, dtype=np.int64)
+        return self.cumulative[np.clip(days, 0, self.last_day)] + np.maximum(days - self.last_day, 0) * self.tail_rate
+
+    def breakdown(self, days):
+        """[{tier, days, rate, amount, day_range}] for the given number of chargeable days"""
+        tiers = []
+        for tier_number, first_day, last_day, rate, day_range in self.segments:
+            if days < first_day:
+                break
+            days_in_tier = days - first_day + 1 if last_day is None else min(days, last_day) - first_day + 1
+            tiers.append({
+                "tier": tier_number,
+                "days": days_in_tier,
+                "rate": rate,
+                "amount": days_in_tier * rate,
+                "day_range": day_range,
+            })
+        return tiers
+
+
+class DemurrageProjectionEngine:
+    def __init__(self, rate_cards, reason_ids):
+        self.reason_ids = list(reason_ids)
+        self.curves = {}
+        self._index = defaultdict(list)  # (size, type, reason) -> curves, by rate card id
+        for rate_card in sorted(rate_cards, key=lambda rc: rc.id):
+            curve = RateCardCurve(rate_card)
+            self.curves[rate_card.id] = curve
+            key = (rate_card.container_size_id, rate_card.container_type_id, rate_card.demurrage_reason_id)
+            self._index[key].append(curve)
+        self._candidates = {}
+
+    def find_rate_card(self, size_id, type_id, reason_id, company_id=None):
+        """The company's rate card for the combination, else the general (company-less) one"""
+        curves = self._index.get((size_id, type_id, reason_id), ())
+        for wanted in ((company_id, None) if company_id else (None,)):
+            for curve in curves:
+                if curve.company_id == wanted:
+                    return curve
+        return None
+
+    def candidates(self, size_id, type_id):
+        """First rate card with tiers for each active reason, for a container size/type"""
+        key = (size_id, type_id)
+        if key not in self._candidates:
+            curves = []
+            for reason_id in self.reason_ids:
+                matches = self._index.get((size_id, type_id, reason_id))
+                if matches and matches[0].has_tiers:
+                    curves.append(matches[0])
+            self._candidates[key] = curves
+        return self._candidates[key]
+
+    def highest_costs(self, items):
+        """
+        Highest projected cost across active reasons for [(size_id, type_id, days)].
+        Returns [(cost, currency_code, curve)] in the same order; curve is None
+        when nothing is chargeable.
+        """
+        results = [(0.0, DEFAULT_CURRENCY, None)] * len(items)
+
+        positions_by_key = defaultdict(list)
+        for position, (size_id, type_id, days) in enumerate(items):
+            if size_id and type_id and days > 0:
+                positions_by_key[(size_id, type_id)].append(position)
+
+        for (size_id, type_id), positions in positions_by_key.items():
+            curves = self.candidates(size_id, type_id)
+            if not curves:
+                continue
+            days = np.array([items[position][2] for position in positions])
+            costs = np.vstack([curve.costs(days) for curve in curves])
+            best = costs.argmax(axis=0)  # first reason wins a tie
+            for column, position in enumerate(positions):
+                cost = float(costs[best[column], column])
+                if cost > 0:
+                    curve = curves[best[column]]
+                    results[position] = (cost, curve.currency_code, curve)
+        return results
+
+    def highest_cost(self, size_id, type_id, days):
+        return self.highest_costs([(size_id, type_id, days)])[0]
+
+
+def _signature():
+    columns = []
+    for model in (DemurrageRateCard, DemurrageRateCardTier, DemurrageReasons):
+        columns.append(select(func.count(model.id)).scalar_subquery())
+        columns.append(select(func.max(model.updated_at)).scalar_subquery())
+    return tuple(db.session.query(*columns).one())
+
+
+def _build_engine():
+    rate_cards = (
+        DemurrageRateCard.query.options(selectinload(DemurrageRateCard.tiers), joinedload(DemurrageRateCard.currency))
+        .filter(DemurrageRateCard.is_active == True)
+        .all()
+    )
+    reason_ids = [
+        reason_id
+        for reason_id, in db.session.query(DemurrageReasons.id)
+        .filter(DemurrageReasons.is_active == True)
+        .order_by(DemurrageReasons.id)
+    ]
+    print(f"Built demurrage projection engine: {len(rate_cards)} rate cards, {len(reason_ids)} reasons")
+    return DemurrageProjectionEngine(rate_cards, reason_ids)
+
+
+def get_projection_engine():
+    """Projection engine for the current rate cards, shared by the process"""
+    global _engine
+
+    if has_request_context() and "_demurrage_projection" in g:
+        return g._demurrage_projection
+
+    signature = _signature()
+    with _engine_lock:
+        cached = _engine
+    if cached and cached[0] == signature:
+        engine = cached[1]
+    else:
+        engine = _build_engine()
+        with _engine_lock:
+            _engine = (signature, engine)
+
+    if has_request_context():
+        g._demurrage_projection = engine
+    return engine
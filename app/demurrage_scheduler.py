@@ -1,28 +1,28 @@
-from datetime import datetime, timedelta, date
-from sqlalchemy import and_
+from collections import defaultdict
 from app.utils import get_sri_lanka_time
-from app.models.demurrage import NonWorkingDay, CompanyDemurrageConfig
+from app.working_calendar import WorkingCalendar, get_working_calendar, get_working_calendars
+from app.models.demurrage import CompanyDemurrageConfig
 from app.models.company import CompanyInfo
 from app.models.cha import OrderShipment
 from app import db
+from flask import current_app
 
 
-def is_working_day(check_date, country_id):
+# Shipment ids per bulk UPDATE statement
+UPDATE_BATCH_SIZE = 1000
+DEFAULT_FREE_DEMURRAGE_DAYS = 3
+
+
+def is_working_day(check_date, country_id, calendar=None):
     """
     Check if a given date is a working day for a specific country
     Returns True if it's a working day, False if it's a non-working day
     """
-    non_working_day = NonWorkingDay.query.filter(
-        and_(
-            NonWorkingDay.date == check_date,
-            NonWorkingDay.country_id == country_id,
-            NonWorkingDay.is_active == True
-        )
-    ).first()
-    
-    return non_working_day is None
+    if calendar is None:
+        calendar = get_working_calendar(country_id)
+    return calendar.is_working_day(check_date)
 
-def calculate_demurrage_start_date(eta_date, country_id, free_days=3):
+def calculate_demurrage_start_date(eta_date, country_id, free_days=3, calendar=None):
     """
     Calculate the date when demurrage starts based on ETA and free working days
     
@@ -30,36 +30,28 @@ def calculate_demurrage_start_date(eta_date, country_id, free_days=3):
         eta_date: The ETA date of the shipment
         country_id: Country ID to check non-working days
         free_days: Number of free working days (default: 3)
+        calendar: WorkingCalendar for the country (the cached one if not given)
     
     Returns:
         Date when demurrage starts
     """
-    print(f"Calculating demurrage start date for ETA: {eta_date}, Country ID: {country_id}")
-    
-    current_date = eta_date.date() if isinstance(eta_date, datetime) else eta_date
-    working_days_counted = 0
-    
-    print(f"Starting from ETA date: {current_date}")
-    
-    while working_days_counted < free_days:
-        current_date += timedelta(days=1)
-        
-        if is_working_day(current_date, country_id):
-            working_days_counted += 1
-            print(f"Working day #{working_days_counted}: {current_date}")
-        else:
-            print(f"Non-working day skipped: {current_date}")
-    
-    # The demurrage starts at the beginning of the next working day
-    demurrage_start_date = current_date + timedelta(days=1)
-    
-    # Find the next working day if the calculated date falls on a non-working day
-    while not is_working_day(demurrage_start_date, country_id):
-        demurrage_start_date += timedelta(days=1)
-        print(f"Demurrage start date adjusted (non-working day): {demurrage_start_date}")
-    
-    print(f"Final demurrage start date: {demurrage_start_date}")
-    return demurrage_start_date
+    if calendar is None:
+        calendar = get_working_calendar(country_id)
+
+    # Demurrage starts on the first working day after the free working days
+    return calendar.add_working_days(eta_date, (free_days or 0) + 1)
+
+def _free_days_by_country():
+    """Free demurrage days of each country's first active config"""
+    free_days = {}
+    configs = (
+        db.session.query(CompanyDemurrageConfig.country_id, CompanyDemurrageConfig.demurrage_days_threshold)
+        .filter(CompanyDemurrageConfig.is_active == True)
+        .order_by(CompanyDemurrageConfig.id)
+    )
+    for country_id, threshold in configs:
+        free_days.setdefault(country_id, threshold)
+    return free_days
 
 def daily_demurrage_check():
     """
@@ -70,8 +62,6 @@ def daily_demurrage_check():
     print("DAILY DEMURRAGE CHECK STARTED")
     print("=" * 50)
     
-    # Configuration
-    
     try:
         # Get current Sri Lankan time and date
         current_sri_lanka_time = get_sri_lanka_time()
@@ -80,84 +70,78 @@ def daily_demurrage_check():
         print(f"Current Sri Lanka time: {current_sri_lanka_time}")
         print(f"Current date: {current_date}")
         
-        # Get all shipments that are not yet marked for demurrage
-        shipments = OrderShipment.query.filter(
-            OrderShipment.is_demurrage == False
-        ).all()
-        
+        # Shipments not yet marked for demurrage, grouped by company
+        shipments = (
+            db.session.query(OrderShipment.id, OrderShipment.eta, OrderShipment.company_id)
+            .filter(OrderShipment.is_demurrage == False)
+            .all()
+        )
         print(f"Found {len(shipments)} shipments to check for demurrage")
-        
-        demurrage_count = 0
-        
-        for shipment in shipments:
-            print(f"\n--- Checking Shipment ID: {shipment.id} ---")
-            print(f"BL Number: {shipment.bl_no}")
-            print(f"Vessel: {shipment.vessel}")
-            print(f"ETA: {shipment.eta}")
-            print(f"Company ID: {shipment.company_id}")
-            
-            # Skip if ETA is None
-            if not shipment.eta:
-                print("Skipping: ETA is None")
+
+        shipments_by_company = defaultdict(list)
+        skipped_no_eta = 0
+        for shipment_id, eta, company_id in shipments:
+            if not eta:
+                skipped_no_eta += 1
                 continue
-            
-            # Get company information to find country
-            company = CompanyInfo.query.get(shipment.company_id)
-            if not company:
-                print(f"Warning: Company not found for ID {shipment.company_id}")
+            shipments_by_company[company_id].append((shipment_id, eta))
+        if skipped_no_eta:
+            print(f"Skipping {skipped_no_eta} shipments with no ETA")
+
+        # Company -> country and free days are loaded once per run
+        company_countries = dict(
+            db.session.query(CompanyInfo.id, CompanyInfo.country)
+            .filter(CompanyInfo.id.in_(list(shipments_by_company)))
+            .all()
+        ) if shipments_by_company else {}
+        free_days_by_country = _free_days_by_country()
+        # All countries' calendars at once: outside a request get_working_calendar
+        # would re-check the cache signature for every company
+        calendars = get_working_calendars()
+
+        # demurrage_from date -> shipment ids entering demurrage
+        due = defaultdict(list)
+        for company_id, company_shipments in shipments_by_company.items():
+            if company_id not in company_countries:
+                print(f"Warning: Company not found for ID {company_id}")
                 continue
 
-            country_id = company.country
-            print(f"Company: {company.company_name}")
-            print(f"Country ID: {country_id}")
-
-            Country_demurrage_data = (
-                CompanyDemurrageConfig.query
-                .filter_by(country_id=country_id, is_active=True)
-                .first()
-            )
-
-            if Country_demurrage_data:
-                FREE_DEMURRAGE_DAYS = Country_demurrage_data.demurrage_days_threshold
-                print(f"Free demurrage days for country: {FREE_DEMURRAGE_DAYS}")
-            else:
-                FREE_DEMURRAGE_DAYS = 3  # or some default value
-                print("No specific demurrage config found, using default 3 days")
-
-            
-            
-            
-            # Calculate when demurrage should start for this shipment
-            demurrage_start_date = calculate_demurrage_start_date(
-                shipment.eta, 
-                country_id, 
-                FREE_DEMURRAGE_DAYS
-            )
-            
-            print(f"Demurrage starts on: {demurrage_start_date}")
-            print(f"Current date: {current_date}")
-            
-            # Check if current date is on or after demurrage start date
-            if current_date >= demurrage_start_date:
-                print(f"DEMURRAGE TRIGGERED for Shipment ID: {shipment.id}")
-                
-                # Update the shipment to mark it as in demurrage
-                shipment.is_demurrage = True
-                shipment.updated_at = current_sri_lanka_time
-                shipment.demurrage_from = demurrage_start_date
-                
-                demurrage_count += 1
-                
-                print(f"Updated shipment {shipment.id} - is_demurrage set to True")
-            else:
-                days_remaining = (demurrage_start_date - current_date).days
-                print(f"Not in demurrage yet. {days_remaining} days remaining.")
+            country_id = company_countries[company_id]
+            calendar = calendars.get(country_id) or WorkingCalendar()
+            free_days = free_days_by_country.get(country_id, DEFAULT_FREE_DEMURRAGE_DAYS)
+
+            for shipment_id, eta in company_shipments:
+                demurrage_start_date = calendar.add_working_days(eta, free_days + 1)
+                if current_date >= demurrage_start_date:
+                    due[demurrage_start_date].append(shipment_id)
+
+        demurrage_count = 0
+        for demurrage_start_date, shipment_ids in due.items():
+            for i in range(0, len(shipment_ids), UPDATE_BATCH_SIZE):
+                batch = shipment_ids[i:i + UPDATE_BATCH_SIZE]
+                demurrage_count += (
+                    OrderShipment.query
+                    .filter(OrderShipment.id.in_(batch), OrderShipment.is_demurrage == False)
+                    .update(
+                        {
+                            OrderShipment.is_demurrage: True,
+                            OrderShipment.demurrage_from: demurrage_start_date,
+                            OrderShipment.updated_at: current_sri_lanka_time,
+                        },
+                        synchronize_session=False,
+                    )
+                )
         
         # Commit all changes to database
         if demurrage_count > 0:
             db.session.commit()
             print(f"\nDatabase updated successfully!")
             print(f"Total shipments moved to demurrage: {demurrage_count}")
+            if current_app.config.get("DASHBOARD_ROLLUPS", False):
+                from app.shipment_rollups import mark_shipment_rollups_stale
+
+                # The bulk UPDATE bypassed the rollup's mapper events
+                mark_shipment_rollups_stale()
         else:
             print(f"\nNo shipments moved to demurrage today.")
         
@@ -0,0 +1,126 @@
+# document_alerts.py
+"""
+Document-expiry alerts for the orders (CHA) and shipments (customer portal)
+tables.
+
+An entry has an alert when a material document of any of its shipment items
+(shipment item -> PO detail -> material HS documents) expires before the
+entry's comparison date: the ETA of its shipment, or its deadline when there
+is no ETA. This is computed for a whole page of entries with one EXISTS
+query. With DOCUMENT_ALERTS_MATERIALIZED the endpoints read the nightly
+entry_document_alerts snapshot instead.
+"""
+from flask import current_app, request
+from sqlalchemy import and_, exists, func, literal, select
+
+from app.extensions import db
+from app.models.cha import OrderShipment, ShipDocumentEntryMaster
+from app.models.po import EntryDocumentAlert, MaterialHSDocuments, PODetail, ShipmentItem
+from app.utils import get_sri_lanka_time
+
+
+def _alert_expression(company_documents_only=False, eta_as_date=True):
+    """Correlated EXISTS over ShipDocumentEntryMaster: True when the entry has an alert"""
+    eta = (
+        select(OrderShipment.eta)
+        .where(OrderShipment.ship_doc_entry_id == ShipDocumentEntryMaster.id)
+        .order_by(OrderShipment.id)
+        .limit(1)
+        .correlate(ShipDocumentEntryMaster)
+        .scalar_subquery()
+    )
+    if eta_as_date:
+        eta = func.date(eta)
+    comparison_date = func.coalesce(eta, ShipDocumentEntryMaster.dealineDate)
+
+    conditions = [
+        ShipmentItem.shipment_id == ShipDocumentEntryMaster.id,
+        PODetail.id == ShipmentItem.po_detail_id,
+        MaterialHSDocuments.material_id == PODetail.material_id,
+        MaterialHSDocuments.expiry_date.isnot(None),
+        MaterialHSDocuments.expiry_date < comparison_date,
+    ]
+    if company_documents_only:
+        conditions.append(MaterialHSDocuments.company_id == ShipDocumentEntryMaster.company_id)
+
+    return exists().where(and_(*conditions)).correlate(ShipDocumentEntryMaster)
+
+
+def _format(rows):
+    return {
+        entry_id: {
+            'has_alerts': bool(has_alerts),
+            'entry_id': entry_id,
+            'docserial': docserial
+        }
+        for entry_id, docserial, has_alerts in rows
+    }
+
+
+def entry_ids_from_request():
+    """Entry ids of the current table page (?entry_ids=1,2,3), or None for all"""
+    value = request.args.get('entry_ids')
+    if value is None:
+        return None
+    return [int(entry_id) for entry_id in value.split(',') if entry_id.strip().isdigit()]
+
+
+def get_entry_alert_status(entry_ids=None, company_id=None, portal=False):
+    """
+    {entry_id: {'has_alerts', 'entry_id', 'docserial'}} for the given entries
+    (all entries if None).
+
+    On the customer portal (portal=True) only the entries of company_id (those
+    without a company when it is None) and their company's own documents
+    count, and the ETA is compared with its time of day as before; on the CHA
+    side every document counts against the ETA date.
+    """
+    if entry_ids is not None and not entry_ids:
+        return {}
+
+    materialized = current_app.config.get("DOCUMENT_ALERTS_MATERIALIZED", False)
+    if materialized:
+        alert_column = EntryDocumentAlert.has_company_alerts if portal else EntryDocumentAlert.has_alerts
+        query = db.session.query(
+            ShipDocumentEntryMaster.id,
+            ShipDocumentEntryMaster.docserial,
+            func.coalesce(alert_column, literal(False)),
+        ).outerjoin(EntryDocumentAlert, EntryDocumentAlert.entry_id == ShipDocumentEntryMaster.id)
+    else:
+        query = db.session.query(
+            ShipDocumentEntryMaster.id,
+            ShipDocumentEntryMaster.docserial,
+            _alert_expression(company_documents_only=portal, eta_as_date=not portal),
+        )
+
+    if portal:
+        query = query.filter(ShipDocumentEntryMaster.company_id == company_id)
+    if entry_ids is not None:
+        query = query.filter(ShipDocumentEntryMaster.id.in_(list(entry_ids)))
+
+    return _format(query.all())
+
+
+def refresh_entry_document_alerts():
+    """Rebuild the entry_document_alerts snapshot in one INSERT ... SELECT (nightly job)"""
+    snapshot = select(
+        ShipDocumentEntryMaster.id,
+        ShipDocumentEntryMaster.company_id,
+        _alert_expression(),
+        _alert_expression(company_documents_only=True, eta_as_date=False),
+        literal(get_sri_lanka_time()),
+    )
+    try:
+        EntryDocumentAlert.query.delete(synchronize_session=False)
+        db.session.execute(
+            EntryDocumentAlert.__table__.insert().from_select(
+                ['entry_id', 'company_id', 'has_alerts', 'has_company_alerts', 'refreshed_at'],
+                snapshot,
+            )
+        )
+        db.session.commit()
+        print("Entry document alerts refreshed")
+    except Exception as e:
+        db.session.rollback()
+        print(f"ERROR refreshing entry document alerts: {str(e)}")
+        raise
@@ -0,0 +1,465 @@
+# document_rules.py
+"""
+Compiled document classification and field extraction rules.
+
+Classification keywords of every document type are compiled into one
+Aho-Corasick automaton, so a document is classified with a single scan of
+its lower-cased text however many types and keywords are configured. The
+regex patterns of each section/field are precompiled once (see FieldPatterns).
+
+The default rules are compiled at import. A shipment category can override
+document types and fields in ship_category_document_rules; its rules are
+compiled once per process and recompiled only when the row's version changes.
+"""
+import re
+import json
+import threading
+from collections import deque
+
+from app.extensions import db
+from app.models.validation import ShipCategoryDocumentRules
+
+
+# Weighted keywords per document type: each positive keyword found in the text
+# adds its weight to the type's score, each negative one subtracts the penalty
+DEFAULT_DOCUMENT_TYPES = {
+    "invoice": {
+        "positive": {
+            "invoice": 5,
+            "bill": 3,
+            "payment": 2,
+            "amount due": 3,
+            "total amount": 2,
+            "invoice number": 3,
+            "invoice date": 3,
+            "due date": 2,
+            "tax": 2,
+            "subtotal": 2,
+            "balance due": 2,
+            "payment terms": 2,
+            "invoice to": 3,
+            "bill to": 3,
+            "customer": 1,
+            "client": 1,
+            "items": 1,
+            "quantity": 1,
+            "unit price": 2,
+            "total": 2,
+            "vat": 1,
+            "gst": 1,
+            "tax amount": 2,
+            "net amount": 2,
+            "grand total": 2,
+        },
+        "negative": [
+            "bill of lading",
+            "shipping",
+            "freight",
+            "cargo",
+            "vessel",
+            "port",
+            "consignee",
+            "shipper",
+            "carrier",
+            "voyage",
+            "container",
+            "seal",
+            "manifest",
+        ],
+    },
+    "bill of lading": {
+        "positive": {
+            "bill of lading": 5,
+            "shipping": 3,
+            "freight": 3,
+            "cargo": 3,
+            "vessel": 3,
+            "port": 3,
+            "consignee": 3,
+            "shipper": 3,
+            "carrier": 3,
+            "voyage": 3,
+            "container": 3,
+            "seal": 3,
+            "manifest": 3,
+            "loading": 2,
+            "discharge": 2,
+            "destination": 2,
+            "origin": 2,
+            "weight": 2,
+            "measurement": 2,
+            "packages": 2,
+            "description": 2,
+        },
+        "negative": [
+            "invoice",
+            "payment",
+            "amount due",
+            "tax",
+            "subtotal",
+            "balance due",
+            "payment terms",
+            "unit price",
+            "vat",
+            "gst",
+        ],
+    },
+    "receipt": {
+        "positive": {
+            "receipt": 5,
+            "payment received": 3,
+            "paid": 3,
+            "payment confirmation": 3,
+            "transaction": 2,
+            "payment date": 2,
+            "payment method": 2,
+            "reference number": 2,
+            "amount paid": 2,
+            "received by": 2,
+            "cash": 1,
+            "credit card": 1,
+            "debit card": 1,
+            "bank transfer": 1,
+        },
+        "negative": [
+            "bill of lading",
+            "shipping",
+            "freight",
+            "cargo",
+            "vessel",
+            "port",
+        ],
+    },
+}
+
+# Extraction patterns per section and field, each with one capture group for the value
+DEFAULT_FIELD_PATTERNS = {
+    "header": {
+        "invoice": [
+            r"(?i)invoice\s*(?:number|no|#)?[:#]?\s*(\w+)",
+            r"(?i)inv\.?\s*(?:number|no|#)?[:#]?\s*(\w+)",
+            r"(?i)invoice\s*(?:number|no|#)?[:#]?\s*(\d+)",
+            r"(?i)invoice\s*(?:number|no|#)?[:#]?\s*([A-Z0-9-]+)",
+        ],
+        "date": [
+            r"(?i)(?:date|dated)[:#]?\s*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
+            r"(?i)(?:date|dated)[:#]?\s*(\d{1,2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{2,4})",
+            r"(?i)(?:date|dated)[:#]?\s*(\d{1,2}\s+\d{1,2}\s+\d{2,4})",
+            r"(?i)(?:date|dated)[:#]?\s*((?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{1,2},?\s+\d{2,4})",
+        ],
+        "from": [
+            r"(?i)from[:#]?\s*([^\n]+)",
+            r"(?i)sender[:#]?\s*([^\n]+)",
+            r"(?i)issued by[:#]?\s*([^\n]+)",
+            r"(?i)company[:#]?\s*([^\n]+)",
+        ],
+        "to": [
+            r"(?i)(?:to|bill to)[:#]?\s*([^\n]+)",
+            r"(?i)(?:recipient|client)[:#]?\s*([^\n]+)",
+            r"(?i)(?:customer|buyer)[:#]?\s*([^\n]+)",
+            r"(?i)(?:sold to|shipped to)[:#]?\s*([^\n]+)",
+        ],
+        "company": [
+            r"(?i)company[:#]?\s*([^\n]+)",
+            r"(?i)organization[:#]?\s*([^\n]+)",
+            r"(?i)business[:#]?\s*([^\n]+)",
+            r"(?i)vendor[:#]?\s*([^\n]+)",
+        ],
+    },
+    "body": {
+        "description": [
+            r"(?i)description[:#]?\s*([^\n]+)",
+            r"(?i)item[:#]?\s*([^\n]+)",
+            r"(?i)product[:#]?\s*([^\n]+)",
+            r"(?i)service[:#]?\s*([^\n]+)",
+            r"(?i)goods[:#]?\s*([^\n]+)",
+        ],
+        "quantity": [
+            r"(?i)quantity[:#]?\s*(\d+)",
+            r"(?i)qty[:#]?\s*(\d+)",
+            r"(?i)amount[:#]?\s*(\d+)",
+            r"(?i)units[:#]?\s*(\d+)",
+            r"(?i)number of[:#]?\s*(\d+)",
+        ],
+        "price": [
+            r"(?i)(?:price|rate)[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)(?:unit price|unit cost)[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)(?:cost|amount)[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)(?:price per unit)[:#]?\s*(\d+(?:\.\d{2})?)",
+        ],
+        "amount": [
+            r"(?i)amount[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)total[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)sum[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)(?:line total|item total)[:#]?\s*(\d+(?:\.\d{2})?)",
+        ],
+        "tax": [
+            r"(?i)(?:tax|vat|gst)[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)(?:tax rate|vat rate)[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)(?:tax amount|vat amount)[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)(?:sales tax|value added tax)[:#]?\s*(\d+(?:\.\d{2})?)",
+        ],
+    },
+    "footer": {
+        "total": [
+            r"(?i)total[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)grand total[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)final amount[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)(?:subtotal|net amount)[:#]?\s*(\d+(?:\.\d{2})?)",
+        ],
+        "tax": [
+            r"(?i)(?:tax|vat|gst)[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)(?:total tax|total vat)[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)(?:tax amount|vat amount)[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)(?:total tax amount|total vat amount)[:#]?\s*(\d+(?:\.\d{2})?)",
+        ],
+        "grand_total": [
+            r"(?i)(?:grand total|final amount)[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)(?:total amount|final total)[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)(?:amount due|balance due)[:#]?\s*(\d+(?:\.\d{2})?)",
+            r"(?i)(?:total payable|amount payable)[:#]?\s*(\d+(?:\.\d{2})?)",
+        ],
+        "payment_terms": [
+            r"(?i)payment terms[:#]?\s*([^\n]+)",
+            r"(?i)terms[:#]?\s*([^\n]+)",
+            r"(?i)payment conditions[:#]?\s*([^\n]+)",
+            r"(?i)(?:payment method|payment mode)[:#]?\s*([^\n]+)",
+        ],
+        "due_date": [
+            r"(?i)due date[:#]?\s*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
+            r"(?i)payment due[:#]?\s*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
+            r"(?i)due by[:#]?\s*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
+            r"(?i)payment date[:#]?\s*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
+        ],
+    },
+}
+
+NEGATIVE_KEYWORD_PENALTY = 1
+
+_rules_cache = {}
+_rules_cache_lock = threading.Lock()
+
+
+class AhoCorasick:
+    """Automaton finding which of a set of keywords occur in a text, in one pass"""
+
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]  # keyword indexes ending at each state
+
+        for keyword_index, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(keyword_index)
+
+        # Breadth-first, so a state's failure link is final before its children's
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child].extend(self._output[self._fail[child]])
+
+    def found(self, text):
+        """Indexes of the keywords occurring in the text"""
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+def _scoped(pattern):
+    """Pattern as a group of an alternation, turning leading global flags like (?i) into scoped ones"""
+    match = re.match(r"\(\?([aiLmsux]+)\)", pattern)
+    if match:
+        return f"(?{match.group(1)}:{pattern[match.end():]})"
+    return f"(?:{pattern})"
+
+
+# Group references that would point at another pattern's groups once patterns are combined
+GROUP_REFERENCE = re.compile(r"\\[1-9]|\(\?P[<=]|\(\?\(")
+
+
+class FieldPatterns:
+    """
+    A field's list of patterns, each with one capture group for the value.
+
+    first_value() keeps the list's precedence: the first listed pattern that
+    matches anywhere wins, as header and footer fields expect. values() finds
+    every match with one regex alternating all the patterns, each wrapped in
+    its own group, so the text is scanned once rather than once per pattern.
+    Where patterns overlap, the leftmost match wins (the first listed pattern
+    on a tie), so overlapping matches of later patterns are not collected.
+    Patterns using group numbers, names or conditionals cannot be combined
+    without changing their meaning; with those, values() searches pattern by
+    pattern.
+    """
+
+    def __init__(self, regexes):
+        self.regexes = regexes
+        self.combined = None
+        if len(regexes) > 1 and not any(GROUP_REFERENCE.search(regex.pattern) for regex in regexes):
+            try:
+                self.combined = re.compile("|".join(f"({_scoped(regex.pattern)})" for regex in regexes))
+            except re.error as e:
+                print(f"Searching field patterns one by one, they cannot be combined: {str(e)}")
+
+    def first_value(self, text):
+        for regex in self.regexes:
+            match = regex.search(text)
+            if match:
+                return match.group(1)
+        return None
+
+    def values(self, text):
+        """Values of all matches, in document order when the patterns are combined"""
+        if self.combined is not None:
+            # The wrapper group of the matching pattern closes last, its own first group follows it
+            return [match.group(match.lastindex + 1) for match in self.combined.finditer(text)]
+        return [match.group(1) for regex in self.regexes for match in regex.finditer(text)]
+
+
+def compile_field_patterns(patterns):
+    """FieldPatterns of a field's usable patterns, or None if there are none"""
+    regexes = []
+    for pattern in patterns:
+        try:
+            regex = re.compile(pattern)
+        except re.error as e:
+            print(f"Skipping invalid field pattern {pattern!r}: {str(e)}")
+            continue
+        if not regex.groups:
+            print(f"Skipping field pattern without a capture group: {pattern!r}")
+            continue
+        regexes.append(regex)
+    if not regexes:
+        return None
+    return FieldPatterns(regexes)
+
+
+class DocumentRules:
+    def __init__(self, document_types=None, field_patterns=None, version=0):
+        self.version = version  # Of the category's stored rules; 0 for the defaults
+        self.document_types = DEFAULT_DOCUMENT_TYPES if document_types is None else document_types
+        self.field_patterns = DEFAULT_FIELD_PATTERNS if field_patterns is None else field_patterns
+        self.is_default = document_types is None and field_patterns is None
+
+        # keyword -> [(type index, score change)] for every type using it
+        keyword_effects = {}
+        self._type_names = list(self.document_types)
+        self._max_scores = []
+        for type_index, type_name in enumerate(self._type_names):
+            keywords = self.document_types[type_name]
+            for keyword, weight in keywords.get("positive", {}).items():
+                keyword_effects.setdefault(keyword.lower(), []).append((type_index, weight))
+            for keyword in keywords.get("negative", []):
+                keyword_effects.setdefault(keyword.lower(), []).append((type_index, -NEGATIVE_KEYWORD_PENALTY))
+            self._max_scores.append(sum(keywords.get("positive", {}).values()))
+
+        self._keyword_effects = list(keyword_effects.values())
+        self._automaton = AhoCorasick(keyword_effects)
+
+        self._field_regexes = {
+            section: {
+                field_name.lower(): compile_field_patterns(patterns)
+                for field_name, patterns in fields.items()
+            }
+            for section, fields in self.field_patterns.items()
+        }
+
+    def classify(self, text):
+        """{"type": best scoring document type or None, "confidence": score / best possible score}"""
+        scores = [0] * len(self._type_names)
+        for keyword_index in self._automaton.found(text.lower()):
+            for type_index, change in self._keyword_effects[keyword_index]:
+                scores[type_index] += change
+
+        # First type with the highest positive score, as the types are listed
+        max_score = 0
+        detected = None
+        for type_index, score in enumerate(scores):
+            if score > max_score:
+                max_score = score
+                detected = type_index
+
+        if detected is None:
+            return {"type": None, "confidence": 0}
+        total_possible_score = self._max_scores[detected]
+        confidence = max_score / total_possible_score if total_possible_score > 0 else 0
+        return {"type": self._type_names[detected], "confidence": confidence}
+
+    def field_regex(self, section, field_name):
+        """FieldPatterns of a field, or None"""
+        return self._field_regexes.get(section, {}).get(field_name.lower())
+
+
+DEFAULT_DOCUMENT_RULES = DocumentRules()
+
+
+def _merged(defaults, overrides):
+    """Defaults with the category's entries added or replacing them, key by key"""
+    if not overrides:
+        return defaults
+    merged = dict(defaults)
+    merged.update(overrides)
+    return merged
+
+
+def get_document_rules(ship_category_id):
+    """
+    Rules of a shipment category, cached per process and recompiled only when
+    the stored version changes. Categories without rules use the defaults.
+    """
+    if not ship_category_id:
+        return DEFAULT_DOCUMENT_RULES
+
+    version = (
+        db.session.query(ShipCategoryDocumentRules.version)
+        .filter_by(ship_category_id=ship_category_id)
+        .scalar()
+    )
+    if version is None:
+        return DEFAULT_DOCUMENT_RULES
+
+    with _rules_cache_lock:
+        cached = _rules_cache.get(ship_category_id)
+        if cached and cached[0] == version:
+            return cached[1]
+
+    row = ShipCategoryDocumentRules.query.filter_by(ship_category_id=ship_category_id).first()
+    document_types = json.loads(row.document_types) if row.document_types else None
+    field_patterns = json.loads(row.field_patterns) if row.field_patterns else None
+    if document_types is None and field_patterns is None:
+        rules = DEFAULT_DOCUMENT_RULES
+    else:
+        rules = DocumentRules(
+            _merged(DEFAULT_DOCUMENT_TYPES, document_types),
+            {
+                section: _merged(DEFAULT_FIELD_PATTERNS.get(section, {}), (field_patterns or {}).get(section))
+                for section in set(DEFAULT_FIELD_PATTERNS) | set(field_patterns or {})
+            },
+            version=row.version,
+        )
+    with _rules_cache_lock:
+        _rules_cache[ship_category_id] = (row.version, rules)
+    return rules
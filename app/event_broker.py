@@ -0,0 +1,179 @@
+# event_broker.py
+"""
+Publish/subscribe channel for pushing live updates to browsers over
+Server-Sent Events.
+
+Events are published to topics ("user:<id>", "thread:<id>") and delivered
+to every open /chat/events stream subscribed to them. The backend is chosen
+by EVENT_BROKER_URL:
+
+    ""                        in-process broker (single worker, tests)
+    "redis://localhost:6379/0"  Redis pub/sub, shared by all workers
+
+The in-process broker cannot reach streams held by other worker processes,
+so create_app() refuses to start without a Redis URL when WEB_CONCURRENCY
+is above 1 (check_broker_config()).
+
+Publishing never raises: a broker outage only costs live updates, the
+pages still load their state from the database.
+"""
+import json
+import time
+import queue
+import threading
+from collections import defaultdict
+
+from flask import current_app, has_app_context
+
+
+DEFAULT_HEARTBEAT_SECONDS = 20
+SUBSCRIBER_QUEUE_SIZE = 100
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+class InProcessBroker:
+    """Broker for a single process: each subscriber gets its own bounded queue"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)  # topic -> queues
+        self._lock = threading.Lock()
+
+    def publish(self, topic, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # A stalled client misses events rather than blocking the publisher
+                pass
+
+    def subscribe(self, topics):
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            for topic in topics:
+                self._subscribers[topic].add(subscriber)
+        return InProcessSubscription(self, topics, subscriber)
+
+    def _unsubscribe(self, topics, subscriber):
+        with self._lock:
+            for topic in topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+
+class InProcessSubscription:
+    def __init__(self, broker, topics, subscriber):
+        self._broker = broker
+        self._topics = topics
+        self._queue = subscriber
+
+    def get(self, timeout):
+        """Next message, or None if nothing arrived within timeout seconds"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._broker._unsubscribe(self._topics, self._queue)
+
+
+class RedisBroker:
+    """Broker backed by Redis pub/sub, so events reach streams in every worker"""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("EVENT_BROKER_URL points to Redis but the redis package is not installed")
+        self._redis = redis.Redis.from_url(url)
+
+    def publish(self, topic, message):
+        self._redis.publish(topic, message)
+
+    def subscribe(self, topics):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(*topics)
+        return RedisSubscription(pubsub)
+
+
+class RedisSubscription:
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+
+    def get(self, timeout):
+        message = self._pubsub.get_message(timeout=timeout)
+        if not message:
+            return None
+        data = message["data"]
+        return data.decode("utf-8") if isinstance(data, bytes) else data
+
+    def close(self):
+        self._pubsub.close()
+
+
+def check_broker_config(app):
+    """Fail fast when several web workers would each get their own in-process broker"""
+    if app.config.get("EVENT_BROKER_URL"):
+        return
+    workers = app.config.get("WEB_CONCURRENCY", 1)
+    if workers > 1:
+        raise RuntimeError(
+            f"WEB_CONCURRENCY is {workers} but EVENT_BROKER_URL is not set: the in-process event broker "
+            "only serves one worker. Set EVENT_BROKER_URL to a Redis URL shared by all workers."
+        )
+    if not app.debug:
+        print("WARNING: live chat/notification events use the in-process broker - run a single web "
+              "worker, or set EVENT_BROKER_URL to a Redis URL")
+
+
+def get_broker(url=None):
+    """Broker for EVENT_BROKER_URL (or the given url), shared by the process"""
+    if url is None:
+        url = current_app.config.get("EVENT_BROKER_URL", "") if has_app_context() else ""
+
+    with _brokers_lock:
+        broker = _brokers.get(url)
+        if broker is None:
+            broker = RedisBroker(url) if url else InProcessBroker()
+            _brokers[url] = broker
+        return broker
+
+
+def publish_event(topics, event, data):
+    """Send an event ({"event": ..., "data": ...}) to each topic"""
+    message = json.dumps({"event": event, "data": data}, default=str)
+    try:
+        broker = get_broker()
+        for topic in topics:
+            broker.publish(topic, message)
+    except Exception as e:
+        print(f"Error publishing {event} event: {str(e)}")
+
+
+def iter_sse(subscription, heartbeat=DEFAULT_HEARTBEAT_SECONDS, max_seconds=None):
+    """
+    Server-Sent Events stream for a subscription. A comment line is sent
+    every heartbeat seconds so proxies keep the connection open; after
+    max_seconds the stream ends and the browser reconnects on its own.
+    """
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    try:
+        yield "retry: 5000\n\n"
+        while deadline is None or time.monotonic() < deadline:
+            message = subscription.get(timeout=heartbeat)
+            if message is None:
+                yield ": ping\n\n"
+                continue
+
+            payload = json.loads(message)
+            yield f"event: {payload['event']}\ndata: {json.dumps(payload['data'])}\n\n"
+    finally:
+        subscription.close()
@@ -0,0 +1,122 @@
+# extraction_cache.py
+"""
+Persistent cache of extracted text for ShipCatDocument sample files.
+
+Entries are keyed by S3 key + ETag, so overwriting a sample at the same key
+is a cache miss. On a miss the file is downloaded once and its SHA-256 is
+looked up, so the same sample uploaded under a different key reuses the
+existing extraction instead of running PDF parsing/OCR again.
+"""
+import os
+import json
+import hashlib
+import tempfile
+from datetime import datetime
+
+from flask import current_app
+from botocore.exceptions import ClientError
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models.validation import SampleExtractionCache
+from app.utils_cha.s3_utils import get_s3_client
+from app.validation_service import extract_text_from_file, get_document_type, extract_text_features
+
+
+def _to_result(entry):
+    return {
+        "text": entry.extracted_text,
+        "document_type": json.loads(entry.document_type) if entry.document_type else None,
+        "features": json.loads(entry.features) if entry.features else {},
+        "content_hash": entry.content_hash,
+    }
+
+
+def _download_to_temp(s3_client, bucket, s3_key):
+    """Download an S3 object to a temp file (keeping its extension) and hash it"""
+    suffix = os.path.splitext(s3_key)[1]
+    fd, temp_path = tempfile.mkstemp(suffix=suffix)
+    sha256 = hashlib.sha256()
+    try:
+        body = s3_client.get_object(Bucket=bucket, Key=s3_key)["Body"]
+        with os.fdopen(fd, "wb") as temp_file:
+            for chunk in body.iter_chunks(chunk_size=1024 * 1024):
+                sha256.update(chunk)
+                temp_file.write(chunk)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return temp_path, sha256.hexdigest()
+
+
+def get_sample_extraction(s3_key, bucket=None):
+    """
+    Return {"text", "document_type", "features", "content_hash"} for a sample file,
+    extracting and caching it on first use. Returns None if the file cannot be read.
+    """
+    if not bucket:
+        bucket = current_app.config["S3_BUCKET_NAME"]
+
+    try:
+        s3_client = get_s3_client()
+        etag = s3_client.head_object(Bucket=bucket, Key=s3_key)["ETag"].strip('"')
+    except ClientError as e:
+        print(f"Error reading sample document metadata from S3: {str(e)}")
+        return None
+
+    entry = SampleExtractionCache.query.filter_by(s3_key=s3_key, etag=etag).first()
+    if entry:
+        print(f"Sample extraction cache hit: {s3_key}")
+        entry.last_used_at = datetime.utcnow()
+        db.session.commit()
+        return _to_result(entry)
+
+    print(f"Sample extraction cache miss: {s3_key}")
+    try:
+        temp_path, content_hash = _download_to_temp(s3_client, bucket, s3_key)
+    except Exception as e:
+        print(f"Error downloading sample document from S3: {str(e)}")
+        return None
+
+    try:
+        same_content = SampleExtractionCache.query.filter_by(content_hash=content_hash).first()
+        if same_content:
+            text = same_content.extracted_text
+            document_type = same_content.document_type
+            features = same_content.features
+        else:
+            text = extract_text_from_file(temp_path)
+            if not text:
+                # Do not cache failed extractions - they may be transient
+                return {"text": "", "document_type": None, "features": {}, "content_hash": content_hash}
+            document_type = json.dumps(get_document_type(text))
+            features = json.dumps(extract_text_features(text))
+    finally:
+        os.remove(temp_path)
+
+    entry = SampleExtractionCache(
+        s3_key=s3_key,
+        etag=etag,
+        content_hash=content_hash,
+        extracted_text=text,
+        document_type=document_type,
+        features=features,
+    )
+    db.session.add(entry)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker cached the same object version concurrently
+        db.session.rollback()
+
+    return _to_result(entry)
+
+
+def invalidate_sample_extraction(s3_key):
+    """Drop cached extractions for a sample key (called when the sample file is replaced)"""
+    if not s3_key:
+        return 0
+    deleted = SampleExtractionCache.query.filter_by(s3_key=s3_key).delete(synchronize_session=False)
+    print(f"Invalidated {deleted} cached extractions for {s3_key}")
+    return deleted
@@ -0,0 +1,158 @@
+# field_locator.py
+"""
+Fuzzy locator of key field names in a submitted document.
+
+The document is tokenised once into words with their character offsets, and
+every 1..MAX_FIELD_WORDS word span becomes a candidate. Words are represented
+by their character trigrams (padded, so "no" gives " no" and "no "), weighted
+by the category IDF of the word, and a span's vector is the sum of its
+words' vectors, built for all spans with one sparse product. All key field
+names are then scored against all spans with a single sparse matrix product
+of L2-normalised rows (cosine similarity).
+
+Character n-grams let "Inv. No:" or OCR'd "lnvoice Numbcr" still match
+"Invoice Number", where whole-word terms would not.
+"""
+import re
+from collections import namedtuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+
+from app.similarity_index import MAX_FIELD_WORDS, SimilarityIndex
+
+
+NGRAM_SIZE = 3
+
+WORD_PATTERN = re.compile(r"\S+")
+WORD_CHARS = re.compile(r"\w+")
+
+# text is the matched span (lower-cased words joined by spaces); start/end are
+# its character offsets in the submitted text
+FieldMatch = namedtuple("FieldMatch", ["text", "similarity", "start", "end"])
+
+
+def _normalize_word(word):
+    return "".join(WORD_CHARS.findall(word.lower()))
+
+
+def char_ngrams(word, size=NGRAM_SIZE):
+    padded = f" {word} "
+    if len(padded) <= size:
+        return [padded]
+    return [padded[i:i + size] for i in range(len(padded) - size + 1)]
+
+
+class FieldLocator:
+    def __init__(self, text, index=None, max_words=MAX_FIELD_WORDS):
+        self.index = index or SimilarityIndex()
+        self.max_words = max_words
+        self._vocabulary = {}  # trigram -> column
+        self._word_rows = {}  # normalised word -> row of the word matrix
+        self._word_entries = ([], [], [])  # rows, columns, weights of the word matrix
+
+        matches = list(WORD_PATTERN.finditer(text))
+        self.words = [match.group().lower() for match in matches]
+        self.offsets = [(match.start(), match.end()) for match in matches]
+        word_ids = [self._word_row(_normalize_word(word)) for word in self.words]
+
+        # Candidate spans in document order, shortest first at each start
+        self.spans = []
+        span_rows, span_columns = [], []
+        for start in range(len(word_ids)):
+            for end in range(start + 1, min(start + max_words, len(word_ids)) + 1):
+                span_row = len(self.spans)
+                self.spans.append((start, end))
+                span_rows.extend([span_row] * (end - start))
+                span_columns.extend(word_ids[start:end])
+
+        self._span_words = csr_matrix(
+            (np.ones(len(span_rows)), (np.asarray(span_rows, dtype=np.int64), np.asarray(span_columns, dtype=np.int64))),
+            shape=(len(self.spans), max(len(self._word_rows), 1)),
+        )
+        self._span_matrix = None
+
+    def _word_row(self, word):
+        """Row of a (normalised) word in the word matrix, adding it and its trigrams if new"""
+        row = self._word_rows.get(word)
+        if row is not None:
+            return row
+        row = self._word_rows[word] = len(self._word_rows)
+        if word:
+            weight = self.index.idf(word)
+            rows, columns, weights = self._word_entries
+            for ngram in char_ngrams(word):
+                rows.append(row)
+                columns.append(self._vocabulary.setdefault(ngram, len(self._vocabulary)))
+                weights.append(weight)
+        return row
+
+    def _word_matrix(self):
+        rows, columns, weights = self._word_entries
+        return csr_matrix(
+            (np.asarray(weights, dtype=np.float64), (np.asarray(rows, dtype=np.int64), np.asarray(columns, dtype=np.int64))),
+            shape=(max(len(self._word_rows), 1), max(len(self._vocabulary), 1)),
+        )
+
+    def locate(self, field_names):
+        """Best matching span of the text for each field name: [FieldMatch]"""
+        if not self.spans or not field_names:
+            return [FieldMatch(None, 0.0, None, None) for _ in field_names]
+
+        if self._span_matrix is None:
+            self._span_matrix = normalize(self._span_words @ self._word_matrix(), norm="l2", copy=False)
+
+        # Field names share the document's trigram columns; trigrams the document
+        # lacks cannot match anything, but still count towards the field's norm
+        field_rows, field_columns, field_weights = [], [], []
+        base_columns = max(len(self._vocabulary), 1)
+        extra_columns = {}
+        for field_row, name in enumerate(field_names):
+            for word in name.lower().split():
+                word = _normalize_word(word)
+                if not word:
+                    continue
+                weight = self.index.idf(word)
+                for ngram in char_ngrams(word):
+                    column = self._vocabulary.get(ngram)
+                    if column is None:
+                        column = extra_columns.setdefault(ngram, base_columns + len(extra_columns))
+                    field_rows.append(field_row)
+                    field_columns.append(column)
+                    field_weights.append(weight)
+
+        columns = base_columns + len(extra_columns)
+        field_matrix = normalize(
+            csr_matrix(
+                (np.asarray(field_weights, dtype=np.float64),
+                 (np.asarray(field_rows, dtype=np.int64), np.asarray(field_columns, dtype=np.int64))),
+                shape=(len(field_names), columns),
+            ),
+            norm="l2",
+            copy=False,
+        )
+        span_matrix = self._span_matrix
+        if extra_columns:
+            span_matrix = csr_matrix(
+                (span_matrix.data, span_matrix.indices, span_matrix.indptr),
+                shape=(span_matrix.shape[0], columns),
+            )
+
+        scores = (field_matrix @ span_matrix.T).toarray()  # fields x spans
+        best = scores.argmax(axis=1)
+
+        matches = []
+        for field_index, span_index in enumerate(best):
+            similarity = float(scores[field_index, span_index])
+            if similarity <= 0:
+                matches.append(FieldMatch(None, 0.0, None, None))
+                continue
+            start, end = self.spans[span_index]
+            matches.append(FieldMatch(
+                " ".join(self.words[start:end]),
+                similarity,
+                self.offsets[start][0],
+                self.offsets[end - 1][1],
+            ))
+        return matches
@@ -9,7 +9,7 @@ import uuid
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import json
-from app.utils_cha.s3_utils import upload_file_to_s3, get_s3_url, serve_s3_file
+from app.utils_cha.s3_utils import upload_batch_to_s3, get_s3_url, serve_s3_file
 from botocore.exceptions import ClientError
 
 def check_hs_permission(action='access'):
@@ -724,55 +724,64 @@ def upload_attachment():
         if 'file' not in request.files:
             return jsonify({"success": False, "message": "No file provided"}), 400
         
-        file = request.files['file']
+        # Several files may be sent under the same field
+        files = [file for file in request.files.getlist('file') if file.filename != '']
         document_id = request.form.get('document_id')
         description = request.form.get('description', '')
         
-        if file.filename == '':
+        if not files:
             return jsonify({"success": False, "message": "No file selected"}), 400
         
         # Allow document_id to be optional for initial upload
         if not document_id or document_id == '':
             document_id = None
         
-        # S3 bucket and key
+        # S3 bucket and keys
         s3_bucket = current_app.config['S3_BUCKET_NAME']  # Set this in your config
-        s3_key = f"hs_documents/{uuid.uuid4()}_{secure_filename(file.filename)}"
+        uploads = [
+            (file, f"hs_documents/{uuid.uuid4()}_{secure_filename(file.filename)}")
+            for file in files
+        ]
 
-        # Upload to S3
-        file.seek(0)
-        upload_success = upload_file_to_s3(file, s3_bucket, s3_key)
-        if not upload_success:
+        # Upload all files to S3 in parallel, or none of them
+        if not upload_batch_to_s3(uploads, s3_bucket):
             return jsonify({"success": False, "message": "Failed to upload to S3"}), 500
 
-        # Store S3 info in DB
-        attachment = HSCodeDocumentAttachment(
-            hs_code_document_id=document_id,
-            file_name=file.filename,
-            file_path=s3_key,  # Store S3 key, not local path
-            file_size=file.content_length or 0,
-            file_type=file.content_type,
-            description=description,
-            uploaded_by=current_user.id,
-            cloud_provider='s3',
-            cloud_file_id=None,
-            cloud_path=s3_key
-        )
-        db.session.add(attachment)
+        # Store S3 info in DB, all files in one transaction
+        attachments = []
+        for file, s3_key in uploads:
+            attachment = HSCodeDocumentAttachment(
+                hs_code_document_id=document_id,
+                file_name=file.filename,
+                file_path=s3_key,  # Store S3 key, not local path
+                file_size=file.content_length or 0,
+                file_type=file.content_type,
+                description=description,
+                uploaded_by=current_user.id,
+                cloud_provider='s3',
+                cloud_file_id=None,
+                cloud_path=s3_key
+            )
+            db.session.add(attachment)
+            attachments.append(attachment)
         db.session.commit()
 
-        # Generate presigned URL for viewing
-        file_url = get_s3_url(s3_bucket, s3_key)
-
-        return jsonify({
-            "success": True,
-            "message": "File uploaded successfully",
-            "attachment": {
+        # Generate presigned URLs for viewing
+        attachments_data = [
+            {
                 "id": attachment.id,
-                "file_name": file.filename,
+                "file_name": attachment.file_name,
                 "file_size": attachment.file_size,
-                "file_url": file_url
+                "file_url": get_s3_url(s3_bucket, attachment.file_path)
             }
+            for attachment in attachments
+        ]
+
+        return jsonify({
+            "success": True,
+            "message": "File uploaded successfully" if len(attachments) == 1 else f"{len(attachments)} files uploaded successfully",
+            "attachment": attachments_data[0],
+            "attachments": attachments_data
         })
     
     except Exception as e:
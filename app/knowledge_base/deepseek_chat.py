@@ -5,13 +5,14 @@ matplotlib.use('Agg')  # Set the backend to non-interactive Agg
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
-from flask import current_app
 from ..models import KnowledgeBaseMaster
+from ..llm_client import get_llm_client
 
 def generate_sql(prompt: str, kb_id: int, chat_history: list) -> str:
     """Generate SQL query from a natural language prompt using DeepSeek's API."""
-    # Get API key from app config
-    api_key = current_app.config.get('DEEPSEEK_API_KEY')
+    # The shared client sends its own key (DEEPSEEK_API_KEY) - check that one
+    client = get_llm_client()
+    api_key = client.api_key
     if not api_key:
         return "Error: DeepSeek API key not configured"
     
@@ -31,9 +32,6 @@ def generate_sql(prompt: str, kb_id: int, chat_history: list) -> str:
     print(f"Using API Key: {api_key[:10]}...")  # Log first 10 chars for debugging
     print(f"Schema info length: {len(schema_info)} characters")
 
-    API_URL = "https://api.deepseek.com/v1/chat/completions"
-    HEADERS = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-
     # Prepare messages including chat history
     messages = [
         {
@@ -68,25 +66,12 @@ def generate_sql(prompt: str, kb_id: int, chat_history: list) -> str:
         "content": prompt
     })
 
-    payload = {
-        "model": "deepseek-chat",
-        "messages": messages,
-        "temperature": 0.1
-    }
-
     try:
-        response = requests.post(API_URL, headers=HEADERS, json=payload)
-        
-        # Log the response for debugging
-        print(f"DeepSeek API Response Status: {response.status_code}")
-        print(f"DeepSeek API Response Headers: {response.headers}")
-        print(f"DeepSeek API Response Content: {response.text}")
-        
-        # Check if the response is successful
-        if response.status_code != 200:
-            return f"Error: API returned status {response.status_code}: {response.text}"
-        
-        output = response.json()
+        output = client.post("chat/completions", {
+            "model": "deepseek-chat",
+            "messages": messages,
+            "temperature": 0.1
+        })
         
         if "choices" in output and output["choices"]:
             sql = output["choices"][0]["message"]["content"].strip()
@@ -98,6 +83,8 @@ def generate_sql(prompt: str, kb_id: int, chat_history: list) -> str:
             print(f"DeepSeek API Response Structure: {output}")
             return f"Error: No SQL query generated. API response: {output}"
 
+    except requests.exceptions.HTTPError as e:
+        return f"Error: API returned status {e.response.status_code}: {e.response.text}"
     except requests.exceptions.RequestException as e:
         return f"Error: API request failed - {str(e)}"
     except Exception as e:
@@ -0,0 +1,247 @@
+# llm_client.py
+"""
+Shared DeepSeek (OpenAI-compatible) API client.
+
+All LLM calls go through one pooled requests.Session with connect/read
+timeouts, so a slow API response can no longer hold a web worker forever.
+Concurrency is bounded by a semaphore, successful responses are cached by
+a hash of the request with a TTL, and identical requests already in flight
+are coalesced onto a single HTTP call. The async helpers run the same
+client on a dedicated thread pool so a batch of prompts can be awaited
+together.
+
+The base URL comes from DEEPSEEK_API_URL, so tests can point the client at
+a local stub server:
+
+    client = LLMClient("http://127.0.0.1:8089/v1", api_key="sk-test")
+"""
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from flask import current_app, has_app_context
+
+
+# Defaults used outside an app context; see the LLM_* settings in config.py
+DEFAULT_API_URL = "https://api.deepseek.com/v1"
+DEFAULT_MODEL = "deepseek-chat"
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 60
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_CACHE_TTL_SECONDS = 3600
+DEFAULT_CACHE_MAX_ENTRIES = 1024
+DEFAULT_MAX_RETRIES = 2
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class LLMClient:
+    def __init__(
+        self,
+        base_url=DEFAULT_API_URL,
+        api_key=None,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+        read_timeout=DEFAULT_READ_TIMEOUT,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+        cache_ttl=DEFAULT_CACHE_TTL_SECONDS,
+        cache_max_entries=DEFAULT_CACHE_MAX_ENTRIES,
+        max_retries=DEFAULT_MAX_RETRIES,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.cache_ttl = cache_ttl
+        self.cache_max_entries = cache_max_entries
+        self.max_concurrency = max_concurrency
+
+        # Retry connection errors and 429/5xx with backoff; POST is retried
+        # explicitly because these endpoints have no side effects
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["POST"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._cache = OrderedDict()  # key -> (expires_at, response json)
+        self._in_flight = {}  # key -> Future shared by coalesced callers
+        self._lock = threading.Lock()
+        self._executor = None
+
+    # ------------------------------------------------------------------
+    # Cache and coalescing
+    # ------------------------------------------------------------------
+    @staticmethod
+    def cache_key(endpoint, payload):
+        raw = json.dumps({"endpoint": endpoint, "payload": payload}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key):
+        entry = self._cache.get(key)
+        if not entry:
+            return None
+        if entry[0] < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry[1]
+
+    def _cache_set(self, key, value):
+        self._cache[key] = (time.monotonic() + self.cache_ttl, value)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_max_entries:
+            self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+    def _post(self, endpoint, payload):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+
+        with self._semaphore:
+            response = self.session.post(
+                f"{self.base_url}/{endpoint}", headers=headers, json=payload, timeout=self.timeout
+            )
+        response.raise_for_status()
+        return response.json()
+
+    def post(self, endpoint, payload, use_cache=True):
+        """
+        POST a JSON payload and return the decoded response.
+        Raises requests.exceptions.RequestException on timeouts and HTTP errors.
+        """
+        if not use_cache:
+            return self._post(endpoint, payload)
+
+        key = self.cache_key(endpoint, payload)
+        with self._lock:
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not owner:
+            # An identical request is already running - wait for its result
+            return future.result()
+
+        try:
+            result = self._post(endpoint, payload)
+        except BaseException as e:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._cache_set(key, result)
+            self._in_flight.pop(key, None)
+        future.set_result(result)
+        return result
+
+    def chat(self, messages, model=DEFAULT_MODEL, temperature=0.2, use_cache=True, **params):
+        """Chat completion; returns the content of the first choice"""
+        payload = {"model": model, "messages": messages, "temperature": temperature, **params}
+        output = self.post("chat/completions", payload, use_cache=use_cache)
+        return output["choices"][0]["message"]["content"]
+
+    def embedding(self, text, model=DEFAULT_MODEL, use_cache=True):
+        output = self.post("embeddings", {"input": text, "model": model}, use_cache=use_cache)
+        return output["data"][0]["embedding"]
+
+    # ------------------------------------------------------------------
+    # asyncio
+    # ------------------------------------------------------------------
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency, thread_name_prefix="llm-client"
+                )
+            return self._executor
+
+    async def achat(self, messages, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), lambda: self.chat(messages, **kwargs))
+
+    async def aembedding(self, text, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), lambda: self.embedding(text, **kwargs))
+
+    def chat_many(self, messages_list, return_exceptions=False, **kwargs):
+        """Run several chat completions concurrently (bounded by max_concurrency)"""
+
+        async def run():
+            return await asyncio.gather(
+                *(self.achat(messages, **kwargs) for messages in messages_list),
+                return_exceptions=return_exceptions,
+            )
+
+        return asyncio.run(run())
+
+    def embedding_many(self, texts, return_exceptions=False, **kwargs):
+        """Embed several texts concurrently (bounded by max_concurrency)"""
+
+        async def run():
+            return await asyncio.gather(
+                *(self.aembedding(text, **kwargs) for text in texts),
+                return_exceptions=return_exceptions,
+            )
+
+        return asyncio.run(run())
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.session.close()
+
+
+def _setting(key, default):
+    if has_app_context():
+        value = current_app.config.get(key)
+        if value is not None:
+            return value
+    return default
+
+
+def get_llm_client():
+    """Client shared by all LLM calls in this process, configured from the app config"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient(
+                base_url=_setting("DEEPSEEK_API_URL", DEFAULT_API_URL),
+                api_key=_setting("DEEPSEEK_API_KEY", None),
+                connect_timeout=_setting("LLM_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT),
+                read_timeout=_setting("LLM_READ_TIMEOUT", DEFAULT_READ_TIMEOUT),
+                max_concurrency=_setting("LLM_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY),
+                cache_ttl=_setting("LLM_CACHE_TTL_SECONDS", DEFAULT_CACHE_TTL_SECONDS),
+                cache_max_entries=_setting("LLM_CACHE_MAX_ENTRIES", DEFAULT_CACHE_MAX_ENTRIES),
+                max_retries=_setting("LLM_MAX_RETRIES", DEFAULT_MAX_RETRIES),
+            )
+        return _client
@@ -46,29 +46,40 @@ from app.models.company import CompanyInfo
 from app.models.po import POHeader, PODetail, POSupplier, POMaterial, POOrderUnit, ShipmentItem, MaterialHSDocuments
 from app.models.user import CountryMaster, CurrencyMaster
 from app.models.hs import HSCode, HSCodeCategory, HSCodeDocument, HSCodeDocumentAttachment, HSCodeIssueBody, HSDocumentCategory
-from app.models.demurrage import DemurrageRateCard, CompanyDemurrageConfig, DemurrageCalculationDetail, DemurrageReasons, ShipmentDemurrage, ShipmentDemurrageAttachment, ShipmentDemurrageBearer, DemurrageRateCardTier
+from app.models.demurrage import DemurrageRateCard, CompanyDemurrageConfig, DemurrageCalculationDetail, DemurrageReasons, ShipmentDemurrage, ShipmentDemurrageAttachment, ShipmentDemurrageBearer
 from datetime import datetime, date, timedelta
 import os
 import secrets
 from werkzeug.utils import secure_filename
 from PIL import Image
 import uuid
-import boto3
-from botocore.config import Config
 from botocore.exceptions import ClientError
-from app.utils_cha.s3_utils import upload_file_to_s3, get_s3_url, delete_file_from_s3, serve_s3_file
+from app.utils_cha.s3_utils import (
+    get_s3_client,
+    upload_fileobj_to_s3,
+    upload_batch_to_s3,
+    get_s3_url,
+    delete_file_from_s3,
+    serve_s3_file,
+)
 from app.utils_cha.validators import validate_file
 from app.utils_cha.helpers import get_enum_values
 from app.utils_cha.decorators import admin_required
 from app.utils_cha.exceptions import UnauthorizedAccessError
-from sqlalchemy import or_
 import json
 import traceback
 import mimetypes
-from sqlalchemy.sql import and_, or_, cast
+from sqlalchemy.sql import and_, cast
 from sqlalchemy import desc
 from app.email import send_email, send_async_email
 from app.utils import get_sri_lanka_time
+from app.extraction_cache import invalidate_sample_extraction
+from app.notification_store import record_new_message, publish_chat_message
+from app.document_alerts import get_entry_alert_status, entry_ids_from_request
+from app.demurrage_projection import get_projection_engine
+from app.working_calendar import WorkingCalendar, get_working_calendar
+from app.pagination import paginate_query, count_where, search_filter
+from app.attachment_store import release_attachment_file
 from decimal import Decimal
 
 from app.masters import bp
@@ -103,7 +114,7 @@ def save_profile_picture(form_picture):
     # Upload to S3
     try:
         with open(temp_path, "rb") as f:
-            upload_file_to_s3(f, current_app.config["S3_BUCKET_NAME"], s3_key)
+            upload_fileobj_to_s3(f, current_app.config["S3_BUCKET_NAME"], s3_key)
         # Clean up temp file
         os.remove(temp_path)
         return s3_key
@@ -136,7 +147,7 @@ def save_document(form_document, document_type):
 
     # Upload to S3
     try:
-        upload_file_to_s3(form_document, current_app.config["S3_BUCKET_NAME"], s3_key)
+        upload_fileobj_to_s3(form_document, current_app.config["S3_BUCKET_NAME"], s3_key)
         return s3_key
     except Exception as e:
         print(f"Error uploading document to S3: {str(e)}")
@@ -151,38 +162,6 @@ def delete_document(document_path, document_type):
             print(f"Error deleting document from S3: {str(e)}")
 
 
-def get_s3_client():
-    """Get an S3 client"""
-    return boto3.client(
-        "s3",
-        aws_access_key_id=current_app.config["AWS_ACCESS_KEY_ID"],
-        aws_secret_access_key=current_app.config["AWS_SECRET_ACCESS_KEY"],
-        region_name=current_app.config["AWS_REGION"],
-        config=Config(signature_version="s3v4"),
-    )
-
-
-def upload_file_to_s3(file, bucket, key):
-    """Upload a file to S3"""
-    s3_client = get_s3_client()
-    s3_client.upload_fileobj(
-        file,
-        bucket,
-        key,
-        ExtraArgs=(
-            {"ContentType": file.content_type}
-            if hasattr(file, "content_type")
-            else None
-        ),
-    )
-
-
-def delete_file_from_s3(bucket, key):
-    """Delete a file from S3"""
-    s3_client = get_s3_client()
-    s3_client.delete_object(Bucket=bucket, Key=key)
-
-
 def generate_presigned_url(bucket, key, expiration=300):
     """Generate a presigned URL for an S3 object"""
     s3_client = get_s3_client()
@@ -205,28 +184,23 @@ def customers():
     customer_type = request.args.get("customer_type", 1, type=int)  # 1 = Customers, 2 = CHA
     status = request.args.get("status", None)
     search = request.args.get("search", None)
+
+    assigned_companies = None
+    if current_user.role != 'super_admin':
+        assigned_companies = db.session.query(CompanyAssignment.company_id).filter(
+            CompanyAssignment.assigned_company_id == current_user.company_id,
+            CompanyAssignment.is_active == True
+        ).subquery()
     
     if customer_type == 1:  # Regular Customers
         # Base query with join to User table and CompanyInfo
-        if current_user.role == 'super_admin':
-            query = db.session.query(Customer, User, CompanyInfo).outerjoin(
-                User, Customer.user_id == User.id
-            ).join(
-                CompanyInfo, Customer.company_id == CompanyInfo.id
-            )
-            base_query = Customer.query
-        else:
-            assigned_companies = db.session.query(CompanyAssignment.company_id).filter(
-                CompanyAssignment.assigned_company_id == current_user.company_id,
-                CompanyAssignment.is_active == True
-            ).subquery()
-            
-            query = db.session.query(Customer, User, CompanyInfo).outerjoin(
-                User, Customer.user_id == User.id
-            ).join(
-                CompanyInfo, Customer.company_id == CompanyInfo.id
-            ).filter(Customer.company_id.in_(assigned_companies))
-            base_query = Customer.query.filter(Customer.company_id.in_(assigned_companies))
+        query = db.session.query(Customer, User, CompanyInfo).outerjoin(
+            User, Customer.user_id == User.id
+        ).join(
+            CompanyInfo, Customer.company_id == CompanyInfo.id
+        )
+        if assigned_companies is not None:
+            query = query.filter(Customer.company_id.in_(assigned_companies))
         
         # Filter by customer type (1 = Company customers)
         query = query.filter(Customer.customer_type == 1)
@@ -240,20 +214,15 @@ def customers():
         
         # Filter by search if provided
         if search:
-            search_term = f"%{search}%"
             query = query.filter(
-                db.or_(
-                    Customer.customer_name.ilike(search_term),
-                    Customer.customer_id.ilike(search_term),
-                    Customer.email.ilike(search_term),
-                    Customer.address.ilike(search_term),
-                    Customer.telephone.ilike(search_term),
-                    CompanyInfo.company_name.ilike(search_term)
+                search_filter(
+                    search,
+                    prefix_columns=(Customer.customer_id, Customer.email, Customer.telephone),
+                    fulltext_columns=(Customer.customer_name, Customer.address, CompanyInfo.company_name),
                 )
             )
         
-        # Get the results and paginate manually
-        results = query.order_by(Customer.created_at.desc()).all()
+        query = query.order_by(Customer.created_at.desc())
         
     else:  # CHA Users (customer_type == 2)
         # Only super_admin can view CHA tab
@@ -275,77 +244,32 @@ def customers():
         
         # Filter by search if provided
         if search:
-            search_term = f"%{search}%"
             query = query.filter(
-                db.or_(
-                    User.name.ilike(search_term),
-                    User.username.ilike(search_term),
-                    User.email.ilike(search_term),
-                    User.contact_number.ilike(search_term),
-                    CompanyInfo.company_name.ilike(search_term)
+                search_filter(
+                    search,
+                    prefix_columns=(User.username, User.email, User.contact_number),
+                    fulltext_columns=(User.name, CompanyInfo.company_name),
                 )
             )
         
-        # Get the results
-        results = query.order_by(User.created_at.desc()).all()
-        base_query = User.query.filter_by(role_id=3)
-    
-    # Create a custom pagination object
-    from math import ceil
-    total = len(results)
-    start = (page - 1) * per_page
-    end = start + per_page
-    items = results[start:end]
-    
-    class CustomPagination:
-        def __init__(self, items, page, per_page, total):
-            self.items = items
-            self.page = page
-            self.per_page = per_page
-            self.total = total
-            self.pages = ceil(total / per_page) if per_page > 0 else 0
-            
-        @property
-        def has_prev(self):
-            return self.page > 1
-            
-        @property
-        def has_next(self):
-            return self.page < self.pages
-            
-        @property
-        def prev_num(self):
-            return self.page - 1 if self.has_prev else None
-            
-        @property
-        def next_num(self):
-            return self.page + 1 if self.has_next else None
-            
-        def iter_pages(self, left_edge=2, right_edge=2, left_current=2, right_current=3):
-            last = self.pages
-            for num in range(1, last + 1):
-                if num <= left_edge or \
-                   (self.page - left_current - 1 < num < self.page + right_current) or \
-                   num > last - right_edge:
-                    yield num
-    
-    customers_paginated = CustomPagination(items, page, per_page, total)
-    
-    # Get counts for badges
+        query = query.order_by(User.created_at.desc())
+    
+    customers_paginated = paginate_query(query, page, per_page)
+    
+    # Get counts for badges, both from one SELECT
+    company_count = db.session.query(db.func.count(Customer.id)).filter(Customer.customer_type == 1)
+    if assigned_companies is not None:
+        company_count = company_count.filter(Customer.company_id.in_(assigned_companies))
+    columns = [company_count.scalar_subquery().label('company')]
     if current_user.role == 'super_admin':
-        counts = {
-            'company': Customer.query.filter_by(customer_type=1).count(),
-            'cha': User.query.filter_by(role_id=3).count(),
-        }
-    else:
-        assigned_companies = db.session.query(CompanyAssignment.company_id).filter(
-            CompanyAssignment.assigned_company_id == current_user.company_id,
-            CompanyAssignment.is_active == True
-        ).subquery()
-        counts = {
-            'company': Customer.query.filter(Customer.company_id.in_(assigned_companies), Customer.customer_type == 1).count(),
-            'cha': 0,  # Non-super admins can't see CHA count
-        }
+        columns.append(
+            db.session.query(db.func.count(User.id)).filter(User.role_id == 3).scalar_subquery().label('cha')
+        )
+    badge_counts = db.session.query(*columns).one()
+    counts = {
+        'company': badge_counts.company,
+        'cha': badge_counts.cha if current_user.role == 'super_admin' else 0,  # Non-super admins can't see CHA count
+    }
     
     return render_template(
         "masters/customers.html", 
@@ -1032,60 +956,50 @@ def upload_customer_attachment(customer_id):
         if not expiry_date:
             return jsonify({"success": False, "message": "Expiry date is required"}), 400
         
-        # Validate file
+        # Validate files - several may be sent under the same field
         if 'file' not in request.files:
             return jsonify({"success": False, "message": "No file provided"}), 400
         
-        file = request.files['file']
-        if file.filename == '':
+        files = [file for file in request.files.getlist('file') if file.filename != '']
+        if not files:
             return jsonify({"success": False, "message": "No file selected"}), 400
         
-        # Secure filename
-        filename = secure_filename(file.filename)
-        file_extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-        
-        # Generate unique filename
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        
-        # Create S3 path
-        s3_path = f"customer_attachments/{customer_id}/{unique_filename}"
-        
-        # Upload to S3
-        try:
-            s3_client = boto3.client(
-                's3',
-                endpoint_url=current_app.config['S3_ENDPOINT_URL'],
-                aws_access_key_id=current_app.config['AWS_ACCESS_KEY_ID'],
-                aws_secret_access_key=current_app.config['AWS_SECRET_ACCESS_KEY']
-            )
+        uploads = []
+        for file in files:
+            # Secure filename
+            filename = secure_filename(file.filename)
+            file_extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
             
-            s3_client.upload_fileobj(
-                file,
-                current_app.config['S3_BUCKET_NAME'],
-                s3_path
-            )
-        except Exception as e:
-            current_app.logger.error(f"S3 upload error: {str(e)}")
-            return jsonify({"success": False, "message": "Failed to upload file"}), 500
+            # Generate unique filename and S3 path
+            unique_filename = f"{uuid.uuid4()}.{file_extension}"
+            s3_path = f"customer_attachments/{customer_id}/{unique_filename}"
+            uploads.append((file, filename, s3_path))
         
-        # Create attachment record
-        attachment = CustomerAttachment(
-            customer_id=customer_id,
-            user_id=customer.user_id,
-            uploaded_by=current_user.id,
-            company_id=current_user.company_id,
-            file_path=s3_path,
-            file_name=filename,
-            expiry_date=datetime.strptime(expiry_date, '%Y-%m-%d').date(),
-            description=description
-        )
+        # Upload all files to S3 in parallel, or none of them
+        if not upload_batch_to_s3(
+            [(file, s3_path) for file, _, s3_path in uploads], current_app.config['S3_BUCKET_NAME']
+        ):
+            current_app.logger.error(f"S3 upload failed for customer {customer_id} attachments")
+            return jsonify({"success": False, "message": "Failed to upload file"}), 500
         
-        db.session.add(attachment)
+        # Create attachment records in one transaction
+        for _, filename, s3_path in uploads:
+            attachment = CustomerAttachment(
+                customer_id=customer_id,
+                user_id=customer.user_id,
+                uploaded_by=current_user.id,
+                company_id=current_user.company_id,
+                file_path=s3_path,
+                file_name=filename,
+                expiry_date=datetime.strptime(expiry_date, '%Y-%m-%d').date(),
+                description=description
+            )
+            db.session.add(attachment)
         db.session.commit()
         
         return jsonify({
             "success": True,
-            "message": "Document uploaded successfully"
+            "message": "Document uploaded successfully" if len(uploads) == 1 else f"{len(uploads)} documents uploaded successfully"
         })
         
     except Exception as e:
@@ -1122,14 +1036,8 @@ def update_customer_attachment(customer_id, attachment_id):
             file = request.files['file']
             if file and file.filename != '':
                 # Delete old file from S3
+                s3_client = get_s3_client()
                 try:
-                    s3_client = boto3.client(
-                        's3',
-                        endpoint_url=current_app.config['S3_ENDPOINT_URL'],
-                        aws_access_key_id=current_app.config['AWS_ACCESS_KEY_ID'],
-                        aws_secret_access_key=current_app.config['AWS_SECRET_ACCESS_KEY']
-                    )
-                    
                     s3_client.delete_object(
                         Bucket=current_app.config['S3_BUCKET_NAME'],
                         Key=attachment.file_path
@@ -1144,11 +1052,7 @@ def update_customer_attachment(customer_id, attachment_id):
                 s3_path = f"customer_attachments/{customer_id}/{unique_filename}"
                 
                 try:
-                    s3_client.upload_fileobj(
-                        file,
-                        current_app.config['S3_BUCKET_NAME'],
-                        s3_path
-                    )
+                    upload_fileobj_to_s3(file, current_app.config['S3_BUCKET_NAME'], s3_path)
                     
                     # Update attachment record
                     attachment.file_path = s3_path
@@ -1344,12 +1248,7 @@ def delete_customer(id):
         # Delete files from S3
         if customer_attachments:
             try:
-                s3_client = boto3.client(
-                    's3',
-                    endpoint_url=current_app.config['S3_ENDPOINT_URL'],
-                    aws_access_key_id=current_app.config['AWS_ACCESS_KEY_ID'],
-                    aws_secret_access_key=current_app.config['AWS_SECRET_ACCESS_KEY']
-                )
+                s3_client = get_s3_client()
                 
                 for attachment in customer_attachments:
                     try:
@@ -1683,7 +1582,7 @@ def add_attachment_document():
                     file.seek(0)
                     
                     # Upload file to S3
-                    upload_result = upload_file_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
+                    upload_result = upload_fileobj_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
                     print(f"Upload result type: {type(upload_result)}, value: {upload_result}")
                     
                     if upload_result:
@@ -1693,7 +1592,7 @@ def add_attachment_document():
                         print(f"File uploaded successfully. Path: {sample_file_path}")
                         print(f"Generated URL: {sample_file_url}")
                     else:
-                        print("upload_file_to_s3 returned False/None")
+                        print("upload_fileobj_to_s3 returned False/None")
                         # Let's try to construct the URL anyway since S3 showed 200
                         sample_file_path = s3_key
                         sample_file_url = f"{current_app.config['S3_ENDPOINT_URL']}/{current_app.config['S3_BUCKET_NAME']}/{s3_key}"
@@ -1836,7 +1735,7 @@ def update_attachment_document(document_id):
             file.seek(0)
             
             # Upload the file to S3 (we'll assume success based on S3's 200 response)
-            upload_file_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
+            upload_fileobj_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
             
             # Update document with new file path
             document.sample_file_path = s3_key
@@ -3689,15 +3588,10 @@ def create_runner_login(runner_id):
 def wharf_profiles():
     page = request.args.get("page", 1, type=int)
     if current_user.is_super_admin == 1:
-        wharf_profiles = WharfProfile.query.order_by(
-            WharfProfile.created_at.desc()
-        ).paginate(page=page, per_page=10)
+        query = WharfProfile.query
     else:
-        wharf_profiles = (
-            WharfProfile.query.filter_by(company_id=current_user.company_id)
-            .order_by(WharfProfile.created_at.desc())
-            .paginate(page=page, per_page=10)
-        )
+        query = WharfProfile.query.filter_by(company_id=current_user.company_id)
+    wharf_profiles = paginate_query(query.order_by(WharfProfile.created_at.desc()), page, 10)
     return render_template(
         "masters/wharf_profiles.html",
         title="Wharf Profiles",
@@ -3835,7 +3729,7 @@ def new_wharf_profile():
                     # Upload to S3
                     print("Uploading to S3...")
                     with open(temp_path, "rb") as f:
-                        upload_file_to_s3(
+                        upload_fileobj_to_s3(
                             f, current_app.config["S3_BUCKET_NAME"], s3_key
                         )
                     print("Upload to S3 successful")
@@ -3872,7 +3766,7 @@ def new_wharf_profile():
 
                     # Upload to S3
                     print("Uploading to S3...")
-                    upload_file_to_s3(
+                    upload_fileobj_to_s3(
                         form.nic_document.data,
                         current_app.config["S3_BUCKET_NAME"],
                         s3_key,
@@ -3906,7 +3800,7 @@ def new_wharf_profile():
 
                     # Upload to S3
                     print("Uploading to S3...")
-                    upload_file_to_s3(
+                    upload_fileobj_to_s3(
                         form.insurance_document.data,
                         current_app.config["S3_BUCKET_NAME"],
                         s3_key,
@@ -4050,7 +3944,7 @@ def edit_wharf_profile(id):
 
                     # Upload to S3
                     with open(temp_path, "rb") as f:
-                        upload_file_to_s3(
+                        upload_fileobj_to_s3(
                             f, current_app.config["S3_BUCKET_NAME"], s3_key
                         )
 
@@ -4081,7 +3975,7 @@ def edit_wharf_profile(id):
                     s3_key = f"{current_app.config['S3_BASE_FOLDER']}/documents/nic/{document_fn}"
 
                     # Upload to S3
-                    upload_file_to_s3(
+                    upload_fileobj_to_s3(
                         form.nic_document.data,
                         current_app.config["S3_BUCKET_NAME"],
                         s3_key,
@@ -4111,7 +4005,7 @@ def edit_wharf_profile(id):
                     s3_key = f"{current_app.config['S3_BASE_FOLDER']}/documents/insurance/{document_fn}"
 
                     # Upload to S3
-                    upload_file_to_s3(
+                    upload_fileobj_to_s3(
                         form.insurance_document.data,
                         current_app.config["S3_BUCKET_NAME"],
                         s3_key,
@@ -4421,9 +4315,9 @@ def container_documents():
     # Apply filters
     if search:
         query = query.filter(
-            db.or_(
-                ContainerDocument.document_code.ilike(f'%{search}%'),
-                ContainerDocument.document_name.ilike(f'%{search}%')
+            search_filter(
+                search,
+                prefix_columns=(ContainerDocument.document_code, ContainerDocument.document_name),
             )
         )
     
@@ -4436,9 +4330,7 @@ def container_documents():
     query = query.order_by(ContainerDocument.created_at.desc())
     
     # Paginate
-    documents = query.paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    documents = paginate_query(query, page, per_page)
     
     return render_template(
         "masters/container_documents.html",
@@ -4485,7 +4377,7 @@ def new_container_document():
                 s3_key = f"{current_app.config['S3_BASE_FOLDER']}/documents/container_documents/{company_id}/{filename}"
                 
                 # Upload file to S3
-                upload_result = upload_file_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
+                upload_result = upload_fileobj_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
                 sample_file_path = s3_key
             
             # Create new container document
@@ -4565,7 +4457,7 @@ def edit_container_document(document_id):
                 s3_key = f"{current_app.config['S3_BASE_FOLDER']}/documents/container_documents/{document.company_id}/{filename}"
                 
                 # Upload new file to S3
-                upload_result = upload_file_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
+                upload_result = upload_fileobj_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
                 document.sample_file_path = s3_key
             
             db.session.commit()
@@ -4659,9 +4551,9 @@ def container_deposit_workflows():
     if search:
         print("Applying search filter...")
         query = query.filter(
-            db.or_(
-                ContainerDepositWorkflow.workflow_code.ilike(f'%{search}%'),
-                ContainerDepositWorkflow.workflow_name.ilike(f'%{search}%')
+            search_filter(
+                search,
+                prefix_columns=(ContainerDepositWorkflow.workflow_code, ContainerDepositWorkflow.workflow_name),
             )
         )
 
@@ -4673,7 +4565,7 @@ def container_deposit_workflows():
         query = query.filter(ContainerDepositWorkflow.is_active == False)
 
     query = query.order_by(ContainerDepositWorkflow.created_at.desc())
-    workflows = query.paginate(page=page, per_page=per_page, error_out=False)
+    workflows = paginate_query(query, page, per_page)
 
     print(f"Fetched {len(workflows.items)} workflows")
     return render_template("masters/container_deposit_workflows.html", title="Container Deposit Workflows", workflows=workflows)
@@ -5172,10 +5064,13 @@ def add_ship_cat_document():
             s3_key = f"{current_app.config['S3_BASE_FOLDER']}/documents/sample_documents/{ship_cat_id}/{filename}"
             print(f"S3 key: {s3_key}")
             
-            # Debug: Check what the upload_file_to_s3 function is returning
-            upload_result = upload_file_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
+            # Debug: Check what the upload_fileobj_to_s3 function is returning
+            upload_result = upload_fileobj_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
             print(f"Upload result type: {type(upload_result)}, Value: {upload_result}")
             
+            # The key may already hold an older sample with the same filename
+            invalidate_sample_extraction(s3_key)
+            
             # Force the success path for testing (since we know the upload is working)
             # Remove this in production, just for testing
             print("Forcing sample file path to be set regardless of function return value")
@@ -5327,7 +5222,11 @@ def update_ship_cat_document(document_id):
             s3_key = f"{current_app.config['S3_BASE_FOLDER']}/documents/sample_documents/{document.shipCatid}/{filename}"
             
             # Upload the file to S3
-            upload_file_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
+            upload_fileobj_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
+            
+            # Drop cached text for both the replaced sample and the (possibly overwritten) new key
+            invalidate_sample_extraction(document.sample_file_path)
+            invalidate_sample_extraction(s3_key)
             
             # Update document with new file path
             document.sample_file_path = s3_key
@@ -5639,26 +5538,27 @@ def orders():
     # Apply search filter if specified - ADD CLEARING AGENT TO SEARCH
     if search_term:
         print(f"Applying search filter: '{search_term}'")
-        search_pattern = f"%{search_term}%"
         query = query.filter(
-            db.or_(
-                ShipDocumentEntryMaster.docserial.ilike(search_pattern),
-                Customer.customer_name.ilike(search_pattern),
-                ShipCategory.catname.ilike(search_pattern),
-                ShipmentType.shipment_name.ilike(search_pattern),
-                User.name.ilike(search_pattern),
-                # NEW: Add clearing agent to search
-                ClearingAgentUser.name.ilike(search_pattern)
+            search_filter(
+                search_term,
+                prefix_columns=(
+                    ShipDocumentEntryMaster.docserial,
+                    ShipCategory.catname,
+                    ShipmentType.shipment_name,
+                ),
+                fulltext_columns=(
+                    Customer.customer_name,
+                    User.name,
+                    # NEW: Add clearing agent to search
+                    ClearingAgentUser.name,
+                ),
             )
         )
 
-    # Get total count for pagination
-    total_entries = query.count()
-    print(f"Total filtered entries: {total_entries}")
-
-    # Apply sorting and pagination
-    query = query.order_by(ShipDocumentEntryMaster.id.desc())
-    query_results = query.limit(per_page).offset((page - 1) * per_page).all()
+    # Sort and fetch one page, counted in the same query
+    entries_page = paginate_query(query.order_by(ShipDocumentEntryMaster.id.desc()), page, per_page)
+    query_results = entries_page.items
+    print(f"Total filtered entries: {entries_page.total}")
     print(f"Retrieved {len(query_results)} entries for current page")
 
     # Process the results to extract entries and assignment info
@@ -5686,26 +5586,6 @@ def orders():
         
         paginated_entries.append(entry)
 
-    # Calculate pagination variables
-    max_pages = (total_entries + per_page - 1) // per_page
-    has_prev = page > 1
-    has_next = page * per_page < total_entries
-    prev_num = page - 1 if has_prev else None
-    next_num = page + 1 if has_next else None
-    current_page = page
-    
-    # Create a list of page numbers for pagination
-    page_nums = []
-    if max_pages <= 7:
-        page_nums = list(range(1, max_pages + 1))
-    else:
-        if page <= 4:
-            page_nums = list(range(1, 6)) + [None, max_pages]
-        elif page >= max_pages - 3:
-            page_nums = [1, None] + list(range(max_pages - 4, max_pages + 1))
-        else:
-            page_nums = [1, None, page-1, page, page+1, None, max_pages]
-
     # Calculate document counts for paginated entries
     for entry in paginated_entries:
         required_documents = ShipCatDocument.query.filter_by(
@@ -5764,24 +5644,23 @@ def orders():
         )
     )
 
-    # Calculate counts for each status
-    status_counts = {
-        'total': base_query.count(),
-        'new': base_query.filter(db.func.lower(DocumentStatus.docStatusName).like('%new%')).count(),
-        'open': base_query.filter(db.func.lower(DocumentStatus.docStatusName).like('%open%')).count(),
-        'ongoing': base_query.filter(
+    # Calculate counts for each status in one query
+    status_counts = count_where(
+        base_query,
+        total=None,
+        new=db.func.lower(DocumentStatus.docStatusName).like('%new%'),
+        open=db.func.lower(DocumentStatus.docStatusName).like('%open%'),
+        ongoing=db.and_(
             ~db.func.lower(DocumentStatus.docStatusName).like('%new%'),
             ~db.func.lower(DocumentStatus.docStatusName).like('%complete%'),
             ~db.func.lower(DocumentStatus.docStatusName).like('%done%'),
             ~db.func.lower(DocumentStatus.docStatusName).like('%open%')
-        ).count(),
-        'completed': base_query.filter(
-            db.or_(
-                db.func.lower(DocumentStatus.docStatusName).like('%complete%'),
-                db.func.lower(DocumentStatus.docStatusName).like('%done%')
-            )
-        ).count()
-    }
+        ),
+        completed=db.or_(
+            db.func.lower(DocumentStatus.docStatusName).like('%complete%'),
+            db.func.lower(DocumentStatus.docStatusName).like('%done%')
+        ),
+    )
     
     # Pass the current date/time for deadline calculations
     now = get_sri_lanka_time()
@@ -5792,13 +5671,13 @@ def orders():
         form=form,
         entries=paginated_entries,  # Use paginated entries instead of all entries
         shipment_types=shipment_types,
-        total_entries=total_entries,
-        has_prev=has_prev,
-        has_next=has_next,
-        prev_num=prev_num,
-        next_num=next_num,
-        page_nums=page_nums,
-        current_page=current_page,
+        total_entries=entries_page.total,
+        has_prev=entries_page.has_prev,
+        has_next=entries_page.has_next,
+        prev_num=entries_page.prev_num,
+        next_num=entries_page.next_num,
+        page_nums=entries_page.page_numbers(),
+        current_page=entries_page.page,
         now=now,
         status_filter=status_filter,  # NEW: Pass status filter to template
         status_counts=status_counts # NEW: Pass status counts to template
@@ -6009,45 +5888,20 @@ def assigned_orders():
     # Apply search filter if specified
     if search_term:
         print(f"Applying search filter: '{search_term}'")
-        search_pattern = f"%{search_term}%"
         query = query.filter(
-            db.or_(
-                ShipDocumentEntryMaster.docserial.ilike(search_pattern),
-                Customer.customer_name.ilike(search_pattern),
-                ShipCategory.catname.ilike(search_pattern)
-                # Add more fields to search as needed
+            search_filter(
+                search_term,
+                prefix_columns=(ShipDocumentEntryMaster.docserial, ShipCategory.catname),
+                fulltext_columns=(Customer.customer_name,),
             )
         )
 
-    # Get total count for pagination
-    total_entries = query.count()
-    print(f"Total filtered assigned entries: {total_entries}")
-
-    # Apply sorting and pagination
-    query = query.order_by(ShipDocumentEntryMaster.id.desc())
-    paginated_entries = query.limit(per_page).offset((page - 1) * per_page).all()
+    # Sort and fetch one page, counted in the same query
+    entries_page = paginate_query(query.order_by(ShipDocumentEntryMaster.id.desc()), page, per_page)
+    paginated_entries = entries_page.items
+    print(f"Total filtered assigned entries: {entries_page.total}")
     print(f"Retrieved {len(paginated_entries)} assigned entries for current page")
 
-    # Calculate pagination variables
-    max_pages = (total_entries + per_page - 1) // per_page
-    has_prev = page > 1
-    has_next = page * per_page < total_entries
-    prev_num = page - 1 if has_prev else None
-    next_num = page + 1 if has_next else None
-    current_page = page
-    
-    # Create a list of page numbers for pagination
-    page_nums = []
-    if max_pages <= 7:
-        page_nums = list(range(1, max_pages + 1))
-    else:
-        if page <= 4:
-            page_nums = list(range(1, 6)) + [None, max_pages]
-        elif page >= max_pages - 3:
-            page_nums = [1, None] + list(range(max_pages - 4, max_pages + 1))
-        else:
-            page_nums = [1, None, page-1, page, page+1, None, max_pages]
-
     # Calculate document counts for paginated entries
     for entry in paginated_entries:
         required_documents = ShipCatDocument.query.filter_by(
@@ -6099,24 +5953,23 @@ def assigned_orders():
         )
     )    
 
-    # Calculate counts for each status
-    status_counts = {
-        'total': base_query.count(),
-        'open': base_query.filter(db.func.lower(DocumentStatus.docStatusName).like('%open%')).count(),
-        'new': base_query.filter(db.func.lower(DocumentStatus.docStatusName).like('%new%')).count(),
-        'ongoing': base_query.filter(
+    # Calculate counts for each status in one query
+    status_counts = count_where(
+        base_query,
+        total=None,
+        open=db.func.lower(DocumentStatus.docStatusName).like('%open%'),
+        new=db.func.lower(DocumentStatus.docStatusName).like('%new%'),
+        ongoing=db.and_(
             ~db.func.lower(DocumentStatus.docStatusName).like('%open%'),
             ~db.func.lower(DocumentStatus.docStatusName).like('%new%'),
             ~db.func.lower(DocumentStatus.docStatusName).like('%complete%'),
             ~db.func.lower(DocumentStatus.docStatusName).like('%done%')
-        ).count(),
-        'completed': base_query.filter(
-            db.or_(
-                db.func.lower(DocumentStatus.docStatusName).like('%complete%'),
-                db.func.lower(DocumentStatus.docStatusName).like('%done%')
-            )
-        ).count()
-    }
+        ),
+        completed=db.or_(
+            db.func.lower(DocumentStatus.docStatusName).like('%complete%'),
+            db.func.lower(DocumentStatus.docStatusName).like('%done%')
+        ),
+    )
 
     # Get all shipment types for filter dropdown
     shipment_types = ShipmentType.query.filter_by(company_id=current_user.company_id).all()
@@ -6130,21 +5983,19 @@ def assigned_orders():
         form=form,
         entries=paginated_entries,  # Use paginated entries instead of all entries
         shipment_types=shipment_types,
-        total_entries=total_entries,
-        has_prev=has_prev,
-        has_next=has_next,
-        prev_num=prev_num,
-        next_num=next_num,
-        page_nums=page_nums,
-        current_page=current_page,
+        total_entries=entries_page.total,
+        has_prev=entries_page.has_prev,
+        has_next=entries_page.has_next,
+        prev_num=entries_page.prev_num,
+        next_num=entries_page.next_num,
+        page_nums=entries_page.page_numbers(),
+        current_page=entries_page.page,
         now=now,
         status_filter=status_filter,  # NEW: Pass status filter to template
         status_counts=status_counts  # NEW: Pass status counts to template
     )
 
 
-from sqlalchemy.orm import aliased
-
 @bp.route("/assigned_agents", methods=["GET", "POST"])
 @login_required
 def assigned_agents():
@@ -6338,24 +6189,18 @@ def assigned_agents():
     # Apply search filter if specified
     if search_term:
         print(f"Applying search filter: '{search_term}'")
-        search_pattern = f"%{search_term}%"
         query = query.filter(
-            db.or_(
-                ShipDocumentEntryMaster.docserial.ilike(search_pattern),
-                Customer.customer_name.ilike(search_pattern),
-                ShipCategory.catname.ilike(search_pattern),
-                AssignedUser.name.ilike(search_pattern)
-                # Add more fields to search as needed
+            search_filter(
+                search_term,
+                prefix_columns=(ShipDocumentEntryMaster.docserial, ShipCategory.catname),
+                fulltext_columns=(Customer.customer_name, AssignedUser.name),
             )
         )
 
-    # Get total count for pagination
-    total_entries = query.count()
-    print(f"Total filtered assigned clearing agent entries: {total_entries}")
-
-    # Apply sorting and pagination
-    query = query.order_by(ShipDocumentEntryMaster.id.desc())
-    query_results = query.limit(per_page).offset((page - 1) * per_page).all()
+    # Sort and fetch one page, counted in the same query
+    entries_page = paginate_query(query.order_by(ShipDocumentEntryMaster.id.desc()), page, per_page)
+    query_results = entries_page.items
+    print(f"Total filtered assigned clearing agent entries: {entries_page.total}")
     print(f"Retrieved {len(query_results)} assigned clearing agent entries for current page")
 
     # Process the results to extract entries and assignment info
@@ -6375,26 +6220,6 @@ def assigned_agents():
         
         paginated_entries.append(entry)
 
-    # Calculate pagination variables
-    max_pages = (total_entries + per_page - 1) // per_page
-    has_prev = page > 1
-    has_next = page * per_page < total_entries
-    prev_num = page - 1 if has_prev else None
-    next_num = page + 1 if has_next else None
-    current_page = page
-    
-    # Create a list of page numbers for pagination
-    page_nums = []
-    if max_pages <= 7:
-        page_nums = list(range(1, max_pages + 1))
-    else:
-        if page <= 4:
-            page_nums = list(range(1, 6)) + [None, max_pages]
-        elif page >= max_pages - 3:
-            page_nums = [1, None] + list(range(max_pages - 4, max_pages + 1))
-        else:
-            page_nums = [1, None, page-1, page, page+1, None, max_pages]
-
     # Calculate document counts for paginated entries
     for entry in paginated_entries:
         required_documents = ShipCatDocument.query.filter_by(
@@ -6439,13 +6264,13 @@ def assigned_agents():
         form=form,
         entries=paginated_entries,  # Use paginated entries instead of all entries
         shipment_types=shipment_types,
-        total_entries=total_entries,
-        has_prev=has_prev,
-        has_next=has_next,
-        prev_num=prev_num,
-        next_num=next_num,
-        page_nums=page_nums,
-        current_page=current_page,
+        total_entries=entries_page.total,
+        has_prev=entries_page.has_prev,
+        has_next=entries_page.has_next,
+        prev_num=entries_page.prev_num,
+        next_num=entries_page.next_num,
+        page_nums=entries_page.page_numbers(),
+        current_page=entries_page.page,
         now=now
     )
 
@@ -6657,24 +6482,18 @@ def clearing_company():
     # Apply search filter if specified
     if search_term:
         print(f"Applying search filter: '{search_term}'")
-        search_pattern = f"%{search_term}%"
         query = query.filter(
-            db.or_(
-                ShipDocumentEntryMaster.docserial.ilike(search_pattern),
-                Customer.customer_name.ilike(search_pattern),
-                ShipCategory.catname.ilike(search_pattern),
-                AssignedUser.name.ilike(search_pattern)
-                # Add more fields to search as needed
+            search_filter(
+                search_term,
+                prefix_columns=(ShipDocumentEntryMaster.docserial, ShipCategory.catname),
+                fulltext_columns=(Customer.customer_name, AssignedUser.name),
             )
         )
 
-    # Get total count for pagination
-    total_entries = query.count()
-    print(f"Total filtered assigned clearing company entries: {total_entries}")
-
-    # Apply sorting and pagination
-    query = query.order_by(ShipDocumentEntryMaster.id.desc())
-    query_results = query.limit(per_page).offset((page - 1) * per_page).all()
+    # Sort and fetch one page, counted in the same query
+    entries_page = paginate_query(query.order_by(ShipDocumentEntryMaster.id.desc()), page, per_page)
+    query_results = entries_page.items
+    print(f"Total filtered assigned clearing company entries: {entries_page.total}")
     print(f"Retrieved {len(query_results)} assigned clearing company entries for current page")
 
     # Process the results to extract entries and assignment info
@@ -6700,26 +6519,6 @@ def clearing_company():
         
         paginated_entries.append(entry)
 
-    # Calculate pagination variables
-    max_pages = (total_entries + per_page - 1) // per_page
-    has_prev = page > 1
-    has_next = page * per_page < total_entries
-    prev_num = page - 1 if has_prev else None
-    next_num = page + 1 if has_next else None
-    current_page = page
-    
-    # Create a list of page numbers for pagination
-    page_nums = []
-    if max_pages <= 7:
-        page_nums = list(range(1, max_pages + 1))
-    else:
-        if page <= 4:
-            page_nums = list(range(1, 6)) + [None, max_pages]
-        elif page >= max_pages - 3:
-            page_nums = [1, None] + list(range(max_pages - 4, max_pages + 1))
-        else:
-            page_nums = [1, None, page-1, page, page+1, None, max_pages]
-
     # Calculate document counts for paginated entries
     for entry in paginated_entries:
         required_documents = ShipCatDocument.query.filter_by(
@@ -6764,13 +6563,13 @@ def clearing_company():
         form=form,
         entries=paginated_entries,
         shipment_types=shipment_types,
-        total_entries=total_entries,
-        has_prev=has_prev,
-        has_next=has_next,
-        prev_num=prev_num,
-        next_num=next_num,
-        page_nums=page_nums,
-        current_page=current_page,
+        total_entries=entries_page.total,
+        has_prev=entries_page.has_prev,
+        has_next=entries_page.has_next,
+        prev_num=entries_page.prev_num,
+        next_num=entries_page.next_num,
+        page_nums=entries_page.page_numbers(),
+        current_page=entries_page.page,
         now=now
     )
 
@@ -7933,7 +7732,7 @@ def upload_entry_attachment(entry_id):
 
         # Upload to S3
         try:
-            upload_file_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
+            upload_fileobj_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
         except Exception as e:
             return (
                 jsonify({"success": False, "error": f"Error uploading file: {str(e)}"}),
@@ -7970,11 +7769,9 @@ def delete_entry_attachment(entry_id, attachment_id):
         attachment = ShipDocumentEntryAttachment.query.get_or_404(attachment_id)
 
 
-        # Delete from S3
+        # Delete from S3 unless another attachment shares the file
         try:
-            delete_file_from_s3(
-                current_app.config["S3_BUCKET_NAME"], attachment.attachement_path
-            )
+            release_attachment_file(attachment.attachement_path, attachment_ids=[attachment.id])
         except Exception as e:
             print(f"Error deleting file from S3: {str(e)}")
 
@@ -8195,6 +7992,7 @@ def send_message(entry_id):
         )
         db.session.add(new_message)
         db.session.flush()
+        recipient_ids = record_new_message(new_message, current_user.role)
 
         # Handle file upload first
         attachment = None
@@ -8220,7 +8018,7 @@ def send_message(entry_id):
                 file.seek(0)  # Reset to beginning
                 
                 # Upload to S3
-                upload_result = upload_file_to_s3(
+                upload_result = upload_fileobj_to_s3(
                     file, 
                     current_app.config["S3_BUCKET_NAME"], 
                     s3_key,
@@ -8250,6 +8048,7 @@ def send_message(entry_id):
 
         db.session.commit()
         print("Message and attachment saved successfully")
+        publish_chat_message(new_message, recipient_ids)
 
         return jsonify({
             "success": True, 
@@ -8351,7 +8150,7 @@ def upload_voice_note(entry_id):
         s3_key = f"{current_app.config['S3_BASE_FOLDER']}/chat/voice/{entry_id}/{unique_filename}"
 
         # Upload to S3
-        if upload_file_to_s3(voice_file, current_app.config["S3_BUCKET_NAME"], s3_key):
+        if upload_fileobj_to_s3(voice_file, current_app.config["S3_BUCKET_NAME"], s3_key):
             return jsonify(
                 {"success": True, "path": s3_key, "name": filename, "type": "voice"}
             )
@@ -8384,7 +8183,7 @@ def upload_chat_attachment(entry_id):
         s3_key = f"{current_app.config['S3_BASE_FOLDER']}/chat/attachments/{entry_id}/{unique_filename}"
 
         # Upload to S3
-        if upload_file_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key):
+        if upload_fileobj_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key):
             return jsonify(
                 {
                     "success": True,
@@ -8468,7 +8267,7 @@ def create_shipment_document(entry_id):
         
         # Upload to S3
         try:
-            upload_file_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
+            upload_fileobj_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
         except Exception as s3_error:
             if request.is_json or request.headers.get('Content-Type', '').startswith('application/json'):
                 return jsonify({
@@ -8645,7 +8444,7 @@ def update_shipment_document(entry_id, document_id):
                         delete_file_from_s3(current_app.config["S3_BUCKET_NAME"], document.file_path)
                     
                     # Upload new file
-                    upload_file_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
+                    upload_fileobj_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
                     
                     # Update document details
                     document.document_name = filename
@@ -8810,16 +8609,19 @@ def income_expenses():
     
     # Apply search filter
     if search:
-        query = query.filter(or_(
-            IncomeExpense.description.ilike(f'%{search}%'),
-            IncomeExpense.gl_code.ilike(f'%{search}%')
-        ))
+        query = query.filter(
+            search_filter(
+                search,
+                prefix_columns=(IncomeExpense.gl_code,),
+                fulltext_columns=(IncomeExpense.description,),
+            )
+        )
     
     # Order by creation date
     query = query.order_by(IncomeExpense.created_date.desc())
     
     # Paginate the results
-    income_expenses = query.paginate(page=page, per_page=per_page)
+    income_expenses = paginate_query(query, page, per_page)
     
     return render_template('masters/income_expense.html', income_expenses=income_expenses)
 
@@ -8965,7 +8767,7 @@ def save_shipment_expense(entry_id):
                 s3_key = f"expenses/{entry_id}/{unique_filename}"
                 
                 # Upload to S3
-                upload_file_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
+                upload_fileobj_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
                 expense.attachment_path = s3_key
         
         # Check for attachment removal flag (for edit only)
@@ -9371,7 +9173,7 @@ def manage_shipment_expense(entry_id, expense_id):
                     s3_key = f"expenses/{entry_id}/{unique_filename}"
                     
                     # Upload to S3
-                    upload_file_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
+                    upload_fileobj_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
                     expense.attachment_path = s3_key
             
             # Update other fields
@@ -10449,7 +10251,7 @@ def upload_container_step_document():
         print(f"Uploading file: {original_filename} to S3 key: {s3_key}")
         
         # Upload file to S3
-        upload_result = upload_file_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
+        upload_result = upload_fileobj_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
         print(f"Upload result: {upload_result}")
         
         # Get workflow_id from step
@@ -10521,19 +10323,10 @@ def download_container_step_document(document_id):
         # file_url = f"{current_app.config['S3_ENDPOINT_URL']}/{current_app.config['S3_BUCKET_NAME']}/{document.uploaded_file_path}"
         # return redirect(file_url)
         
-        # ADDED: Secure serving through app proxy with download headers
-        response = serve_s3_file(s3_key)
-        
-        # Modify headers to force download instead of inline viewing
-        if response and hasattr(response, 'headers'):
-            # Get filename from S3 key or use a default
-            filename = os.path.basename(s3_key) or f"document_{document_id}"
-            
-            # Force download by changing Content-Disposition header
-            response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
-            response.headers['Content-Type'] = 'application/octet-stream'
-        
-        return response
+        # ADDED: Secure serving through app proxy, as a download
+        # Get filename from S3 key or use a default
+        filename = os.path.basename(s3_key) or f"document_{document_id}"
+        return serve_s3_file(s3_key, download_name=filename)
         
     except ClientError as e:
         # Handle S3-specific errors
@@ -11125,19 +10918,19 @@ def suppliers():
     # Apply search filter
     if search:
         query = query.filter(
-            db.or_(
-                POSupplier.supplier_code.contains(search),
-                POSupplier.supplier_name.contains(search)
+            search_filter(
+                search,
+                prefix_columns=(POSupplier.supplier_code,),
+                fulltext_columns=(POSupplier.supplier_name,),
             )
         )
     
     # Order by creation date (newest first)
     query = query.order_by(POSupplier.created_at.desc())
     
-    # Get all suppliers (or paginate if needed)
-    suppliers = query.all()
+    pagination = paginate_query(query, page, per_page)
     
-    return render_template('masters/suppliers.html', suppliers=suppliers)
+    return render_template('masters/suppliers.html', suppliers=pagination.items, pagination=pagination)
 
 @bp.route('/suppliers/new', methods=['GET', 'POST'])
 @login_required
@@ -11266,6 +11059,7 @@ def materials():
     # Get filter parameters
     search = request.args.get('search', '', type=str)
     per_page = request.args.get('per_page', 10, type=int)
+    page = request.args.get('page', 1, type=int)
     
     # Base query with explicit HS code join
     query = POMaterial.query.filter_by(company_id=current_user.company_id).outerjoin(
@@ -11275,45 +11069,51 @@ def materials():
     # Apply search filter
     if search:
         query = query.filter(
-            db.or_(
-                POMaterial.material_code.contains(search),
-                POMaterial.material_name.contains(search),
-                HSCode.code.contains(search)
+            search_filter(
+                search,
+                prefix_columns=(POMaterial.material_code, HSCode.code),
+                fulltext_columns=(POMaterial.material_name,),
             )
         )
     
     # Order by creation date (newest first)
     query = query.order_by(POMaterial.created_at.desc())
     
-    # Get all materials
-    materials = query.all()
+    pagination = paginate_query(query, page, per_page)
+    materials = pagination.items
     
-    # Calculate expiry status for each material
+    # Calculate expiry status for the page's materials
     today = datetime.now().date()
     warning_date = today + timedelta(days=30)
     
+    # (material, hs code) -> (documents, documents expiring within 30 days)
+    document_counts = {}
+    material_ids = [material.id for material in materials if material.hs_code_id]
+    if material_ids:
+        document_counts = {
+            (material_id, hs_code_id): (total, expiring)
+            for material_id, hs_code_id, total, expiring in db.session.query(
+                MaterialHSDocuments.material_id,
+                MaterialHSDocuments.hs_code_id,
+                db.func.count(MaterialHSDocuments.id),
+                db.func.sum(db.case((MaterialHSDocuments.expiry_date <= warning_date, 1), else_=0)),
+            )
+            .filter(
+                MaterialHSDocuments.material_id.in_(material_ids),
+                MaterialHSDocuments.company_id == current_user.company_id
+            )
+            .group_by(MaterialHSDocuments.material_id, MaterialHSDocuments.hs_code_id)
+        }
+    
     for material in materials:
         material.expiry_status = 'none'  # Default: no documents
         
         if material.hs_code_id:
-            # Get all uploaded documents for this material
-            uploaded_docs = MaterialHSDocuments.query.filter_by(
-                material_id=material.id,
-                hs_code_id=material.hs_code_id,
-                company_id=current_user.company_id
-            ).all()
-            
-            if uploaded_docs:
-                # Check if any document expires within 30 days
-                has_expiring_docs = False
-                for doc in uploaded_docs:
-                    if doc.expiry_date and doc.expiry_date <= warning_date:
-                        has_expiring_docs = True
-                        break
-                
-                material.expiry_status = 'warning' if has_expiring_docs else 'good'
+            total, expiring = document_counts.get((material.id, material.hs_code_id), (0, 0))
+            if total:
+                material.expiry_status = 'warning' if expiring else 'good'
     
-    return render_template('masters/materials.html', materials=materials)
+    return render_template('masters/materials.html', materials=materials, pagination=pagination)
 
 
 from urllib.parse import unquote
@@ -11396,23 +11196,15 @@ def download_material_document(document_id):
         # file_url = get_s3_url(s3_bucket, material_doc.file_path)
         # return redirect(file_url)
         
-        # ADDED: Secure serving through app proxy with download headers
-        response = serve_s3_file(s3_key)
+        # ADDED: Secure serving through app proxy, as a download
+        # Get filename from S3 key or create a meaningful name
+        filename = os.path.basename(s3_key) or f"material_document_{document_id}"
         
-        # Modify headers to force download instead of inline viewing
-        if response and hasattr(response, 'headers'):
-            # Get filename from S3 key or create a meaningful name
-            filename = os.path.basename(s3_key) or f"material_document_{document_id}"
-            
-            # Add file extension if not present
-            if not os.path.splitext(filename)[1]:
-                filename += ".pdf"  # Default to PDF, adjust based on your needs
-            
-            # Force download by changing Content-Disposition header
-            response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
-            response.headers['Content-Type'] = 'application/octet-stream'
+        # Add file extension if not present
+        if not os.path.splitext(filename)[1]:
+            filename += ".pdf"  # Default to PDF, adjust based on your needs
         
-        return response
+        return serve_s3_file(s3_key, download_name=filename)
         
     except ClientError as e:
         # Handle S3-specific errors
@@ -11513,8 +11305,6 @@ def material_hs_summary(material_id):
 def view_sample_document(file_path):
     """SECURE: View sample document through app proxy"""
     try:
-        from urllib.parse import unquote
-        
         # Decode the file path (handles URL encoding)
         decoded_path = unquote(file_path)
         
@@ -12019,8 +11809,8 @@ def upload_material_document():
                         # Upload to S3
                         file.seek(0)
                         try:
-                            upload_result = upload_file_to_s3(file, s3_bucket, s3_key)
-                            current_app.logger.info(f"upload_file_to_s3 returned: {upload_result}")
+                            upload_result = upload_fileobj_to_s3(file, s3_bucket, s3_key)
+                            current_app.logger.info(f"upload_fileobj_to_s3 returned: {upload_result}")
                             
                             if upload_result is False:
                                 current_app.logger.error("S3 upload explicitly returned False")
@@ -12936,16 +12726,25 @@ def calculate_detailed_demurrage(shipment_id, container_id, container_type, reas
         if demurrage_date <= demurrage_from:
             return {"success": False, "message": "Demurrage date must be after demurrage from date"}
         
-        total_days = (demurrage_date - demurrage_from).days
-        excluded_days = 0  # Add weekend/holiday logic here if needed
-        chargeable_days = max(0, total_days - excluded_days)
+        shipment_entry = ShipDocumentEntryMaster.query.get(shipment_id)
+        company_config = get_demurrage_config(shipment_entry)
+        calculation_result = calculate_chargeable_days(demurrage_from, demurrage_date, company_config)
+        total_days = calculation_result['total_days']
+        excluded_days = calculation_result['excluded_days']
+        chargeable_days = calculation_result['chargeable_days']
+
+        # Tier dates are the chargeable days themselves, from the calendar that counted them
+        calendar = get_working_calendar(company_config.country_id) if company_config else WorkingCalendar()
+        exclusions = {
+            "exclude_weekends": bool(company_config and company_config.exclude_weekends),
+            "exclude_holidays": bool(company_config and company_config.exclude_holidays),
+        }
 
         # Calculate tier breakdown with detailed date information
         tier_breakdown = []
         total_amount = 0.0
         remaining_days = chargeable_days
         current_day = 1
-        current_date = demurrage_from
 
         for tier in rate_card.tiers:
             if remaining_days <= 0:
@@ -12972,9 +12771,9 @@ def calculate_detailed_demurrage(shipment_id, container_id, container_type, reas
             if days_in_tier > 0:
                 tier_amount = days_in_tier * tier.rate_amount
                 
-                # Calculate actual date range for this tier
-                tier_start_date = current_date
-                tier_end_date = current_date + timedelta(days=days_in_tier - 1) if days_in_tier > 0 else current_date
+                # First and last chargeable day of this tier
+                tier_start_date = calendar.nth_chargeable_day(demurrage_from, current_day, **exclusions)
+                tier_end_date = calendar.nth_chargeable_day(demurrage_from, current_day + days_in_tier - 1, **exclusions)
                 
                 tier_breakdown.append({
                     "tier_number": tier.tier_number,
@@ -12992,7 +12791,6 @@ def calculate_detailed_demurrage(shipment_id, container_id, container_type, reas
                 total_amount += tier_amount
                 remaining_days -= days_in_tier
                 current_day += days_in_tier
-                current_date += timedelta(days=days_in_tier)
 
         return {
             "success": True,
@@ -13473,24 +13271,13 @@ def calculate_demurrage_rate():
         if not container_size_id or not container_type_id:
             return jsonify({"success": False, "message": "Container size/type information not found"}), 400
 
-        # Find matching rate card
-        rate_card = DemurrageRateCard.query.filter_by(
-            container_size_id=container_size_id,
-            container_type_id=container_type_id,
-            demurrage_reason_id=reason_id,
-            company_id=current_user.company_id,
-            is_active=True
-        ).first()
-
-        # If company-specific rate card not found, try general rate card
-        if not rate_card:
-            rate_card = DemurrageRateCard.query.filter_by(
-                container_size_id=container_size_id,
-                container_type_id=container_type_id,
-                demurrage_reason_id=reason_id,
-                company_id=None,  # General rate card
-                is_active=True
-            ).first()
+        # Find matching rate card: company-specific first, then the general rate card
+        rate_card = get_projection_engine().find_rate_card(
+            container_size_id,
+            container_type_id,
+            int(reason_id),
+            company_id=current_user.company_id
+        )
 
         if not rate_card:
             return jsonify({
@@ -13498,17 +13285,11 @@ def calculate_demurrage_rate():
                 "message": "No rate card found for the selected container and reason combination"
             }), 404
 
-        # Get company demurrage configuration
-        company_config = CompanyDemurrageConfig.query.filter_by(
-            country_id=shipment_entry.country_id if hasattr(shipment_entry, 'country_id') else 1,
-            is_active=True
-        ).first()
-
         # Calculate chargeable days
         calculation_result = calculate_chargeable_days(
             order_shipment.demurrage_from,
             demurrage_date,
-            company_config
+            get_demurrage_config(shipment_entry)
         )
 
         # Calculate tiered amounts
@@ -13520,7 +13301,7 @@ def calculate_demurrage_rate():
         # Prepare response
         result = {
             "calculated_amount": total_amount,
-            "currency_code": rate_card.currency.CurrencyCode,
+            "currency_code": rate_card.currency_code,
             "currency_id": rate_card.currency_id,
             "calculation_details": {
                 "demurrage_from": order_shipment.demurrage_from.strftime('%Y-%m-%d'),
@@ -13528,7 +13309,7 @@ def calculate_demurrage_rate():
                 "total_days": calculation_result['total_days'],
                 "chargeable_days": calculation_result['chargeable_days'],
                 "excluded_days": calculation_result['excluded_days'],
-                "rate_card_id": rate_card.id,
+                "rate_card_id": rate_card.rate_card_id,
                 "rate_card_name": rate_card.rate_card_name,
                 "tier_breakdown": tier_breakdown
             }
@@ -13541,100 +13322,47 @@ def calculate_demurrage_rate():
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+def get_demurrage_config(shipment_entry):
+    """Active demurrage configuration for the shipment's country"""
+    return CompanyDemurrageConfig.query.filter_by(
+        country_id=shipment_entry.country_id if hasattr(shipment_entry, 'country_id') else 1,
+        is_active=True
+    ).first()
+
+
 def calculate_chargeable_days(demurrage_from, demurrage_date, company_config):
-    """Calculate chargeable days excluding weekends/holidays based on config"""
-    
-    if demurrage_date <= demurrage_from:
-        return {
-            'total_days': 0,
-            'chargeable_days': 0,
-            'excluded_days': 0
-        }
-    
-    total_days = (demurrage_date - demurrage_from).days
-    excluded_days = 0
-    
-    # Count excluded days if configuration exists
-    if company_config:
-        current_date = demurrage_from
-        while current_date < demurrage_date:
-            current_date += timedelta(days=1)
-            
-            # Exclude weekends if configured
-            if company_config.exclude_weekends and current_date.weekday() >= 5:  # Saturday=5, Sunday=6
-                excluded_days += 1
-            
-            # TODO: Add holiday exclusion logic here if needed
-            # if company_config.exclude_holidays and is_holiday(current_date):
-            #     excluded_days += 1
-    
-    chargeable_days = max(0, total_days - excluded_days)
-    
-    return {
-        'total_days': total_days,
-        'chargeable_days': chargeable_days,
-        'excluded_days': excluded_days
-    }
+    """
+    Calculate chargeable days excluding weekends/holidays based on config.
+    Holidays are the public holidays of the config's country (Non-Working Days master).
+    """
+    if not company_config:
+        return WorkingCalendar().chargeable_days(demurrage_from, demurrage_date)
+
+    return get_working_calendar(company_config.country_id).chargeable_days(
+        demurrage_from,
+        demurrage_date,
+        exclude_weekends=bool(company_config.exclude_weekends),
+        exclude_holidays=bool(company_config.exclude_holidays)
+    )
 
 
 def calculate_tiered_amount(chargeable_days, rate_card):
-    """Calculate amount based on flexible tiered rate structure"""
+    """
+    Calculate amount based on flexible tiered rate structure.
+    rate_card is a rate card curve from the projection engine (or a DemurrageRateCard).
+    """
     
     if chargeable_days <= 0:
         return [], 0.0
     
-    # Get tiers ordered by tier_number
-    tiers = DemurrageRateCardTier.query.filter_by(
-        rate_card_id=rate_card.id
-    ).order_by(DemurrageRateCardTier.tier_number).all()
+    if isinstance(rate_card, DemurrageRateCard):
+        rate_card = get_projection_engine().curves.get(rate_card.id)
     
-    if not tiers:
+    if not rate_card or not rate_card.has_tiers:
         return [], 0.0
     
-    tier_breakdown = []
-    total_amount = 0.0
-    remaining_days = chargeable_days
-    current_day = 1
-    
-    for tier in tiers:
-        if remaining_days <= 0:
-            break
-            
-        # Calculate days for this tier
-        tier_start = tier.from_day
-        tier_end = tier.to_day
-        
-        # Skip if current day is past this tier's start
-        if current_day > tier_start:
-            if tier_end and current_day > tier_end:
-                continue  # Skip this tier entirely
-            tier_start = current_day
-        
-        if tier_end:
-            # Finite tier
-            days_in_tier = min(remaining_days, tier_end - tier_start + 1)
-            if current_day > tier_start:
-                days_in_tier = min(remaining_days, tier_end - current_day + 1)
-        else:
-            # Unlimited tier (last tier)
-            days_in_tier = remaining_days
-        
-        if days_in_tier > 0:
-            tier_amount = days_in_tier * tier.rate_amount
-            
-            tier_breakdown.append({
-                "tier": tier.tier_number,
-                "days": days_in_tier,
-                "rate": tier.rate_amount,
-                "amount": tier_amount,
-                "day_range": tier.day_range_display
-            })
-            
-            total_amount += tier_amount
-            remaining_days -= days_in_tier
-            current_day += days_in_tier
-    
-    return tier_breakdown, round(total_amount, 2)
+    tier_breakdown = rate_card.breakdown(chargeable_days)
+    return tier_breakdown, round(rate_card.cost(chargeable_days), 2)
 
 @bp.route("/api/demurrage/shipment/<int:shipment_id>/demurrage-from", methods=["GET"])
 @login_required
@@ -14074,9 +13802,10 @@ def demurrage_reasons():
     # Apply filters
     if search:
         query = query.filter(
-            db.or_(
-                DemurrageReasons.reason_name.ilike(f'%{search}%'),
-                DemurrageReasons.description.ilike(f'%{search}%')
+            search_filter(
+                search,
+                prefix_columns=(DemurrageReasons.reason_name,),
+                fulltext_columns=(DemurrageReasons.description,),
             )
         )
     
@@ -14089,9 +13818,7 @@ def demurrage_reasons():
     query = query.order_by(DemurrageReasons.created_at.desc())
     
     # Paginate
-    reasons = query.paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    reasons = paginate_query(query, page, per_page)
     
     return render_template(
         "masters/demurrage_reasons.html",
@@ -14267,7 +13994,7 @@ def upload_demurrage_attachment(demurrage_id):
 
         # Upload to S3 using your existing function
         try:
-            upload_file_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
+            upload_fileobj_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
         except Exception as e:
             return (
                 jsonify({"success": False, "error": f"Error uploading file: {str(e)}"}),
@@ -14345,7 +14072,7 @@ def update_demurrage_attachment(demurrage_id, attachment_id):
             s3_key = f"demurrage_attachments/{demurrage.shipment.docserial}/{demurrage_id}/{unique_filename}"
             
             try:
-                upload_file_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
+                upload_fileobj_to_s3(file, current_app.config["S3_BUCKET_NAME"], s3_key)
                 attachment.attachment_path = s3_key
                 attachment.file_name = filename
             except Exception as s3_error:
@@ -14558,78 +14285,9 @@ def get_material_document_alerts(material_id, shipment_id):
 @bp.route('/api/all-orders-alert-status')
 @login_required
 def get_all_orders_alert_status():
-    """Get alert status for all orders to highlight rows in orders page (CHA side)"""
+    """Get alert status for the orders on the current page (?entry_ids=...) to highlight rows in orders page (CHA side)"""
     try:
-        # Get all entries (orders) for CHA users - you may need to adjust the filter based on your system
-        # This assumes CHA users can see all entries, but you might want to filter by assigned CHA
-        entries = ShipDocumentEntryMaster.query.all()
-        
-        print(f"Found {len(entries)} entries for CHA alert check")
-        
-        alert_status = {}
-        
-        for entry in entries:
-            print(f"\nProcessing Entry ID: {entry.id}, DocSerial: {entry.docserial}")
-            
-            # Get the related OrderShipment to check for ETA
-            order_shipment = OrderShipment.query.filter_by(ship_doc_entry_id=entry.id).first()
-            if order_shipment:
-                print(f"  Found OrderShipment with ETA: {order_shipment.eta}")
-            else:
-                print("  No OrderShipment found")
-
-            # Determine the comparison date
-            comparison_date = None
-            if order_shipment and order_shipment.eta:
-                comparison_date = order_shipment.eta.date()
-            elif entry.dealineDate:
-                comparison_date = entry.dealineDate
-            
-            print(f"  Comparison date set to: {comparison_date}")
-            
-            has_alerts = False
-            
-            if comparison_date:
-                # Get all shipment items for this entry
-                shipment_items = db.session.query(ShipmentItem).filter_by(
-                    shipment_id=entry.id
-                ).all()
-                print(f"  Found {len(shipment_items)} shipment items")
-                
-                for item in shipment_items:
-                    print(f"    Processing ShipmentItem ID: {item.id}")
-                    if item.po_detail_id:
-                        po_detail = PODetail.query.get(item.po_detail_id)
-                        if po_detail and po_detail.material_id:
-                            print(f"      Found PODetail with Material ID: {po_detail.material_id}")
-                            
-                            # Check if any documents expire before the comparison date
-                            expiring_docs = MaterialHSDocuments.query.filter(
-                                MaterialHSDocuments.material_id == po_detail.material_id,
-                                MaterialHSDocuments.expiry_date.isnot(None),
-                                MaterialHSDocuments.expiry_date < comparison_date
-                            ).first()
-                            
-                            if expiring_docs:
-                                print(f"      ALERT: Expiring document found with expiry date {expiring_docs.expiry_date}")
-                                has_alerts = True
-                                break
-                            else:
-                                print("      No expiring document found")
-                    
-                    if has_alerts:
-                        break
-            
-            alert_status[entry.id] = {
-                'has_alerts': has_alerts,
-                'entry_id': entry.id,
-                'docserial': entry.docserial
-            }
-            print(f"  Final alert status for entry: {has_alerts}")
-        
-        print("\n--- Final Alert Status Result ---")
-        for eid, status in alert_status.items():
-            print(f"Entry ID: {eid}, Has Alerts: {status['has_alerts']}")
+        alert_status = get_entry_alert_status(entry_ids_from_request())
 
         return jsonify({
             'success': True,
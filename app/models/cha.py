@@ -442,7 +442,8 @@ class ShipDocumentEntryAttachment(db.Model):
     )
     description = db.Column(db.String(255), nullable=False)
     isMandatory = db.Column(db.Integer, nullable=False)
-    attachement_path = db.Column(db.String(255), nullable=False)
+    attachement_path = db.Column(db.String(255), nullable=False, index=True)
+    content_hash = db.Column(db.String(64), index=True)  # SHA-256 of the uploaded file
     note = db.Column(db.String(255))
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     customer_id = db.Column(db.Integer, db.ForeignKey("customer.id"))
@@ -507,6 +508,10 @@ class ChatMessage(db.Model):
     )
     parent_message = db.relationship("ChatMessage", remote_side=[id], backref="replies")
 
+    __table_args__ = (
+        db.Index("idx_chat_messages_reference_created", "reference_id", "created_at", "id"),
+    )
+
 
 class ChatThread(db.Model):
     """Model for chat threads"""
@@ -569,6 +574,18 @@ class ChatAttachment(db.Model):
     message = db.relationship("ChatMessage", back_populates="attachments")
 
 
+class ChatUnreadCounter(db.Model):
+    """Unread chat messages per user and thread (maintained by app/notification_store.py)"""
+
+    __tablename__ = "chat_unread_counters"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    thread_id = db.Column(db.Integer, db.ForeignKey("chat_threads.id"), primary_key=True)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+    last_message_id = db.Column(db.Integer, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+
 class Order(db.Model):
     __tablename__ = "order"
     id = db.Column(db.Integer, primary_key=True)
@@ -701,6 +718,39 @@ class OrderShipment(db.Model):
     job_type_rel = db.relationship('OsJobType', backref='shipments')
 
 
+class ShipmentMonthlyRollup(db.Model):
+    """Shipment counts per company, customer, month and job type for the dashboard (app/shipment_rollups.py)"""
+
+    __tablename__ = "shipment_monthly_rollup"
+
+    id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, nullable=False)
+    customer_id = db.Column(db.Integer, nullable=False, default=0)  # 0 = no customer
+    period_year = db.Column(db.Integer, nullable=False)  # 0 = no created_at
+    period_month = db.Column(db.Integer, nullable=False)
+    job_type = db.Column(db.Integer, nullable=False)
+    on_time_count = db.Column(db.Integer, nullable=False, default=0)
+    demurrage_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "company_id", "customer_id", "period_year", "period_month", "job_type",
+            name="uq_shipment_monthly_rollup_key"
+        ),
+        db.Index("ix_shipment_monthly_rollup_customer", "customer_id", "period_year", "period_month"),
+    )
+
+
+class ShipmentRollupState(db.Model):
+    """Single row: when shipment_monthly_rollup was last rebuilt and last known to be wrong"""
+
+    __tablename__ = "shipment_rollup_state"
+
+    id = db.Column(db.Integer, primary_key=True)  # Always 1
+    rebuilt_at = db.Column(db.DateTime, nullable=True)  # Start of the last completed rebuild
+    stale_at = db.Column(db.DateTime, nullable=True)  # Last failed update or bulk change
+
+
 
 class ShipCatDocumentAICheck(db.Model):
     """Model for AI Check Fields for Ship Category Documents"""
@@ -1572,3 +1622,22 @@ class OsJobType(db.Model):
 
     
 
+
+
+class SearchDocument(db.Model):
+    """Search index row of a customer, entry, shipment, attachment or container (app/search_index.py)"""
+    __tablename__ = 'search_documents'
+    __table_args__ = (
+        db.UniqueConstraint('entity_type', 'entity_id', name='uq_search_documents_entity'),
+        db.Index('ft_search_documents_text', 'title', 'keywords', 'body', mysql_prefix='FULLTEXT'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity_type = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    company_id = db.Column(db.Integer, nullable=True, index=True)
+    entry_id = db.Column(db.Integer, nullable=True)  # Ship document entry the row belongs to
+    title = db.Column(db.String(255), nullable=True)
+    keywords = db.Column(db.Text, nullable=True)  # Reference numbers: BL, container, invoice, ...
+    body = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
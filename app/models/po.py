@@ -320,3 +320,38 @@ class MaterialHSDocuments(db.Model):
     uploader = db.relationship('User', backref='uploaded_material_docs')
     company = db.relationship('CompanyInfo', backref='material_hs_documents')
 
+
+class EntryDocumentAlert(db.Model):
+    """Nightly snapshot of document-expiry alerts per entry (app/document_alerts.py)"""
+    __tablename__ = 'entry_document_alerts'
+
+    entry_id = db.Column(db.Integer, db.ForeignKey('ship_document_entry_master.id'), primary_key=True)
+    company_id = db.Column(db.Integer, nullable=True, index=True)
+    # Any material document expiring before the entry's ETA/deadline (CHA side)
+    has_alerts = db.Column(db.Boolean, nullable=False, default=False)
+    # Only the entry company's own documents (customer portal)
+    has_company_alerts = db.Column(db.Boolean, nullable=False, default=False)
+    refreshed_at = db.Column(db.DateTime, default=get_sri_lanka_time)
+
+
+class POImportJob(db.Model):
+    """Excel purchase order import running in the background (app/po/excel_import.py)"""
+    __tablename__ = 'po_import_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('company_info.id'), nullable=False)
+    user_role = db.Column(db.String(50), nullable=True)  # Role-based PO scope of the uploader
+    filename = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    stage = db.Column(db.String(20), nullable=True)  # reading, headers, lines, saving, completion
+    total_rows = db.Column(db.Integer, nullable=True)
+    processed_rows = db.Column(db.Integer, default=0)
+    stats = db.Column(db.Text, nullable=True)  # JSON: new_pos, new_items, updated_items, completed_items, completed_pos
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<POImportJob {self.id} {self.status}>"
@@ -0,0 +1,27 @@
+from app.extensions import db
+from datetime import datetime
+
+
+class ReportExportJob(db.Model):
+    """Large report export generated in the background and stored on S3"""
+
+    __tablename__ = "report_export_jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    company_id = db.Column(db.Integer, db.ForeignKey("company_info.id"), nullable=False)
+    report = db.Column(db.String(50), nullable=False)  # e.g. daily_status
+    export_format = db.Column(db.String(10), nullable=False)  # excel, csv
+    filename = db.Column(db.String(255), nullable=False)
+    request_data = db.Column(db.Text, nullable=True)  # JSON: params, filter_model, sort_model, columns
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued, running, done, failed
+    row_count = db.Column(db.Integer, nullable=True)
+    s3_key = db.Column(db.String(512), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    user = db.relationship("User", backref=db.backref("report_export_jobs", lazy="dynamic"))
+
+    def __repr__(self):
+        return f"<ReportExportJob {self.id} {self.report} {self.status}>"
@@ -0,0 +1,143 @@
+from app.extensions import db
+from datetime import datetime
+
+
+class ValidationJob(db.Model):
+    """Queued AI validation work for a single ShipDocumentEntryAttachment"""
+
+    __tablename__ = "validation_jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # One job row per attachment - re-uploads reset the existing row
+    attachment_id = db.Column(
+        db.Integer,
+        db.ForeignKey("ship_document_entry_attachement.id", ondelete="CASCADE"),
+        nullable=False,
+        unique=True,
+    )
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    attachment = db.relationship(
+        "ShipDocumentEntryAttachment",
+        backref=db.backref(
+            "validation_job", uselist=False, cascade="all, delete-orphan", passive_deletes=True
+        ),
+    )
+
+    __table_args__ = (
+        db.Index("ix_validation_jobs_status_run_after", "status", "run_after"),
+    )
+
+    def __repr__(self):
+        return f"<ValidationJob {self.id} attachment={self.attachment_id} {self.status}>"
+
+
+class SampleExtractionCache(db.Model):
+    """Extracted text and derived data for a ShipCatDocument sample file, keyed by S3 object version"""
+
+    __tablename__ = "sample_extraction_cache"
+
+    id = db.Column(db.Integer, primary_key=True)
+    s3_key = db.Column(db.String(512), nullable=False)
+    etag = db.Column(db.String(128), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False, index=True)  # SHA-256 of the file bytes
+    extracted_text = db.Column(db.Text(length=4294967295), nullable=False)  # LONGTEXT on MySQL
+    document_type = db.Column(db.Text)  # JSON result of get_document_type
+    features = db.Column(db.Text(length=4294967295))  # JSON term counts of the extracted text
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint("s3_key", "etag", name="uq_sample_extraction_key_etag"),
+    )
+
+    def __repr__(self):
+        return f"<SampleExtractionCache {self.s3_key} {self.etag}>"
+
+
+class ValidationResultCache(db.Model):
+    """Validation outcome of a file's content against a ShipCatDocument sample, reused for re-uploads"""
+
+    __tablename__ = "validation_result_cache"
+
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)  # SHA-256 of the submitted file
+    ship_cat_document_id = db.Column(
+        db.Integer, db.ForeignKey("ship_cat_document.id", ondelete="CASCADE"), nullable=False
+    )
+    sample_version = db.Column(db.String(64), nullable=False)  # See validation_result_cache.sample_version
+    ai_validated = db.Column(db.Integer, nullable=False)
+    validation_results = db.Column(db.Text)
+    extracted_content = db.Column(db.Text)
+    validation_percentage = db.Column(db.Float)
+    document_similarity_percentage = db.Column(db.Float)
+    similarity_message = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # Pruned when old
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "content_hash", "ship_cat_document_id", "sample_version", name="uq_validation_result_cache_key"
+        ),
+    )
+
+    def __repr__(self):
+        return f"<ValidationResultCache {self.content_hash[:12]} doc={self.ship_cat_document_id}>"
+
+
+class ShipCategorySimilarityIndex(db.Model):
+    """Number of accepted documents per shipment category; their terms are in ShipCategoryTermFrequency"""
+
+    __tablename__ = "ship_category_similarity_index"
+
+    id = db.Column(db.Integer, primary_key=True)
+    ship_category_id = db.Column(db.Integer, db.ForeignKey("ship_category.id"), nullable=False, unique=True)
+    document_count = db.Column(db.Integer, nullable=False, default=0)
+    version = db.Column(db.Integer, nullable=False, default=0)  # Bumped on every update
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    ship_category = db.relationship("ShipCategory", backref=db.backref("similarity_index", uselist=False))
+
+    def __repr__(self):
+        return f"<ShipCategorySimilarityIndex category={self.ship_category_id} docs={self.document_count}>"
+
+
+class ShipCategoryTermFrequency(db.Model):
+    """Number of a shipment category's accepted documents containing a term"""
+
+    __tablename__ = "ship_category_term_frequencies"
+
+    ship_category_id = db.Column(db.Integer, db.ForeignKey("ship_category.id"), primary_key=True)
+    term = db.Column(db.String(100), primary_key=True)
+    document_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ShipCategoryTermFrequency category={self.ship_category_id} {self.term}={self.document_count}>"
+
+
+class ShipCategoryDocumentRules(db.Model):
+    """Document classification keywords and field extraction patterns of a shipment category"""
+
+    __tablename__ = "ship_category_document_rules"
+
+    id = db.Column(db.Integer, primary_key=True)
+    ship_category_id = db.Column(db.Integer, db.ForeignKey("ship_category.id"), nullable=False, unique=True)
+    # JSON {document type: {"positive": {keyword: weight}, "negative": [keyword]}}
+    document_types = db.Column(db.Text)
+    # JSON {section: {field name: [regex with one capture group]}}
+    field_patterns = db.Column(db.Text)
+    version = db.Column(db.Integer, nullable=False, default=0)  # Bump on every change
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    ship_category = db.relationship("ShipCategory", backref=db.backref("document_rules", uselist=False))
+
+    def __repr__(self):
+        return f"<ShipCategoryDocumentRules category={self.ship_category_id} version={self.version}>"
@@ -0,0 +1,365 @@
+# notification_store.py
+"""
+Per-user unread chat notification counters.
+
+chat_unread_counters holds, for every thread participant, how many messages
+in the thread are unread for them. Sending a message increments the counters
+of the recipients that may see it; marking messages read recomputes the
+counters of the affected threads. Page renders and notification polls then
+cost one indexed lookup on user_id, and the result is kept in a short-TTL
+per-process cache (NOTIFICATION_CACHE_TTL_SECONDS).
+
+A message is unread for a user when it is not read, was not sent by them,
+comes from the other side (customer <-> company users) and the thread's
+entry belongs to the user's company - the same rules get_all_notifications
+always applied.
+
+Once the change is committed, publish_chat_message / publish_chat_read push
+the new counts to the "user:<id>" and "thread:<id>" event topics
+(app/event_broker.py) so open pages do not have to poll.
+"""
+import time
+import threading
+
+from flask import current_app, has_app_context
+from sqlalchemy import and_, func, or_, text
+from sqlalchemy.orm import aliased
+
+from app.extensions import db
+from app.event_broker import publish_event
+from app.models.cha import (
+    ChatMessage,
+    ChatParticipant,
+    ChatThread,
+    ChatUnreadCounter,
+    ShipDocumentEntryMaster,
+)
+from app.models.user import User
+
+
+COMPANY_ROLES = ("user", "base_user")
+MAX_CHAT_NOTIFICATIONS = 10
+DEFAULT_CACHE_TTL_SECONDS = 15
+
+_cache = {}  # user_id -> (expires_at, notifications)
+_cache_lock = threading.Lock()
+
+
+def empty_notifications():
+    return {
+        'chat_notifications': [],
+        'questionnaire_reviews': [],
+        'monthly_safety_reviews': [],
+        'total_count': 0
+    }
+
+
+def _cache_ttl():
+    if has_app_context():
+        return current_app.config.get("NOTIFICATION_CACHE_TTL_SECONDS", DEFAULT_CACHE_TTL_SECONDS)
+    return DEFAULT_CACHE_TTL_SECONDS
+
+
+def forget_notifications(user_ids):
+    with _cache_lock:
+        for user_id in user_ids:
+            _cache.pop(user_id, None)
+
+
+def _entry_visible_to(recipient):
+    """The thread's entry belongs to the recipient's company"""
+    return or_(
+        and_(recipient.role == 'customer', ShipDocumentEntryMaster.company_id == recipient.company_id),
+        and_(recipient.role != 'customer', ShipDocumentEntryMaster.assigned_clearing_company_id == recipient.company_id),
+    )
+
+
+def _from_other_side(recipient, sender):
+    return or_(
+        and_(recipient.role == 'customer', sender.role.in_(COMPANY_ROLES)),
+        and_(recipient.role != 'customer', sender.role == 'customer'),
+    )
+
+
+# ----------------------------------------------------------------------
+# Writes (called inside the caller's transaction; the caller commits)
+# ----------------------------------------------------------------------
+def record_new_message(message, sender_role):
+    """
+    Count a newly flushed message as unread for the participants who may see it.
+    Returns the recipients' user ids.
+    """
+    if sender_role == 'customer':
+        recipient_filter = User.role != 'customer'
+    elif sender_role in COMPANY_ROLES:
+        recipient_filter = User.role == 'customer'
+    else:
+        return []
+
+    recipient_ids = [
+        user_id
+        for (user_id,) in db.session.query(ChatParticipant.user_id)
+        .join(User, User.id == ChatParticipant.user_id)
+        .join(ChatThread, ChatThread.id == ChatParticipant.thread_id)
+        .join(ShipDocumentEntryMaster, ShipDocumentEntryMaster.id == ChatThread.reference_id)
+        .filter(
+            ChatParticipant.thread_id == message.thread_id,
+            ChatParticipant.user_id != message.sender_id,
+            recipient_filter,
+            _entry_visible_to(User),
+        )
+        .distinct()
+    ]
+    if not recipient_ids:
+        return []
+
+    db.session.execute(
+        text(
+            "INSERT INTO chat_unread_counters (user_id, thread_id, unread_count, last_message_id) "
+            "VALUES (:user_id, :thread_id, 1, :message_id) "
+            "ON DUPLICATE KEY UPDATE unread_count = unread_count + 1, last_message_id = VALUES(last_message_id)"
+        ),
+        [
+            {"user_id": user_id, "thread_id": message.thread_id, "message_id": message.id}
+            for user_id in recipient_ids
+        ],
+    )
+    forget_notifications(recipient_ids)
+    return recipient_ids
+
+
+def refresh_thread_counters(thread_ids=None):
+    """
+    Recompute the counters of the given threads (all threads if None) from
+    chat_messages, e.g. after messages were marked read. Returns the ids of
+    the users whose counters changed.
+    """
+    if thread_ids is not None:
+        thread_ids = list(set(thread_ids))
+        if not thread_ids:
+            return set()
+
+    recipient = aliased(User)
+    sender = aliased(User)
+    query = (
+        db.session.query(
+            ChatParticipant.user_id,
+            ChatParticipant.thread_id,
+            func.count(func.distinct(ChatMessage.id)),
+            func.max(ChatMessage.id),
+        )
+        .join(recipient, recipient.id == ChatParticipant.user_id)
+        .join(ChatThread, ChatThread.id == ChatParticipant.thread_id)
+        .join(ShipDocumentEntryMaster, ShipDocumentEntryMaster.id == ChatThread.reference_id)
+        .join(
+            ChatMessage,
+            and_(
+                ChatMessage.thread_id == ChatParticipant.thread_id,
+                ChatMessage.is_read == False,
+                ChatMessage.sender_id != ChatParticipant.user_id,
+            ),
+        )
+        .join(sender, sender.id == ChatMessage.sender_id)
+        .filter(_entry_visible_to(recipient), _from_other_side(recipient, sender))
+        .group_by(ChatParticipant.user_id, ChatParticipant.thread_id)
+    )
+    stale = ChatUnreadCounter.query
+    if thread_ids is not None:
+        query = query.filter(ChatParticipant.thread_id.in_(thread_ids))
+        stale = stale.filter(ChatUnreadCounter.thread_id.in_(thread_ids))
+
+    counters = [
+        {"user_id": user_id, "thread_id": thread_id, "unread_count": count, "last_message_id": last_message_id}
+        for user_id, thread_id, count, last_message_id in query
+    ]
+    affected_users = {user_id for (user_id,) in stale.with_entities(ChatUnreadCounter.user_id)}
+    affected_users.update(counter["user_id"] for counter in counters)
+
+    stale.delete(synchronize_session=False)
+    if counters:
+        db.session.bulk_insert_mappings(ChatUnreadCounter, counters)
+
+    if thread_ids is None:
+        with _cache_lock:
+            _cache.clear()
+    else:
+        forget_notifications(affected_users)
+    return affected_users
+
+
+# ----------------------------------------------------------------------
+# Reads
+# ----------------------------------------------------------------------
+def get_unread_count(user_id):
+    """Total unread chat messages for a user"""
+    cached = _cache_get(user_id)
+    if cached is not None:
+        return cached['total_count']
+
+    return db.session.query(func.coalesce(func.sum(ChatUnreadCounter.unread_count), 0)).filter(
+        ChatUnreadCounter.user_id == user_id
+    ).scalar()
+
+
+def get_user_notifications(user_id):
+    """
+    Notifications for the topbar: unread total plus the latest
+    MAX_CHAT_NOTIFICATIONS unread messages.
+    """
+    cached = _cache_get(user_id)
+    if cached is not None:
+        return cached
+
+    notifications = empty_notifications()
+
+    unread = (
+        db.session.query(ChatUnreadCounter.thread_id, ChatUnreadCounter.unread_count)
+        .filter(ChatUnreadCounter.user_id == user_id, ChatUnreadCounter.unread_count > 0)
+        .all()
+    )
+    if unread:
+        recipient = aliased(User)
+        sender = aliased(User)
+        messages = (
+            db.session.query(
+                ChatMessage.id,
+                ChatMessage.thread_id,
+                ChatMessage.message,
+                ChatMessage.created_at,
+                ChatThread.module_name,
+                ChatThread.reference_id,
+                ShipDocumentEntryMaster.docserial,
+                sender.username,
+            )
+            .join(ChatThread, ChatThread.id == ChatMessage.thread_id)
+            .join(ShipDocumentEntryMaster, ShipDocumentEntryMaster.id == ChatThread.reference_id)
+            .join(sender, sender.id == ChatMessage.sender_id)
+            .join(recipient, recipient.id == user_id)
+            .filter(
+                ChatMessage.thread_id.in_([thread_id for thread_id, _ in unread]),
+                ChatMessage.is_read == False,
+                ChatMessage.sender_id != user_id,
+                _from_other_side(recipient, sender),
+            )
+            .order_by(ChatMessage.created_at.desc())
+            .limit(MAX_CHAT_NOTIFICATIONS)
+        )
+
+        for message_id, thread_id, message, created_at, module_name, reference_id, docserial, username in messages:
+            message = message or ''
+            notifications['chat_notifications'].append({
+                'id': message_id,
+                'thread_id': thread_id,
+                'module_name': module_name,
+                'entry_id': reference_id,
+                'sender_name': username,
+                'message': message[:100] + '...' if len(message) > 100 else message,
+                'timestamp': created_at,
+                'docserial': docserial or 'N/A'
+            })
+        notifications['total_count'] = sum(count for _, count in unread)
+
+    with _cache_lock:
+        _cache[user_id] = (time.monotonic() + _cache_ttl(), notifications)
+    return notifications
+
+
+# ----------------------------------------------------------------------
+# Live updates (call after commit)
+# ----------------------------------------------------------------------
+def _unread_state(user_ids, thread_ids):
+    """({(user_id, thread_id): unread}, {user_id: total unread}) for the given users"""
+    thread_counts = dict(
+        ((user_id, thread_id), count)
+        for user_id, thread_id, count in db.session.query(
+            ChatUnreadCounter.user_id, ChatUnreadCounter.thread_id, ChatUnreadCounter.unread_count
+        ).filter(ChatUnreadCounter.user_id.in_(user_ids), ChatUnreadCounter.thread_id.in_(thread_ids))
+    )
+    totals = dict(
+        db.session.query(ChatUnreadCounter.user_id, func.sum(ChatUnreadCounter.unread_count))
+        .filter(ChatUnreadCounter.user_id.in_(user_ids))
+        .group_by(ChatUnreadCounter.user_id)
+        .all()
+    )
+    return thread_counts, totals
+
+
+def publish_chat_message(message, recipient_ids):
+    """Push a new message to its thread and, with the new counts, to its recipients"""
+    try:
+        thread = message.thread
+        publish_event([f"thread:{thread.id}"], "thread_message", {
+            'thread_id': thread.id,
+            'module_name': thread.module_name,
+            'entry_id': thread.reference_id,
+            'message_id': message.id,
+            'sender_id': message.sender_id,
+        })
+        if not recipient_ids:
+            return
+
+        thread_counts, totals = _unread_state(recipient_ids, [thread.id])
+        entry = ShipDocumentEntryMaster.query.get(thread.reference_id)
+        body = message.message or ''
+        notification = {
+            'id': message.id,
+            'thread_id': thread.id,
+            'module_name': thread.module_name,
+            'entry_id': thread.reference_id,
+            'sender_name': message.sender.username if message.sender else None,
+            'message': body[:100] + '...' if len(body) > 100 else body,
+            'timestamp': message.created_at,
+            'docserial': entry.docserial if entry else 'N/A'
+        }
+        for user_id in recipient_ids:
+            publish_event([f"user:{user_id}"], "chat_message", {
+                'notification': notification,
+                'thread_unread_count': thread_counts.get((user_id, thread.id), 0),
+                'total_count': int(totals.get(user_id) or 0),
+            })
+    except Exception as e:
+        # Live updates are best effort - the change itself is already committed
+        print(f"Error publishing chat event: {str(e)}")
+
+
+def publish_chat_read(thread_ids, user_ids):
+    """Push the new unread counts of the given threads to the affected users"""
+    try:
+        thread_ids = list(set(thread_ids))
+        user_ids = list(user_ids)
+        if not thread_ids or not user_ids:
+            return
+
+        threads = (
+            db.session.query(ChatThread.id, ChatThread.module_name, ChatThread.reference_id)
+            .filter(ChatThread.id.in_(thread_ids))
+            .all()
+        )
+        thread_counts, totals = _unread_state(user_ids, thread_ids)
+        for user_id in user_ids:
+            publish_event([f"user:{user_id}"], "chat_read", {
+                'threads': [
+                    {
+                        'thread_id': thread_id,
+                        'module_name': module_name,
+                        'entry_id': reference_id,
+                        'unread_count': thread_counts.get((user_id, thread_id), 0),
+                    }
+                    for thread_id, module_name, reference_id in threads
+                ],
+                'total_count': int(totals.get(user_id) or 0),
+            })
+    except Exception as e:
+        # Live updates are best effort - the change itself is already committed
+        print(f"Error publishing chat event: {str(e)}")
+
+
+def _cache_get(user_id):
+    with _cache_lock:
+        entry = _cache.get(user_id)
+        if not entry:
+            return None
+        if entry[0] < time.monotonic():
+            del _cache[user_id]
+            return None
+        return entry[1]
@@ -0,0 +1,178 @@
+# pagination.py
+"""
+SQL-side paging, counting and searching for the masters list views.
+
+paginate_query() fetches one page with LIMIT/OFFSET and takes the total from
+a COUNT(*) OVER() column of the same SELECT, so a listing costs one query
+instead of loading the table (or a COUNT plus a page query). The returned
+Page has the attributes the templates already use from Flask-SQLAlchemy's
+Pagination (items, page, pages, has_prev, iter_pages, ...).
+
+count_where() returns all badge counts of a listing from one SELECT of
+SUM(CASE ...) columns, and search_filter() builds a search condition that
+uses prefix LIKE on indexed columns and MATCH ... AGAINST on FULLTEXT
+indexed ones instead of '%term%' scans.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+from math import ceil
+
+from sqlalchemy import case, func, or_, true
+
+DEFAULT_PER_PAGE = 10
+MAX_PER_PAGE = 100
+
+_TOTAL_COLUMN = "_page_total"
+
+
+class Page:
+    """One page of a query's results"""
+
+    def __init__(self, items, page, per_page, total):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+
+    @property
+    def pages(self):
+        return ceil(self.total / self.per_page) if self.per_page else 0
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+    def iter_pages(self, left_edge=2, left_current=2, right_current=5, right_edge=2):
+        """Page numbers for the pager, with None where numbers are skipped"""
+        last = 0
+        for num in range(1, self.pages + 1):
+            if (
+                num <= left_edge
+                or self.page - left_current - 1 < num < self.page + right_current
+                or num > self.pages - right_edge
+            ):
+                if last + 1 != num:
+                    yield None
+                yield num
+                last = num
+
+    def page_numbers(self):
+        """Pager of the orders tables: up to 7 slots, None for a gap"""
+        if self.pages <= 7:
+            return list(range(1, self.pages + 1))
+        if self.page <= 4:
+            return list(range(1, 6)) + [None, self.pages]
+        if self.page >= self.pages - 3:
+            return [1, None] + list(range(self.pages - 4, self.pages + 1))
+        return [1, None, self.page - 1, self.page, self.page + 1, None, self.pages]
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+@lru_cache(maxsize=None)
+def _row_type(fields):
+    return namedtuple("PageRow", fields, rename=True)
+
+
+def _strip_total(row):
+    """The row without the trailing total column, keeping the column names"""
+    if len(row) == 2:
+        return row[0]
+    return _row_type(tuple(name or "column" for name in row._fields[:-1]))(*row[:-1])
+
+
+def paginate_query(query, page=1, per_page=DEFAULT_PER_PAGE, max_per_page=MAX_PER_PAGE):
+    """
+    Page of an ordered query, with the total counted by the database in the
+    same SELECT. Items have the query's own shape: entities for a single-entity
+    query, named rows otherwise.
+    """
+    page = max(page or 1, 1)
+    per_page = min(max(per_page or DEFAULT_PER_PAGE, 1), max_per_page)
+
+    rows = (
+        query.add_columns(func.count().over().label(_TOTAL_COLUMN))
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+        .all()
+    )
+
+    if rows:
+        total = rows[0][-1]
+    elif page > 1:
+        # Past the last page the window has no rows to report the total on
+        total = query.order_by(None).count()
+    else:
+        total = 0
+
+    return Page([_strip_total(row) for row in rows], page, per_page, total)
+
+
+def count_where(query, **conditions):
+    """
+    {name: rows of the query matching the condition} in one SELECT. A
+    condition of None counts every row.
+    """
+    columns = [
+        (
+            func.count()
+            if condition is None
+            else func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+        ).label(name)
+        for name, condition in conditions.items()
+    ]
+    row = query.order_by(None).with_entities(*columns).one()
+    return {name: int(row[index]) for index, name in enumerate(conditions)}
+
+
+def _escape_like(term):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def boolean_mode_terms(term):
+    """'abc trad' -> '+abc* +trad*': every word must start a word in the column"""
+    words = re.findall(r"\w+", term)
+    return " ".join(f"+{word}*" for word in words)
+
+
+def search_filter(term, prefix_columns=(), fulltext_columns=()):
+    """
+    Condition matching rows where a prefix column starts with the term or a
+    full-text column has words starting with each word of the term. A blank
+    term matches every row.
+
+    Prefix columns need a B-tree index and fulltext columns a FULLTEXT index
+    (see db_changes.sql). LIKE is used rather than ILIKE, which would wrap the
+    column in LOWER() and skip the index; the tables use case-insensitive
+    collations. Wildcards in the term are escaped with MySQL's default
+    backslash escape.
+    """
+    term = (term or "").strip()
+    if not term:
+        return true()
+
+    pattern = f"{_escape_like(term)}%"
+    conditions = [column.like(pattern) for column in prefix_columns]
+
+    boolean_terms = boolean_mode_terms(term)
+    if boolean_terms:
+        conditions.extend(column.match(boolean_terms) for column in fulltext_columns)
+
+    return or_(*conditions)
@@ -0,0 +1,153 @@
+# pdf_extraction.py
+"""
+Page-level PDF text extraction.
+
+PyMuPDF reads the text layer of every page. Pages without one (scanned
+bills of lading, photographed invoices) are rasterised and OCR'd with
+Tesseract in a shared process pool, so a multi-page scan uses all cores.
+Pages are yielded in order as soon as they are ready, and every document
+is bounded by a page cap and an overall timeout.
+"""
+import io
+import os
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz  # PyMuPDF
+import pytesseract
+from PIL import Image
+from flask import current_app, has_app_context
+
+
+# Defaults used outside an app context; see the PDF_* settings in config.py
+DEFAULT_MAX_PAGES = 200
+DEFAULT_TIMEOUT_SECONDS = 120
+DEFAULT_OCR_DPI = 300
+DEFAULT_MIN_TEXT_CHARS = 20
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+
+def _setting(key, default):
+    if has_app_context():
+        return current_app.config.get(key, default)
+    return default
+
+
+def _ocr_processes():
+    """
+    PDF_OCR_PROCESSES, or by default this process's share of the CPU cores:
+    every validation worker process has its own pool, so the cores are
+    divided among VALIDATION_WORKER_PROCESSES of them
+    """
+    configured = _setting("PDF_OCR_PROCESSES", 0)
+    if configured:
+        return configured
+    workers = max(1, _setting("VALIDATION_WORKER_PROCESSES", 1) or 1)
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _get_ocr_pool():
+    """Process pool shared by all extractions in this process, created on first OCR"""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            processes = _ocr_processes()
+            _ocr_pool = ProcessPoolExecutor(max_workers=processes)
+            print(f"Started PDF OCR pool with {processes} processes")
+        return _ocr_pool
+
+
+def _reset_ocr_pool():
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is not None:
+            _ocr_pool.shutdown(wait=False, cancel_futures=True)
+        _ocr_pool = None
+
+
+def ocr_pdf_page(file_path, page_index, dpi, ocr_timeout):
+    """Rasterise one PDF page and OCR it (runs inside a pool process)"""
+    with fitz.open(file_path) as doc:
+        pixmap = doc.load_page(page_index).get_pixmap(dpi=dpi)
+        image = Image.open(io.BytesIO(pixmap.tobytes("png")))
+    try:
+        return pytesseract.image_to_string(image, timeout=ocr_timeout)
+    except RuntimeError as e:
+        # pytesseract raises RuntimeError when Tesseract exceeds the timeout
+        print(f"OCR timed out for page {page_index + 1} of {file_path}: {str(e)}")
+        return ""
+
+
+def iter_pdf_pages(file_path, max_pages=None, timeout=None):
+    """
+    Yield (page_number, text) for each page of a PDF, in page order.
+
+    Stops early (without raising) when the page cap or the per-document
+    timeout is reached; pages not yet extracted are skipped.
+    """
+    max_pages = max_pages or _setting("PDF_MAX_PAGES", DEFAULT_MAX_PAGES)
+    timeout = timeout or _setting("PDF_EXTRACTION_TIMEOUT", DEFAULT_TIMEOUT_SECONDS)
+    dpi = _setting("PDF_OCR_DPI", DEFAULT_OCR_DPI)
+    min_text_chars = _setting("PDF_MIN_TEXT_CHARS", DEFAULT_MIN_TEXT_CHARS)
+    deadline = time.monotonic() + timeout
+
+    # Pass 1: read the text layer and find pages that need OCR
+    page_texts = {}
+    with fitz.open(file_path) as doc:
+        page_count = min(doc.page_count, max_pages)
+        if doc.page_count > max_pages:
+            print(f"PDF has {doc.page_count} pages, extracting the first {max_pages}")
+
+        for page_index in range(page_count):
+            if time.monotonic() > deadline:
+                print(f"PDF extraction timed out after {timeout}s reading the text layer")
+                page_count = page_index
+                break
+            text = doc.load_page(page_index).get_text("text")
+            if len(text.strip()) >= min_text_chars:
+                page_texts[page_index] = text
+
+    ocr_pages = [i for i in range(page_count) if i not in page_texts]
+
+    # Pass 2: OCR the remaining pages in parallel
+    futures = {}
+    if ocr_pages:
+        print(f"OCR needed for {len(ocr_pages)} of {page_count} pages")
+        ocr_timeout = max(int(deadline - time.monotonic()), 1)
+        pool = _get_ocr_pool()
+        for page_index in ocr_pages:
+            futures[page_index] = pool.submit(ocr_pdf_page, file_path, page_index, dpi, ocr_timeout)
+
+    try:
+        for page_index in range(page_count):
+            if page_index in page_texts:
+                yield page_index + 1, page_texts[page_index]
+                continue
+
+            remaining = deadline - time.monotonic()
+            try:
+                text = futures[page_index].result(timeout=max(remaining, 0))
+            except FutureTimeoutError:
+                print(f"PDF extraction timed out after {timeout}s at page {page_index + 1}")
+                return
+            except BrokenProcessPool:
+                print("PDF OCR pool crashed, it will be restarted for the next document")
+                _reset_ocr_pool()
+                return
+            except Exception as e:
+                print(f"Error in OCR of page {page_index + 1}: {str(e)}")
+                text = ""
+            yield page_index + 1, text
+    finally:
+        # Drop queued OCR work the caller no longer needs
+        for future in futures.values():
+            future.cancel()
+
+
+def extract_pdf_text(file_path, max_pages=None, timeout=None):
+    """Full text of a PDF, pages joined by newlines"""
+    return "\n".join(text for _, text in iter_pdf_pages(file_path, max_pages, timeout) if text)
@@ -0,0 +1,619 @@
+# excel_import.py
+"""
+Purchase order import from SAP Excel exports (po.upload_excel).
+
+The sheet is read once and normalised column by column, using the aliases of
+create_column_mapping. Existing suppliers, materials, order units, PO headers
+and PO lines are preloaded into dicts, new rows are written with bulk
+inserts and changed lines with batched bulk updates, all in one transaction.
+
+Imports run in a background thread (POImportJob). Progress is written to the
+job row on its own connection, so it is visible while the import
+transaction is still open.
+"""
+import os
+import json
+import tempfile
+import traceback
+from datetime import datetime, timedelta
+from decimal import Decimal
+from threading import Thread
+
+import pandas as pd
+from flask import current_app
+from flask_login import current_user
+from sqlalchemy import and_, exists
+
+from app import db
+from app.models.po import POHeader, PODetail, POSupplier, POMaterial, POOrderUnit, POImportJob
+
+
+BATCH_SIZE = 1000
+
+# Fields (create_column_mapping keys) every export must have
+REQUIRED_FIELDS = [
+    'po_number', 'po_date', 'supplier_name', 'material_code', 'material_description',
+    'order_unit', 'order_quantity', 'net_price', 'po_line_item', 'delivery_date'
+]
+
+
+def create_column_mapping():
+    """Create flexible column mapping to handle different Excel formats"""
+    return {
+        # Required columns with possible variations - INCLUDING YOUR EXACT COLUMN NAMES
+        'po_number': [
+            'Purchasing Document', 'PO No', 'PO Number', 'Purchase Order Number', 'Purchase Order No',
+            'PO_No', 'po_no', 'po_number', 'PurchaseOrderNumber'
+        ],
+        'po_line_item': [
+            'Item', 'PO Line Item', 'Line Item', 'Line', 'PO Item',
+            'po_line_item', 'line_item', 'item_number'
+        ],
+        'po_date': [
+            'Document Date', 'PO Date', 'Purchase Order Date', 'Order Date', 'Date',
+            'po_date', 'order_date', 'purchase_date'
+        ],
+        'supplier_name': [
+            'Supplier/Supplying Plant', 'Supplier', 'Supplier Name', 'Vendor', 'Vendor Name',
+            'supplier_name', 'vendor_name', 'supplier', 'Supplying Plant'
+        ],
+        'supplier_code': [
+            'Supplier Code', 'Vendor Code', 'Supplier ID', 'Vendor ID',
+            'supplier_code', 'vendor_code', 'supplier_id'
+        ],
+        'total_value': [
+            'Net Price', 'Value', 'Total Value', 'Amount', 'Total Amount', 'Price',
+            'value', 'total_value', 'amount', 'net_value'
+        ],
+        'currency': [
+            'Currency', 'Curr', 'currency', 'curr'
+        ],
+        'inco_term': [
+            'Inco Term', 'Incoterm', 'Inco Terms', 'Terms',
+            'inco_term', 'incoterm', 'delivery_terms'
+        ],
+        'payment_term': [
+            'Payment Term', 'Payment Terms', 'Pay Terms',
+            'payment_term', 'payment_terms', 'pay_terms'
+        ],
+        'delivery_date': [
+            'Delivery Date', 'PO delivery date', 'Due Date', 'Expected Date',
+            'delivery_date', 'due_date', 'expected_delivery_date'
+        ],
+        # Optional columns - INCLUDING YOUR EXACT COLUMN NAMES
+        'material_code': [
+            'Material', 'Material Code', 'Item Code', 'Product Code', 'SKU',
+            'material_code', 'item_code', 'product_code'
+        ],
+        'material_description': [
+            'Short Text', 'Material Description', 'Description', 'Item Description',
+            'material_description', 'description', 'item_description'
+        ],
+        'order_quantity': [
+            'Order Quantity', 'Quantity', 'Qty', 'Order Qty',
+            'order_quantity', 'quantity', 'qty'
+        ],
+        'order_unit': [
+            'Order Unit', 'Unit', 'UOM', 'Unit of Measure',
+            'order_unit', 'unit', 'uom'
+        ],
+        'quantity_received': [
+            'Quantity Received', 'Received Qty', 'Received',
+            'quantity_received', 'received_qty', 'received'
+        ],
+        'still_to_deliver': [
+            'Still to be delivered (qty)', 'Still to Deliver', 'Remaining Qty', 'Balance', 'Outstanding',
+            'still_to_deliver', 'remaining_qty', 'balance'
+        ],
+        'net_price': [
+            'Net Price', 'Unit Price', 'Price per Unit',
+            'net_price', 'unit_price', 'price_per_unit'
+        ],
+        'license_required': [
+            'License', 'License Required', 'License Req',
+            'license', 'license_required', 'license_req'
+        ],
+        'teip_required': [
+            'TEIP', 'TEIP Required', 'TEIP Req',
+            'teip', 'teip_required', 'teip_req'
+        ],
+        'bank_info': [
+            'Bank', 'Bank Info', 'Bank Information',
+            'bank', 'bank_info', 'bank_information'
+        ],
+        'country_port': [
+            'Country /Port', 'Country', 'Port', 'Country/Port',
+            'country_port', 'country', 'port', 'origin'
+        ]
+    }
+
+
+def map_columns(df, column_mapping):
+    """Map actual column names to expected column names"""
+    mapped_columns = {}
+    available_columns = {str(col).strip().lower(): col for col in reversed(df.columns.tolist())}
+
+    print(f"Available columns in Excel: {df.columns.tolist()}")
+
+    for target_col, possible_names in column_mapping.items():
+        for possible_name in possible_names:
+            # Exact match (case insensitive)
+            actual_col = available_columns.get(possible_name.strip().lower())
+            if actual_col is not None:
+                mapped_columns[target_col] = actual_col
+                break
+        else:
+            print(f"Warning: Could not find column for '{target_col}' in {possible_names}")
+
+    print(f"Mapped columns: {mapped_columns}")
+    return mapped_columns
+
+
+def read_po_sheet(path):
+    """
+    Read an export into a DataFrame with one normalised column per field.
+    Returns (df, missing required fields).
+    """
+    raw = pd.read_excel(path)
+    print(f"Excel file read successfully. Rows: {len(raw)}")
+
+    column_mapping = create_column_mapping()
+    mapped = map_columns(raw, column_mapping)
+    missing = [field for field in REQUIRED_FIELDS if field not in mapped]
+    if missing:
+        return None, [column_mapping[field][0] for field in missing]
+
+    # Rows without a PO number were never imported (groupby drops them)
+    raw = raw[raw[mapped['po_number']].notna()]
+
+    df = pd.DataFrame(index=raw.index)
+    for field in ('po_number', 'material_code', 'material_description', 'order_unit'):
+        df[field] = raw[mapped[field]].astype(str)
+    df['item_number'] = pd.to_numeric(raw[mapped['po_line_item']]).astype(int)
+    df['order_quantity'] = pd.to_numeric(raw[mapped['order_quantity']]).astype(float)
+    df['net_price'] = pd.to_numeric(raw[mapped['net_price']]).astype(float)
+
+    if 'still_to_deliver' in mapped:
+        df['quantity_pending'] = pd.to_numeric(raw[mapped['still_to_deliver']], errors='coerce').fillna(df['order_quantity'])
+    else:
+        df['quantity_pending'] = df['order_quantity']
+    if 'quantity_received' in mapped:
+        df['quantity_received'] = pd.to_numeric(raw[mapped['quantity_received']], errors='coerce').fillna(0.0)
+    else:
+        df['quantity_received'] = 0.0
+
+    delivery_dates = _parse_dates(raw[mapped['delivery_date']])
+    # A date that is present but unreadable leaves an existing line's date unchanged
+    df['delivery_date_invalid'] = raw[mapped['delivery_date']].notna() & delivery_dates.isna()
+    df['delivery_date'] = _dates(delivery_dates)
+    df['po_date'] = _dates(_parse_dates(raw[mapped['po_date']]))
+
+    # SAP exports put "<code> <name>" in the supplier column
+    supplier = raw[mapped['supplier_name']].astype(str).str.strip()
+    if 'supplier_code' in mapped:
+        df['supplier_code'] = raw[mapped['supplier_code']].astype(str).str.strip()
+        df['supplier_name'] = supplier
+    else:
+        parts = supplier.str.split(n=1, expand=True)
+        codes = parts[0].fillna('')
+        df['supplier_code'] = codes.where(codes != '', 'UNKNOWN')
+        df['supplier_name'] = parts[1].fillna(supplier) if 1 in parts.columns else supplier
+
+    return df, []
+
+
+def _parse_dates(values):
+    """
+    Parse a date column value by value, as the row-by-row import did; NaT
+    where unreadable. pd.to_datetime over the whole column would infer one
+    format from the first value and coerce other layouts to NaT (or read
+    03/04 the other way round). Each distinct value is parsed once.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+
+    parsed = {}
+
+    def parse(value):
+        if pd.isna(value):
+            return pd.NaT
+        if value not in parsed:
+            try:
+                parsed[value] = pd.to_datetime(value)
+            except (ValueError, TypeError, OverflowError):
+                parsed[value] = pd.NaT
+        return parsed[value]
+
+    return values.map(parse)
+
+
+def _dates(values):
+    """datetime Series -> object Series of dates, None where missing"""
+    return pd.Series([value.date() if pd.notna(value) else None for value in values], index=values.index, dtype=object)
+
+
+def _decimal(value):
+    return Decimal(str(float(value)))
+
+
+def _chunks(values, size=BATCH_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _bulk_insert(model, mappings):
+    for batch in _chunks(mappings):
+        db.session.bulk_insert_mappings(model, batch)
+
+
+def _bulk_update(model, mappings):
+    for batch in _chunks(mappings):
+        db.session.bulk_update_mappings(model, batch)
+
+
+def _next_sysdocnums(count):
+    """count consecutive system document numbers after the last one"""
+    first = POHeader.generate_sysdocnum()
+    number = int(first[3:])
+    return [f"CHA{number + i:04d}" for i in range(count)]
+
+
+def _load_codes(column, values, *criteria):
+    """{code: id} for the given codes of a lookup table (suppliers, materials, units)"""
+    found = {}
+    model = column.class_
+    for batch in _chunks(values):
+        query = db.session.query(column, model.id).filter(column.in_(batch), *criteria)
+        found.update(dict(query.all()))
+    return found
+
+
+def _get_or_create_codes(column, new_rows, *criteria):
+    """
+    {code: id} for the codes in new_rows ({code: insert mapping}); the ones
+    that do not exist yet are bulk inserted first.
+    """
+    found = _load_codes(column, new_rows, *criteria)
+    missing = [mapping for code, mapping in new_rows.items() if code not in found]
+    if missing:
+        print(f"Creating {len(missing)} new {column.class_.__tablename__} rows")
+        _bulk_insert(column.class_, missing)
+        found.update(_load_codes(column, [mapping[column.key] for mapping in missing], *criteria))
+    return found
+
+
+def import_purchase_orders(df, company_id, user_id, user_role, progress=None):
+    """
+    Apply a normalised export (read_po_sheet) for a company. Customers work on
+    their company's POs, other roles on the POs they created.
+
+    New PO lines are created, changed quantities/delivery dates are updated,
+    open lines missing from the export are marked completed and so are POs
+    whose lines are all completed. The caller commits.
+    """
+    progress = progress or (lambda stage, processed_rows: None)
+    now = datetime.utcnow()
+    stats = {
+        'new_pos': 0,
+        'new_items': 0,
+        'updated_items': 0,
+        'completed_items': 0,
+        'completed_pos': 0
+    }
+
+    if user_role == 'customer':
+        header_scope = POHeader.company_id == company_id
+    else:
+        header_scope = POHeader.created_by == user_id
+
+    # Open lines before the import, to complete the ones missing from the export
+    open_lines = (
+        db.session.query(PODetail.id, PODetail.po_number, PODetail.material_code, PODetail.item_number, PODetail.order_quantity)
+        .join(POHeader)
+        .filter(header_scope, PODetail.is_completed == False)
+        .all()
+    )
+    print(f"Found {len(open_lines)} existing incomplete PO items")
+
+    # PO headers: preload existing ones, bulk insert the rest
+    progress('headers', 0)
+    po_numbers = df['po_number'].unique().tolist()
+    headers = {}
+    for batch in _chunks(po_numbers):
+        query = (
+            db.session.query(POHeader.id, POHeader.po_number, POHeader.sysdocnum, POHeader.supplier_id,
+                             POSupplier.supplier_code, POSupplier.supplier_name)
+            .join(POSupplier, POSupplier.id == POHeader.supplier_id)
+            .filter(header_scope, POHeader.po_number.in_(batch))
+        )
+        for header in query:
+            headers.setdefault(header.po_number, header)
+    existing_header_ids = [header.id for header in headers.values()]
+
+    new_headers = df[~df['po_number'].isin(list(headers))].drop_duplicates('po_number')
+    if len(new_headers):
+        invalid = new_headers[new_headers['po_date'].map(lambda value: value is None)]
+        if len(invalid):
+            raise ValueError(f"Invalid Document Date for PO {invalid['po_number'].iloc[0]}")
+
+        supplier_rows = {}
+        for code, name in zip(new_headers['supplier_code'], new_headers['supplier_name']):
+            supplier_rows.setdefault(code, {'supplier_code': code, 'supplier_name': name, 'company_id': company_id})
+        supplier_ids = _get_or_create_codes(POSupplier.supplier_code, supplier_rows, POSupplier.company_id == company_id)
+
+        _bulk_insert(POHeader, [
+            {
+                'sysdocnum': sysdocnum,
+                'po_number': row.po_number,
+                'po_date': row.po_date,
+                'supplier_id': supplier_ids[row.supplier_code],
+                'company_id': company_id,
+                'created_by': user_id,
+                'is_completed': False,
+            }
+            for row, sysdocnum in zip(new_headers.itertuples(index=False), _next_sysdocnums(len(new_headers)))
+        ])
+        for batch in _chunks(new_headers['po_number']):
+            query = (
+                db.session.query(POHeader.id, POHeader.po_number, POHeader.sysdocnum, POHeader.supplier_id,
+                                 POSupplier.supplier_code, POSupplier.supplier_name)
+                .join(POSupplier, POSupplier.id == POHeader.supplier_id)
+                .filter(POHeader.company_id == company_id, POHeader.po_number.in_(batch))
+            )
+            for header in query:
+                headers[header.po_number] = header
+        stats['new_pos'] = len(new_headers)
+        print(f"Created {len(new_headers)} new PO headers")
+
+    # Existing lines of these POs, keyed like the export rows
+    lines = {}
+    header_ids = [header.id for header in headers.values()]
+    for batch in _chunks(header_ids):
+        query = db.session.query(
+            PODetail.id, PODetail.po_header_id, PODetail.material_code, PODetail.item_number,
+            PODetail.quantity_received, PODetail.quantity_pending, PODetail.delivery_date, PODetail.line_total
+        ).filter(PODetail.po_header_id.in_(batch))
+        for line in query:
+            lines[(line.po_header_id, line.material_code, line.item_number)] = line._asdict()
+
+    # Lines: compare every row with the preloaded lines
+    changed_ids = set()
+    new_lines = []
+    excel_items = set()
+    totals = {}
+
+    for position, row in enumerate(df.itertuples(index=False), start=1):
+        header = headers[row.po_number]
+        key = (header.id, row.material_code, row.item_number)
+        excel_items.add((row.po_number, row.material_code, row.item_number))
+
+        line = lines.get(key)
+        if line is None:
+            order_quantity = _decimal(row.order_quantity)
+            net_price = _decimal(row.net_price)
+            line = {
+                'po_header_id': header.id,
+                'po_number': row.po_number,
+                'sysdocnum': header.sysdocnum,
+                'item_number': row.item_number,
+                'material_code': row.material_code,
+                'material_name': row.material_description,
+                'order_unit': row.order_unit,
+                'order_quantity': order_quantity,
+                'quantity_received': _decimal(row.quantity_received),
+                'quantity_pending': _decimal(row.quantity_pending),
+                'delivery_date': row.delivery_date,
+                'net_price': net_price,
+                'line_total': order_quantity * net_price,
+                'supplier_id': header.supplier_id,
+                'supplier_code': header.supplier_code,
+                'supplier_name': header.supplier_name,
+                'company_id': company_id,
+                'is_completed': False,
+            }
+            lines[key] = line
+            new_lines.append(line)
+        else:
+            # quantity_received is derived from order quantity - still to be delivered
+            new_qty_pending = _decimal(row.quantity_pending)
+            new_qty_received = _decimal(row.order_quantity) - new_qty_pending
+            new_delivery_date = line['delivery_date'] if row.delivery_date_invalid else row.delivery_date
+
+            if (line['quantity_received'] != new_qty_received or line['quantity_pending'] != new_qty_pending
+                    or line['delivery_date'] != new_delivery_date):
+                line['quantity_received'] = new_qty_received
+                line['quantity_pending'] = new_qty_pending
+                line['delivery_date'] = new_delivery_date
+                line['is_completed'] = False
+                line['updated_at'] = now
+                if 'id' in line:
+                    changed_ids.add(line['id'])
+
+        totals[header.id] = totals.get(header.id, Decimal('0.00')) + line['line_total']
+
+        if position % BATCH_SIZE == 0:
+            progress('lines', position)
+
+    progress('saving', len(df))
+
+    if new_lines:
+        material_rows = {}
+        unit_rows = {}
+        for line in new_lines:
+            material_rows.setdefault(line['material_code'], {
+                'material_code': line['material_code'],
+                'material_name': line['material_name'],
+                'company_id': company_id,
+            })
+            unit_rows.setdefault(line['order_unit'], {'order_unit': line['order_unit']})
+        material_ids = _get_or_create_codes(POMaterial.material_code, material_rows, POMaterial.company_id == company_id)
+        unit_ids = _get_or_create_codes(POOrderUnit.order_unit, unit_rows)
+
+        for line in new_lines:
+            line['material_id'] = material_ids[line['material_code']]
+            line['order_unit_id'] = unit_ids[line['order_unit']]
+        _bulk_insert(PODetail, new_lines)
+        stats['new_items'] = len(new_lines)
+
+    if changed_ids:
+        _bulk_update(PODetail, [
+            {
+                'id': line['id'],
+                'quantity_received': line['quantity_received'],
+                'quantity_pending': line['quantity_pending'],
+                'delivery_date': line['delivery_date'],
+                'is_completed': False,
+                'updated_at': now,
+            }
+            for line in lines.values() if line.get('id') in changed_ids
+        ])
+        stats['updated_items'] = len(changed_ids)
+
+    # Header totals; existing POs in the export are open again
+    _bulk_update(POHeader, [
+        {'id': header_id, 'total_value': total, 'is_completed': False, 'updated_at': now}
+        for header_id, total in totals.items()
+    ])
+    print(f"Updated totals of {len(totals)} PO headers ({len(existing_header_ids)} existing)")
+
+    # Open lines that are no longer in the export are completed
+    progress('completion', len(df))
+    completed = [
+        {
+            'id': line.id,
+            'is_completed': True,
+            'quantity_received': line.order_quantity,
+            'quantity_pending': Decimal('0.00'),
+            'updated_at': now,
+        }
+        for line in open_lines
+        if (line.po_number, line.material_code, line.item_number) not in excel_items
+    ]
+    _bulk_update(PODetail, completed)
+    stats['completed_items'] = len(completed)
+
+    # POs without open lines are completed
+    open_line = exists().where(and_(PODetail.po_header_id == POHeader.id, PODetail.is_completed == False))
+    completed_header_ids = [
+        header_id for header_id, in db.session.query(POHeader.id).filter(
+            header_scope, POHeader.is_completed == False, ~open_line
+        )
+    ]
+    for batch in _chunks(completed_header_ids):
+        POHeader.query.filter(POHeader.id.in_(batch)).update(
+            {POHeader.is_completed: True, POHeader.updated_at: now}, synchronize_session=False
+        )
+    stats['completed_pos'] = len(completed_header_ids)
+
+    print(f"Final statistics: {stats}")
+    return stats
+
+
+# ----------------------------------------------------------------------
+# Background jobs
+# ----------------------------------------------------------------------
+def start_po_import_job(file):
+    """Save an uploaded export and import it for the current user (who must have a company) in a background thread"""
+    extension = os.path.splitext(file.filename)[1].lower() or '.xlsx'
+    fd, path = tempfile.mkstemp(suffix=extension)
+    os.close(fd)
+    file.save(path)
+
+    job = POImportJob(
+        user_id=current_user.id,
+        company_id=current_user.company_id,
+        user_role=current_user.role,
+        filename=file.filename,
+        status='queued',
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    Thread(
+        target=run_po_import_job, args=(current_app._get_current_object(), job.id, path), daemon=True
+    ).start()
+    return job
+
+
+def _report_progress(job_id, **values):
+    """Update the job row on a separate connection (the import transaction is still open)"""
+    table = POImportJob.__table__
+    with db.engine.begin() as connection:
+        connection.execute(table.update().where(table.c.id == job_id).values(**values))
+
+
+def _fail_job(job_id, error):
+    db.session.rollback()
+    job = POImportJob.query.get(job_id)
+    if job and job.status in ('queued', 'running'):
+        job.status = 'failed'
+        job.error = error
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
+    print(f"PO import job {job_id} failed: {error}")
+
+
+def fail_stale_import_job(job):
+    """
+    Mark a queued or running import failed once it is older than
+    PO_IMPORT_JOB_TIMEOUT_MINUTES: its thread died with the worker process.
+    Called when the job is read; returns the job.
+    """
+    timeout = current_app.config.get('PO_IMPORT_JOB_TIMEOUT_MINUTES', 60)
+    if (
+        job.status in ('queued', 'running')
+        and job.created_at
+        and job.created_at < datetime.utcnow() - timedelta(minutes=timeout)
+    ):
+        job.status = 'failed'
+        job.error = 'Import did not finish; the worker running it stopped. Please upload the file again.'
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
+    return job
+
+
+def run_po_import_job(app, job_id, path):
+    with app.app_context():
+        try:
+            _run_po_import_job(job_id, path)
+        except Exception as e:
+            print(f"Traceback: {traceback.format_exc()}")
+            _fail_job(job_id, str(e))
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+            db.session.remove()
+
+
+def _run_po_import_job(job_id, path):
+    job = POImportJob.query.get(job_id)
+    if not job or job.status != 'queued':
+        return
+
+    job.status = 'running'
+    job.stage = 'reading'
+    job.started_at = datetime.utcnow()
+    db.session.commit()
+    print(f"Running PO import job {job.id} ({job.filename})")
+
+    company_id, user_id, user_role = job.company_id, job.user_id, job.user_role
+    df, missing_columns = read_po_sheet(path)
+    if missing_columns:
+        raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
+    _report_progress(job_id, total_rows=len(df))
+
+    stats = import_purchase_orders(
+        df, company_id, user_id, user_role,
+        progress=lambda stage, processed_rows: _report_progress(job_id, stage=stage, processed_rows=processed_rows)
+    )
+    db.session.commit()
+
+    job = POImportJob.query.get(job_id)
+    job.status = 'done'
+    job.stage = None
+    job.processed_rows = len(df)
+    job.stats = json.dumps(stats)
+    job.completed_at = datetime.utcnow()
+    db.session.commit()
+    print(f"PO import job {job_id} finished: {stats}")
@@ -5,16 +5,16 @@ from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 from app.po import bp
 from app import db
-import pandas as pd
 import openpyxl
 from werkzeug.utils import secure_filename
 import os
-from decimal import Decimal, InvalidOperation
-from app.models.po import POHeader, PODetail, POSupplier, POMaterial, POOrderUnit, ShipmentItem
+import json
+from app.models.po import POHeader, PODetail, POSupplier, ShipmentItem, POImportJob
 from app.models.cha import OrderShipment, ShipDocumentEntryDocument, ShipDocumentEntryMaster, ShipCatDocument, ShipDocumentEntryAttachment
 from sqlalchemy import func, or_
 from botocore.exceptions import ClientError
 from app.utils_cha.s3_utils import upload_file_to_s3, get_s3_url, serve_s3_file
+from app.po.excel_import import fail_stale_import_job, start_po_import_job
 
 @bp.route('/purchase_orders', methods=['GET'])
 @login_required
@@ -320,457 +320,77 @@ def calculate_po_status(total_quantity, total_received):
 @bp.route('/upload', methods=['POST'])
 @login_required
 def upload_excel():
-    """Upload and process Excel file with item-level processing and completion tracking"""
+    """Upload an Excel file and import it in the background with completion tracking"""
     
     print(f"=== PO Excel Upload Started ===")
     print(f"User ID: {current_user.id}")
     print(f"User Role: {current_user.role}")
     print(f"Company ID: {current_user.company_id}")
     
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    
+    def upload_error(message):
+        if wants_json:
+            return jsonify({'success': False, 'message': message}), 400
+        flash(message, 'danger')
+        return redirect(url_for('po.purchase_orders'))
+    
     if 'excel_file' not in request.files:
         print("ERROR: No file selected in request")
-        flash('No file selected', 'danger')
-        return redirect(url_for('po.purchase_orders'))
+        return upload_error('No file selected')
     
     file = request.files['excel_file']
     
     if file.filename == '':
         print("ERROR: Empty filename")
-        flash('No file selected', 'danger')
-        return redirect(url_for('po.purchase_orders'))
+        return upload_error('No file selected')
     
     if not file.filename.lower().endswith(('.xlsx', '.xls')):
         print(f"ERROR: Invalid file type: {file.filename}")
-        flash('Please upload an Excel file (.xlsx or .xls)', 'danger')
-        return redirect(url_for('po.purchase_orders'))
+        return upload_error('Please upload an Excel file (.xlsx or .xls)')
     
-    try:
-        print(f"Reading Excel file: {file.filename}")
-        # Read Excel file
-        df = pd.read_excel(file)
-        print(f"Excel file read successfully. Rows: {len(df)}")
-        
-        # Validate required columns
-        required_columns = [
-            'Purchasing Document', 'Document Date', 'Supplier/Supplying Plant',
-            'Material', 'Short Text', 'Order Unit', 'Order Quantity',
-            'Net Price', 'Item', 'Delivery Date'
-        ]
-        
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            print(f"ERROR: Missing columns: {missing_columns}")
-            flash(f'Missing required columns: {", ".join(missing_columns)}', 'danger')
-            return redirect(url_for('po.purchase_orders'))
-        
-        print(f"All required columns found")
-        
-        # Process data with new item-level logic
-        processed_results = process_excel_data_with_completion_tracking(df)
-        
-        print(f"Processing completed: {processed_results}")
-        
-        flash_message = f'''Purchase Orders processed Successfully'''
-        
-        flash(flash_message, 'success')
-        print(f"=== PO Excel Upload Completed ===")
-        
-    except Exception as e:
-        print(f"ERROR in Excel upload: {str(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
-        flash(f'Error processing file: {str(e)}', 'danger')
-    
-    return redirect(url_for('po.purchase_orders'))
-
-
-def process_excel_data_with_completion_tracking(df):
-    """Process Excel data with item-level processing and completion tracking"""
-    
-    print(f"=== Processing Excel Data with Completion Tracking ===")
-    
-    # Statistics tracking
-    stats = {
-        'new_pos': 0,
-        'new_items': 0,
-        'updated_items': 0,
-        'completed_items': 0,
-        'completed_pos': 0
-    }
+    # Imported POs and the import job belong to the uploader's company
+    if not current_user.company_id:
+        print(f"ERROR: User {current_user.id} has no company")
+        return upload_error('Your account is not linked to a company, so purchase orders cannot be imported')
     
     try:
-        # Step 1: Get all current PO items for this company that are not completed
-        print(f"Step 1: Getting existing incomplete PO items for company {current_user.company_id}")
-        
-        # Apply role-based filter for existing POs
-        existing_pos_query = db.session.query(PODetail).join(POHeader)
-        
-        if current_user.role == 'customer':
-            print(f"User role: Filtering by company_id = {current_user.company_id}")
-            existing_pos_query = existing_pos_query.filter(
-                POHeader.company_id == current_user.company_id,
-                PODetail.is_completed == False
-            )
-        else:
-            print(f"Non-user role: Filtering by created_by = {current_user.id}")
-            existing_pos_query = existing_pos_query.filter(
-                POHeader.created_by == current_user.id,
-                PODetail.is_completed == False
-            )
-        
-        existing_po_items = existing_pos_query.all()
-        
-        print(f"Found {len(existing_po_items)} existing incomplete PO items")
-        
-        # Create a set of items from current Excel for comparison
-        excel_items = set()
-        
-        # Step 2: Process each row in the Excel file
-        print(f"Step 2: Processing {len(df)} rows from Excel")
-        
-        # Group by PO Number first
-        po_groups = df.groupby('Purchasing Document')
-        
-        for po_number, po_data in po_groups:
-            po_number = str(po_number)
-            print(f"Processing PO: {po_number} with {len(po_data)} items")
-            
-            # Check if PO header exists
-            po_header_query = POHeader.query.filter_by(po_number=po_number)
-            
-            # Apply role-based filter for PO header
-            if current_user.role == 'customer':
-                po_header_query = po_header_query.filter_by(company_id=current_user.company_id)
-            else:
-                po_header_query = po_header_query.filter_by(created_by=current_user.id)
-            
-            existing_po_header = po_header_query.first()
-            
-            if not existing_po_header:
-                print(f"  Creating new PO header for {po_number}")
-                # Create new PO header
-                po_header = create_new_po_header(po_data.iloc[0], po_number)
-                stats['new_pos'] += 1
-            else:
-                print(f"  Using existing PO header for {po_number} (ID: {existing_po_header.id})")
-                po_header = existing_po_header
-                # Reset completion status as we're processing it again
-                po_header.is_completed = False
-            
-            # Process each item in this PO
-            total_value = Decimal('0.00')
-            
-            for _, row in po_data.iterrows():
-                material_code = str(row['Material'])
-                item_number = int(row['Item'])
-                
-                # Add to Excel items set for completion tracking
-                excel_items.add((po_number, material_code, item_number))
-                
-                print(f"    Processing item: {material_code} (Item #{item_number})")
-                
-                # Check if this specific item exists
-                existing_item = PODetail.query.filter_by(
-                    po_header_id=po_header.id,
-                    material_code=material_code,
-                    item_number=item_number
-                ).first()
-                
-                if existing_item:
-                    print(f"      Found existing item - checking for updates")
-                    
-                    # FEATURE 3: Calculate quantity_received from order_quantity - quantity_pending
-                    new_qty_pending = Decimal(str(float(row.get('Still to be delivered (qty)', row['Order Quantity']))))
-                    new_qty_received = Decimal(str(float(row['Order Quantity']))) - new_qty_pending
-                    
-                    # FEATURE 2: Check delivery_date changes too
-                    new_delivery_date = None
-                    if 'Delivery Date' in row and pd.notna(row['Delivery Date']):
-                        try:
-                            new_delivery_date = pd.to_datetime(row['Delivery Date']).date()
-                        except:
-                            new_delivery_date = existing_item.delivery_date
-                    
-                    # Check if quantities OR delivery date have changed
-                    quantities_changed = (existing_item.quantity_received != new_qty_received or 
-                                        existing_item.quantity_pending != new_qty_pending)
-                    
-                    delivery_date_changed = (existing_item.delivery_date != new_delivery_date)
-                    
-                    if quantities_changed or delivery_date_changed:
-                        print(f"      Updating item:")
-                        
-                        if quantities_changed:
-                            print(f"        Quantities: Received {existing_item.quantity_received} -> {new_qty_received}, Pending {existing_item.quantity_pending} -> {new_qty_pending}")
-                            existing_item.quantity_received = new_qty_received
-                            existing_item.quantity_pending = new_qty_pending
-                        
-                        if delivery_date_changed:
-                            print(f"        Delivery Date: {existing_item.delivery_date} -> {new_delivery_date}")
-                            existing_item.delivery_date = new_delivery_date
-                        
-                        existing_item.is_completed = False  # Reset completion status
-                        existing_item.updated_at = datetime.utcnow()
-                        
-                        stats['updated_items'] += 1
-                    else:
-                        print(f"      No changes in quantities or delivery date - skipping")
-                    
-                    # Add to total value calculation
-                    total_value += existing_item.line_total
-                    
-                else:
-                    print(f"      Creating new item")
-                    # Create new item
-                    new_item = create_new_po_detail(po_header, row, po_number)
-                    stats['new_items'] += 1
-                    total_value += new_item.line_total
-            
-            # Update PO header total value
-            po_header.total_value = total_value
-            print(f"  Updated PO {po_number} total value: {total_value}")
-        
-        # Step 3: Mark items as completed if they don't appear in current Excel
-        print(f"Step 3: Marking items as completed")
-        
-        for existing_item in existing_po_items:
-            item_key = (existing_item.po_number, existing_item.material_code, existing_item.item_number)
-            
-            if item_key not in excel_items:
-                print(f"  Marking item as completed: PO {existing_item.po_number}, Material {existing_item.material_code}")
-                
-                # FEATURE 1: Set quantities for completed items
-                existing_item.is_completed = True
-                existing_item.quantity_received = existing_item.order_quantity  # Set received = ordered
-                existing_item.quantity_pending = Decimal('0.00')  # Set pending = 0
-                existing_item.updated_at = datetime.utcnow()
-                
-                print(f"    Updated quantities: Received = {existing_item.quantity_received}, Pending = 0")
-                stats['completed_items'] += 1
-        
-        # Step 4: Check and mark PO headers as completed if all items are completed
-        print(f"Step 4: Checking PO header completion status")
-        
-        # Get all PO headers that might need completion status update
-        po_headers_to_check_query = db.session.query(POHeader).filter(POHeader.is_completed == False)
-        
-        # Apply role-based filter
-        if current_user.role == 'customer':
-            po_headers_to_check_query = po_headers_to_check_query.filter(POHeader.company_id == current_user.company_id)
-        else:
-            po_headers_to_check_query = po_headers_to_check_query.filter(POHeader.created_by == current_user.id)
-        
-        po_headers_to_check = po_headers_to_check_query.all()
-        
-        for po_header in po_headers_to_check:
-            # Check if all items in this PO are completed
-            incomplete_items = PODetail.query.filter_by(
-                po_header_id=po_header.id,
-                is_completed=False
-            ).count()
-            
-            if incomplete_items == 0:
-                print(f"  Marking PO header as completed: {po_header.po_number}")
-                po_header.is_completed = True
-                po_header.updated_at = datetime.utcnow()
-                stats['completed_pos'] += 1
-            else:
-                print(f"  PO {po_header.po_number} still has {incomplete_items} incomplete items")
-        
-        # Commit all changes
-        db.session.commit()
-        print(f"All changes committed to database")
-        
-        print(f"Final statistics: {stats}")
-        print(f"=== End Processing Excel Data ===")
-        
-        return stats
-        
+        job = start_po_import_job(file)
+        print(f"PO import job {job.id} started for {file.filename}")
     except Exception as e:
-        print(f"ERROR in process_excel_data_with_completion_tracking: {str(e)}")
+        print(f"ERROR in Excel upload: {str(e)}")
         import traceback
         print(f"Traceback: {traceback.format_exc()}")
-        db.session.rollback()
-        raise e
-
-
-def create_new_po_header(first_row, po_number):
-    """Create a new PO header"""
+        return upload_error(f'Error processing file: {str(e)}')
     
-    print(f"    Creating new PO header for {po_number}")
-    
-    # Extract and process supplier info
-    supplier_info = str(first_row['Supplier/Supplying Plant']).strip()
-    supplier_parts = supplier_info.split(None, 1)
-    supplier_code = supplier_parts[0] if supplier_parts else 'UNKNOWN'
-    supplier_name = supplier_parts[1] if len(supplier_parts) > 1 else supplier_info
-    
-    print(f"    Supplier: {supplier_code} - {supplier_name}")
-    
-    # Get or create supplier
-    supplier = get_or_create_supplier(supplier_code, supplier_name)
-    
-    # Create PO Header
-    po_header = POHeader(
-        sysdocnum=POHeader.generate_sysdocnum(),
-        po_number=po_number,
-        po_date=pd.to_datetime(first_row['Document Date']).date(),
-        supplier_id=supplier.id,
-        company_id=current_user.company_id,
-        created_by=current_user.id,
-        is_completed=False  # New field
-    )
-    
-    db.session.add(po_header)
-    db.session.flush()  # Get the ID
+    if wants_json:
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status_url': url_for('po.import_job_status', job_id=job.id)
+        }), 202
     
-    print(f"    Created PO header with ID: {po_header.id}")
-    return po_header
+    flash('Purchase orders are being imported in the background. Refresh the page in a moment to see them.', 'info')
+    return redirect(url_for('po.purchase_orders'))
 
 
-def create_new_po_detail(po_header, row, po_number):
-    """Create a new PO detail item"""
-    
-    material_code = str(row['Material'])
-    material_name = str(row['Short Text'])
-    item_number = int(row['Item'])
-    
-    print(f"      Creating new PO detail: {material_code} - {material_name}")
-    
-    # Get or create material
-    material = get_or_create_material(material_code, material_name)
-    
-    # Get or create order unit
-    order_unit_str = str(row['Order Unit'])
-    order_unit = get_or_create_order_unit(order_unit_str)
-    
-    # Calculate quantities and prices
-    try:
-        order_quantity = Decimal(str(float(row['Order Quantity'])))
-        net_price = Decimal(str(float(row['Net Price'])))
-        line_total = order_quantity * net_price
-        
-        # Handle optional quantities
-        quantity_received = Decimal(str(float(row.get('Quantity Received', 0))))
-        quantity_pending = Decimal(str(float(row.get('Still to be delivered (qty)', order_quantity))))
-        
-        print(f"      Quantities: Order={order_quantity}, Received={quantity_received}, Pending={quantity_pending}")
-        
-    except (ValueError, InvalidOperation) as e:
-        print(f"      ERROR: Invalid number in row: {e}")
-        raise e
-    
-    # Create PO Detail
-    po_detail = PODetail(
-        po_header_id=po_header.id,
-        po_number=po_number,
-        sysdocnum=po_header.sysdocnum,
-        item_number=item_number,
-        material_id=material.id,
-        material_code=material_code,
-        material_name=material_name,
-        order_unit_id=order_unit.id,
-        order_unit=order_unit_str,
-        order_quantity=order_quantity,
-        quantity_received=quantity_received,
-        quantity_pending=quantity_pending,
-        delivery_date=pd.to_datetime(row['Delivery Date']).date() if pd.notna(row['Delivery Date']) else None,
-        net_price=net_price,
-        line_total=line_total,
-        supplier_id=po_header.supplier_id,
-        supplier_code=po_header.supplier.supplier_code,
-        supplier_name=po_header.supplier.supplier_name,
-        company_id=current_user.company_id,
-        is_completed=False  # New field
+@bp.route('/import-jobs/<int:job_id>')
+@login_required
+def import_job_status(job_id):
+    """Progress of a background PO import"""
+    job = fail_stale_import_job(
+        POImportJob.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
     )
-    
-    db.session.add(po_detail)
-    db.session.flush()
-    
-    print(f"      Created PO detail with ID: {po_detail.id}")
-    return po_detail
-
-
-def get_or_create_supplier(supplier_code, supplier_name):
-    """Get existing supplier or create new one"""
-    
-    print(f"      Getting/creating supplier: {supplier_code}")
-    
-    supplier_query = POSupplier.query.filter_by(supplier_code=supplier_code)
-    
-    # Apply role-based filter for suppliers
-    if current_user.role == 'customer':
-        supplier_query = supplier_query.filter_by(company_id=current_user.company_id)
-    else:
-        # For non-user roles, we still filter by company_id for suppliers
-        # as suppliers should be company-specific
-        supplier_query = supplier_query.filter_by(company_id=current_user.company_id)
-    
-    supplier = supplier_query.first()
-    
-    if not supplier:
-        print(f"      Creating new supplier: {supplier_code} - {supplier_name}")
-        supplier = POSupplier(
-            supplier_code=supplier_code,
-            supplier_name=supplier_name,
-            company_id=current_user.company_id
-        )
-        db.session.add(supplier)
-        db.session.flush()
-    else:
-        print(f"      Using existing supplier: {supplier.supplier_name}")
-    
-    return supplier
-
-
-def get_or_create_material(material_code, material_name):
-    """Get existing material or create new one"""
-    
-    print(f"      Getting/creating material: {material_code}")
-    
-    material_query = POMaterial.query.filter_by(material_code=material_code)
-    
-    # Apply role-based filter for materials
-    if current_user.role == 'customer':
-        material_query = material_query.filter_by(company_id=current_user.company_id)
-    else:
-        # For non-user roles, we still filter by company_id for materials
-        # as materials should be company-specific
-        material_query = material_query.filter_by(company_id=current_user.company_id)
-    
-    material = material_query.first()
-    
-    if not material:
-        print(f"      Creating new material: {material_code} - {material_name}")
-        material = POMaterial(
-            material_code=material_code,
-            material_name=material_name,
-            company_id=current_user.company_id
-        )
-        db.session.add(material)
-        db.session.flush()
-    else:
-        print(f"      Using existing material: {material.material_name}")
-    
-    return material
-
-
-def get_or_create_order_unit(order_unit_str):
-    """Get existing order unit or create new one"""
-    
-    print(f"      Getting/creating order unit: {order_unit_str}")
-    
-    order_unit = POOrderUnit.query.filter_by(order_unit=order_unit_str).first()
-    
-    if not order_unit:
-        print(f"      Creating new order unit: {order_unit_str}")
-        order_unit = POOrderUnit(order_unit=order_unit_str)
-        db.session.add(order_unit)
-        db.session.flush()
-    else:
-        print(f"      Using existing order unit: {order_unit.order_unit}")
-    
-    return order_unit
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'stage': job.stage,
+        'total_rows': job.total_rows,
+        'processed_rows': job.processed_rows or 0,
+        'stats': json.loads(job.stats) if job.stats else None,
+        'error': job.error
+    })
 
 @bp.route('/view/<int:po_id>')
 @login_required
@@ -2328,9 +1948,6 @@ def get_po_detail_info(po_detail_id):
 
 # Backend Route for Calendar Data (add this to your dashboard routes)
 
-from sqlalchemy import func, extract
-from datetime import datetime, date
-
 @bp.route('/api/calendar/po-summary')
 @login_required
 def get_po_calendar_summary():
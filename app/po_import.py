@@ -7,121 +7,7 @@ from app.models.user import User
 import os
 import tempfile
 from werkzeug.utils import secure_filename
-
-def create_column_mapping():
-    """Create flexible column mapping to handle different Excel formats"""
-    return {
-        # Required columns with possible variations - INCLUDING YOUR EXACT COLUMN NAMES
-        'po_number': [
-            'Purchasing Document', 'PO No', 'PO Number', 'Purchase Order Number', 'Purchase Order No', 
-            'PO_No', 'po_no', 'po_number', 'PurchaseOrderNumber'
-        ],
-        'po_line_item': [
-            'Item', 'PO Line Item', 'Line Item', 'Line', 'PO Item',
-            'po_line_item', 'line_item', 'item_number'
-        ],
-        'po_date': [
-            'Document Date', 'PO Date', 'Purchase Order Date', 'Order Date', 'Date',
-            'po_date', 'order_date', 'purchase_date'
-        ],
-        'supplier_name': [
-            'Supplier/Supplying Plant', 'Supplier', 'Supplier Name', 'Vendor', 'Vendor Name', 
-            'supplier_name', 'vendor_name', 'supplier', 'Supplying Plant'
-        ],
-        'supplier_code': [
-            'Supplier Code', 'Vendor Code', 'Supplier ID', 'Vendor ID',
-            'supplier_code', 'vendor_code', 'supplier_id'
-        ],
-        'total_value': [
-            'Net Price', 'Value', 'Total Value', 'Amount', 'Total Amount', 'Price',
-            'value', 'total_value', 'amount', 'net_value'
-        ],
-        'currency': [
-            'Currency', 'Curr', 'currency', 'curr'
-        ],
-        'inco_term': [
-            'Inco Term', 'Incoterm', 'Inco Terms', 'Terms',
-            'inco_term', 'incoterm', 'delivery_terms'
-        ],
-        'payment_term': [
-            'Payment Term', 'Payment Terms', 'Pay Terms',
-            'payment_term', 'payment_terms', 'pay_terms'
-        ],
-        'delivery_date': [
-            'Delivery Date', 'PO delivery date', 'Due Date', 'Expected Date',
-            'delivery_date', 'due_date', 'expected_delivery_date'
-        ],
-        # Optional columns - INCLUDING YOUR EXACT COLUMN NAMES
-        'material_code': [
-            'Material', 'Material Code', 'Item Code', 'Product Code', 'SKU',
-            'material_code', 'item_code', 'product_code'
-        ],
-        'material_description': [
-            'Short Text', 'Material Description', 'Description', 'Item Description',
-            'material_description', 'description', 'item_description'
-        ],
-        'order_quantity': [
-            'Order Quantity', 'Quantity', 'Qty', 'Order Qty',
-            'order_quantity', 'quantity', 'qty'
-        ],
-        'order_unit': [
-            'Order Unit', 'Unit', 'UOM', 'Unit of Measure',
-            'order_unit', 'unit', 'uom'
-        ],
-        'quantity_received': [
-            'Quantity Received', 'Received Qty', 'Received',
-            'quantity_received', 'received_qty', 'received'
-        ],
-        'still_to_deliver': [
-            'Still to be delivered (qty)', 'Still to Deliver', 'Remaining Qty', 'Balance', 'Outstanding',
-            'still_to_deliver', 'remaining_qty', 'balance'
-        ],
-        'net_price': [
-            'Net Price', 'Unit Price', 'Price per Unit',
-            'net_price', 'unit_price', 'price_per_unit'
-        ],
-        'license_required': [
-            'License', 'License Required', 'License Req',
-            'license', 'license_required', 'license_req'
-        ],
-        'teip_required': [
-            'TEIP', 'TEIP Required', 'TEIP Req',
-            'teip', 'teip_required', 'teip_req'
-        ],
-        'bank_info': [
-            'Bank', 'Bank Info', 'Bank Information',
-            'bank', 'bank_info', 'bank_information'
-        ],
-        'country_port': [
-            'Country /Port', 'Country', 'Port', 'Country/Port',
-            'country_port', 'country', 'port', 'origin'
-        ]
-    }
-
-def map_columns(df, column_mapping):
-    """Map actual column names to expected column names"""
-    mapped_columns = {}
-    available_columns = df.columns.tolist()
-    
-    print(f"Available columns in Excel: {available_columns}")
-    
-    for target_col, possible_names in column_mapping.items():
-        found = False
-        for possible_name in possible_names:
-            # Check for exact match (case insensitive)
-            for actual_col in available_columns:
-                if actual_col.strip().lower() == possible_name.strip().lower():
-                    mapped_columns[target_col] = actual_col
-                    found = True
-                    break
-            if found:
-                break
-        
-        if not found:
-            print(f"Warning: Could not find column for '{target_col}' in {possible_names}")
-    
-    print(f"Mapped columns: {mapped_columns}")
-    return mapped_columns
+from app.po.excel_import import create_column_mapping, map_columns
 
 def validate_excel_structure(df):
     """Validate if Excel has required columns with flexible mapping"""
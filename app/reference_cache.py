@@ -0,0 +1,189 @@
+# reference_cache.py
+"""
+Cache of master/reference data (users, branches, wharf clerks, document
+statuses, job types, currencies, countries) shared by reports, dashboards
+and the customer portal.
+
+Each dataset is cached per process as immutable rows, keyed by company for
+company-scoped datasets. Validity is tracked in reference_data_versions: any
+insert, update or delete of a cached model bumps the dataset's version in the
+same transaction (so masters/admin create, edit and delete routes invalidate
+it for every worker process). Versions are read once per request.
+"""
+import threading
+from collections import namedtuple
+
+from flask import g, has_request_context
+from flask_login import current_user
+from sqlalchemy import event, text
+
+from app.extensions import db
+from app.models.user import User, CountryMaster, CurrencyMaster
+from app.models.cha import Branch, WharfProfile, DocumentStatus, OsJobType
+
+
+# Global (not company-scoped) datasets are stored under company 0
+GLOBAL_COMPANY = 0
+
+
+def _dataset(model, fields, company_column=None, order_by=None):
+    return {
+        "model": model,
+        "fields": fields,
+        "row": namedtuple(f"{model.__name__}Row", fields),
+        "company_column": company_column,
+        "order_by": order_by,
+    }
+
+
+REFERENCE_DATASETS = {
+    "users": _dataset(User, ("id", "name", "username", "email", "company_id", "role_id"), company_column="company_id"),
+    "branches": _dataset(Branch, ("id", "branch_id", "name", "company_id")),
+    "wharf_clerks": _dataset(
+        WharfProfile, ("id", "wharf_id", "first_name", "last_name", "user_id", "company_id"), company_column="company_id"
+    ),
+    "document_statuses": _dataset(
+        DocumentStatus, ("docStatusID", "docType", "docStatusName", "docLevel", "isActive", "doctypeid")
+    ),
+    "job_types": _dataset(OsJobType, ("id", "name")),
+    "currencies": _dataset(CurrencyMaster, ("currencyID", "CurrencyName", "CurrencyCode", "DecimalPlaces", "isLocal")),
+    "countries": _dataset(CountryMaster, ("countryID", "countryCode", "alpha2Code", "countryName", "isLocal")),
+}
+
+_MODEL_DATASETS = {spec["model"]: name for name, spec in REFERENCE_DATASETS.items()}
+
+_cache = {}  # (dataset, company key) -> (version, rows)
+_cache_lock = threading.Lock()
+
+
+def _company_key(name, company_id):
+    if not REFERENCE_DATASETS[name]["company_column"]:
+        return GLOBAL_COMPANY
+    if company_id is None:
+        company_id = current_user.company_id
+    return company_id or GLOBAL_COMPANY
+
+
+def _load_versions(company_id):
+    rows = db.session.execute(
+        text(
+            "SELECT name, company_id, version FROM reference_data_versions "
+            "WHERE company_id IN (:global_company, :company_id)"
+        ),
+        {"global_company": GLOBAL_COMPANY, "company_id": company_id},
+    )
+    return {(row.name, row.company_id): row.version for row in rows}
+
+
+def _current_version(name, company_key):
+    """Dataset version, read once per request for the global and company rows"""
+    if not has_request_context():
+        return _load_versions(company_key).get((name, company_key), 0)
+
+    versions = g.setdefault("_reference_versions", {})
+    if company_key not in versions:
+        versions[company_key] = _load_versions(company_key)
+    return versions[company_key].get((name, company_key), 0)
+
+
+def get_reference_data(name, company_id=None):
+    """Rows (namedtuples) of a reference dataset, e.g. get_reference_data("users")"""
+    spec = REFERENCE_DATASETS[name]
+    company_key = _company_key(name, company_id)
+    version = _current_version(name, company_key)
+
+    with _cache_lock:
+        cached = _cache.get((name, company_key))
+    if cached and cached[0] == version:
+        return cached[1]
+
+    model = spec["model"]
+    query = db.session.query(*[getattr(model, field) for field in spec["fields"]])
+    if spec["company_column"]:
+        query = query.filter(getattr(model, spec["company_column"]) == company_key)
+    if spec["order_by"]:
+        query = query.order_by(getattr(model, spec["order_by"]))
+    rows = tuple(spec["row"](*row) for row in query.all())
+
+    with _cache_lock:
+        _cache[(name, company_key)] = (version, rows)
+    return rows
+
+
+def get_reference_map(name, label="name", key=None, company_id=None):
+    """
+    {id: label} for a dataset. label may be a field name or a function of the row;
+    key defaults to the dataset's first field (its primary key).
+    """
+    key = key or REFERENCE_DATASETS[name]["fields"][0]
+    get_label = label if callable(label) else (lambda row: getattr(row, label))
+    return {getattr(row, key): get_label(row) for row in get_reference_data(name, company_id)}
+
+
+def bump_reference_versions(connection, keys):
+    """Increment dataset versions for [(dataset, company key)] on the given connection"""
+    for name, company_key in keys:
+        connection.execute(
+            text(
+                "INSERT INTO reference_data_versions (name, company_id, version) "
+                "VALUES (:name, :company_id, 1) "
+                "ON DUPLICATE KEY UPDATE version = version + 1"
+            ),
+            {"name": name, "company_id": company_key},
+        )
+
+
+def invalidate_reference_data(name, company_id=None):
+    """Explicitly invalidate a dataset (e.g. after a bulk UPDATE that bypasses the ORM)"""
+    company_key = _company_key(name, company_id)
+    bump_reference_versions(db.session.connection(), [(name, company_key)])
+    _forget(name, company_key)
+
+
+def _forget(name, company_key):
+    with _cache_lock:
+        _cache.pop((name, company_key), None)
+    if has_request_context():
+        g.pop("_reference_versions", None)
+
+
+def _changed_datasets(session):
+    keys = set()
+    modified = [i for i in session.dirty if session.is_modified(i, include_collections=False)]
+    for instance in list(session.new) + modified + list(session.deleted):
+        name = _MODEL_DATASETS.get(type(instance))
+        if not name:
+            continue
+        company_column = REFERENCE_DATASETS[name]["company_column"]
+        if company_column:
+            keys.add((name, getattr(instance, company_column, None) or GLOBAL_COMPANY))
+        else:
+            keys.add((name, GLOBAL_COMPANY))
+    return keys
+
+
+@event.listens_for(db.session, "before_flush")
+def _track_reference_changes(session, flush_context, instances):
+    keys = _changed_datasets(session)
+    if keys:
+        session.info.setdefault("_reference_changes", set()).update(keys)
+
+
+@event.listens_for(db.session, "after_flush")
+def _bump_reference_changes(session, flush_context):
+    keys = session.info.pop("_reference_changes", None)
+    if keys:
+        bump_reference_versions(session.connection(), keys)
+        session.info.setdefault("_reference_committed", set()).update(keys)
+
+
+@event.listens_for(db.session, "after_commit")
+def _forget_committed_changes(session):
+    for name, company_key in session.info.pop("_reference_committed", set()):
+        _forget(name, company_key)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("_reference_changes", None)
+    session.info.pop("_reference_committed", None)
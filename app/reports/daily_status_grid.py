@@ -0,0 +1,529 @@
+# daily_status_grid.py
+"""
+SQL-backed row model for the daily status report AG Grid.
+
+Every grid column maps to a SQL expression, so filtering and sorting on
+any column run in MySQL. Only the requested block of rows is fetched, and
+only the columns the grid is showing are selected. Blocks after the first
+are fetched with keyset pagination: each response carries a cursor (the
+sort key of its last row) which the grid sends back with the next block,
+so deep scrolling does not pay for large OFFSETs.
+"""
+import json
+import base64
+import hashlib
+from decimal import Decimal
+from datetime import date, datetime, timedelta
+
+from flask_login import current_user
+from sqlalchemy import and_, or_, not_, case, func, false
+from sqlalchemy.orm import aliased
+
+from app import db
+from app.models.user import User
+from app.models.cha import (
+    Branch,
+    Customer,
+    CompanyAssignment,
+    DocumentStatus,
+    OrderShipment,
+    ShipDocumentEntryMaster,
+    WharfProfile,
+)
+
+
+DEFAULT_BLOCK_SIZE = 100
+MAX_BLOCK_SIZE = 1000
+
+BillingParty = aliased(User)
+SalesPerson = aliased(User)
+CsExecutive = aliased(User)
+
+
+def _company_user_join(alias, column):
+    return lambda query, company_id: query.outerjoin(
+        alias, and_(column == alias.id, alias.company_id == company_id)
+    )
+
+
+# Optional joins, added only when a requested, filtered or sorted column needs them
+JOINS = {
+    "customer": lambda query, company_id: query.outerjoin(Customer, OrderShipment.customer_id == Customer.id),
+    "branch": lambda query, company_id: query.outerjoin(Branch, OrderShipment.branch_id == Branch.id),
+    "billing_party": _company_user_join(BillingParty, OrderShipment.billing_party_id),
+    "sales_person": _company_user_join(SalesPerson, OrderShipment.sales_person_id),
+    "cs_executive": _company_user_join(CsExecutive, OrderShipment.cs_executive_id),
+    "wharf_clerk": lambda query, company_id: query.outerjoin(
+        WharfProfile, OrderShipment.wharf_clerk_id == WharfProfile.id
+    ),
+}
+
+
+def _text(expr):
+    """Displayed text of a column - empty values show as N/A, as in the grid"""
+    return func.coalesce(func.nullif(expr, ""), "N/A")
+
+
+def _yes_with_reason(flag, reason):
+    return case((flag == "Y", func.concat("Yes - ", func.coalesce(reason, ""))), else_="No")
+
+
+def _mapped(column, mapping):
+    return case(mapping, value=column, else_="N/A")
+
+
+def _column(expr, kind="text", join=None):
+    """
+    kind: 'text' (filter/sort on the displayed text), 'number', 'date' or 'datetime'
+    (filter/sort on the value; text filters match the displayed dd-mm-YYYY string).
+    """
+    if kind == "date":
+        text_expr = _text(func.date_format(expr, "%d-%m-%Y"))
+    elif kind == "datetime":
+        text_expr = _text(func.date_format(expr, "%d-%m-%Y %H:%i:%s"))
+    else:
+        text_expr = _text(expr)
+    return {
+        "expr": expr,
+        "kind": kind,
+        "join": join,
+        "text": text_expr,
+        "sort": expr if kind in ("number", "date", "datetime") else text_expr,
+    }
+
+
+DAILY_STATUS_COLUMNS = {
+    "id": _column(OrderShipment.id, "number"),
+    "status": _column(DocumentStatus.docStatusName),
+    "branch_name": _column(Branch.name, join="branch"),
+    "import_id": _column(func.coalesce(func.nullif(OrderShipment.import_id, ""), ShipDocumentEntryMaster.docserial)),
+    "shipment_deadline": _column(OrderShipment.shipment_deadline, "date"),
+    "bl_no": _column(OrderShipment.bl_no),
+    "license_number": _column(OrderShipment.license_number),
+    "primary_job": _column(_yes_with_reason(OrderShipment.primary_job_yn, OrderShipment.primary_job)),
+    "shipment_type": _column(_mapped(OrderShipment.shipment_type_id, {1: "Custom", 2: "BOI"})),
+    "sub_type": _column(_mapped(OrderShipment.sub_type_id, {1: "Tiep", 2: "Infac", 3: "Bond"})),
+    "customer_category": _column(_mapped(OrderShipment.customer_category_id, {1: "Direct"})),
+    "business_type": _column(_mapped(
+        OrderShipment.business_type_id, {1: "Sales Nomination", 2: "Agent Nomination", 3: "Free hand"}
+    )),
+    "customer_name": _column(Customer.customer_name, join="customer"),
+    "billing_party": _column(BillingParty.name, join="billing_party"),
+    "clearing_agent": _column(OrderShipment.clearing_agent),
+    "contact_person": _column(OrderShipment.contact_person),
+    "sales_person": _column(SalesPerson.name, join="sales_person"),
+    "cs_executive": _column(CsExecutive.name, join="cs_executive"),
+    "wharf_clerk": _column(
+        func.concat(WharfProfile.first_name, " ", WharfProfile.last_name), join="wharf_clerk"
+    ),
+    "po_no": _column(OrderShipment.po_no),
+    "invoice_no": _column(OrderShipment.invoice_no),
+    "customer_ref_no": _column(OrderShipment.customer_ref_no),
+    "customs_dti_no": _column(OrderShipment.customs_dti_no),
+    "mbl_number": _column(OrderShipment.mbl_number),
+    "vessel": _column(OrderShipment.vessel),
+    "voyage": _column(OrderShipment.voyage),
+    "eta": _column(OrderShipment.eta, "datetime"),
+    "shipper": _column(OrderShipment.shipper),
+    "port_of_loading": _column(OrderShipment.port_of_loading),
+    "port_of_discharge": _column(OrderShipment.port_of_discharge),
+    "job_type": _column(_mapped(OrderShipment.job_type, {1: "FCL", 2: "LCL"})),
+    "fcl_gate_out_date": _column(OrderShipment.fcl_gate_out_date, "date"),
+    "pod_datetime": _column(OrderShipment.pod_datetime, "datetime"),
+    "no_of_packages": _column(OrderShipment.no_of_packages, "number"),
+    "package_type": _column(OrderShipment.package_type),
+    "cbm": _column(OrderShipment.cbm, "number"),
+    "gross_weight": _column(OrderShipment.gross_weight, "number"),
+    "cargo_description": _column(OrderShipment.cargo_description),
+    "liner": _column(OrderShipment.liner),
+    "entrepot": _column(OrderShipment.entrepot),
+    "job_currency": _column(OrderShipment.job_currency),
+    "ex_rating_buying": _column(OrderShipment.ex_rating_buying, "number"),
+    "ex_rating_selling": _column(OrderShipment.ex_rating_selling, "number"),
+    "remarks": _column(OrderShipment.remarks),
+    "on_hold": _column(_yes_with_reason(OrderShipment.onhold_yn, OrderShipment.onhold_reason)),
+    "cleared_date": _column(OrderShipment.cleared_date, "date"),
+    "estimated_job_closing_date": _column(OrderShipment.estimated_job_closing_date, "date"),
+    "created_at": _column(OrderShipment.created_at, "datetime"),
+    "updated_at": _column(OrderShipment.updated_at, "datetime"),
+}
+
+STATUS_FILTER_MAP = {
+    'open': 'Open',
+    'new': 'New',
+    'ongoing': 'Ongoing',
+    'completed': 'Completed'
+}
+
+
+def build_daily_status_query(params, company_id):
+    """
+    Base query of the daily status report for a clearing company,
+    narrowed by the report's filter form (status1, customer_id, date_range...).
+    Selects only OrderShipment.id - callers project the columns they need.
+    """
+    query = db.session.query(OrderShipment.id).join(
+        ShipDocumentEntryMaster,
+        OrderShipment.ship_doc_entry_id == ShipDocumentEntryMaster.id
+    ).join(
+        DocumentStatus,
+        ShipDocumentEntryMaster.docStatusID == DocumentStatus.docStatusID
+    ).join(
+        CompanyAssignment,
+        and_(
+            ShipDocumentEntryMaster.company_id == CompanyAssignment.company_id,
+            CompanyAssignment.assigned_company_id == company_id,
+            CompanyAssignment.is_active == True
+        )
+    ).filter(ShipDocumentEntryMaster.assigned_clearing_company_id == company_id)
+
+    status1 = params.get('status1')
+    if status1 in STATUS_FILTER_MAP:
+        query = query.filter(DocumentStatus.docStatusName == STATUS_FILTER_MAP[status1])
+
+    if params.get('customer_id'):
+        query = query.filter(OrderShipment.customer_id == params.get('customer_id'))
+
+    if params.get('branch_id'):
+        query = query.filter(OrderShipment.branch_id == params.get('branch_id'))
+
+    if params.get('business_type'):
+        query = query.filter(OrderShipment.business_type_id == params.get('business_type'))
+
+    if params.get('date_range'):
+        try:
+            dates = params.get('date_range').split(' - ')
+            start_date = datetime.strptime(dates[0], '%d %b, %Y')
+            end_date = datetime.strptime(dates[1], '%d %b, %Y') + timedelta(days=1)
+            query = query.filter(OrderShipment.eta >= start_date, OrderShipment.eta < end_date)
+        except (ValueError, IndexError):
+            pass
+
+    if params.get('sales_person_id'):
+        query = query.filter(OrderShipment.sales_person_id == params.get('sales_person_id'))
+
+    if params.get('shipment_type_id'):
+        query = query.filter(OrderShipment.shipment_type_id == params.get('shipment_type_id'))
+
+    return query
+
+
+# ----------------------------------------------------------------------
+# AG Grid filter model -> SQL
+# ----------------------------------------------------------------------
+def _parse_date(value):
+    # AG Grid sends 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'
+    return datetime.strptime(value[:10], '%Y-%m-%d')
+
+
+def _text_condition(expr, operator, value):
+    value = value or ''
+    if operator == 'equals':
+        return expr == value
+    if operator == 'notEqual':
+        return expr != value
+    if operator == 'startsWith':
+        return expr.startswith(value, autoescape=True)
+    if operator == 'endsWith':
+        return expr.endswith(value, autoescape=True)
+    if operator == 'notContains':
+        return not_(expr.contains(value, autoescape=True))
+    if operator == 'blank':
+        return expr == 'N/A'
+    if operator == 'notBlank':
+        return expr != 'N/A'
+    return expr.contains(value, autoescape=True)
+
+
+def _number_condition(expr, operator, value, value_to):
+    if operator == 'blank':
+        return expr.is_(None)
+    if operator == 'notBlank':
+        return expr.isnot(None)
+    if value is None:
+        return None
+    if operator == 'notEqual':
+        return expr != value
+    if operator == 'greaterThan':
+        return expr > value
+    if operator == 'greaterThanOrEqual':
+        return expr >= value
+    if operator == 'lessThan':
+        return expr < value
+    if operator == 'lessThanOrEqual':
+        return expr <= value
+    if operator == 'inRange' and value_to is not None:
+        return expr.between(value, value_to)
+    return expr == value
+
+
+def _date_condition(expr, operator, date_from, date_to):
+    if operator == 'blank':
+        return expr.is_(None)
+    if operator == 'notBlank':
+        return expr.isnot(None)
+    if not date_from:
+        return None
+    start = _parse_date(date_from)
+    next_day = start + timedelta(days=1)
+    if operator == 'notEqual':
+        return or_(expr < start, expr >= next_day)
+    if operator == 'greaterThan':
+        return expr >= next_day
+    if operator == 'lessThan':
+        return expr < start
+    if operator == 'inRange' and date_to:
+        return and_(expr >= start, expr < _parse_date(date_to) + timedelta(days=1))
+    return and_(expr >= start, expr < next_day)
+
+
+def _filter_condition(column, filter_config):
+    # Combined model: {"operator": "AND"/"OR", "conditions": [...]} (or condition1/condition2)
+    conditions = filter_config.get('conditions')
+    if conditions is None and 'condition1' in filter_config:
+        conditions = [filter_config['condition1'], filter_config.get('condition2')]
+    if conditions is not None:
+        clauses = [_filter_condition(column, c) for c in conditions if c]
+        clauses = [c for c in clauses if c is not None]
+        if not clauses:
+            return None
+        return or_(*clauses) if filter_config.get('operator') == 'OR' else and_(*clauses)
+
+    filter_type = filter_config.get('filterType', 'text')
+    operator = filter_config.get('type')
+
+    if filter_type == 'set':
+        values = filter_config.get('values') or []
+        return column['text'].in_(values) if values else false()
+    if filter_type == 'number':
+        return _number_condition(column['expr'], operator, filter_config.get('filter'), filter_config.get('filterTo'))
+    if filter_type == 'date':
+        if column['kind'] not in ('date', 'datetime'):
+            return None
+        return _date_condition(column['expr'], operator, filter_config.get('dateFrom'), filter_config.get('dateTo'))
+    return _text_condition(column['text'], operator, filter_config.get('filter'))
+
+
+def apply_grid_filters(query, filter_model, joined, company_id):
+    """Apply an AG Grid filter model; every column of DAILY_STATUS_COLUMNS is supported"""
+    for field, filter_config in (filter_model or {}).items():
+        column = DAILY_STATUS_COLUMNS.get(field)
+        if not column or not filter_config:
+            continue
+        try:
+            condition = _filter_condition(column, filter_config)
+        except (ValueError, TypeError):
+            continue  # malformed date/number - ignore like the grid does
+        if condition is None:
+            continue
+        query = _ensure_join(query, column, joined, company_id)
+        query = query.filter(condition)
+    return query
+
+
+def _ensure_join(query, column, joined, company_id):
+    join = column['join']
+    if join and join not in joined:
+        query = JOINS[join](query, company_id)
+        joined.add(join)
+    return query
+
+
+# ----------------------------------------------------------------------
+# Sorting and keyset pagination
+# ----------------------------------------------------------------------
+def _sort_keys(sort_model):
+    """[(field, sort expression, descending)], always ending with the unique id"""
+    keys = []
+    for sort_config in sort_model or []:
+        field = sort_config.get('colId')
+        if field == 'id' or field not in DAILY_STATUS_COLUMNS:
+            continue
+        keys.append((field, DAILY_STATUS_COLUMNS[field]['sort'], sort_config.get('sort') == 'desc'))
+
+    id_desc = any(s.get('colId') == 'id' and s.get('sort') == 'desc' for s in sort_model or [])
+    keys.append(('id', OrderShipment.id, id_desc))
+    return keys
+
+
+def _keyset_condition(keys, values):
+    """
+    Rows strictly after `values` in the (multi-column, mixed direction) sort order.
+    MySQL sorts NULLs first in ascending and last in descending order.
+    """
+    (_, expr, desc), value = keys[0], values[0]
+    rest = _keyset_condition(keys[1:], values[1:]) if len(keys) > 1 else None
+
+    if value is None:
+        beyond = None if desc else expr.isnot(None)
+        same = expr.is_(None)
+    else:
+        beyond = or_(expr < value, expr.is_(None)) if desc else expr > value
+        same = expr == value
+
+    clauses = [c for c in (beyond, and_(same, rest) if rest is not None else None) if c is not None]
+    return or_(*clauses) if clauses else false()
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'dec': str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+        if 'dec' in value:
+            return Decimal(value['dec'])
+    return value
+
+
+def _signature(params, filter_model, sort_model):
+    raw = json.dumps([params, filter_model, sort_model], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def encode_cursor(row_index, signature, values):
+    raw = json.dumps({'r': row_index, 's': signature, 'v': [_encode_value(v) for v in values]})
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, row_index, signature):
+    """Keyset values of a cursor, or None if it does not continue at row_index for this query"""
+    if not cursor:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    if data.get('r') != row_index or data.get('s') != signature:
+        return None
+    return [_decode_value(v) for v in data.get('v', [])]
+
+
+# ----------------------------------------------------------------------
+# Row formatting
+# ----------------------------------------------------------------------
+def _format_value(kind, value):
+    if kind == 'date':
+        return value.strftime('%d-%m-%Y') if value else 'N/A'
+    if kind == 'datetime':
+        return value.strftime('%d-%m-%Y %H:%M:%S') if value else 'N/A'
+    return value if value else 'N/A'
+
+
+def _format_row(fields, result):
+    return {
+        field: result[i] if field in ('id', 'status') else _format_value(DAILY_STATUS_COLUMNS[field]['kind'], result[i])
+        for i, field in enumerate(fields)
+    }
+
+
+def _requested_fields(columns):
+    fields = [f for f in (columns or DAILY_STATUS_COLUMNS) if f in DAILY_STATUS_COLUMNS]
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+
+def _select_sorted(query, fields, keys, joined, company_id):
+    """Project the requested columns plus the sort keys, in grid order"""
+    for field, _, _ in keys:
+        query = _ensure_join(query, DAILY_STATUS_COLUMNS[field], joined, company_id)
+    for field in fields:
+        query = _ensure_join(query, DAILY_STATUS_COLUMNS[field], joined, company_id)
+
+    selected = [DAILY_STATUS_COLUMNS[f]['expr'].label(f) for f in fields]
+    sort_columns = [expr.label(f'_sort_{i}') for i, (_, expr, _) in enumerate(keys)]
+    return query.with_entities(*selected, *sort_columns).order_by(
+        *[expr.desc() if desc else expr.asc() for _, expr, desc in keys]
+    )
+
+
+def _filtered_query(params, filter_model, company_id):
+    joined = set()
+    query = build_daily_status_query(params, company_id)
+    query = apply_grid_filters(query, filter_model, joined, company_id)
+    return query, joined
+
+
+def get_daily_status_rows(params, start_row=0, end_row=None, filter_model=None, sort_model=None, columns=None, cursor=None):
+    """
+    One block of the daily status grid.
+
+    Returns {"rows", "lastRow", "total_count", "cursor"}: lastRow is the total
+    row count once known (always on the first block, or when the last block is
+    reached) and -1 otherwise; cursor continues the keyset scan at end_row.
+    """
+    start_row = max(int(start_row or 0), 0)
+    if end_row is None:
+        end_row = start_row + DEFAULT_BLOCK_SIZE
+    block_size = min(max(int(end_row) - start_row, 1), MAX_BLOCK_SIZE)
+    fields = _requested_fields(columns)
+    company_id = current_user.company_id
+
+    query, joined = _filtered_query(params, filter_model, company_id)
+
+    total_count = None
+    if start_row == 0:
+        total_count = query.with_entities(func.count(OrderShipment.id)).order_by(None).scalar()
+
+    keys = _sort_keys(sort_model)
+    signature = _signature(params, filter_model, sort_model)
+    keyset_values = decode_cursor(cursor, start_row, signature)
+    if keyset_values is not None and len(keyset_values) == len(keys):
+        query = query.filter(_keyset_condition(keys, keyset_values))
+        offset = 0
+    else:
+        offset = start_row
+
+    query = _select_sorted(query, fields, keys, joined, company_id)
+    results = query.offset(offset).limit(block_size).all()
+    rows = [_format_row(fields, result) for result in results]
+
+    next_cursor = None
+    if results:
+        last = results[-1]
+        next_cursor = encode_cursor(start_row + len(results), signature, list(last[len(fields):]))
+
+    if total_count is not None:
+        last_row = total_count
+    elif len(results) < block_size:
+        last_row = start_row + len(results)
+    else:
+        last_row = -1
+
+    return {
+        'rows': rows,
+        'lastRow': last_row,
+        'total_count': total_count,
+        'cursor': next_cursor,
+    }
+
+
+def count_daily_status_rows(params, filter_model=None, company_id=None):
+    company_id = company_id or current_user.company_id
+    query, _ = _filtered_query(params, filter_model, company_id)
+    return query.with_entities(func.count(OrderShipment.id)).order_by(None).scalar()
+
+
+def iter_daily_status_rows(params, filter_model=None, sort_model=None, columns=None, company_id=None, batch_size=1000):
+    """
+    All rows matching the grid's filters and sort, formatted like the grid (for exports).
+    Rows are fetched from the database in batches, so memory stays flat for any size.
+    company_id defaults to the current user's (pass it explicitly outside a request).
+    """
+    company_id = company_id or current_user.company_id
+    fields = _requested_fields(columns)
+    query, joined = _filtered_query(params, filter_model, company_id)
+    query = _select_sorted(query, fields, _sort_keys(sort_model), joined, company_id)
+    for result in query.yield_per(batch_size):
+        yield _format_row(fields, result)
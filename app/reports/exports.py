@@ -0,0 +1,306 @@
+# exports.py
+"""
+Streaming CSV / Excel export pipeline for reports.
+
+Rows are consumed from any iterable (normally a yield_per query) and never
+collected into a list. CSV is generated in small chunks straight into the
+response. Excel is written with xlsxwriter in constant_memory mode, which
+flushes each row to disk, and the finished file is streamed back in chunks.
+Exports larger than EXPORT_BACKGROUND_ROW_THRESHOLD rows run in a
+background thread instead: the file is uploaded to S3 and the user gets a
+download link (ReportExportJob).
+"""
+import io
+import os
+import csv
+import json
+import tempfile
+from datetime import datetime, timedelta
+from threading import Thread
+
+import xlsxwriter
+from flask import Response, current_app, stream_with_context
+from flask_login import current_user
+
+from app import db
+from app.models.report import ReportExportJob
+from app.reports.daily_status_grid import iter_daily_status_rows
+from app.utils_cha.s3_utils import get_s3_client, get_transfer_config
+
+
+EXCEL_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+CSV_FLUSH_ROWS = 500
+FILE_CHUNK_SIZE = 64 * 1024
+MAX_COLUMN_WIDTH = 50
+
+DAILY_STATUS_HEADERS = {
+    'id': 'ID',
+    'status': 'Status',
+    'branch_name': 'Branch',
+    'import_id': 'Import ID',
+    'shipment_deadline': 'Shipment Deadline',
+    'bl_no': 'BL No',
+    'license_number': 'License Number',
+    'primary_job': 'Primary Job',
+    'shipment_type': 'Shipment Type',
+    'sub_type': 'Sub Type',
+    'customer_category': 'Customer Category',
+    'business_type': 'Business Type',
+    'customer_name': 'Customer',
+    'billing_party': 'Billing Party',
+    'clearing_agent': 'Clearing Agent',
+    'contact_person': 'Contact Person',
+    'sales_person': 'Sales Person',
+    'cs_executive': 'CS Executive',
+    'wharf_clerk': 'Wharf Clerk',
+    'po_no': 'PO No',
+    'invoice_no': 'Invoice No',
+    'customer_ref_no': 'Customer Ref No',
+    'customs_dti_no': 'Customs DTI No',
+    'mbl_number': 'MBL Number',
+    'vessel': 'Vessel',
+    'voyage': 'Voyage',
+    'eta': 'ETA',
+    'shipper': 'Shipper',
+    'port_of_loading': 'Port of Loading',
+    'port_of_discharge': 'Port of Discharge',
+    'job_type': 'Job Type',
+    'fcl_gate_out_date': 'FCL Gate Out Date',
+    'pod_datetime': 'POD Datetime',
+    'no_of_packages': 'No of Packages',
+    'package_type': 'Package Type',
+    'cbm': 'CBM',
+    'gross_weight': 'Gross Weight',
+    'cargo_description': 'Cargo Description',
+    'liner': 'Liner',
+    'entrepot': 'Entrepot',
+    'job_currency': 'Job Currency',
+    'ex_rating_buying': 'Ex Rating Buying',
+    'ex_rating_selling': 'Ex Rating Selling',
+    'remarks': 'Remarks',
+    'on_hold': 'On Hold',
+    'cleared_date': 'Cleared Date',
+    'estimated_job_closing_date': 'Est. Job Closing Date',
+    'created_at': 'Created',
+    'updated_at': 'Updated'
+}
+
+
+def _row_values(row, columns):
+    return [row.get(col, 'N/A') for col in columns]
+
+
+def iter_csv(rows, columns, headers):
+    """CSV text in chunks of CSV_FLUSH_ROWS rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+
+    for count, row in enumerate(rows, 1):
+        writer.writerow(_row_values(row, columns))
+        if count % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue()
+
+
+def write_xlsx(rows, columns, headers, path, sheet_name='Shipments'):
+    """Write rows to an .xlsx file row by row; returns the number of data rows"""
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'tmpdir': tempfile.gettempdir()})
+    try:
+        worksheet = workbook.add_worksheet(sheet_name)
+        header_format = workbook.add_format({'bold': True})
+        worksheet.write_row(0, 0, headers, header_format)
+
+        # Column widths are tracked while writing (the rows are not kept)
+        widths = [len(str(header)) for header in headers]
+        count = 0
+        for count, row in enumerate(rows, 1):
+            values = _row_values(row, columns)
+            worksheet.write_row(count, 0, values)
+            for i, value in enumerate(values):
+                widths[i] = max(widths[i], len(str(value)))
+
+        for i, width in enumerate(widths):
+            worksheet.set_column(i, i, min(width + 2, MAX_COLUMN_WIDTH))
+    finally:
+        workbook.close()
+    return count
+
+
+def _iter_file(path, delete=True):
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if delete and os.path.exists(path):
+            os.remove(path)
+
+
+def iter_xlsx(rows, columns, headers, sheet_name='Shipments'):
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        write_xlsx(rows, columns, headers, path, sheet_name)
+    except Exception:
+        os.remove(path)
+        raise
+    yield from _iter_file(path)
+
+
+def export_response(rows, columns, export_format, filename, column_headers=None, sheet_name='Shipments'):
+    """
+    Streaming download response for an iterable of row dicts.
+    filename is without extension; export_format is 'csv' or 'excel'.
+    """
+    column_headers = column_headers or DAILY_STATUS_HEADERS
+    headers = [column_headers.get(col, col) for col in columns]
+
+    if export_format == 'csv':
+        body = iter_csv(rows, columns, headers)
+        mimetype = 'text/csv'
+        extension = 'csv'
+    else:
+        body = iter_xlsx(rows, columns, headers, sheet_name)
+        mimetype = EXCEL_MIMETYPE
+        extension = 'xlsx'
+
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}.{extension}'
+    return response
+
+
+# ----------------------------------------------------------------------
+# Background exports
+# ----------------------------------------------------------------------
+def start_daily_status_export_job(params, filter_model, sort_model, columns, export_format, filename):
+    """Queue a daily status export for the current user and start it in a background thread"""
+    job = ReportExportJob(
+        user_id=current_user.id,
+        company_id=current_user.company_id,
+        report='daily_status',
+        export_format=export_format,
+        filename=filename,
+        request_data=json.dumps({
+            'params': params,
+            'filter_model': filter_model,
+            'sort_model': sort_model,
+            'columns': columns,
+        }),
+        status='queued',
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    Thread(
+        target=run_export_job, args=(current_app._get_current_object(), job.id), daemon=True
+    ).start()
+    return job
+
+
+def _fail_job(job_id, error):
+    db.session.rollback()
+    job = ReportExportJob.query.get(job_id)
+    if job and job.status in ('queued', 'running'):
+        job.status = 'failed'
+        job.error = error
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
+    print(f"Export job {job_id} failed: {error}")
+
+
+def fail_stale_export_job(job):
+    """
+    Mark a queued or running job failed once it is older than
+    EXPORT_JOB_TIMEOUT_MINUTES: its thread died with the worker process.
+    Called when the job is read; returns the job.
+    """
+    timeout = current_app.config.get('EXPORT_JOB_TIMEOUT_MINUTES', 120)
+    if (
+        job.status in ('queued', 'running')
+        and job.created_at
+        and job.created_at < datetime.utcnow() - timedelta(minutes=timeout)
+    ):
+        job.status = 'failed'
+        job.error = 'Export did not finish; the worker running it stopped. Please export again.'
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
+    return job
+
+
+def run_export_job(app, job_id):
+    with app.app_context():
+        try:
+            _run_export_job(app, job_id)
+        except Exception as e:
+            _fail_job(job_id, str(e))
+        finally:
+            db.session.remove()
+
+
+def _run_export_job(app, job_id):
+    job = ReportExportJob.query.get(job_id)
+    if not job or job.status != 'queued':
+        return
+
+    job.status = 'running'
+    db.session.commit()
+    print(f"Running export job {job.id} ({job.report}, {job.export_format})")
+
+    extension = 'csv' if job.export_format == 'csv' else 'xlsx'
+    fd, path = tempfile.mkstemp(suffix=f'.{extension}')
+    os.close(fd)
+    try:
+        spec = json.loads(job.request_data or '{}')
+        columns = spec.get('columns') or []
+        headers = [DAILY_STATUS_HEADERS.get(col, col) for col in columns]
+        rows = iter_daily_status_rows(
+            spec.get('params') or {},
+            spec.get('filter_model'),
+            spec.get('sort_model'),
+            columns,
+            company_id=job.company_id,
+        )
+
+        if job.export_format == 'csv':
+            row_count = 0
+
+            def counted(rows):
+                nonlocal row_count
+                for row in rows:
+                    row_count += 1
+                    yield row
+
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                for chunk in iter_csv(counted(rows), columns, headers):
+                    f.write(chunk)
+        else:
+            row_count = write_xlsx(rows, columns, headers, path)
+
+        base_folder = (app.config.get('S3_BASE_FOLDER') or '').strip('/')
+        s3_key = '/'.join(
+            part for part in (base_folder, 'exports', str(job.company_id), f'{job.id}_{job.filename}.{extension}') if part
+        )
+        get_s3_client().upload_file(
+            path,
+            app.config['S3_BUCKET_NAME'],
+            s3_key,
+            ExtraArgs={'ContentType': 'text/csv' if extension == 'csv' else EXCEL_MIMETYPE},
+            Config=get_transfer_config(),
+        )
+
+        job.s3_key = s3_key
+        job.row_count = row_count
+        job.status = 'done'
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
+        print(f"Export job {job.id} finished: {row_count} rows")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
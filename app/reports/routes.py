@@ -23,8 +23,6 @@ from app.models.cha import (
     ShippingLine,
     Terminal,
     Runner,
-    WharfProfile,
-    Branch,
     ShipCategory,
     ShipCatDocument,
     Order,
@@ -49,11 +47,14 @@ from app.models.cha import (
 from flask_login import login_required, current_user
 from app import db
 from app.reports import bp
-from flask import send_file, make_response
-import pandas as pd
-import io
-import csv
 from app.utils import get_sri_lanka_time
+from app.reference_cache import get_reference_data
+from app.reports.daily_status_grid import get_daily_status_rows, iter_daily_status_rows, count_daily_status_rows
+from app.reports.exports import (
+    DAILY_STATUS_HEADERS, export_response, fail_stale_export_job, start_daily_status_export_job
+)
+from app.models.report import ReportExportJob
+from app.utils_cha.s3_utils import get_s3_url
 
 @bp.route("/daily_status")
 @login_required
@@ -70,11 +71,12 @@ def daily_status():
     
     # Get customers, branches, sales people, ports for dropdowns
     customers = Customer.query.all()
-    branches = Branch.query.all()
-    sales_people = User.query.filter_by(company_id=current_user.company_id).all()  # Assuming role_id 3 is for sales people
-    billing_party = User.query.filter_by(company_id=current_user.company_id).all()  # Assuming role_id 3 is for sales people
-    wharf_clerks = WharfProfile.query.filter_by(company_id=current_user.company_id).all()  # Assuming role_id 3 is for sales people
-    cs_executives = User.query.filter_by(company_id=current_user.company_id).all()  # Assuming role_id 3 is for sales people
+    branches = get_reference_data("branches")
+    company_users = get_reference_data("users")
+    sales_people = company_users
+    billing_party = company_users
+    wharf_clerks = get_reference_data("wharf_clerks")
+    cs_executives = company_users
 
     
     # loading_ports = Port.query.filter_by(port_type='loading').all()
@@ -177,189 +179,49 @@ def daily_status():
 
 # Add this route to your existing Flask blueprint (reports.py)
 
-@bp.route("/api/daily_status")
+@bp.route("/api/daily_status", methods=["GET", "POST"])
 @login_required
 def api_daily_status():
-    """API endpoint for AG Grid to fetch daily status data"""
+    """
+    AG Grid row model endpoint for the daily status report.
+
+    POST body (or GET args, with JSON-encoded models):
+        startRow, endRow, sortModel, filterModel - as sent by the grid datasource
+        columns - visible column ids (only these are selected)
+        cursor  - cursor returned with the previous block, for keyset pagination
+        params  - the report filter form (status1, customer_id, date_range, ...)
+    """
     try:
-        # Get filter parameters from request
-        status1 = request.args.get('status1')
-        customer_id = request.args.get('customer_id')
-        branch_id = request.args.get('branch_id')
-        business_type = request.args.get('business_type')
-        date_range = request.args.get('date_range')
-        sales_person_id = request.args.get('sales_person_id')
-        cnts_sizes = request.args.get('cnts_sizes')
-        shipment_type_id = request.args.get('shipment_type_id')
-        
-        # Build query for OrderShipment with joins
-        query = db.session.query(
-            OrderShipment, ShipDocumentEntryMaster, DocumentStatus, Customer
-        ).join(
-            ShipDocumentEntryMaster, 
-            OrderShipment.ship_doc_entry_id == ShipDocumentEntryMaster.id
-        ).join(
-            DocumentStatus,
-            ShipDocumentEntryMaster.docStatusID == DocumentStatus.docStatusID
-        ).join(  # NEW: Add INNER JOIN with CompanyAssignment
-            CompanyAssignment,
-            db.and_(
-                ShipDocumentEntryMaster.company_id == CompanyAssignment.company_id,
-                CompanyAssignment.assigned_company_id == current_user.company_id,
-                CompanyAssignment.is_active == True
-            )
-        ).outerjoin(
-            Customer,
-            OrderShipment.customer_id == Customer.id
-        )
-        
-        # Filter by user's company
-        query = query.filter(ShipDocumentEntryMaster.assigned_clearing_company_id == current_user.company_id)
-        
-        # Apply filters if provided
-        if status1:
-            status_map = {
-                'open': 'Open',
-                'new': 'New',
-                'ongoing': 'Ongoing',
-                'completed': 'Completed'
-            }
-            if status1 in status_map:
-                query = query.filter(DocumentStatus.docStatusName == status_map[status1])
-        
-        if customer_id:
-            query = query.filter(OrderShipment.customer_id == customer_id)
-        
-        if branch_id:
-            query = query.filter(OrderShipment.branch_id == branch_id)
-        
-        if business_type:
-            query = query.filter(OrderShipment.business_type_id == business_type)
-        
-        if date_range:
-            try:
-                dates = date_range.split(' - ')
-                start_date = datetime.strptime(dates[0], '%d %b, %Y')
-                end_date = datetime.strptime(dates[1], '%d %b, %Y')
-                end_date = end_date + timedelta(days=1)
-                query = query.filter(OrderShipment.eta >= start_date, OrderShipment.eta < end_date)
-            except (ValueError, IndexError):
-                pass
-        
-        if sales_person_id:
-            query = query.filter(OrderShipment.sales_person_id == sales_person_id)
-        
-        if shipment_type_id:
-            query = query.filter(OrderShipment.shipment_type_id == shipment_type_id)
-        
-        # Get all shipments (no pagination for AG Grid - it handles client-side pagination)
-        shipments = query.all()
-        
-        # Get lookup data for foreign keys
-        branches = {branch.id: branch.name for branch in Branch.query.all()}
-        sales_people = {person.id: person.name for person in User.query.filter_by(company_id=current_user.company_id).all()}
-        billing_parties = {person.id: person.name for person in User.query.filter_by(company_id=current_user.company_id).all()}
-        wharf_clerks = {clerk.id: f"{clerk.first_name} {clerk.last_name}" for clerk in WharfProfile.query.filter_by(company_id=current_user.company_id).all()}
-        cs_executives = {exec.id: exec.name for exec in User.query.filter_by(company_id=current_user.company_id).all()}
-        
-        # Format data for AG Grid
-        formatted_data = []
-        for shipment, doc_entry, doc_status, customer in shipments:
-            # Format each field similar to your HTML template
-            primary_job = f"Yes - {shipment.primary_job}" if shipment.primary_job_yn == 'Y' else "No"
-            
-            # Map shipment type
-            shipment_type_map = {1: "Custom", 2: "BOI"}
-            shipment_type = shipment_type_map.get(shipment.shipment_type_id, "N/A")
-            
-            # Map sub type
-            sub_type_map = {1: "Tiep", 2: "Infac", 3: "Bond"}
-            sub_type = sub_type_map.get(shipment.sub_type_id, "N/A")
-            
-            # Map customer category
-            customer_category = "Direct" if shipment.customer_category_id == 1 else "N/A"
-            
-            # Map business type
-            business_type_map = {
-                1: "Sales Nomination",
-                2: "Agent Nomination", 
-                3: "Free hand"
-            }
-            business_type_text = business_type_map.get(shipment.business_type_id, "N/A")
-            
-            # Map job type
-            job_type_map = {"1": "FCL", "2": "LCL"}
-            job_type = job_type_map.get(shipment.job_type, "N/A")
-            
-            # Format dates safely
-            def format_date(date_obj, format_str='%d-%m-%Y'):
-                return date_obj.strftime(format_str) if date_obj else 'N/A'
-                
-            def format_datetime(datetime_obj):
-                return datetime_obj.strftime('%d-%m-%Y %H:%M:%S') if datetime_obj else 'N/A'
-            
-            # Format on hold
-            on_hold = f"Yes - {shipment.onhold_reason}" if shipment.onhold_yn == 'Y' else "No"
-            
-            # Create the data row with proper formatting
-            row_data = {
-                'id': shipment.id,
-                'status': doc_status.docStatusName,
-                'branch_name': branches.get(shipment.branch_id, 'N/A'),
-                'import_id': shipment.import_id or doc_entry.docserial or 'N/A',
-                'shipment_deadline': format_date(shipment.shipment_deadline),
-                'bl_no': shipment.bl_no or 'N/A',
-                'license_number': shipment.license_number or 'N/A',
-                'primary_job': primary_job,
-                'shipment_type': shipment_type,
-                'sub_type': sub_type,
-                'customer_category': customer_category,
-                'business_type': business_type_text,
-                'customer_name': customer.customer_name if customer else 'N/A',
-                'billing_party': billing_parties.get(shipment.billing_party_id, 'N/A'),
-                'clearing_agent': shipment.clearing_agent or 'N/A',
-                'contact_person': shipment.contact_person or 'N/A',
-                'sales_person': sales_people.get(shipment.sales_person_id, 'N/A'),
-                'cs_executive': cs_executives.get(shipment.cs_executive_id, 'N/A'),
-                'wharf_clerk': wharf_clerks.get(shipment.wharf_clerk_id, 'N/A'),
-                'po_no': shipment.po_no or 'N/A',
-                'invoice_no': shipment.invoice_no or 'N/A',
-                'customer_ref_no': shipment.customer_ref_no or 'N/A',
-                'customs_dti_no': shipment.customs_dti_no or 'N/A',
-                'mbl_number': shipment.mbl_number or 'N/A',
-                'vessel': shipment.vessel or 'N/A',
-                'voyage': shipment.voyage or 'N/A',
-                'eta': format_datetime(shipment.eta),
-                'shipper': shipment.shipper or 'N/A',
-                'port_of_loading': shipment.port_of_loading or 'N/A',
-                'port_of_discharge': shipment.port_of_discharge or 'N/A',
-                'job_type': job_type,
-                'fcl_gate_out_date': format_date(shipment.fcl_gate_out_date),
-                'pod_datetime': format_datetime(shipment.pod_datetime),
-                'no_of_packages': shipment.no_of_packages or 'N/A',
-                'package_type': shipment.package_type or 'N/A',
-                'cbm': shipment.cbm or 'N/A',
-                'gross_weight': shipment.gross_weight or 'N/A',
-                'cargo_description': shipment.cargo_description or 'N/A',
-                'liner': shipment.liner or 'N/A',
-                'entrepot': shipment.entrepot or 'N/A',
-                'job_currency': shipment.job_currency or 'N/A',
-                'ex_rating_buying': shipment.ex_rating_buying or 'N/A',
-                'ex_rating_selling': shipment.ex_rating_selling or 'N/A',
-                'remarks': shipment.remarks or 'N/A',
-                'on_hold': on_hold,
-                'cleared_date': format_date(shipment.cleared_date),
-                'estimated_job_closing_date': format_date(shipment.estimated_job_closing_date),
-                'created_at': format_datetime(shipment.created_at),
-                'updated_at': format_datetime(shipment.updated_at)
+        if request.method == "POST" and request.is_json:
+            data = request.get_json() or {}
+            params = data.get('params') or {}
+        else:
+            data = {
+                'startRow': request.args.get('startRow', 0, type=int),
+                'endRow': request.args.get('endRow', type=int),
+                'sortModel': json.loads(request.args.get('sortModel', '[]')),
+                'filterModel': json.loads(request.args.get('filterModel', '{}')),
+                'columns': [c for c in request.args.get('columns', '').split(',') if c],
+                'cursor': request.args.get('cursor'),
             }
-            
-            formatted_data.append(row_data)
-        
+            params = request.args.to_dict()
+
+        result = get_daily_status_rows(
+            params,
+            start_row=data.get('startRow', 0),
+            end_row=data.get('endRow'),
+            filter_model=data.get('filterModel'),
+            sort_model=data.get('sortModel'),
+            columns=data.get('columns'),
+            cursor=data.get('cursor'),
+        )
+
         return jsonify({
             'success': True,
-            'shipments': formatted_data,
-            'total_count': len(formatted_data)
+            'shipments': result['rows'],
+            'lastRow': result['lastRow'],
+            'total_count': result['total_count'],
+            'cursor': result['cursor']
         })
         
     except Exception as e:
@@ -376,185 +238,14 @@ def api_daily_status():
 def api_export_daily_status():
     """API endpoint to export filtered data with only selected columns"""
     try:
-        # Get filter parameters
-        status1 = request.args.get('status1')
-        customer_id = request.args.get('customer_id')
-        branch_id = request.args.get('branch_id')
-        business_type = request.args.get('business_type')
-        date_range = request.args.get('date_range')
-        sales_person_id = request.args.get('sales_person_id')
-        shipment_type_id = request.args.get('shipment_type_id')
-        
-        # Get selected columns (comma-separated list)
-        selected_columns = request.args.get('columns', '').split(',')
+        selected_columns = _selected_columns(request.args.get('columns', '').split(','))
         export_format = request.args.get('format', 'excel')  # excel or csv
         
-        # Use the same query logic as the main API
-        query = db.session.query(
-            OrderShipment, ShipDocumentEntryMaster, DocumentStatus, Customer
-        ).join(
-            ShipDocumentEntryMaster, 
-            OrderShipment.ship_doc_entry_id == ShipDocumentEntryMaster.id
-        ).join(
-            DocumentStatus,
-            ShipDocumentEntryMaster.docStatusID == DocumentStatus.docStatusID
-        ).outerjoin(
-            Customer,
-            OrderShipment.customer_id == Customer.id
-        )
-        
-        # Apply same filters as API
-        query = query.filter(ShipDocumentEntryMaster.company_id == current_user.company_id)
-        
-        if status1:
-            status_map = {'open': 'Open', 'new': 'New', 'ongoing': 'Ongoing', 'completed': 'Completed'}
-            if status1 in status_map:
-                query = query.filter(DocumentStatus.docStatusName == status_map[status1])
-        
-        if customer_id:
-            query = query.filter(OrderShipment.customer_id == customer_id)
-        if branch_id:
-            query = query.filter(OrderShipment.branch_id == branch_id)
-        if business_type:
-            query = query.filter(OrderShipment.business_type_id == business_type)
-        if sales_person_id:
-            query = query.filter(OrderShipment.sales_person_id == sales_person_id)
-        if shipment_type_id:
-            query = query.filter(OrderShipment.shipment_type_id == shipment_type_id)
-        
-        if date_range:
-            try:
-                dates = date_range.split(' - ')
-                start_date = datetime.strptime(dates[0], '%d %b, %Y')
-                end_date = datetime.strptime(dates[1], '%d %b, %Y') + timedelta(days=1)
-                query = query.filter(OrderShipment.eta >= start_date, OrderShipment.eta < end_date)
-            except (ValueError, IndexError):
-                pass
-        
-        shipments = query.all()
-        
-        # Column mapping - maps field names to display names
-        column_mapping = {
-            'id': 'ID',
-            'status': 'Status',
-            'branch_name': 'Branch',
-            'import_id': 'Import ID',
-            'shipment_deadline': 'Shipment Deadline',
-            'bl_no': 'BL No',
-            'license_number': 'License Number',
-            'primary_job': 'Primary Job',
-            'shipment_type': 'Shipment Type',
-            'sub_type': 'Sub Type',
-            'customer_category': 'Customer Category',
-            'business_type': 'Business Type',
-            'customer_name': 'Customer',
-            'billing_party': 'Billing Party',
-            'clearing_agent': 'Clearing Agent',
-            'contact_person': 'Contact Person',
-            'sales_person': 'Sales Person',
-            'cs_executive': 'CS Executive',
-            'wharf_clerk': 'Wharf Clerk',
-            'po_no': 'PO No',
-            'invoice_no': 'Invoice No',
-            'customer_ref_no': 'Customer Ref No',
-            'customs_dti_no': 'Customs DTI No',
-            'mbl_number': 'MBL Number',
-            'vessel': 'Vessel',
-            'voyage': 'Voyage',
-            'eta': 'ETA',
-            'shipper': 'Shipper',
-            'port_of_loading': 'Port of Loading',
-            'port_of_discharge': 'Port of Discharge',
-            'job_type': 'Job Type',
-            'fcl_gate_out_date': 'FCL Gate Out Date',
-            'pod_datetime': 'POD Datetime',
-            'no_of_packages': 'No of Packages',
-            'package_type': 'Package Type',
-            'cbm': 'CBM',
-            'gross_weight': 'Gross Weight',
-            'cargo_description': 'Cargo Description',
-            'liner': 'Liner',
-            'entrepot': 'Entrepot',
-            'job_currency': 'Job Currency',
-            'ex_rating_buying': 'Ex Rating Buying',
-            'ex_rating_selling': 'Ex Rating Selling',
-            'remarks': 'Remarks',
-            'on_hold': 'On Hold',
-            'cleared_date': 'Cleared Date',
-            'estimated_job_closing_date': 'Est. Job Closing Date',
-            'created_at': 'Created',
-            'updated_at': 'Updated'
-        }
-        
-        # Format data (reuse logic from main API)
-        formatted_data = []
-        for shipment, doc_entry, doc_status, customer in shipments:
-            # [Same formatting logic as above - shortened for brevity]
-            row_data = {
-                'id': shipment.id,
-                'status': doc_status.docStatusName,
-                'customer_name': customer.customer_name if customer else 'N/A',
-                # ... add all other fields as needed
-            }
-            formatted_data.append(row_data)
-        
-        # Filter data to only include selected columns
-        if selected_columns and selected_columns[0]:  # Check if columns are specified
-            filtered_data = []
-            for row in formatted_data:
-                filtered_row = {col: row.get(col, 'N/A') for col in selected_columns if col in row}
-                filtered_data.append(filtered_row)
-            
-            # Create headers for selected columns only
-            headers = [column_mapping.get(col, col) for col in selected_columns if col in column_mapping]
-        else:
-            # Export all columns if none specified
-            filtered_data = formatted_data
-            headers = list(column_mapping.values())
-        
-        current_date = get_sri_lanka_time().strftime('%d-%m-%Y')
+        # Export all columns if none specified
+        if not selected_columns:
+            selected_columns = list(DAILY_STATUS_HEADERS)
         
-        if export_format == 'csv':
-            # Create CSV
-            output = io.StringIO()
-            writer = csv.writer(output)
-            writer.writerow(headers)
-            
-            for row in filtered_data:
-                writer.writerow([row.get(col, 'N/A') for col in selected_columns])
-            
-            csv_data = output.getvalue()
-            response = make_response(csv_data)
-            response.headers['Content-Disposition'] = f'attachment; filename=DSR_{current_date}.csv'
-            response.headers['Content-Type'] = 'text/csv'
-            return response
-            
-        else:  # Excel format
-            # Create DataFrame with selected columns only
-            df_data = []
-            for row in filtered_data:
-                df_data.append([row.get(col, 'N/A') for col in selected_columns])
-            
-            df = pd.DataFrame(df_data, columns=headers)
-            output = io.BytesIO()
-            
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, sheet_name='Shipments', index=False)
-                worksheet = writer.sheets['Shipments']
-                
-                # Auto-adjust column widths
-                for i, col in enumerate(df.columns):
-                    max_len = max(df[col].astype(str).map(len).max(), len(str(col))) + 2
-                    worksheet.set_column(i, i, min(max_len, 50))
-            
-            output.seek(0)
-            
-            return send_file(
-                output,
-                as_attachment=True,
-                download_name=f'DSR_{current_date}.xlsx',
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
+        return _export_daily_status(request.args.to_dict(), {}, [], selected_columns, export_format)
             
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -566,8 +257,8 @@ def api_daily_status_metadata():
     """API endpoint to get dropdown options for filters"""
     try:
         customers = [{'id': c.id, 'name': c.customer_name} for c in Customer.query.all()]
-        branches = [{'id': b.id, 'name': b.name} for b in Branch.query.all()]
-        sales_people = [{'id': u.id, 'name': u.name} for u in User.query.filter_by(company_id=current_user.company_id).all()]
+        branches = [{'id': b.id, 'name': b.name} for b in get_reference_data("branches")]
+        sales_people = [{'id': u.id, 'name': u.name} for u in get_reference_data("users")]
         
         return jsonify({
             'success': True,
@@ -581,269 +272,56 @@ def api_daily_status_metadata():
 
 
 
+def _selected_columns(columns):
+    return [col.strip() for col in columns if col and col.strip()]
+
+
+def _export_daily_status(params, filter_model, sort_model, selected_columns, export_format, prefix=''):
+    """
+    Stream a daily status export, or start a background export job (with a
+    download link) when the result is larger than EXPORT_BACKGROUND_ROW_THRESHOLD.
+    """
+    current_date = get_sri_lanka_time().strftime('%d-%m-%Y')
+    filename = f'DSR_{prefix}_{current_date}' if prefix else f'DSR_{current_date}'
+
+    threshold = current_app.config.get('EXPORT_BACKGROUND_ROW_THRESHOLD')
+    if threshold and count_daily_status_rows(params, filter_model) > threshold:
+        job = start_daily_status_export_job(params, filter_model, sort_model, selected_columns, export_format, filename)
+        status_url = url_for('reports.export_job_status', job_id=job.id)
+        download_url = url_for('reports.download_export_job', job_id=job.id)
+        if request.is_json:
+            return jsonify({
+                'success': True,
+                'background': True,
+                'job_id': job.id,
+                'status_url': status_url,
+                'download_url': download_url
+            }), 202
+        flash(
+            f"This export is large and is being prepared in the background. "
+            f"It will be available at {download_url}",
+            "info"
+        )
+        return redirect(url_for('reports.daily_status'))
+
+    rows = iter_daily_status_rows(params, filter_model, sort_model, selected_columns)
+    return export_response(rows, selected_columns, export_format, filename)
+
+
 @bp.route('/daily_status/download/excel', methods=['GET'])
+@login_required
 def download_daily_status_excel():
     """Download the daily status report as Excel file with only selected columns"""
     try:
         # Get selected columns (comma-separated list)
-        selected_columns = request.args.get('columns', '').split(',')
-        selected_columns = [col.strip() for col in selected_columns if col.strip()]
+        selected_columns = _selected_columns(request.args.get('columns', '').split(','))
         
         if not selected_columns:
             flash("No columns selected for export", "error")
             return redirect(url_for('reports.daily_status'))
         
-        # Get all the filter parameters
-        status1 = request.args.get('status1', '')
-        customer_id = request.args.get('customer_id', '')
-        branch_id = request.args.get('branch_id', '')
-        business_type = request.args.get('business_type', '')
-        date_range = request.args.get('date_range', '')
-        sales_person_id = request.args.get('sales_person_id', '')
-        shipment_type_id = request.args.get('shipment_type_id', '')
-        
-        # Build query (same as API)
-        query = db.session.query(
-            OrderShipment, ShipDocumentEntryMaster, DocumentStatus, Customer
-        ).join(
-            ShipDocumentEntryMaster, 
-            OrderShipment.ship_doc_entry_id == ShipDocumentEntryMaster.id
-        ).join(
-            DocumentStatus,
-            ShipDocumentEntryMaster.docStatusID == DocumentStatus.docStatusID
-        ).outerjoin(
-            Customer,
-            OrderShipment.customer_id == Customer.id
-        )
-        
-        # Filter by user's company
-        query = query.filter(ShipDocumentEntryMaster.company_id == current_user.company_id)
-        
-        # Apply filters (same logic as API)
-        if status1:
-            status_map = {
-                'open': 'Open',
-                'new': 'New', 
-                'ongoing': 'Ongoing',
-                'completed': 'Completed'
-            }
-            if status1 in status_map:
-                query = query.filter(DocumentStatus.docStatusName == status_map[status1])
-        
-        if customer_id:
-            query = query.filter(OrderShipment.customer_id == customer_id)
-        if branch_id:
-            query = query.filter(OrderShipment.branch_id == branch_id)
-        if business_type:
-            query = query.filter(OrderShipment.business_type_id == business_type)
-        if sales_person_id:
-            query = query.filter(OrderShipment.sales_person_id == sales_person_id)
-        if shipment_type_id:
-            query = query.filter(OrderShipment.shipment_type_id == shipment_type_id)
-        
-        if date_range:
-            try:
-                dates = date_range.split(' - ')
-                start_date = datetime.strptime(dates[0], '%d %b, %Y')
-                end_date = datetime.strptime(dates[1], '%d %b, %Y')
-                end_date = end_date + timedelta(days=1)
-                query = query.filter(OrderShipment.eta >= start_date, OrderShipment.eta < end_date)
-            except (ValueError, IndexError):
-                pass
-        
-        # Get all shipments
-        shipments = query.all()
-        
-        # Get lookup data for foreign keys (same as API)
-        branches = {branch.id: branch.name for branch in Branch.query.all()}
-        sales_people = {person.id: person.name for person in User.query.filter_by(company_id=current_user.company_id).all()}
-        billing_parties = {person.id: person.name for person in User.query.filter_by(company_id=current_user.company_id).all()}
-        wharf_clerks = {clerk.id: f"{clerk.first_name} {clerk.last_name}" for clerk in WharfProfile.query.filter_by(company_id=current_user.company_id).all()}
-        cs_executives = {exec.id: exec.name for exec in User.query.filter_by(company_id=current_user.company_id).all()}
-        
-        # Column mapping for headers
-        column_headers = {
-            'id': 'ID',
-            'status': 'Status',
-            'branch_name': 'Branch',
-            'import_id': 'Import ID',
-            'shipment_deadline': 'Shipment Deadline',
-            'bl_no': 'BL No',
-            'license_number': 'License Number',
-            'primary_job': 'Primary Job',
-            'shipment_type': 'Shipment Type',
-            'sub_type': 'Sub Type',
-            'customer_category': 'Customer Category',
-            'business_type': 'Business Type',
-            'customer_name': 'Customer',
-            'billing_party': 'Billing Party',
-            'clearing_agent': 'Clearing Agent',
-            'contact_person': 'Contact Person',
-            'sales_person': 'Sales Person',
-            'cs_executive': 'CS Executive',
-            'wharf_clerk': 'Wharf Clerk',
-            'po_no': 'PO No',
-            'invoice_no': 'Invoice No',
-            'customer_ref_no': 'Customer Ref No',
-            'customs_dti_no': 'Customs DTI No',
-            'mbl_number': 'MBL Number',
-            'vessel': 'Vessel',
-            'voyage': 'Voyage',
-            'eta': 'ETA',
-            'shipper': 'Shipper',
-            'port_of_loading': 'Port of Loading',
-            'port_of_discharge': 'Port of Discharge',
-            'job_type': 'Job Type',
-            'fcl_gate_out_date': 'FCL Gate Out Date',
-            'pod_datetime': 'POD Datetime',
-            'no_of_packages': 'No of Packages',
-            'package_type': 'Package Type',
-            'cbm': 'CBM',
-            'gross_weight': 'Gross Weight',
-            'cargo_description': 'Cargo Description',
-            'liner': 'Liner',
-            'entrepot': 'Entrepot',
-            'job_currency': 'Job Currency',
-            'ex_rating_buying': 'Ex Rating Buying',
-            'ex_rating_selling': 'Ex Rating Selling',
-            'remarks': 'Remarks',
-            'on_hold': 'On Hold',
-            'cleared_date': 'Cleared Date',
-            'estimated_job_closing_date': 'Est. Job Closing Date',
-            'created_at': 'Created',
-            'updated_at': 'Updated'
-        }
-        
-        # Helper functions for formatting (same as API)
-        def format_date(date_obj, format_str='%d-%m-%Y'):
-            return date_obj.strftime(format_str) if date_obj else 'N/A'
-            
-        def format_datetime(datetime_obj):
-            return datetime_obj.strftime('%d-%m-%Y %H:%M:%S') if datetime_obj else 'N/A'
-        
-        # Format data for each shipment (same logic as API)
-        formatted_data = []
-        for shipment, doc_entry, doc_status, customer in shipments:
-            # Format each field exactly like in the API
-            primary_job = f"Yes - {shipment.primary_job}" if shipment.primary_job_yn == 'Y' else "No"
-            
-            # Map shipment type
-            shipment_type_map = {1: "Custom", 2: "BOI"}
-            shipment_type = shipment_type_map.get(shipment.shipment_type_id, "N/A")
-            
-            # Map sub type
-            sub_type_map = {1: "Tiep", 2: "Infac", 3: "Bond"}
-            sub_type = sub_type_map.get(shipment.sub_type_id, "N/A")
-            
-            # Map customer category
-            customer_category = "Direct" if shipment.customer_category_id == 1 else "N/A"
-            
-            # Map business type
-            business_type_map = {
-                1: "Sales Nomination",
-                2: "Agent Nomination", 
-                3: "Free hand"
-            }
-            business_type_text = business_type_map.get(shipment.business_type_id, "N/A")
-            
-            # Map job type
-            job_type_map = {"1": "FCL", "2": "LCL"}
-            job_type = job_type_map.get(shipment.job_type, "N/A")
-            
-            # Format on hold
-            on_hold = f"Yes - {shipment.onhold_reason}" if shipment.onhold_yn == 'Y' else "No"
-            
-            # Create the complete row data (same as API)
-            row_data = {
-                'id': shipment.id,
-                'status': doc_status.docStatusName,
-                'branch_name': branches.get(shipment.branch_id, 'N/A'),
-                'import_id': shipment.import_id or doc_entry.docserial or 'N/A',
-                'shipment_deadline': format_date(shipment.shipment_deadline),
-                'bl_no': shipment.bl_no or 'N/A',
-                'license_number': shipment.license_number or 'N/A',
-                'primary_job': primary_job,
-                'shipment_type': shipment_type,
-                'sub_type': sub_type,
-                'customer_category': customer_category,
-                'business_type': business_type_text,
-                'customer_name': customer.customer_name if customer else 'N/A',
-                'billing_party': billing_parties.get(shipment.billing_party_id, 'N/A'),
-                'clearing_agent': shipment.clearing_agent or 'N/A',
-                'contact_person': shipment.contact_person or 'N/A',
-                'sales_person': sales_people.get(shipment.sales_person_id, 'N/A'),
-                'cs_executive': cs_executives.get(shipment.cs_executive_id, 'N/A'),
-                'wharf_clerk': wharf_clerks.get(shipment.wharf_clerk_id, 'N/A'),
-                'po_no': shipment.po_no or 'N/A',
-                'invoice_no': shipment.invoice_no or 'N/A',
-                'customer_ref_no': shipment.customer_ref_no or 'N/A',
-                'customs_dti_no': shipment.customs_dti_no or 'N/A',
-                'mbl_number': shipment.mbl_number or 'N/A',
-                'vessel': shipment.vessel or 'N/A',
-                'voyage': shipment.voyage or 'N/A',
-                'eta': format_datetime(shipment.eta),
-                'shipper': shipment.shipper or 'N/A',
-                'port_of_loading': shipment.port_of_loading or 'N/A',
-                'port_of_discharge': shipment.port_of_discharge or 'N/A',
-                'job_type': job_type,
-                'fcl_gate_out_date': format_date(shipment.fcl_gate_out_date),
-                'pod_datetime': format_datetime(shipment.pod_datetime),
-                'no_of_packages': shipment.no_of_packages or 'N/A',
-                'package_type': shipment.package_type or 'N/A',
-                'cbm': shipment.cbm or 'N/A',
-                'gross_weight': shipment.gross_weight or 'N/A',
-                'cargo_description': shipment.cargo_description or 'N/A',
-                'liner': shipment.liner or 'N/A',
-                'entrepot': shipment.entrepot or 'N/A',
-                'job_currency': shipment.job_currency or 'N/A',
-                'ex_rating_buying': shipment.ex_rating_buying or 'N/A',
-                'ex_rating_selling': shipment.ex_rating_selling or 'N/A',
-                'remarks': shipment.remarks or 'N/A',
-                'on_hold': on_hold,
-                'cleared_date': format_date(shipment.cleared_date),
-                'estimated_job_closing_date': format_date(shipment.estimated_job_closing_date),
-                'created_at': format_datetime(shipment.created_at),
-                'updated_at': format_datetime(shipment.updated_at)
-            }
-            
-            formatted_data.append(row_data)
-        
-        # Filter data to only include selected columns
-        filtered_data = []
-        for row in formatted_data:
-            filtered_row = []
-            for col in selected_columns:
-                filtered_row.append(row.get(col, 'N/A'))
-            filtered_data.append(filtered_row)
-        
-        # Create headers for selected columns only
-        headers = [column_headers.get(col, col) for col in selected_columns]
-        
-        # Create Excel file
-        df = pd.DataFrame(filtered_data, columns=headers)
-        output = io.BytesIO()
-        
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, sheet_name='Shipments', index=False)
-            worksheet = writer.sheets['Shipments']
-            
-            # Auto-adjust column widths
-            for i, col in enumerate(df.columns):
-                max_len = max(
-                    df[col].astype(str).map(len).max(),
-                    len(str(col))
-                ) + 2
-                worksheet.set_column(i, i, min(max_len, 50))
-        
-        output.seek(0)
-        current_date = get_sri_lanka_time().strftime('%d-%m-%Y')
-        
-        return send_file(
-            output,
-            as_attachment=True,
-            download_name=f'DSR_{current_date}.xlsx',
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        # The report filter form (status1, customer_id, date_range, ...) is in the query string
+        return _export_daily_status(request.args.to_dict(), {}, [], selected_columns, 'excel')
         
     except Exception as e:
         flash(f"Error generating Excel: {str(e)}", "error")
@@ -852,254 +330,24 @@ def download_daily_status_excel():
 
 
 @bp.route('/daily_status/download/csv', methods=['GET'])
+@login_required
 def download_daily_status_csv():
     """Download the daily status report as CSV file with only selected columns"""
     try:
         # Get selected columns (comma-separated list)
-        selected_columns = request.args.get('columns', '').split(',')
-        selected_columns = [col.strip() for col in selected_columns if col.strip()]
+        selected_columns = _selected_columns(request.args.get('columns', '').split(','))
         
         if not selected_columns:
             flash("No columns selected for export", "error")
             return redirect(url_for('reports.daily_status'))
         
-        # Get all the filter parameters
-        status1 = request.args.get('status1', '')
-        customer_id = request.args.get('customer_id', '')
-        branch_id = request.args.get('branch_id', '')
-        business_type = request.args.get('business_type', '')
-        date_range = request.args.get('date_range', '')
-        sales_person_id = request.args.get('sales_person_id', '')
-        shipment_type_id = request.args.get('shipment_type_id', '')
-        
-        # Build query (same as Excel function)
-        query = db.session.query(
-            OrderShipment, ShipDocumentEntryMaster, DocumentStatus, Customer
-        ).join(
-            ShipDocumentEntryMaster, 
-            OrderShipment.ship_doc_entry_id == ShipDocumentEntryMaster.id
-        ).join(
-            DocumentStatus,
-            ShipDocumentEntryMaster.docStatusID == DocumentStatus.docStatusID
-        ).outerjoin(
-            Customer,
-            OrderShipment.customer_id == Customer.id
-        )
-        
-        # Filter by user's company
-        query = query.filter(ShipDocumentEntryMaster.company_id == current_user.company_id)
-        
-        # Apply filters (same as Excel function)
-        if status1:
-            status_map = {
-                'open': 'Open',
-                'new': 'New', 
-                'ongoing': 'Ongoing',
-                'completed': 'Completed'
-            }
-            if status1 in status_map:
-                query = query.filter(DocumentStatus.docStatusName == status_map[status1])
-        
-        if customer_id:
-            query = query.filter(OrderShipment.customer_id == customer_id)
-        if branch_id:
-            query = query.filter(OrderShipment.branch_id == branch_id)
-        if business_type:
-            query = query.filter(OrderShipment.business_type_id == business_type)
-        if sales_person_id:
-            query = query.filter(OrderShipment.sales_person_id == sales_person_id)
-        if shipment_type_id:
-            query = query.filter(OrderShipment.shipment_type_id == shipment_type_id)
-        
-        if date_range:
-            try:
-                dates = date_range.split(' - ')
-                start_date = datetime.strptime(dates[0], '%d %b, %Y')
-                end_date = datetime.strptime(dates[1], '%d %b, %Y')
-                end_date = end_date + timedelta(days=1)
-                query = query.filter(OrderShipment.eta >= start_date, OrderShipment.eta < end_date)
-            except (ValueError, IndexError):
-                pass
-        
-        # Get all shipments
-        shipments = query.all()
-        
-        # Get lookup data for foreign keys (same as Excel function)
-        branches = {branch.id: branch.name for branch in Branch.query.all()}
-        sales_people = {person.id: person.name for person in User.query.filter_by(company_id=current_user.company_id).all()}
-        billing_parties = {person.id: person.name for person in User.query.filter_by(company_id=current_user.company_id).all()}
-        wharf_clerks = {clerk.id: f"{clerk.first_name} {clerk.last_name}" for clerk in WharfProfile.query.filter_by(company_id=current_user.company_id).all()}
-        cs_executives = {exec.id: exec.name for exec in User.query.filter_by(company_id=current_user.company_id).all()}
-        
-        # Column mapping for headers (same as Excel)
-        column_headers = {
-            'id': 'ID',
-            'status': 'Status',
-            'branch_name': 'Branch',
-            'import_id': 'Import ID',
-            'shipment_deadline': 'Shipment Deadline',
-            'bl_no': 'BL No',
-            'license_number': 'License Number',
-            'primary_job': 'Primary Job',
-            'shipment_type': 'Shipment Type',
-            'sub_type': 'Sub Type',
-            'customer_category': 'Customer Category',
-            'business_type': 'Business Type',
-            'customer_name': 'Customer',
-            'billing_party': 'Billing Party',
-            'clearing_agent': 'Clearing Agent',
-            'contact_person': 'Contact Person',
-            'sales_person': 'Sales Person',
-            'cs_executive': 'CS Executive',
-            'wharf_clerk': 'Wharf Clerk',
-            'po_no': 'PO No',
-            'invoice_no': 'Invoice No',
-            'customer_ref_no': 'Customer Ref No',
-            'customs_dti_no': 'Customs DTI No',
-            'mbl_number': 'MBL Number',
-            'vessel': 'Vessel',
-            'voyage': 'Voyage',
-            'eta': 'ETA',
-            'shipper': 'Shipper',
-            'port_of_loading': 'Port of Loading',
-            'port_of_discharge': 'Port of Discharge',
-            'job_type': 'Job Type',
-            'fcl_gate_out_date': 'FCL Gate Out Date',
-            'pod_datetime': 'POD Datetime',
-            'no_of_packages': 'No of Packages',
-            'package_type': 'Package Type',
-            'cbm': 'CBM',
-            'gross_weight': 'Gross Weight',
-            'cargo_description': 'Cargo Description',
-            'liner': 'Liner',
-            'entrepot': 'Entrepot',
-            'job_currency': 'Job Currency',
-            'ex_rating_buying': 'Ex Rating Buying',
-            'ex_rating_selling': 'Ex Rating Selling',
-            'remarks': 'Remarks',
-            'on_hold': 'On Hold',
-            'cleared_date': 'Cleared Date',
-            'estimated_job_closing_date': 'Est. Job Closing Date',
-            'created_at': 'Created',
-            'updated_at': 'Updated'
-        }
-        
-        # Helper functions for formatting (same as Excel)
-        def format_date(date_obj, format_str='%d-%m-%Y'):
-            return date_obj.strftime(format_str) if date_obj else 'N/A'
-            
-        def format_datetime(datetime_obj):
-            return datetime_obj.strftime('%d-%m-%Y %H:%M:%S') if datetime_obj else 'N/A'
-        
-        # Format data for each shipment (same as Excel)
-        formatted_data = []
-        for shipment, doc_entry, doc_status, customer in shipments:
-            # Same formatting logic as Excel function
-            primary_job = f"Yes - {shipment.primary_job}" if shipment.primary_job_yn == 'Y' else "No"
-            
-            shipment_type_map = {1: "Custom", 2: "BOI"}
-            shipment_type = shipment_type_map.get(shipment.shipment_type_id, "N/A")
-            
-            sub_type_map = {1: "Tiep", 2: "Infac", 3: "Bond"}
-            sub_type = sub_type_map.get(shipment.sub_type_id, "N/A")
-            
-            customer_category = "Direct" if shipment.customer_category_id == 1 else "N/A"
-            
-            business_type_map = {
-                1: "Sales Nomination",
-                2: "Agent Nomination", 
-                3: "Free hand"
-            }
-            business_type_text = business_type_map.get(shipment.business_type_id, "N/A")
-            
-            job_type_map = {"1": "FCL", "2": "LCL"}
-            job_type = job_type_map.get(shipment.job_type, "N/A")
-            
-            on_hold = f"Yes - {shipment.onhold_reason}" if shipment.onhold_yn == 'Y' else "No"
-            
-            # Create the complete row data (same as Excel)
-            row_data = {
-                'id': shipment.id,
-                'status': doc_status.docStatusName,
-                'branch_name': branches.get(shipment.branch_id, 'N/A'),
-                'import_id': shipment.import_id or doc_entry.docserial or 'N/A',
-                'shipment_deadline': format_date(shipment.shipment_deadline),
-                'bl_no': shipment.bl_no or 'N/A',
-                'license_number': shipment.license_number or 'N/A',
-                'primary_job': primary_job,
-                'shipment_type': shipment_type,
-                'sub_type': sub_type,
-                'customer_category': customer_category,
-                'business_type': business_type_text,
-                'customer_name': customer.customer_name if customer else 'N/A',
-                'billing_party': billing_parties.get(shipment.billing_party_id, 'N/A'),
-                'clearing_agent': shipment.clearing_agent or 'N/A',
-                'contact_person': shipment.contact_person or 'N/A',
-                'sales_person': sales_people.get(shipment.sales_person_id, 'N/A'),
-                'cs_executive': cs_executives.get(shipment.cs_executive_id, 'N/A'),
-                'wharf_clerk': wharf_clerks.get(shipment.wharf_clerk_id, 'N/A'),
-                'po_no': shipment.po_no or 'N/A',
-                'invoice_no': shipment.invoice_no or 'N/A',
-                'customer_ref_no': shipment.customer_ref_no or 'N/A',
-                'customs_dti_no': shipment.customs_dti_no or 'N/A',
-                'mbl_number': shipment.mbl_number or 'N/A',
-                'vessel': shipment.vessel or 'N/A',
-                'voyage': shipment.voyage or 'N/A',
-                'eta': format_datetime(shipment.eta),
-                'shipper': shipment.shipper or 'N/A',
-                'port_of_loading': shipment.port_of_loading or 'N/A',
-                'port_of_discharge': shipment.port_of_discharge or 'N/A',
-                'job_type': job_type,
-                'fcl_gate_out_date': format_date(shipment.fcl_gate_out_date),
-                'pod_datetime': format_datetime(shipment.pod_datetime),
-                'no_of_packages': shipment.no_of_packages or 'N/A',
-                'package_type': shipment.package_type or 'N/A',
-                'cbm': shipment.cbm or 'N/A',
-                'gross_weight': shipment.gross_weight or 'N/A',
-                'cargo_description': shipment.cargo_description or 'N/A',
-                'liner': shipment.liner or 'N/A',
-                'entrepot': shipment.entrepot or 'N/A',
-                'job_currency': shipment.job_currency or 'N/A',
-                'ex_rating_buying': shipment.ex_rating_buying or 'N/A',
-                'ex_rating_selling': shipment.ex_rating_selling or 'N/A',
-                'remarks': shipment.remarks or 'N/A',
-                'on_hold': on_hold,
-                'cleared_date': format_date(shipment.cleared_date),
-                'estimated_job_closing_date': format_date(shipment.estimated_job_closing_date),
-                'created_at': format_datetime(shipment.created_at),
-                'updated_at': format_datetime(shipment.updated_at)
-            }
-            
-            formatted_data.append(row_data)
-        
-        # Create headers for selected columns only
-        headers = [column_headers.get(col, col) for col in selected_columns]
-        
-        # Create CSV file
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(headers)
-        
-        # Write data rows for selected columns only
-        for row in formatted_data:
-            csv_row = [row.get(col, 'N/A') for col in selected_columns]
-            writer.writerow(csv_row)
-        
-        csv_data = output.getvalue()
-        current_date = get_sri_lanka_time().strftime('%d-%m-%Y')
-
-        response = make_response(csv_data)
-        response.headers['Content-Disposition'] = f'attachment; filename=DSR_{current_date}.csv'
-        response.headers['Content-Type'] = 'text/csv'
-        
-        return response
+        return _export_daily_status(request.args.to_dict(), {}, [], selected_columns, 'csv')
         
     except Exception as e:
         flash(f"Error generating CSV: {str(e)}", "error")
         return redirect(url_for('reports.daily_status'))
 
 
-
 @bp.route('/daily_status/export_filtered', methods=['POST'])
 @login_required
 def export_filtered_daily_status():
@@ -1119,7 +367,7 @@ def export_filtered_daily_status():
             export_format = request.form.get('format', 'excel')
         
         # Clean up column list
-        selected_columns = [col.strip() for col in selected_columns if col.strip()]
+        selected_columns = _selected_columns(selected_columns)
         
         if not selected_columns:
             return jsonify({'error': 'No columns selected for export'}), 400
@@ -1127,108 +375,7 @@ def export_filtered_daily_status():
         if not filtered_data:
             return jsonify({'error': 'No data to export'}), 400
         
-        # Column mapping for headers
-        column_headers = {
-            'id': 'ID',
-            'status': 'Status',
-            'branch_name': 'Branch',
-            'import_id': 'Import ID',
-            'shipment_deadline': 'Shipment Deadline',
-            'bl_no': 'BL No',
-            'license_number': 'License Number',
-            'primary_job': 'Primary Job',
-            'shipment_type': 'Shipment Type',
-            'sub_type': 'Sub Type',
-            'customer_category': 'Customer Category',
-            'business_type': 'Business Type',
-            'customer_name': 'Customer',
-            'billing_party': 'Billing Party',
-            'clearing_agent': 'Clearing Agent',
-            'contact_person': 'Contact Person',
-            'sales_person': 'Sales Person',
-            'cs_executive': 'CS Executive',
-            'wharf_clerk': 'Wharf Clerk',
-            'po_no': 'PO No',
-            'invoice_no': 'Invoice No',
-            'customer_ref_no': 'Customer Ref No',
-            'customs_dti_no': 'Customs DTI No',
-            'mbl_number': 'MBL Number',
-            'vessel': 'Vessel',
-            'voyage': 'Voyage',
-            'eta': 'ETA',
-            'shipper': 'Shipper',
-            'port_of_loading': 'Port of Loading',
-            'port_of_discharge': 'Port of Discharge',
-            'job_type': 'Job Type',
-            'fcl_gate_out_date': 'FCL Gate Out Date',
-            'pod_datetime': 'POD Datetime',
-            'no_of_packages': 'No of Packages',
-            'package_type': 'Package Type',
-            'cbm': 'CBM',
-            'gross_weight': 'Gross Weight',
-            'cargo_description': 'Cargo Description',
-            'liner': 'Liner',
-            'entrepot': 'Entrepot',
-            'job_currency': 'Job Currency',
-            'ex_rating_buying': 'Ex Rating Buying',
-            'ex_rating_selling': 'Ex Rating Selling',
-            'remarks': 'Remarks',
-            'on_hold': 'On Hold',
-            'cleared_date': 'Cleared Date',
-            'estimated_job_closing_date': 'Est. Job Closing Date',
-            'created_at': 'Created',
-            'updated_at': 'Updated'
-        }
-        
-        # Create headers for selected columns only
-        headers = [column_headers.get(col, col) for col in selected_columns]
-        
-        # Prepare export data - filter each row to only include selected columns
-        export_data = []
-        for row in filtered_data:
-            export_row = [row.get(col, 'N/A') for col in selected_columns]
-            export_data.append(export_row)
-        
-        current_date = get_sri_lanka_time().strftime('%d-%m-%Y')
-        
-        if export_format == 'csv':
-            # Create CSV
-            output = io.StringIO()
-            writer = csv.writer(output)
-            writer.writerow(headers)
-            writer.writerows(export_data)
-            
-            csv_data = output.getvalue()
-            response = make_response(csv_data)
-            response.headers['Content-Disposition'] = f'attachment; filename=DSR_Filtered_{current_date}.csv'
-            response.headers['Content-Type'] = 'text/csv'
-            return response
-            
-        else:  # Excel format
-            # Create DataFrame
-            df = pd.DataFrame(export_data, columns=headers)
-            output = io.BytesIO()
-            
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, sheet_name='Filtered Shipments', index=False)
-                worksheet = writer.sheets['Filtered Shipments']
-                
-                # Auto-adjust column widths
-                for i, col in enumerate(df.columns):
-                    max_len = max(
-                        df[col].astype(str).map(len).max() if len(df) > 0 else 0,
-                        len(str(col))
-                    ) + 2
-                    worksheet.set_column(i, i, min(max_len, 50))
-            
-            output.seek(0)
-            
-            return send_file(
-                output,
-                as_attachment=True,
-                download_name=f'DSR_Filtered_{current_date}.xlsx',
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
+        return export_formatted_data(filtered_data, selected_columns, export_format, 'Filtered')
             
     except Exception as e:
         print(f"Error in filtered export: {str(e)}")
@@ -1252,49 +399,22 @@ def export_with_ag_grid_filters():
             selected_columns = data.get('columns', [])
             export_format = data.get('format', 'excel')
             sort_model = data.get('sort_model', [])
+            params = data.get('params') or {}
         else:
             filter_model = json.loads(request.form.get('filter_model', '{}'))
             selected_columns = request.form.get('columns', '').split(',')
             export_format = request.form.get('format', 'excel')
             sort_model = json.loads(request.form.get('sort_model', '[]'))
+            params = json.loads(request.form.get('params', '{}'))
         
         # Clean up column list
-        selected_columns = [col.strip() for col in selected_columns if col.strip()]
+        selected_columns = _selected_columns(selected_columns)
         
         if not selected_columns:
             return jsonify({'error': 'No columns selected for export'}), 400
         
-        # Build base query (same as your existing API)
-        query = db.session.query(
-            OrderShipment, ShipDocumentEntryMaster, DocumentStatus, Customer
-        ).join(
-            ShipDocumentEntryMaster, 
-            OrderShipment.ship_doc_entry_id == ShipDocumentEntryMaster.id
-        ).join(
-            DocumentStatus,
-            ShipDocumentEntryMaster.docStatusID == DocumentStatus.docStatusID
-        ).outerjoin(
-            Customer,
-            OrderShipment.customer_id == Customer.id
-        )
-        
-        # Filter by user's company
-        query = query.filter(ShipDocumentEntryMaster.company_id == current_user.company_id)
-        
-        # Apply AG Grid filters to the query
-        query = apply_ag_grid_filters(query, filter_model)
-        
-        # Apply sorting if provided
-        query = apply_ag_grid_sorting(query, sort_model)
-        
-        # Get all filtered shipments
-        shipments = query.all()
-        
-        # Format data (same as your existing API)
-        formatted_data = format_shipment_data(shipments)
-        
-        # Export the formatted data
-        return export_formatted_data(formatted_data, selected_columns, export_format, 'Filtered')
+        # Same query, filters and sort as the grid, streamed into the file
+        return _export_daily_status(params, filter_model, sort_model, selected_columns, export_format, 'Filtered')
         
     except Exception as e:
         print(f"Error in export with filters: {str(e)}")
@@ -1305,296 +425,45 @@ def export_with_ag_grid_filters():
             return redirect(url_for('reports.daily_status'))
 
 
-def apply_ag_grid_filters(query, filter_model):
-    """Apply AG Grid filters to SQLAlchemy query"""
-    for field, filter_config in filter_model.items():
-        filter_type = filter_config.get('filterType')
-        
-        if filter_type == 'text':
-            # Handle text filters
-            filter_value = filter_config.get('filter', '')
-            filter_operator = filter_config.get('type', 'contains')
-            
-            if field == 'status':
-                if filter_operator == 'contains':
-                    query = query.filter(DocumentStatus.docStatusName.ilike(f'%{filter_value}%'))
-                elif filter_operator == 'equals':
-                    query = query.filter(DocumentStatus.docStatusName == filter_value)
-                elif filter_operator == 'startsWith':
-                    query = query.filter(DocumentStatus.docStatusName.ilike(f'{filter_value}%'))
-                elif filter_operator == 'endsWith':
-                    query = query.filter(DocumentStatus.docStatusName.ilike(f'%{filter_value}'))
-            
-            elif field == 'customer_name':
-                if filter_operator == 'contains':
-                    query = query.filter(Customer.customer_name.ilike(f'%{filter_value}%'))
-                elif filter_operator == 'equals':
-                    query = query.filter(Customer.customer_name == filter_value)
-                # Add more fields as needed
-            
-            # Add more field mappings as needed
-            
-        elif filter_type == 'number':
-            # Handle number filters
-            filter_value = filter_config.get('filter')
-            filter_operator = filter_config.get('type', 'equals')
-            
-            if field == 'id':
-                if filter_operator == 'equals':
-                    query = query.filter(OrderShipment.id == filter_value)
-                elif filter_operator == 'greaterThan':
-                    query = query.filter(OrderShipment.id > filter_value)
-                elif filter_operator == 'lessThan':
-                    query = query.filter(OrderShipment.id < filter_value)
-                # Add more operators as needed
-        
-        elif filter_type == 'date':
-            # Handle date filters
-            date_from = filter_config.get('dateFrom')
-            date_to = filter_config.get('dateTo')
-            
-            if field == 'eta' and date_from:
-                start_date = datetime.strptime(date_from, '%Y-%m-%d')
-                query = query.filter(OrderShipment.eta >= start_date)
-                
-                if date_to:
-                    end_date = datetime.strptime(date_to, '%Y-%m-%d')
-                    query = query.filter(OrderShipment.eta <= end_date)
-    
-    return query
+def export_formatted_data(formatted_data, selected_columns, export_format, prefix=''):
+    """Export formatted rows (any iterable of dicts) to Excel or CSV as a streamed download"""
+    current_date = get_sri_lanka_time().strftime('%d-%m-%Y')
+    filename = f'DSR_{prefix}_{current_date}' if prefix else f'DSR_{current_date}'
+    return export_response(formatted_data, selected_columns, export_format, filename)
 
 
-def apply_ag_grid_sorting(query, sort_model):
-    """Apply AG Grid sorting to SQLAlchemy query"""
-    for sort_config in sort_model:
-        field = sort_config.get('colId')
-        sort_direction = sort_config.get('sort', 'asc')
-        
-        if field == 'id':
-            if sort_direction == 'asc':
-                query = query.order_by(OrderShipment.id.asc())
-            else:
-                query = query.order_by(OrderShipment.id.desc())
-        elif field == 'status':
-            if sort_direction == 'asc':
-                query = query.order_by(DocumentStatus.docStatusName.asc())
-            else:
-                query = query.order_by(DocumentStatus.docStatusName.desc())
-        elif field == 'customer_name':
-            if sort_direction == 'asc':
-                query = query.order_by(Customer.customer_name.asc())
-            else:
-                query = query.order_by(Customer.customer_name.desc())
-        # Add more field mappings as needed
-    
-    return query
+@bp.route('/exports/<int:job_id>')
+@login_required
+def export_job_status(job_id):
+    """Status of a background export job"""
+    job = fail_stale_export_job(
+        ReportExportJob.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    )
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'row_count': job.row_count,
+        'error': job.error,
+        'download_url': url_for('reports.download_export_job', job_id=job.id) if job.status == 'done' else None
+    })
 
 
-def format_shipment_data(shipments):
-    """Format shipment data (extracted from your existing API logic)"""
-    # Get lookup data for foreign keys
-    branches = {branch.id: branch.name for branch in Branch.query.all()}
-    sales_people = {person.id: person.name for person in User.query.filter_by(company_id=current_user.company_id).all()}
-    billing_parties = {person.id: person.name for person in User.query.filter_by(company_id=current_user.company_id).all()}
-    wharf_clerks = {clerk.id: f"{clerk.first_name} {clerk.last_name}" for clerk in WharfProfile.query.filter_by(company_id=current_user.company_id).all()}
-    cs_executives = {exec.id: exec.name for exec in User.query.filter_by(company_id=current_user.company_id).all()}
-    
-    # Helper functions for formatting
-    def format_date(date_obj, format_str='%d-%m-%Y'):
-        return date_obj.strftime(format_str) if date_obj else 'N/A'
-        
-    def format_datetime(datetime_obj):
-        return datetime_obj.strftime('%d-%m-%Y %H:%M:%S') if datetime_obj else 'N/A'
-    
-    # Format data for each shipment
-    formatted_data = []
-    for shipment, doc_entry, doc_status, customer in shipments:
-        # Same formatting logic as your API
-        primary_job = f"Yes - {shipment.primary_job}" if shipment.primary_job_yn == 'Y' else "No"
-        
-        shipment_type_map = {1: "Custom", 2: "BOI"}
-        shipment_type = shipment_type_map.get(shipment.shipment_type_id, "N/A")
-        
-        sub_type_map = {1: "Tiep", 2: "Infac", 3: "Bond"}
-        sub_type = sub_type_map.get(shipment.sub_type_id, "N/A")
-        
-        customer_category = "Direct" if shipment.customer_category_id == 1 else "N/A"
-        
-        business_type_map = {
-            1: "Sales Nomination",
-            2: "Agent Nomination", 
-            3: "Free hand"
-        }
-        business_type_text = business_type_map.get(shipment.business_type_id, "N/A")
-        
-        job_type_map = {"1": "FCL", "2": "LCL"}
-        job_type = job_type_map.get(shipment.job_type, "N/A")
-        
-        on_hold = f"Yes - {shipment.onhold_reason}" if shipment.onhold_yn == 'Y' else "No"
-        
-        # Create the complete row data
-        row_data = {
-            'id': shipment.id,
-            'status': doc_status.docStatusName,
-            'branch_name': branches.get(shipment.branch_id, 'N/A'),
-            'import_id': shipment.import_id or doc_entry.docserial or 'N/A',
-            'shipment_deadline': format_date(shipment.shipment_deadline),
-            'bl_no': shipment.bl_no or 'N/A',
-            'license_number': shipment.license_number or 'N/A',
-            'primary_job': primary_job,
-            'shipment_type': shipment_type,
-            'sub_type': sub_type,
-            'customer_category': customer_category,
-            'business_type': business_type_text,
-            'customer_name': customer.customer_name if customer else 'N/A',
-            'billing_party': billing_parties.get(shipment.billing_party_id, 'N/A'),
-            'clearing_agent': shipment.clearing_agent or 'N/A',
-            'contact_person': shipment.contact_person or 'N/A',
-            'sales_person': sales_people.get(shipment.sales_person_id, 'N/A'),
-            'cs_executive': cs_executives.get(shipment.cs_executive_id, 'N/A'),
-            'wharf_clerk': wharf_clerks.get(shipment.wharf_clerk_id, 'N/A'),
-            'po_no': shipment.po_no or 'N/A',
-            'invoice_no': shipment.invoice_no or 'N/A',
-            'customer_ref_no': shipment.customer_ref_no or 'N/A',
-            'customs_dti_no': shipment.customs_dti_no or 'N/A',
-            'mbl_number': shipment.mbl_number or 'N/A',
-            'vessel': shipment.vessel or 'N/A',
-            'voyage': shipment.voyage or 'N/A',
-            'eta': format_datetime(shipment.eta),
-            'shipper': shipment.shipper or 'N/A',
-            'port_of_loading': shipment.port_of_loading or 'N/A',
-            'port_of_discharge': shipment.port_of_discharge or 'N/A',
-            'job_type': job_type,
-            'fcl_gate_out_date': format_date(shipment.fcl_gate_out_date),
-            'pod_datetime': format_datetime(shipment.pod_datetime),
-            'no_of_packages': shipment.no_of_packages or 'N/A',
-            'package_type': shipment.package_type or 'N/A',
-            'cbm': shipment.cbm or 'N/A',
-            'gross_weight': shipment.gross_weight or 'N/A',
-            'cargo_description': shipment.cargo_description or 'N/A',
-            'liner': shipment.liner or 'N/A',
-            'entrepot': shipment.entrepot or 'N/A',
-            'job_currency': shipment.job_currency or 'N/A',
-            'ex_rating_buying': shipment.ex_rating_buying or 'N/A',
-            'ex_rating_selling': shipment.ex_rating_selling or 'N/A',
-            'remarks': shipment.remarks or 'N/A',
-            'on_hold': on_hold,
-            'cleared_date': format_date(shipment.cleared_date),
-            'estimated_job_closing_date': format_date(shipment.estimated_job_closing_date),
-            'created_at': format_datetime(shipment.created_at),
-            'updated_at': format_datetime(shipment.updated_at)
-        }
-        
-        formatted_data.append(row_data)
-    
-    return formatted_data
-
+@bp.route('/exports/<int:job_id>/download')
+@login_required
+def download_export_job(job_id):
+    """Redirect to a short-lived S3 link for a finished background export"""
+    job = fail_stale_export_job(
+        ReportExportJob.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    )
+    if job.status != 'done' or not job.s3_key:
+        flash(f"Export is not ready yet (status: {job.status})", "info")
+        return redirect(url_for('reports.daily_status'))
 
-def export_formatted_data(formatted_data, selected_columns, export_format, prefix=''):
-    """Export formatted data to Excel or CSV"""
-    # Column mapping for headers
-    column_headers = {
-        'id': 'ID',
-        'status': 'Status',
-        'branch_name': 'Branch',
-        'import_id': 'Import ID',
-        'shipment_deadline': 'Shipment Deadline',
-        'bl_no': 'BL No',
-        'license_number': 'License Number',
-        'primary_job': 'Primary Job',
-        'shipment_type': 'Shipment Type',
-        'sub_type': 'Sub Type',
-        'customer_category': 'Customer Category',
-        'business_type': 'Business Type',
-        'customer_name': 'Customer',
-        'billing_party': 'Billing Party',
-        'clearing_agent': 'Clearing Agent',
-        'contact_person': 'Contact Person',
-        'sales_person': 'Sales Person',
-        'cs_executive': 'CS Executive',
-        'wharf_clerk': 'Wharf Clerk',
-        'po_no': 'PO No',
-        'invoice_no': 'Invoice No',
-        'customer_ref_no': 'Customer Ref No',
-        'customs_dti_no': 'Customs DTI No',
-        'mbl_number': 'MBL Number',
-        'vessel': 'Vessel',
-        'voyage': 'Voyage',
-        'eta': 'ETA',
-        'shipper': 'Shipper',
-        'port_of_loading': 'Port of Loading',
-        'port_of_discharge': 'Port of Discharge',
-        'job_type': 'Job Type',
-        'fcl_gate_out_date': 'FCL Gate Out Date',
-        'pod_datetime': 'POD Datetime',
-        'no_of_packages': 'No of Packages',
-        'package_type': 'Package Type',
-        'cbm': 'CBM',
-        'gross_weight': 'Gross Weight',
-        'cargo_description': 'Cargo Description',
-        'liner': 'Liner',
-        'entrepot': 'Entrepot',
-        'job_currency': 'Job Currency',
-        'ex_rating_buying': 'Ex Rating Buying',
-        'ex_rating_selling': 'Ex Rating Selling',
-        'remarks': 'Remarks',
-        'on_hold': 'On Hold',
-        'cleared_date': 'Cleared Date',
-        'estimated_job_closing_date': 'Est. Job Closing Date',
-        'created_at': 'Created',
-        'updated_at': 'Updated'
-    }
-    
-    # Create headers for selected columns only
-    headers = [column_headers.get(col, col) for col in selected_columns]
-    
-    # Prepare export data
-    export_data = []
-    for row in formatted_data:
-        export_row = [row.get(col, 'N/A') for col in selected_columns]
-        export_data.append(export_row)
-    
-    current_date = get_sri_lanka_time().strftime('%d-%m-%Y')
-    file_prefix = f'DSR_{prefix}_' if prefix else 'DSR_'
-    
-    if export_format == 'csv':
-        # Create CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(headers)
-        writer.writerows(export_data)
-        
-        csv_data = output.getvalue()
-        response = make_response(csv_data)
-        response.headers['Content-Disposition'] = f'attachment; filename={file_prefix}{current_date}.csv'
-        response.headers['Content-Type'] = 'text/csv'
-        return response
-        
-    else:  # Excel format
-        # Create DataFrame
-        df = pd.DataFrame(export_data, columns=headers)
-        output = io.BytesIO()
-        
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, sheet_name='Shipments', index=False)
-            worksheet = writer.sheets['Shipments']
-            
-            # Auto-adjust column widths
-            for i, col in enumerate(df.columns):
-                max_len = max(
-                    df[col].astype(str).map(len).max() if len(df) > 0 else 0,
-                    len(str(col))
-                ) + 2
-                worksheet.set_column(i, i, min(max_len, 50))
-        
-        output.seek(0)
-        
-        return send_file(
-            output,
-            as_attachment=True,
-            download_name=f'{file_prefix}{current_date}.xlsx',
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+    url = get_s3_url(current_app.config['S3_BUCKET_NAME'], job.s3_key, expires_in=300)
+    if not url:
+        abort(404)
+    return redirect(url)
 
 
 
@@ -0,0 +1,51 @@
+from flask import jsonify, request
+from flask_login import login_required, current_user
+
+from app import db
+from app.models.cha import CompanyAssignment
+from app.search import bp
+from app.search_index import SEARCH_ENTITIES, search
+from app.pagination import MAX_PER_PAGE
+
+
+def searchable_company_ids():
+    """Companies the user may search: None (all) for super admins, else own and assigned companies"""
+    if current_user.is_super_admin == 1:
+        return None
+    assigned = db.session.query(CompanyAssignment.company_id).filter(
+        CompanyAssignment.assigned_company_id == current_user.company_id,
+        CompanyAssignment.is_active == True
+    )
+    return {current_user.company_id} | {company_id for company_id, in assigned}
+
+
+@bp.route("/", methods=["GET"])
+@login_required
+def search_api():
+    """
+    Ranked search over customers, entries, shipments, attachments and containers.
+    ?q=<term>&types=shipment,import_container&page=1&per_page=20
+    """
+    term = request.args.get("q", "").strip()
+    page = request.args.get("page", 1, type=int)
+    per_page = min(max(request.args.get("per_page", 20, type=int), 1), MAX_PER_PAGE)
+    types = [t for t in request.args.get("types", "").split(",") if t in SEARCH_ENTITIES]
+
+    if not term:
+        return jsonify({"success": False, "message": "Search term is required"}), 400
+
+    try:
+        results = search(term, searchable_company_ids(), types or None, page, per_page)
+    except Exception as e:
+        print(f"Error searching for '{term}': {str(e)}")
+        return jsonify({"success": False, "message": "Search failed"}), 500
+
+    return jsonify({
+        "success": True,
+        "query": term,
+        "results": results.items,
+        "total": results.total,
+        "page": results.page,
+        "per_page": results.per_page,
+        "pages": results.pages,
+    })
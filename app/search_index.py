@@ -0,0 +1,426 @@
+# search_index.py
+"""
+Search index over customers, ship document entries, shipments, entry
+attachments and containers, served by the /search API.
+
+Every indexed row is flattened into a search document: a title, keywords
+(reference numbers such as BL, container, invoice and job numbers) and a
+free-text body. The backend is chosen by SEARCH_INDEX_URL:
+
+    ""                              search_documents table, MySQL FULLTEXT index
+    "sqlite:////path/to/search.db"  SQLite FTS5 sidecar (local development, tests)
+
+Documents are refreshed from the models' after_insert, after_update and
+after_delete events. The MySQL backend writes in the same transaction as the
+change; the sidecar is written once the session commits. Index errors are
+logged and never fail the change itself. rebuild_search_index() (the
+"search-reindex" command) fills the index from scratch.
+"""
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam, event, inspect, select, text, tuple_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import object_session
+
+from app.extensions import db
+from app.models.cha import (
+    Customer, ExportContainer, ImportContainer, OrderShipment, SearchDocument,
+    ShipDocumentEntryAttachment, ShipDocumentEntryMaster,
+)
+from app.pagination import Page, boolean_mode_terms
+
+TITLE_MAX_CHARS = 255
+BODY_MAX_CHARS = 16000  # stays within a MySQL TEXT column in utf8mb4
+EXCERPT_CHARS = 200
+REBUILD_BATCH_SIZE = 1000
+
+
+def _entity(model, title, keywords=(), body=(), company="company_id", entry=None):
+    """
+    company is the model's company column, or None when the company comes from
+    the ship document entry the row belongs to (entry is that foreign key).
+    """
+    return {
+        "model": model,
+        "title": title,
+        "keywords": keywords,
+        "body": body,
+        "company": company,
+        "entry": entry,
+    }
+
+
+SEARCH_ENTITIES = {
+    "customer": _entity(
+        Customer,
+        title=("customer_name",),
+        keywords=("customer_id", "short_name", "email", "telephone", "billing_party_email", "billing_party_telephone"),
+        body=("address", "billing_party_name", "billing_party_contact_person", "billing_party_address"),
+    ),
+    "entry": _entity(
+        ShipDocumentEntryMaster,
+        title=("docserial",),
+        body=("custComment",),
+        entry="id",
+    ),
+    "shipment": _entity(
+        OrderShipment,
+        title=("bl_no", "vessel"),
+        keywords=(
+            "bl_no", "mbl_number", "import_id", "license_number", "primary_job", "po_no",
+            "invoice_no", "customer_ref_no", "customs_dti_no",
+        ),
+        body=(
+            "shipper", "clearing_agent", "contact_person", "voyage", "port_of_loading",
+            "port_of_discharge", "liner", "cargo_description", "remarks",
+        ),
+        entry="ship_doc_entry_id",
+    ),
+    "attachment": _entity(
+        ShipDocumentEntryAttachment,
+        title=("description",),
+        keywords=("attachement_path",),
+        body=("note", "docAccepteComments", "extracted_content"),
+        company=None,
+        entry="shipDocEntryMasterID",
+    ),
+    "import_container": _entity(
+        ImportContainer,
+        title=("container_number",),
+        body=("remarks",),
+        company=None,
+        entry="shipment_id",
+    ),
+    "export_container": _entity(
+        ExportContainer,
+        title=("container_number",),
+        keywords=("container_size", "container_type"),
+        body=("remarks",),
+        company=None,
+        entry="shipment_id",
+    ),
+}
+
+_MODEL_ENTITIES = {spec["model"]: name for name, spec in SEARCH_ENTITIES.items()}
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _join(instance, fields, limit):
+    values = (getattr(instance, field) for field in fields)
+    return " ".join(str(value) for value in values if value not in (None, ""))[:limit]
+
+
+def build_document(name, instance, company_id=None):
+    """Search document of a model instance; company_id is used when the model has no company column"""
+    spec = SEARCH_ENTITIES[name]
+    if spec["company"]:
+        company_id = getattr(instance, spec["company"])
+    return {
+        "entity_type": name,
+        "entity_id": instance.id,
+        "company_id": company_id,
+        "entry_id": getattr(instance, spec["entry"]) if spec["entry"] else None,
+        "title": _join(instance, spec["title"], TITLE_MAX_CHARS),
+        "keywords": _join(instance, spec["keywords"], BODY_MAX_CHARS),
+        "body": _join(instance, spec["body"], BODY_MAX_CHARS),
+        "updated_at": datetime.now(),
+    }
+
+
+def _result(row, score):
+    return {
+        "entity_type": row["entity_type"],
+        "entity_id": row["entity_id"],
+        "company_id": row["company_id"],
+        "entry_id": row["entry_id"],
+        "title": row["title"],
+        "keywords": row["keywords"],
+        "excerpt": (row["body"] or "")[:EXCERPT_CHARS],
+        "score": float(score or 0),
+    }
+
+
+class MySQLSearchIndex:
+    """search_documents table with a FULLTEXT index over title, keywords and body"""
+
+    staged = False
+
+    def write(self, documents, connection=None):
+        if not documents:
+            return
+        statement = mysql_insert(SearchDocument.__table__)
+        statement = statement.on_duplicate_key_update(
+            {column: statement.inserted[column] for column in
+             ("company_id", "entry_id", "title", "keywords", "body", "updated_at")}
+        )
+        (connection or db.session.connection()).execute(statement, list(documents))
+
+    def delete(self, keys, connection=None):
+        if not keys:
+            return
+        (connection or db.session.connection()).execute(
+            SearchDocument.__table__.delete().where(
+                tuple_(SearchDocument.entity_type, SearchDocument.entity_id).in_(list(keys))
+            )
+        )
+
+    def clear(self, connection):
+        connection.execute(SearchDocument.__table__.delete())
+
+    def search(self, term, company_ids, entity_types, limit, offset):
+        terms = boolean_mode_terms(term)
+        if not terms:
+            return [], 0
+
+        filters = ""
+        params = {"terms": terms, "limit": limit, "offset": offset}
+        bind_params = []
+        if company_ids is not None:
+            filters += " AND company_id IN :company_ids"
+            params["company_ids"] = list(company_ids)
+            bind_params.append(bindparam("company_ids", expanding=True))
+        if entity_types:
+            filters += " AND entity_type IN :entity_types"
+            params["entity_types"] = list(entity_types)
+            bind_params.append(bindparam("entity_types", expanding=True))
+
+        statement = text(
+            "SELECT entity_type, entity_id, company_id, entry_id, title, keywords, body, "
+            "MATCH (title, keywords, body) AGAINST (:terms IN BOOLEAN MODE) AS score, "
+            "COUNT(*) OVER () AS total "
+            "FROM search_documents "
+            f"WHERE MATCH (title, keywords, body) AGAINST (:terms IN BOOLEAN MODE){filters} "
+            "ORDER BY score DESC, updated_at DESC "
+            "LIMIT :limit OFFSET :offset"
+        ).bindparams(*bind_params)
+        rows = db.session.execute(statement, params).mappings().all()
+        return [_result(row, row["score"]) for row in rows], (rows[0]["total"] if rows else None)
+
+
+class SQLiteSearchIndex:
+    """SQLite FTS5 sidecar file, written after each commit"""
+
+    staged = True
+
+    # bm25() weights for title, keywords and body
+    _RANK = "bm25(search_documents, 0, 0, 0, 0, 10.0, 5.0, 1.0)"
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS search_documents USING fts5("
+                "entity_type UNINDEXED, entity_id UNINDEXED, company_id UNINDEXED, entry_id UNINDEXED, "
+                "title, keywords, body, tokenize = 'unicode61')"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self._path, timeout=10)
+
+    def write(self, documents, connection=None):
+        documents = list(documents)
+        if not documents:
+            return
+        with self._lock, self._connect() as sidecar:
+            self._delete(sidecar, [(doc["entity_type"], doc["entity_id"]) for doc in documents])
+            sidecar.executemany(
+                "INSERT INTO search_documents (entity_type, entity_id, company_id, entry_id, title, keywords, body) "
+                "VALUES (:entity_type, :entity_id, :company_id, :entry_id, :title, :keywords, :body)",
+                documents,
+            )
+
+    def delete(self, keys, connection=None):
+        if not keys:
+            return
+        with self._lock, self._connect() as sidecar:
+            self._delete(sidecar, keys)
+
+    @staticmethod
+    def _delete(sidecar, keys):
+        sidecar.executemany(
+            "DELETE FROM search_documents WHERE entity_type = ? AND entity_id = ?", list(keys)
+        )
+
+    def clear(self, connection=None):
+        with self._lock, self._connect() as sidecar:
+            sidecar.execute("DELETE FROM search_documents")
+
+    def search(self, term, company_ids, entity_types, limit, offset):
+        words = re.findall(r"\w+", term)
+        if not words:
+            return [], 0
+
+        filters = ""
+        params = [" AND ".join(f'"{word}"*' for word in words)]
+        if company_ids is not None:
+            company_ids = list(company_ids)
+            if not company_ids:
+                return [], 0
+            filters += f" AND company_id IN ({', '.join('?' * len(company_ids))})"
+            params.extend(company_ids)
+        if entity_types:
+            filters += f" AND entity_type IN ({', '.join('?' * len(entity_types))})"
+            params.extend(entity_types)
+
+        # FTS5 ranking functions cannot be combined with a window COUNT
+        with self._connect() as sidecar:
+            sidecar.row_factory = sqlite3.Row
+            rows = sidecar.execute(
+                "SELECT entity_type, entity_id, company_id, entry_id, title, keywords, body, "
+                f"-{self._RANK} AS score "
+                f"FROM search_documents WHERE search_documents MATCH ?{filters} "
+                "ORDER BY score DESC LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+            total = sidecar.execute(
+                f"SELECT COUNT(*) FROM search_documents WHERE search_documents MATCH ?{filters}", params
+            ).fetchone()[0]
+        return [_result(row, row["score"]) for row in rows], total
+
+
+def get_search_index(url=None):
+    """Index backend for SEARCH_INDEX_URL (or the given url), shared by the process"""
+    if url is None:
+        url = current_app.config.get("SEARCH_INDEX_URL", "") if has_app_context() else ""
+
+    with _indexes_lock:
+        index = _indexes.get(url)
+        if index is None:
+            if url.startswith("sqlite:///"):
+                index = SQLiteSearchIndex(url[len("sqlite:///"):])
+            elif url:
+                raise RuntimeError(f"Unsupported SEARCH_INDEX_URL: {url}")
+            else:
+                index = MySQLSearchIndex()
+            _indexes[url] = index
+        return index
+
+
+def search(term, company_ids=None, entity_types=None, page=1, per_page=20):
+    """
+    Ranked Page of result dicts for a search term: every word of the term must
+    start a word of the document. company_ids=None searches every company.
+    """
+    page = max(page or 1, 1)
+    rows, total = get_search_index().search(term, company_ids, entity_types, per_page, (page - 1) * per_page)
+    if total is None:
+        # Past the last page the window has no rows to report the total on
+        total = 0 if page == 1 else get_search_index().search(term, company_ids, entity_types, 1, 0)[1] or 0
+    return Page(rows, page, per_page, total)
+
+
+# --- Keeping the index up to date ---------------------------------------------------
+
+def _entry_company_id(connection, entry_id):
+    if not entry_id:
+        return None
+    return connection.execute(
+        select(ShipDocumentEntryMaster.company_id).where(ShipDocumentEntryMaster.id == entry_id)
+    ).scalar()
+
+
+def _indexed_fields_changed(target, spec):
+    state = inspect(target)
+    fields = set(spec["title"]) | set(spec["keywords"]) | set(spec["body"])
+    fields.update(field for field in (spec["company"], spec["entry"]) if field)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+
+def _stage(target, connection, document=None, key=None):
+    index = get_search_index()
+    if not index.staged:
+        if document:
+            index.write([document], connection)
+        else:
+            index.delete([key], connection)
+        return
+
+    session = object_session(target)
+    if session is not None:
+        pending = session.info.setdefault("_search_pending", {})
+        pending[key or (document["entity_type"], document["entity_id"])] = document
+
+
+def _index_instance(mapper, connection, target):
+    name = _MODEL_ENTITIES[mapper.class_]
+    spec = SEARCH_ENTITIES[name]
+    try:
+        company_id = None
+        if not spec["company"]:
+            company_id = _entry_company_id(connection, getattr(target, spec["entry"]))
+        _stage(target, connection, document=build_document(name, target, company_id))
+    except Exception as e:
+        print(f"Error indexing {name} {target.id} for search: {str(e)}")
+
+
+def _on_update(mapper, connection, target):
+    if _indexed_fields_changed(target, SEARCH_ENTITIES[_MODEL_ENTITIES[mapper.class_]]):
+        _index_instance(mapper, connection, target)
+
+
+def _on_delete(mapper, connection, target):
+    name = _MODEL_ENTITIES[mapper.class_]
+    try:
+        _stage(target, connection, key=(name, target.id))
+    except Exception as e:
+        print(f"Error removing {name} {target.id} from search: {str(e)}")
+
+
+for _spec in SEARCH_ENTITIES.values():
+    event.listen(_spec["model"], "after_insert", _index_instance)
+    event.listen(_spec["model"], "after_update", _on_update)
+    event.listen(_spec["model"], "after_delete", _on_delete)
+
+
+@event.listens_for(db.session, "after_commit")
+def _write_staged_documents(session):
+    pending = session.info.pop("_search_pending", None)
+    if not pending:
+        return
+    try:
+        index = get_search_index()
+        index.delete([key for key, document in pending.items() if document is None])
+        index.write([document for document in pending.values() if document is not None])
+    except Exception as e:
+        print(f"Error writing search index: {str(e)}")
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_staged_documents(session):
+    session.info.pop("_search_pending", None)
+
+
+def rebuild_search_index():
+    """Re-index every searchable row; returns the number of documents written"""
+    index = get_search_index()
+    entry_companies = dict(db.session.query(ShipDocumentEntryMaster.id, ShipDocumentEntryMaster.company_id))
+
+    with db.engine.begin() as connection:
+        index.clear(connection)
+
+    written = 0
+    for name, spec in SEARCH_ENTITIES.items():
+        batch = []
+        for instance in spec["model"].query.order_by(spec["model"].id).yield_per(REBUILD_BATCH_SIZE):
+            company_id = None if spec["company"] else entry_companies.get(getattr(instance, spec["entry"]))
+            batch.append(build_document(name, instance, company_id))
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                with db.engine.begin() as connection:
+                    index.write(batch, connection)
+                written += len(batch)
+                batch = []
+        if batch:
+            with db.engine.begin() as connection:
+                index.write(batch, connection)
+            written += len(batch)
+        print(f"Search index: {name} indexed")
+
+    print(f"Search index rebuilt: {written} documents")
+    return written
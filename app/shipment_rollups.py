@@ -0,0 +1,274 @@
+# shipment_rollups.py
+"""
+Shipment counts for the main dashboard.
+
+shipment_counts() returns the on-time and demurrage counts of a company's or
+customer's shipments per (company, job type) from one GROUP BY query. With
+DASHBOARD_ROLLUPS the unfiltered and month/year views read the
+shipment_monthly_rollup table instead, which holds the same counts per
+company, customer, month and job type, so a dashboard load reads one row per
+group rather than scanning the shipments.
+
+The rollup is kept current by OrderShipment mapper events, in the same
+transaction as the shipment change, and rebuilt nightly (or with
+`flask shipment-rollups-rebuild`). shipment_rollup_state records the start
+of the last completed rebuild and the last time the rollup was known to be
+wrong: an event that failed, or a bulk UPDATE that bypasses the events
+(mark_shipment_rollups_stale(), e.g. the daily demurrage check). Reads use
+live counts until a rebuild has started after that, and before the first
+rebuild. Shipments without a job type are not counted, as the dashboard
+never showed them.
+"""
+from flask import current_app, g, has_request_context
+from sqlalchemy import case, event, extract, func, inspect, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from app.extensions import db
+from app.models.cha import OrderShipment, ShipmentMonthlyRollup, ShipmentRollupState
+
+STATE_ID = 1
+
+ROLLUP_FIELDS = ("company_id", "customer_id", "created_at", "job_type", "is_demurrage")
+
+
+def _enabled():
+    return current_app.config.get("DASHBOARD_ROLLUPS", False)
+
+
+def _rollup_current():
+    """True when the rollup has been rebuilt since it was last known to be wrong (read once per request)"""
+    if has_request_context() and "_shipment_rollup_current" in g:
+        return g._shipment_rollup_current
+    state = db.session.query(ShipmentRollupState.rebuilt_at, ShipmentRollupState.stale_at).filter(
+        ShipmentRollupState.id == STATE_ID
+    ).first()
+    current = bool(state and state.rebuilt_at and (state.stale_at is None or state.stale_at < state.rebuilt_at))
+    if has_request_context():
+        g._shipment_rollup_current = current
+    return current
+
+
+def rollups_built():
+    """True once a rebuild has completed"""
+    return db.session.query(ShipmentRollupState.rebuilt_at).filter(
+        ShipmentRollupState.id == STATE_ID, ShipmentRollupState.rebuilt_at.isnot(None)
+    ).first() is not None
+
+
+def mark_shipment_rollups_stale():
+    """
+    Record that the rollup no longer matches the shipments (after a bulk
+    UPDATE, or a failed event), on its own connection so it holds even if the
+    caller's transaction rolls back. Reads use live counts until the next rebuild.
+    """
+    table = ShipmentRollupState.__table__
+    statement = mysql_insert(table).values(id=STATE_ID, stale_at=func.now())
+    with db.engine.begin() as connection:
+        connection.execute(statement.on_duplicate_key_update(stale_at=func.now()))
+
+
+def _demurrage_sum(is_demurrage):
+    return func.coalesce(func.sum(case((is_demurrage == True, 1), else_=0)), 0)
+
+
+def _scope(query, model, company_id=None, customer_id=None):
+    if customer_id is not None:
+        return query.filter(model.customer_id == customer_id)
+    return query.filter(model.company_id == company_id)
+
+
+def _live_counts(company_id, customer_id, month, year, start_date, end_date):
+    demurrage = _demurrage_sum(OrderShipment.is_demurrage)
+    query = db.session.query(
+        OrderShipment.company_id,
+        OrderShipment.job_type,
+        func.count() - demurrage,
+        demurrage,
+    ).filter(OrderShipment.job_type.isnot(None))
+    query = _scope(query, OrderShipment, company_id, customer_id)
+
+    if start_date and end_date:
+        query = query.filter(OrderShipment.created_at >= start_date, OrderShipment.created_at <= end_date)
+    elif month and year:
+        query = query.filter(
+            extract('month', OrderShipment.created_at) == month,
+            extract('year', OrderShipment.created_at) == year
+        )
+    return query.group_by(OrderShipment.company_id, OrderShipment.job_type).all()
+
+
+def _rollup_counts(company_id, customer_id, month, year):
+    query = db.session.query(
+        ShipmentMonthlyRollup.company_id,
+        ShipmentMonthlyRollup.job_type,
+        func.sum(ShipmentMonthlyRollup.on_time_count),
+        func.sum(ShipmentMonthlyRollup.demurrage_count),
+    )
+    query = _scope(query, ShipmentMonthlyRollup, company_id, customer_id)
+
+    if month and year:
+        query = query.filter(
+            ShipmentMonthlyRollup.period_year == year,
+            ShipmentMonthlyRollup.period_month == month
+        )
+    return query.group_by(ShipmentMonthlyRollup.company_id, ShipmentMonthlyRollup.job_type).all()
+
+
+def shipment_counts(company_id=None, customer_id=None, month=None, year=None, start_date=None, end_date=None):
+    """
+    [(company_id, job_type, on_time, demurrage)] of a customer's shipments, or
+    a company's when no customer is given. A start/end date range wins over a
+    month/year filter, and either needs both of its values.
+    """
+    if _enabled() and not (start_date and end_date) and _rollup_current():
+        rows = _rollup_counts(company_id, customer_id, month, year)
+    else:
+        rows = _live_counts(company_id, customer_id, month, year, start_date, end_date)
+
+    counts = []
+    for row_company_id, job_type, on_time, demurrage in rows:
+        on_time, demurrage = int(on_time or 0), int(demurrage or 0)
+        if on_time or demurrage:
+            counts.append((row_company_id, job_type, on_time, demurrage))
+    return counts
+
+
+def _rollup_key(values):
+    """(rollup key, is_demurrage) of a shipment's values, or None when it is not counted"""
+    if not values["job_type"] or not values["company_id"]:
+        return None
+    created_at = values["created_at"]
+    year, month = (created_at.year, created_at.month) if created_at else (0, 0)
+    key = (values["company_id"], values["customer_id"] or 0, year, month, values["job_type"])
+    return key, bool(values["is_demurrage"])
+
+
+def _apply(connection, values, delta):
+    counted = _rollup_key(values)
+    if counted is None:
+        return
+    (company_id, customer_id, year, month, job_type), is_demurrage = counted
+    column = "demurrage_count" if is_demurrage else "on_time_count"
+    table = ShipmentMonthlyRollup.__table__
+
+    values = {
+        "company_id": company_id,
+        "customer_id": customer_id,
+        "period_year": year,
+        "period_month": month,
+        "job_type": job_type,
+        "on_time_count": 0,
+        "demurrage_count": 0,
+    }
+    values[column] = max(delta, 0)
+    statement = mysql_insert(table).values(**values)
+    connection.execute(statement.on_duplicate_key_update({column: table.c[column] + delta}))
+
+
+def _stored_values(connection, shipment_id):
+    """The shipment's rollup fields as stored, before this flush changes them"""
+    columns = [getattr(OrderShipment, field) for field in ROLLUP_FIELDS]
+    row = connection.execute(select(*columns).where(OrderShipment.id == shipment_id)).first()
+    return dict(zip(ROLLUP_FIELDS, row)) if row else None
+
+
+def _current_values(target):
+    return {field: getattr(target, field) for field in ROLLUP_FIELDS}
+
+
+def _failed(message):
+    """
+    A rollup update failed: the shipment is still saved, and dashboards read
+    live counts until the next rebuild
+    """
+    print(f"{message} - serving live dashboard counts until the rollup is rebuilt")
+    try:
+        mark_shipment_rollups_stale()
+    except Exception as e:
+        print(f"ERROR marking shipment rollups stale: {str(e)}")
+
+
+@event.listens_for(OrderShipment, "after_insert")
+def _count_inserted(mapper, connection, target):
+    if not _enabled():
+        return
+    try:
+        _apply(connection, _current_values(target), 1)
+    except Exception as e:
+        _failed(f"Error counting shipment {target.id} in dashboard rollup: {str(e)}")
+
+
+@event.listens_for(OrderShipment, "before_update")
+def _count_updated(mapper, connection, target):
+    if not _enabled():
+        return
+    state = inspect(target)
+    if not any(state.attrs[field].history.has_changes() for field in ROLLUP_FIELDS):
+        return
+    try:
+        previous = _stored_values(connection, target.id)
+        current = _current_values(target)
+        if previous and _rollup_key(previous) == _rollup_key(current):
+            return
+        if previous:
+            _apply(connection, previous, -1)
+        _apply(connection, current, 1)
+    except Exception as e:
+        _failed(f"Error recounting shipment {target.id} in dashboard rollup: {str(e)}")
+
+
+@event.listens_for(OrderShipment, "before_delete")
+def _count_deleted(mapper, connection, target):
+    if not _enabled():
+        return
+    try:
+        previous = _stored_values(connection, target.id)
+        if previous:
+            _apply(connection, previous, -1)
+    except Exception as e:
+        _failed(f"Error uncounting shipment {target.id} in dashboard rollup: {str(e)}")
+
+
+def rebuild_shipment_rollups():
+    """
+    Rebuild shipment_monthly_rollup from order_shipment in one INSERT ...
+    SELECT and record the rebuild's start; returns the rollup's row count
+    """
+    period_year = func.coalesce(extract('year', OrderShipment.created_at), 0)
+    period_month = func.coalesce(extract('month', OrderShipment.created_at), 0)
+    customer_id = func.coalesce(OrderShipment.customer_id, 0)
+    demurrage = _demurrage_sum(OrderShipment.is_demurrage)
+
+    snapshot = (
+        select(
+            OrderShipment.company_id,
+            customer_id,
+            period_year,
+            period_month,
+            OrderShipment.job_type,
+            func.count() - demurrage,
+            demurrage,
+        )
+        .where(OrderShipment.job_type.isnot(None))
+        .group_by(OrderShipment.company_id, customer_id, period_year, period_month, OrderShipment.job_type)
+    )
+    try:
+        # Anything marked stale from here on still needs the next rebuild
+        started_at = db.session.execute(select(func.now())).scalar()
+        ShipmentMonthlyRollup.query.delete(synchronize_session=False)
+        result = db.session.execute(
+            ShipmentMonthlyRollup.__table__.insert().from_select(
+                ['company_id', 'customer_id', 'period_year', 'period_month', 'job_type',
+                 'on_time_count', 'demurrage_count'],
+                snapshot,
+            )
+        )
+        state = mysql_insert(ShipmentRollupState.__table__).values(id=STATE_ID, rebuilt_at=started_at)
+        db.session.execute(state.on_duplicate_key_update(rebuilt_at=started_at))
+        db.session.commit()
+        print(f"Shipment rollups rebuilt: {result.rowcount} rows")
+        return result.rowcount
+    except Exception as e:
+        db.session.rollback()
+        print(f"ERROR rebuilding shipment rollups: {str(e)}")
+        raise
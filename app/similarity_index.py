@@ -0,0 +1,155 @@
+# similarity_index.py
+"""
+Per-shipment-category TF-IDF index for document similarity.
+
+Instead of fitting a TfidfVectorizer on two texts for every comparison,
+each ShipCategory keeps the number of its accepted documents
+(ship_category_similarity_index) and, per term, how many of them contain it
+(ship_category_term_frequencies). The IDF derived from them is shared by
+every comparison in the category, and texts are turned into L2-normalised
+sparse TF-IDF rows so one matrix product scores a submission against many
+samples. The IDF also weights key field matching in field_locator.py.
+"""
+import re
+import time
+import threading
+
+import numpy as np
+from flask import current_app
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from app.extensions import db
+from app.models.validation import ShipCategorySimilarityIndex, ShipCategoryTermFrequency
+
+
+# Same token pattern as sklearn's TfidfVectorizer
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+# Longest candidate span (in words) compared with a key field name
+MAX_FIELD_WORDS = 4
+
+# Longer tokens (IDs, run-together OCR text) are not stored and count as unseen terms
+MAX_TERM_LENGTH = 100
+
+_index_cache = {}
+_index_cache_lock = threading.Lock()
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class SimilarityIndex:
+    """Smoothed IDF over a corpus of documents, as in TfidfVectorizer(smooth_idf=True)"""
+
+    def __init__(self, document_count=0, document_frequencies=None):
+        self.document_count = document_count
+        self.document_frequencies = document_frequencies or {}
+        # Terms never seen in the corpus get the highest IDF
+        self.unseen_idf = np.log((1 + document_count) / 1) + 1
+
+    def idf(self, term):
+        df = self.document_frequencies.get(term)
+        if not df:
+            return self.unseen_idf
+        return np.log((1 + self.document_count) / (1 + df)) + 1
+
+    def vectorize(self, term_counts_list):
+        """
+        L2-normalised TF-IDF rows (CSR) for a list of {term: count} dicts.
+        All rows share one column space, so any two rows can be compared.
+        """
+        vocabulary = {}
+        indptr = [0]
+        indices = []
+        data = []
+        for term_counts in term_counts_list:
+            for term, count in term_counts.items():
+                column = vocabulary.setdefault(term, len(vocabulary))
+                indices.append(column)
+                data.append(count * self.idf(term))
+            indptr.append(len(indices))
+
+        matrix = csr_matrix(
+            (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(term_counts_list), max(len(vocabulary), 1)),
+        )
+        return normalize(matrix, norm="l2", copy=False)
+
+    def similarities(self, term_counts, other_term_counts_list):
+        """Cosine similarity of one document against many (e.g. all samples of a category)"""
+        matrix = self.vectorize([term_counts] + list(other_term_counts_list))
+        return (matrix[1:] @ matrix[0].T).toarray().ravel()
+
+
+def get_similarity_index(ship_category_id):
+    """
+    Similarity index for a shipment category, cached per process. A cached
+    copy is used for SIMILARITY_INDEX_REFRESH_SECONDS, then reloaded only if
+    the stored version has changed - the IDF shifts little per document.
+    """
+    if not ship_category_id:
+        return SimilarityIndex()
+
+    refresh_seconds = current_app.config.get("SIMILARITY_INDEX_REFRESH_SECONDS", 300)
+    with _index_cache_lock:
+        cached = _index_cache.get(ship_category_id)
+    if cached and time.monotonic() - cached[1] < refresh_seconds:
+        return cached[2]
+
+    row = (
+        db.session.query(ShipCategorySimilarityIndex.version, ShipCategorySimilarityIndex.document_count)
+        .filter_by(ship_category_id=ship_category_id)
+        .first()
+    )
+    if row is None:
+        return SimilarityIndex()
+
+    if cached and cached[0] == row.version:
+        index = cached[2]
+    else:
+        document_frequencies = dict(
+            db.session.query(ShipCategoryTermFrequency.term, ShipCategoryTermFrequency.document_count)
+            .filter(ShipCategoryTermFrequency.ship_category_id == ship_category_id)
+            .all()
+        )
+        index = SimilarityIndex(row.document_count, document_frequencies)
+    with _index_cache_lock:
+        _index_cache[ship_category_id] = (row.version, time.monotonic(), index)
+    return index
+
+
+def add_document_to_index(ship_category_id, text):
+    """
+    Add an accepted document's terms to its category's document frequencies:
+    one upsert per term, so concurrent documents only touch the rows of the
+    terms they contain
+    """
+    if not ship_category_id or not text:
+        return
+
+    # Sorted, so two documents sharing terms lock their rows in the same order
+    terms = sorted(term for term in set(tokenize(text)) if len(term) <= MAX_TERM_LENGTH)
+
+    if terms:
+        term_table = ShipCategoryTermFrequency.__table__
+        statement = mysql_insert(term_table).on_duplicate_key_update(
+            document_count=term_table.c.document_count + 1
+        )
+        db.session.execute(statement, [
+            {"ship_category_id": ship_category_id, "term": term, "document_count": 1}
+            for term in terms
+        ])
+
+    # The category row last, so its lock is held only until the commit
+    index_table = ShipCategorySimilarityIndex.__table__
+    statement = mysql_insert(index_table).values(
+        ship_category_id=ship_category_id, document_count=1, version=1
+    )
+    db.session.execute(statement.on_duplicate_key_update(
+        document_count=index_table.c.document_count + 1,
+        version=index_table.c.version + 1,
+    ))
+    db.session.commit()
@@ -11,6 +11,11 @@ let currentUserId = null;
 let currentUserName = null;
 let messagePollInterval = null;
 let unreadMessages = {};
+let chatEventSource = null;
+let chatEventsConnectedOnce = false;
+// Cursors of the loaded page range (message ids)
+let oldestMessageId = null;
+let newestMessageId = null;
 
 function openChat(moduleName, referenceId) {
     // Set current context
@@ -82,7 +87,8 @@ function initializeChat(moduleName, referenceId) {
             // Load messages after getting thread
             loadMessages();
             
-            // Start polling for new messages
+            // Listen for new messages in this thread (polling is the fallback)
+            connectChatEvents(currentThreadId);
             startMessagePolling();
         })
         .catch(error => {
@@ -111,11 +117,16 @@ function checkAndLoadNewMessages() {
         return;
     }
 
+    // New messages arrive through the event stream while it is connected
+    if (chatEventsActive()) {
+        return;
+    }
+
     fetch(`/chat/check-new-messages/${currentModule}/${currentReferenceId}`)
         .then(response => response.json())
         .then(data => {
             if (data.new_messages_exist) {
-                loadMessages(); // Only load messages if new ones exist
+                loadNewerMessages(); // Only load messages if new ones exist
                 
                 // Auto-mark as read since the chat is open
                 markMessagesAsRead(currentModule, currentReferenceId);
@@ -168,8 +179,85 @@ document.getElementById('chatModal')?.addEventListener('hidden.bs.modal', () =>
         clearInterval(messagePollInterval);
         messagePollInterval = null;
     }
+    // Keep only the user's notification events
+    connectChatEvents(null);
 });
 
+// Live updates over Server-Sent Events (/chat/events)
+function chatEventsActive() {
+    return !!chatEventSource && chatEventSource.readyState === EventSource.OPEN;
+}
+
+function connectChatEvents(threadId) {
+    if (!window.EventSource) return;
+
+    if (chatEventSource) {
+        chatEventSource.close();
+    }
+
+    chatEventSource = new EventSource(threadId ? `/chat/events?thread=${threadId}` : '/chat/events');
+
+    chatEventSource.addEventListener('open', () => {
+        // Events sent while disconnected are lost - resync once after a reconnect
+        if (chatEventsConnectedOnce) {
+            checkNewMessages();
+        }
+        chatEventsConnectedOnce = true;
+    });
+
+    chatEventSource.addEventListener('chat_message', (e) => {
+        const data = JSON.parse(e.data);
+        setChatBadge(data.notification.module_name, data.notification.entry_id, data.thread_unread_count);
+        setTopbarNotificationCount(data.total_count);
+    });
+
+    chatEventSource.addEventListener('chat_read', (e) => {
+        const data = JSON.parse(e.data);
+        data.threads.forEach(thread => setChatBadge(thread.module_name, thread.entry_id, thread.unread_count));
+        setTopbarNotificationCount(data.total_count);
+    });
+
+    chatEventSource.addEventListener('thread_message', (e) => {
+        const data = JSON.parse(e.data);
+        const chatModal = document.getElementById('chatModal');
+        if (data.thread_id !== currentThreadId || !chatModal || !chatModal.classList.contains('show')) {
+            return;
+        }
+        if (data.sender_id !== currentUserId) {
+            loadNewerMessages();
+            markMessagesAsRead(currentModule, currentReferenceId);
+        }
+    });
+}
+
+function setChatBadge(moduleName, entryId, unreadCount) {
+    const button = document.querySelector(`[data-entry-id="${entryId}"][data-module-name="${moduleName}"]`);
+    const badge = button?.querySelector('.chat-notification-badge');
+    if (!badge) return;
+
+    if (unreadCount > 0) {
+        badge.textContent = unreadCount > 9 ? '9+' : unreadCount;
+        badge.classList.remove('d-none');
+    } else {
+        badge.classList.add('d-none');
+    }
+}
+
+function setTopbarNotificationCount(totalCount) {
+    const countBadge = document.getElementById('topbar-notification-count');
+    const textBadge = document.getElementById('topbar-notification-badge');
+    if (countBadge) {
+        countBadge.textContent = totalCount;
+        countBadge.style.display = totalCount > 0 ? 'inline' : 'none';
+    }
+    if (textBadge) {
+        textBadge.textContent = `${totalCount} New`;
+        textBadge.style.display = totalCount > 0 ? 'inline' : 'none';
+    }
+}
+
+window.chatEventsActive = chatEventsActive;
+
 // Load messages for current thread
 function loadMessages() {
     if (!currentThreadId) {
@@ -191,34 +279,16 @@ function loadMessages() {
         </div>
     `;
 
-    fetch(`/chat/messages/${currentThreadId}`)
-        .then(response => {
-            if (!response.ok) {
-                throw new Error('Failed to fetch messages');
-            }
-            return response.json();
-        })
+    // Newest page first; older pages are loaded on demand
+    fetchMessagePage('')
         .then(data => {
             messageContainer.innerHTML = '';
+            oldestMessageId = data.before;
+            newestMessageId = data.after;
 
             if (data.messages && data.messages.length > 0) {
-                data.messages.forEach(message => {
-                    // Get current user ID from meta tag if not already set
-                    if (!currentUserId) {
-                        const userIdMeta = document.querySelector('meta[name="user-id"]');
-                        if (userIdMeta) {
-                            currentUserId = parseInt(userIdMeta.content);
-                        }
-                    }
-                    
-                    const messageData = {
-                        ...message,
-                        is_sender: parseInt(message.sender.id) === currentUserId
-                    };
-                    const messageHTML = formatMessage(messageData);
-                    messageContainer.insertAdjacentHTML('beforeend', messageHTML);
-                });
-
+                messageContainer.insertAdjacentHTML('beforeend', renderMessagePage(data.messages));
+                setLoadEarlierButton(data.has_more);
                 scrollToBottom();
             } else {
                 messageContainer.innerHTML = `
@@ -238,6 +308,84 @@ function loadMessages() {
         });
 } 
 
+function fetchMessagePage(cursor) {
+    return fetch(`/chat/messages/${currentThreadId}${cursor}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Failed to fetch messages');
+            }
+            return response.json();
+        });
+}
+
+function renderMessagePage(messages) {
+    // Get current user ID from meta tag if not already set
+    if (!currentUserId) {
+        const userIdMeta = document.querySelector('meta[name="user-id"]');
+        if (userIdMeta) {
+            currentUserId = parseInt(userIdMeta.content);
+        }
+    }
+
+    return messages.map(message => formatMessage({
+        ...message,
+        is_sender: parseInt(message.sender.id) === currentUserId
+    })).join('');
+}
+
+function setLoadEarlierButton(hasMore) {
+    const messageContainer = document.getElementById('messageContainer');
+    document.getElementById('loadEarlierMessages')?.remove();
+    if (hasMore && messageContainer) {
+        messageContainer.insertAdjacentHTML('afterbegin', `
+            <div class="text-center my-2" id="loadEarlierMessages">
+                <button type="button" class="btn btn-sm btn-soft-primary" onclick="loadOlderMessages()">Load earlier messages</button>
+            </div>
+        `);
+    }
+}
+
+// Prepend the page of messages before the oldest one shown
+function loadOlderMessages() {
+    const messageContainer = document.getElementById('messageContainer');
+    if (!currentThreadId || !oldestMessageId || !messageContainer) return;
+
+    fetchMessagePage(`?before=${oldestMessageId}`)
+        .then(data => {
+            document.getElementById('loadEarlierMessages')?.remove();
+            // Keep the visible messages where they are
+            const previousHeight = messageContainer.scrollHeight;
+            messageContainer.insertAdjacentHTML('afterbegin', renderMessagePage(data.messages));
+            messageContainer.scrollTop += messageContainer.scrollHeight - previousHeight;
+            oldestMessageId = data.before;
+            setLoadEarlierButton(data.has_more);
+        })
+        .catch(error => console.error('Error loading earlier messages:', error));
+}
+
+// Append the messages newer than the newest one shown
+function loadNewerMessages() {
+    if (!currentThreadId) return;
+    if (!newestMessageId) {
+        loadMessages();
+        return;
+    }
+
+    const messageContainer = document.getElementById('messageContainer');
+    fetchMessagePage(`?after=${newestMessageId}`)
+        .then(data => {
+            if (!data.messages.length || !messageContainer) return;
+            messageContainer.insertAdjacentHTML('beforeend', renderMessagePage(data.messages));
+            newestMessageId = data.after;
+            if (data.has_more) {
+                loadNewerMessages();
+            } else {
+                scrollToBottom();
+            }
+        })
+        .catch(error => console.error('Error loading new messages:', error));
+}
+
 // Handle file selection
 function handleFileSelect(input) {
     const files = Array.from(input.files);
@@ -580,8 +728,8 @@ document.addEventListener('DOMContentLoaded', () => {
                     // Clear reply preview
                     cancelReply();
 
-                    // Refresh chat
-                    loadMessages();
+                    // Show the new message
+                    loadNewerMessages();
                 } else {
                     throw new Error(data.error || 'Failed to send message');
                 }
@@ -592,19 +740,27 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
     
-    // Check for new messages on page load and periodically
+    // Check for new messages on page load; afterwards updates are pushed over
+    // the event stream and polling only runs while it is not connected
     checkNewMessages();
-    setInterval(checkNewMessages, 15000);
+    connectChatEvents(null);
+    setInterval(() => {
+        if (!chatEventsActive()) {
+            checkNewMessages();
+        }
+    }, 15000);
 
     document.addEventListener('visibilitychange', function() {
-        if (!document.hidden) {
+        if (!document.hidden && !chatEventsActive()) {
             checkNewMessages();
         }
     });
 });
 
 window.addEventListener('focus', function() {
-    checkNewMessages();
+    if (!chatEventsActive()) {
+        checkNewMessages();
+    }
 });
 
 // Update role checking if needed
@@ -322,8 +322,13 @@ document.addEventListener('DOMContentLoaded', function() {
     // Initialize real-time updates
     updateTopbarNotifications();
     
-    // Check for new notifications every 15 seconds (same as chat badges)
-    setInterval(updateTopbarNotifications, 15000);
+    // Check for new notifications every 15 seconds (same as chat badges),
+    // unless chat.js is receiving them over the event stream
+    setInterval(function() {
+        if (!(window.chatEventsActive && window.chatEventsActive())) {
+            updateTopbarNotifications();
+        }
+    }, 15000);
     
     // Check when page becomes visible
     document.addEventListener('visibilitychange', function() {
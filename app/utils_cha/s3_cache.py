@@ -0,0 +1,162 @@
+"""
+Bounded on-disk LRU cache of S3 objects served by serve_s3_file.
+
+Each object is stored as <sha256 of bucket/key> with a .json file holding its
+S3 metadata (ETag, Last-Modified, content type, size). All state lives in the
+directory, so the web workers sharing it share one cache and one size limit:
+a hit bumps the data file's mtime, and after every store the directory is
+scanned and the least recently used files (oldest mtime) are removed until
+the cache fits in max_bytes. mtime is used rather than atime, which noatime
+and relatime mounts do not keep.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Leftover .part files of interrupted downloads older than this are removed
+PART_MAX_AGE_SECONDS = 3600
+
+
+class DiskLRUCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()  # one eviction scan at a time per process
+        os.makedirs(directory, exist_ok=True)
+        self._evict()
+
+    @staticmethod
+    def _name(bucket, key):
+        return hashlib.sha256(f"{bucket}/{key}".encode("utf-8")).hexdigest()
+
+    def _data_path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _meta_path(self, name):
+        return os.path.join(self.directory, f"{name}.json")
+
+    def _remove_files(self, name):
+        for path in (self._data_path(name), self._meta_path(name)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _read_meta(self, name):
+        try:
+            with open(self._meta_path(name)) as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, name, meta):
+        """Replace the metadata file atomically, so readers in other workers never see half of it"""
+        descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(descriptor, "w") as temp_file:
+                json.dump(meta, temp_file)
+            os.replace(temp_path, self._meta_path(name))
+        except Exception:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _evict(self):
+        """Remove the least recently used files of all workers until the directory fits in max_bytes"""
+        with self._lock:
+            now = time.time()
+            entries = []  # (mtime, size, name) of data files
+            metas = {}  # name -> mtime of metadata files
+            total = 0
+            for entry in os.scandir(self.directory):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # removed by another worker
+                if entry.name.endswith(".part"):
+                    if now - stat.st_mtime > PART_MAX_AGE_SECONDS:
+                        try:
+                            os.remove(entry.path)
+                        except OSError:
+                            pass
+                    else:
+                        total += stat.st_size
+                elif entry.name.endswith(".json"):
+                    metas[entry.name[:-len(".json")]] = stat.st_mtime
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry.name))
+                    total += stat.st_size
+
+            # Data without metadata cannot be served. Metadata without data is
+            # normal while a put is downloading, so only old leftovers go
+            served = []
+            for mtime, size, name in entries:
+                if name in metas:
+                    served.append((mtime, size, name))
+                else:
+                    self._remove_files(name)
+                    total -= size
+            data_names = {name for _, _, name in served}
+            for name, mtime in metas.items():
+                if name not in data_names and now - mtime > PART_MAX_AGE_SECONDS:
+                    self._remove_files(name)
+
+            entries = sorted(served)
+            for mtime, size, name in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove_files(name)
+                total -= size
+
+    def get(self, bucket, key):
+        """(path, metadata) of a cached object, or None"""
+        name = self._name(bucket, key)
+        path = self._data_path(name)
+        meta = self._read_meta(name)
+        if meta is None:
+            return None
+        try:
+            os.utime(path)  # most recently used, for every worker's eviction scan
+        except OSError:
+            return None  # evicted, or not stored yet
+        return path, meta
+
+    def touch(self, bucket, key, **changes):
+        """Update a cached object's metadata (e.g. its revalidation time)"""
+        name = self._name(bucket, key)
+        meta = self._read_meta(name)
+        if meta is not None:
+            meta.update(changes)
+            self._write_meta(name, meta)
+
+    def put(self, bucket, key, body, meta, chunk_size):
+        """Store an object read from a file-like body; returns its path, or None if it does not fit"""
+        if meta["size"] > self.max_bytes:
+            return None
+        name = self._name(bucket, key)
+        meta = dict(meta, validated_at=time.time())
+
+        descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(descriptor, "wb") as temp_file:
+                for chunk in iter(lambda: body.read(chunk_size), b""):
+                    temp_file.write(chunk)
+            self._write_meta(name, meta)
+            os.replace(temp_path, self._data_path(name))
+        except Exception:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+        self._evict()
+        return self._data_path(name)
+
+    def discard(self, bucket, key):
+        self._remove_files(self._name(bucket, key))
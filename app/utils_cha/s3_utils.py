@@ -1,50 +1,162 @@
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
 from flask import current_app
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from botocore.exceptions import ClientError
-from flask import Response, stream_with_context
+from flask import Response, stream_with_context, request, send_file, redirect
+from app.utils_cha.s3_cache import DiskLRUCache
+
+DOCUMENT_MAX_AGE = 3600  # seconds browsers may reuse a served document
+
+_clients = {}  # connection settings -> shared client
+_transfer_configs = {}  # transfer settings -> TransferConfig
+_clients_lock = threading.Lock()
+
+_upload_executor = None
+_upload_executor_lock = threading.Lock()
+
+_document_cache = None
+_document_cache_lock = threading.Lock()
 
 def get_s3_client():
-    """Get S3 client with configured credentials"""
-    try:
-        client = boto3.client(
-            "s3",
-            aws_access_key_id=current_app.config["AWS_ACCESS_KEY_ID"],
-            aws_secret_access_key=current_app.config["AWS_SECRET_ACCESS_KEY"],
-            region_name=current_app.config["AWS_REGION"],
-            endpoint_url=current_app.config["S3_ENDPOINT_URL"],
-            config=Config(signature_version="s3v4"),
-        )
-        print("S3 client created successfully")
+    """S3 client for the configured credentials, shared by the process (boto3 clients are thread-safe)"""
+    settings = (
+        current_app.config["AWS_ACCESS_KEY_ID"],
+        current_app.config["AWS_SECRET_ACCESS_KEY"],
+        current_app.config["AWS_REGION"],
+        current_app.config["S3_ENDPOINT_URL"],
+        current_app.config.get("S3_MAX_POOL_CONNECTIONS", 50),
+    )
+    with _clients_lock:
+        client = _clients.get(settings)
+        if client is not None:
+            return client
+        try:
+            client = boto3.client(
+                "s3",
+                aws_access_key_id=settings[0],
+                aws_secret_access_key=settings[1],
+                region_name=settings[2],
+                endpoint_url=settings[3],
+                config=Config(signature_version="s3v4", max_pool_connections=settings[4]),
+            )
+            print("S3 client created successfully")
+        except Exception as e:
+            print(f"Error creating S3 client: {str(e)}")
+            raise
+        _clients[settings] = client
         return client
-    except Exception as e:
-        print(f"Error creating S3 client: {str(e)}")
-        raise
+
+
+def get_transfer_config():
+    """Multipart/threaded transfer settings shared by all uploads and downloads"""
+    settings = (
+        current_app.config.get("S3_MULTIPART_THRESHOLD_BYTES", 8 * 1024 * 1024),
+        current_app.config.get("S3_MULTIPART_CHUNK_BYTES", 8 * 1024 * 1024),
+        current_app.config.get("S3_TRANSFER_CONCURRENCY", 4),
+    )
+    with _clients_lock:
+        transfer_config = _transfer_configs.get(settings)
+        if transfer_config is None:
+            transfer_config = _transfer_configs[settings] = TransferConfig(
+                multipart_threshold=settings[0],
+                multipart_chunksize=settings[1],
+                max_concurrency=settings[2],
+                use_threads=settings[2] > 1,
+            )
+        return transfer_config
+
+
+def _get_upload_executor():
+    global _upload_executor
+    with _upload_executor_lock:
+        if _upload_executor is None:
+            _upload_executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get("S3_UPLOAD_WORKERS", 8), thread_name_prefix="s3-upload"
+            )
+        return _upload_executor
+
+
+def _upload(s3_client, transfer_config, file, bucket, key):
+    # Reset file pointer to beginning
+    file.seek(0)
+
+    # Get content type from file if available
+    content_type = getattr(file, "content_type", None) or "application/octet-stream"
+
+    s3_client.upload_fileobj(
+        file, bucket, key, ExtraArgs={"ContentType": content_type}, Config=transfer_config
+    )
+
+
+def upload_fileobj_to_s3(file, bucket, key):
+    """Upload a file-like object with the shared client and transfer settings; raises on failure"""
+    print(f"Starting S3 upload - Bucket: {bucket}, Key: {key}")
+    _upload(get_s3_client(), get_transfer_config(), file, bucket, key)
+    print("File uploaded successfully to S3")
+    return True
 
 
 def upload_file_to_s3(file, bucket, key):
-    """Upload a file to S3 bucket"""
+    """Upload a file to S3 bucket; returns False on failure"""
     try:
-        print(f"Starting S3 upload - Bucket: {bucket}, Key: {key}")
-        s3_client = get_s3_client()
+        return upload_fileobj_to_s3(file, bucket, key)
+    except Exception as e:
+        print(f"Error uploading {key} to S3: {str(e)}")
+        return False
 
-        # Reset file pointer to beginning
-        file.seek(0)
 
-        # Get content type from file if available
-        content_type = getattr(file, "content_type", "application/octet-stream")
+def upload_files_to_s3(uploads, bucket):
+    """
+    Upload several (file, key) pairs at once, in parallel on the process-wide
+    upload pool. Returns True/False per upload, in the order given.
+    """
+    uploads = list(uploads)
+    if len(uploads) <= 1:
+        return [upload_file_to_s3(file, bucket, key) for file, key in uploads]
 
-        # Upload file with content type
-        s3_client.upload_fileobj(
-            file, bucket, key, ExtraArgs={"ContentType": content_type}
-        )
-        print("File uploaded successfully to S3")
+    # The client and transfer settings are resolved here - workers have no app context
+    s3_client = get_s3_client()
+    transfer_config = get_transfer_config()
+    executor = _get_upload_executor()
+    print(f"Starting {len(uploads)} parallel S3 uploads - Bucket: {bucket}")
+    futures = [
+        (key, executor.submit(_upload, s3_client, transfer_config, file, bucket, key))
+        for file, key in uploads
+    ]
+
+    results = []
+    for key, future in futures:
+        try:
+            future.result()
+            results.append(True)
+        except Exception as e:
+            print(f"Error uploading {key} to S3: {str(e)}")
+            results.append(False)
+    print(f"Uploaded {sum(results)} of {len(uploads)} files to S3")
+    return results
+
+
+def upload_batch_to_s3(uploads, bucket):
+    """
+    upload_files_to_s3() for a batch that is saved together: True if every
+    file uploaded, otherwise the files that did upload are deleted again and
+    False is returned, so a failed batch leaves nothing behind in S3.
+    """
+    uploads = list(uploads)
+    results = upload_files_to_s3(uploads, bucket)
+    if all(results):
         return True
-    except ClientError as e:
-        return False
-    except Exception as e:
-        return False
+    for (_, key), uploaded in zip(uploads, results):
+        if uploaded:
+            delete_file_from_s3(bucket, key)
+    print(f"S3 upload failed for {results.count(False)} of {len(results)} files, removed the others")
+    return False
 
 
 def get_s3_url(bucket, key, expires_in=3600):
@@ -120,10 +232,156 @@ def get_secure_document_url(s3_key):
         return None
     
 
-def serve_s3_file(s3_key, bucket=None):
+def _object_metadata(s3_client, bucket, key):
+    head = s3_client.head_object(Bucket=bucket, Key=key)
+    return {
+        "etag": head.get("ETag", "").strip('"'),
+        "last_modified": head["LastModified"].timestamp() if head.get("LastModified") else None,
+        "content_type": head.get("ContentType") or "application/octet-stream",
+        "size": head.get("ContentLength", 0),
+    }
+
+
+def get_document_cache():
+    """Disk cache of served S3 objects (shared by all workers), or None when S3_CACHE_MAX_BYTES is 0"""
+    global _document_cache
+
+    max_bytes = current_app.config.get("S3_CACHE_MAX_BYTES", 0)
+    if not max_bytes:
+        return None
+    directory = current_app.config.get("S3_CACHE_DIR") or os.path.join(current_app.root_path, "instance", "s3_cache")
+
+    with _document_cache_lock:
+        if _document_cache is None or _document_cache.directory != directory or _document_cache.max_bytes != max_bytes:
+            _document_cache = DiskLRUCache(directory, max_bytes)
+        return _document_cache
+
+
+def _disposition(filename, download_name):
+    if download_name:
+        return f'attachment; filename="{download_name}"'
+    return f'inline; filename="{filename}"'
+
+
+def _cache_headers(response, meta):
+    if meta["etag"]:
+        response.set_etag(meta["etag"])
+    if meta["last_modified"]:
+        response.last_modified = datetime.fromtimestamp(meta["last_modified"], timezone.utc)
+    response.headers["Cache-Control"] = f"private, max-age={DOCUMENT_MAX_AGE}"
+    return response
+
+
+def _not_modified(meta):
+    """304 response when the browser's copy (If-None-Match / If-Modified-Since) is current"""
+    if request.if_none_match:
+        fresh = bool(meta["etag"]) and request.if_none_match.contains(meta["etag"])
+    elif request.if_modified_since and meta["last_modified"]:
+        fresh = int(meta["last_modified"]) <= request.if_modified_since.timestamp()
+    else:
+        fresh = False
+    return _cache_headers(Response(status=304), meta) if fresh else None
+
+
+def _requested_range(meta):
+    """(start, stop) of a single satisfiable Range request, "invalid" if unsatisfiable, else None"""
+    byte_range = request.range
+    if byte_range is None or byte_range.units != "bytes" or len(byte_range.ranges) != 1:
+        return None
+    if_range = request.if_range
+    if if_range.etag and if_range.etag != meta["etag"]:
+        return None
+    if if_range.date and (not meta["last_modified"] or int(meta["last_modified"]) > if_range.date.timestamp()):
+        return None
+    return byte_range.range_for_length(meta["size"]) or "invalid"
+
+
+def _send_cached(path, meta, filename, download_name):
+    """Serve a cached file; send_file answers Range and conditional requests itself"""
+    response = send_file(
+        path,
+        mimetype="application/octet-stream" if download_name else meta["content_type"],
+        conditional=True,
+        etag=meta["etag"] or False,
+        last_modified=meta["last_modified"],
+    )
+    response.headers["Content-Disposition"] = _disposition(filename, download_name)
+    response.headers["Cache-Control"] = f"private, max-age={DOCUMENT_MAX_AGE}"
+    return response
+
+
+def _stream_from_s3(s3_client, bucket, key, meta, filename, download_name):
+    """Proxy the object (or the requested byte range of it) from S3"""
+    params = {"Bucket": bucket, "Key": key}
+    if meta["etag"]:
+        params["IfMatch"] = f'"{meta["etag"]}"'
+
+    byte_range = _requested_range(meta)
+    if byte_range == "invalid":
+        response = Response("Requested range not satisfiable", status=416)
+        response.headers["Content-Range"] = f"bytes */{meta['size']}"
+        return response
+    if byte_range:
+        start, stop = byte_range
+        params["Range"] = f"bytes={start}-{stop - 1}"
+
+    s3_object = s3_client.get_object(**params)
+    chunk_size = current_app.config.get("S3_STREAM_CHUNK_BYTES", 65536)
+
+    def generate():
+        try:
+            for chunk in s3_object["Body"].iter_chunks(chunk_size=chunk_size):
+                yield chunk
+        except Exception as e:
+            print(f"Error streaming file: {str(e)}")
+        finally:
+            s3_object["Body"].close()
+
+    response = Response(
+        stream_with_context(generate()),
+        status=206 if byte_range else 200,
+        mimetype="application/octet-stream" if download_name else meta["content_type"],
+        headers={
+            "Content-Disposition": _disposition(filename, download_name),
+            "Content-Length": str(s3_object.get("ContentLength", meta["size"])),
+            "Accept-Ranges": "bytes",
+        },
+    )
+    if byte_range:
+        response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{meta['size']}"
+    return _cache_headers(response, meta)
+
+
+def _signed_redirect(s3_client, bucket, key, filename, download_name):
+    """Short-lived presigned URL redirect, so the browser downloads straight from S3"""
+    params = {
+        "Bucket": bucket,
+        "Key": key,
+        "ResponseContentDisposition": _disposition(filename, download_name),
+    }
+    if download_name:
+        params["ResponseContentType"] = "application/octet-stream"
+    url = s3_client.generate_presigned_url(
+        "get_object",
+        Params=params,
+        ExpiresIn=current_app.config.get("S3_SIGNED_REDIRECT_SECONDS", 60),
+    )
+    response = redirect(url, code=302)
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+def serve_s3_file(s3_key, bucket=None, download_name=None):
     """
     Serve S3 file through your application (proxy method).
     This function is used by the secure document route.
+
+    Answers If-None-Match / If-Modified-Since with 304 and Range requests with
+    206. Objects up to S3_CACHE_MAX_OBJECT_BYTES are kept in a disk LRU cache
+    (revalidated against S3 every S3_CACHE_REVALIDATE_SECONDS); larger ones
+    are streamed from S3, forwarding the range, or - from
+    S3_SIGNED_REDIRECT_MIN_BYTES on - redirected to a short-lived presigned
+    URL. download_name serves the file as an attachment with that name.
     """
     try:
         if not bucket:
@@ -132,35 +390,62 @@ def serve_s3_file(s3_key, bucket=None):
         print(f"Serving S3 file - Bucket: {bucket}, Key: {s3_key}")
         s3_client = get_s3_client()
         
-        # Get object from S3
-        response = s3_client.get_object(Bucket=bucket, Key=s3_key)
-        
-        # Get content type
-        content_type = response.get('ContentType', 'application/octet-stream')
-        
         # Get filename from S3 key
         filename = os.path.basename(s3_key)
-        
-        def generate():
+
+        cache = get_document_cache()
+        cached = cache.get(bucket, s3_key) if cache else None
+        meta = None
+        if cached:
+            revalidate_after = current_app.config.get("S3_CACHE_REVALIDATE_SECONDS", 300)
+            if time.time() - cached[1]["validated_at"] > revalidate_after:
+                meta = _object_metadata(s3_client, bucket, s3_key)
+                if meta["etag"] == cached[1]["etag"]:
+                    cache.touch(bucket, s3_key, validated_at=time.time())
+                else:
+                    cache.discard(bucket, s3_key)
+                    cached = None
+        if cached:
             try:
-                # Stream the file in chunks
-                for chunk in response['Body'].iter_chunks(chunk_size=8192):
-                    yield chunk
-            except Exception as e:
-                print(f"Error streaming file: {str(e)}")
-                
-        return Response(
-            stream_with_context(generate()),
-            mimetype=content_type,
-            headers={
-                'Content-Disposition': f'inline; filename="{filename}"',
-                'Cache-Control': 'private, max-age=3600'  # Cache for 1 hour
-            }
-        )
+                return _send_cached(cached[0], cached[1], filename, download_name)
+            except FileNotFoundError:
+                # Evicted by another worker since cache.get(); fetch it again
+                pass
+
+        if meta is None:
+            meta = _object_metadata(s3_client, bucket, s3_key)
+
+        not_modified = _not_modified(meta)
+        if not_modified:
+            return not_modified
+
+        redirect_min_bytes = current_app.config.get("S3_SIGNED_REDIRECT_MIN_BYTES", 0)
+        if redirect_min_bytes and meta["size"] >= redirect_min_bytes:
+            return _signed_redirect(s3_client, bucket, s3_key, filename, download_name)
+
+        if cache and meta["size"] <= current_app.config.get("S3_CACHE_MAX_OBJECT_BYTES", 0):
+            params = {"Bucket": bucket, "Key": s3_key}
+            if meta["etag"]:
+                params["IfMatch"] = f'"{meta["etag"]}"'
+            body = s3_client.get_object(**params)["Body"]
+            try:
+                path = cache.put(
+                    bucket, s3_key, body, meta, current_app.config.get("S3_STREAM_CHUNK_BYTES", 65536)
+                )
+            finally:
+                body.close()
+            if path:
+                try:
+                    return _send_cached(path, meta, filename, download_name)
+                except FileNotFoundError:
+                    # Already evicted by another worker; stream it instead
+                    pass
+
+        return _stream_from_s3(s3_client, bucket, s3_key, meta, filename, download_name)
         
     except ClientError as e:
         print(f"AWS Error serving file: {str(e)}")
-        if e.response['Error']['Code'] == 'NoSuchKey':
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
             return Response("File not found", status=404)
         else:
             return Response("Error accessing file", status=500)
@@ -169,4 +454,3 @@ def serve_s3_file(s3_key, bucket=None):
         import traceback
         traceback.print_exc()
         return Response("Internal server error", status=500)
-    
@@ -159,141 +159,15 @@ def get_all_notifications(user_id):
     Returns:
         dict: Dictionary with chat notification data
     """
-    print(f"\n=== GET ALL NOTIFICATIONS ===")
-    print(f"User ID: {user_id}")
-    
-    from .models.cha import ChatMessage, ChatThread, ShipDocumentEntryMaster, ChatParticipant
-    from .models.user import User
-    
-    # Initialize empty notifications structure
-    all_notifications = {
-        'chat_notifications': [],
-        'questionnaire_reviews': [],
-        'monthly_safety_reviews': [],
-        'total_count': 0
-    }
+    from .notification_store import empty_notifications, get_user_notifications
     
     try:
-        print("Querying for unread chat messages...")
-        
-        # Get current user
-        current_user = User.query.get(user_id)
-        if not current_user:
-            print(f"User {user_id} not found")
-            return all_notifications
-        
-        print(f"Current user: {current_user.username}, Role: {current_user.role}, Company: {current_user.company_id}")
-        
-        # Get threads where the current user is a participant
-        user_threads = ChatParticipant.query.filter_by(user_id=user_id).all()
-        user_thread_ids = [pt.thread_id for pt in user_threads]
-        
-        print(f"User is participant in {len(user_thread_ids)} threads: {user_thread_ids}")
-        
-        if not user_thread_ids:
-            print("User is not a participant in any threads")
-            return all_notifications
-        
-        # Get unread messages based on role-based logic
-        if current_user.role == 'customer':
-            # Customer should see messages from company users (user, base_user) that are unread
-            unread_messages = ChatMessage.query.join(User, ChatMessage.sender_id == User.id).filter(
-                ChatMessage.is_read == False,
-                ChatMessage.thread_id.in_(user_thread_ids),
-                ChatMessage.sender_id != user_id,  # Not sent by current user
-                User.role.in_(['user', 'base_user'])  # Only from company users
-            ).order_by(ChatMessage.created_at.desc()).limit(10).all()
-        else:
-            # Company users (user, base_user) should see messages from customers that are unread
-            unread_messages = ChatMessage.query.join(User, ChatMessage.sender_id == User.id).filter(
-                ChatMessage.is_read == False,
-                ChatMessage.thread_id.in_(user_thread_ids),
-                ChatMessage.sender_id != user_id,  # Not sent by current user
-                User.role == 'customer'  # Only from customers
-            ).order_by(ChatMessage.created_at.desc()).limit(10).all()
-        
-        print(f"Found {len(unread_messages)} unread messages for user {user_id} (role: {current_user.role})")
-        
-        for i, message in enumerate(unread_messages):
-            print(f"\nProcessing message {i+1}/{len(unread_messages)}:")
-            print(f"  Message ID: {message.id}")
-            print(f"  Thread ID: {message.thread_id}")
-            print(f"  Sender ID: {message.sender_id}")
-            print(f"  Sender Role: {message.sender.role}")
-            print(f"  Is Read: {message.is_read}")
-            print(f"  Message: {message.message[:50]}...")
-            
-            # Get thread information
-            thread = ChatThread.query.get(message.thread_id)
-            if thread:
-                print(f"  Thread found: {thread.id}, Module: {thread.module_name}, Reference: {thread.reference_id}")
-                
-                # Get entry information
-                entry = ShipDocumentEntryMaster.query.get(thread.reference_id)
-                if entry:
-                    print(f"  Entry found: {entry.id}, DocSerial: {entry.docserial}, Company: {entry.company_id}")
-                    
-                    # Additional company-level filtering for security
-                    if current_user.role == 'customer':
-                        # Customer can only see their own entries
-                        if entry.company_id != current_user.company_id:
-                            print(f"  ✗ Skipped - Customer can't access entry from company {entry.company_id}")
-                            continue
-                    else:
-                        # Company users can see entries assigned to their company
-                        if entry.assigned_clearing_company_id != current_user.company_id:
-                            print(f"  ✗ Skipped - Company user can't access entry assigned to company {entry.assigned_clearing_company_id}")
-                            continue
-                else:
-                    print(f"  Entry NOT found for reference_id: {thread.reference_id}")
-                    continue
-                
-                # Get sender information
-                sender = User.query.get(message.sender_id)
-                if sender:
-                    print(f"  Sender found: {sender.id}, Username: {sender.username}, Role: {sender.role}")
-                else:
-                    print(f"  Sender NOT found for sender_id: {message.sender_id}")
-                    continue
-                
-                # Only add notification if we have all required data and passed security checks
-                message_content = message.message[:100] + '...' if len(message.message) > 100 else message.message
-                
-                notification_data = {
-                    'id': message.id,
-                    'thread_id': message.thread_id,
-                    'module_name': thread.module_name,
-                    'entry_id': thread.reference_id,
-                    'sender_name': sender.username,
-                    'message': message_content,
-                    'timestamp': message.created_at,
-                    'docserial': entry.docserial if entry else 'N/A'
-                }
-                
-                all_notifications['chat_notifications'].append(notification_data)
-                print(f"  ✓ Added notification: {sender.username} ({sender.role}) -> {message_content[:50]}...")
-            else:
-                print(f"  ✗ Thread NOT found for thread_id: {message.thread_id}")
-        
-        # Set total count to only chat notifications
-        all_notifications['total_count'] = len(all_notifications['chat_notifications'])
-        
-        print(f"\nFinal notification count: {all_notifications['total_count']}")
-        print(f"Chat notifications: {len(all_notifications['chat_notifications'])}")
-        print("=== END GET ALL NOTIFICATIONS ===\n")
-        
+        return get_user_notifications(user_id)
     except Exception as e:
         print(f"ERROR in get_all_notifications: {str(e)}")
         import traceback
         print(f"Full traceback: {traceback.format_exc()}")
         # Return empty structure on error
-        all_notifications = {
-            'chat_notifications': [],
-            'questionnaire_reviews': [],
-            'monthly_safety_reviews': [],
-            'total_count': 0
-        }
-    
-    return all_notifications
+        return empty_notifications()
 
 
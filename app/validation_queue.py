@@ -0,0 +1,287 @@
+# validation_queue.py
+"""
+DB-backed job queue for AI document validation.
+
+Uploads enqueue a ValidationJob row in the same transaction as the attachment.
+Standalone worker processes (see validation_worker.py at the project root)
+claim jobs with SELECT ... FOR UPDATE SKIP LOCKED, run process_document_validation
+and either complete the job or reschedule it with exponential backoff.
+A job whose lease expires (crashed worker) is picked up again by another worker.
+"""
+import os
+import socket
+import time
+import traceback
+import multiprocessing
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models.validation import ValidationJob
+
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+def _config(key, default):
+    return current_app.config.get(key, default)
+
+
+def enqueue_validation(attachment_id, delay_seconds=0):
+    """
+    Queue (or re-queue) AI validation for an attachment.
+
+    The job is added to the current session; the caller commits it together
+    with the attachment so a worker never sees a job for an uncommitted row.
+    """
+    run_after = datetime.utcnow() + timedelta(seconds=delay_seconds)
+
+    job = ValidationJob.query.filter_by(attachment_id=attachment_id).first()
+    if job:
+        job.status = JOB_QUEUED
+        job.attempts = 0
+        job.run_after = run_after
+        job.locked_by = None
+        job.locked_until = None
+        job.last_error = None
+    else:
+        job = ValidationJob(
+            attachment_id=attachment_id,
+            status=JOB_QUEUED,
+            attempts=0,
+            run_after=run_after,
+        )
+        db.session.add(job)
+
+    return job
+
+
+def enqueue_pending_documents():
+    """
+    Safety net: queue every pending attachment (ai_validated = 0) that has no job yet,
+    e.g. rows created by code paths without an enqueue hook.
+    Safe to run concurrently from several web workers.
+    """
+    from app.models.cha import ShipDocumentEntryAttachment
+
+    pending_ids = [
+        row.id
+        for row in db.session.query(ShipDocumentEntryAttachment.id)
+        .outerjoin(ValidationJob, ValidationJob.attachment_id == ShipDocumentEntryAttachment.id)
+        .filter(
+            ShipDocumentEntryAttachment.ai_validated == 0,
+            ValidationJob.id.is_(None),
+        )
+        .all()
+    ]
+
+    if not pending_ids:
+        return 0
+
+    now = datetime.utcnow()
+    db.session.bulk_insert_mappings(
+        ValidationJob,
+        [
+            {"attachment_id": attachment_id, "status": JOB_QUEUED, "attempts": 0, "run_after": now}
+            for attachment_id in pending_ids
+        ],
+    )
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker queued the same attachments first
+        db.session.rollback()
+        return 0
+
+    print(f"Queued {len(pending_ids)} pending documents for validation")
+    return len(pending_ids)
+
+
+def claim_jobs(worker_id, limit=1):
+    """
+    Claim up to `limit` runnable jobs for this worker.
+    Rows locked by another worker's claim are skipped rather than waited on.
+    """
+    now = datetime.utcnow()
+    lease_seconds = _config("VALIDATION_LEASE_SECONDS", 600)
+
+    jobs = (
+        ValidationJob.query.filter(
+            or_(
+                and_(ValidationJob.status == JOB_QUEUED, ValidationJob.run_after <= now),
+                # Lease expired - the worker that held it died mid-job
+                and_(ValidationJob.status == JOB_RUNNING, ValidationJob.locked_until < now),
+            )
+        )
+        .order_by(ValidationJob.run_after, ValidationJob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+
+    for job in jobs:
+        job.status = JOB_RUNNING
+        job.attempts = (job.attempts or 0) + 1
+        job.locked_by = worker_id
+        job.locked_until = now + timedelta(seconds=lease_seconds)
+
+    db.session.commit()
+    return jobs
+
+
+def complete_job(job_id):
+    job = ValidationJob.query.get(job_id)
+    if not job:
+        return
+    job.status = JOB_DONE
+    job.locked_by = None
+    job.locked_until = None
+    job.last_error = None
+    db.session.commit()
+
+
+def fail_job(job_id, error_message):
+    """Reschedule a failed job with exponential backoff, or give up after max attempts"""
+    job = ValidationJob.query.get(job_id)
+    if not job:
+        return
+
+    max_attempts = _config("VALIDATION_MAX_ATTEMPTS", 5)
+    base_delay = _config("VALIDATION_RETRY_BASE_SECONDS", 30)
+    max_delay = _config("VALIDATION_RETRY_MAX_SECONDS", 3600)
+
+    job.last_error = (error_message or "Unknown error")[:2000]
+    job.locked_by = None
+    job.locked_until = None
+
+    if job.attempts >= max_attempts:
+        job.status = JOB_FAILED
+        print(f"Validation job {job.id} failed permanently after {job.attempts} attempts: {job.last_error}")
+    else:
+        delay = min(base_delay * (2 ** (job.attempts - 1)), max_delay)
+        job.status = JOB_QUEUED
+        job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        print(f"Validation job {job.id} failed (attempt {job.attempts}), retrying in {delay}s: {job.last_error}")
+
+    db.session.commit()
+
+
+def run_job(job):
+    """Validate the attachment behind a claimed job and record the outcome"""
+    from app.models.cha import ShipDocumentEntryAttachment
+    from app.customer_portal.routes import process_document_validation
+
+    job_id = job.id
+    attachment_id = job.attachment_id
+    print(f"Running validation job {job_id} for attachment {attachment_id} (attempt {job.attempts})")
+
+    document = ShipDocumentEntryAttachment.query.get(attachment_id)
+    if not document:
+        complete_job(job_id)
+        return
+
+    try:
+        result = process_document_validation(document)
+    except Exception as e:
+        traceback.print_exc()
+        result = {"success": False, "message": str(e)}
+
+    # process_document_validation commits on its own; clear any failed transaction
+    db.session.rollback()
+
+    document = ShipDocumentEntryAttachment.query.get(attachment_id)
+    # Failures that already recorded a final status (e.g. text extraction
+    # failed, ai_validated 4/5/6) are not retried - only transient ones are
+    if result.get("success", False) or (document and document.ai_validated not in (0, None)):
+        complete_job(job_id)
+    else:
+        fail_job(job_id, result.get("message"))
+
+
+def worker_loop(app, worker_id=None, run_once=False):
+    """
+    Claim and run jobs until interrupted.
+    With run_once=True, return as soon as the queue is empty (useful for cron/tests).
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+
+    with app.app_context():
+        poll_seconds = _config("VALIDATION_WORKER_POLL_SECONDS", 2)
+        batch_size = _config("VALIDATION_WORKER_BATCH_SIZE", 1)
+        processed = 0
+
+        # Load the NLP model before the first job rather than inside it
+        from app.validation_service import get_nlp
+        get_nlp()
+
+        print(f"Validation worker {worker_id} started")
+        while True:
+            try:
+                jobs = claim_jobs(worker_id, batch_size)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Validation worker {worker_id} could not claim jobs: {str(e)}")
+                jobs = []
+
+            if not jobs:
+                if run_once:
+                    return processed
+                time.sleep(poll_seconds)
+                continue
+
+            for job in jobs:
+                job_id = job.id
+                try:
+                    run_job(job)
+                except Exception as e:
+                    db.session.rollback()
+                    traceback.print_exc()
+                    fail_job(job_id, str(e))
+                processed += 1
+
+            db.session.remove()
+
+
+def _worker_process(index, processes=1):
+    # Spawned children import the app themselves so no DB connection
+    # is shared with the parent process
+    from app import app as flask_app
+
+    # The actual pool size (--processes may override the setting); the
+    # OCR pools split the CPU cores by it
+    flask_app.config["VALIDATION_WORKER_PROCESSES"] = processes
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    try:
+        worker_loop(flask_app, worker_id)
+    except KeyboardInterrupt:
+        pass
+
+
+def run_worker_pool(processes):
+    """Start a pool of validation worker processes and wait for them"""
+    if processes <= 1:
+        _worker_process(0)
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=_worker_process, args=(i, processes), name=f"validation-worker-{i}") for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    print(f"Started {processes} validation worker processes")
+
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        print("Stopping validation workers...")
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,103 @@
+# validation_result_cache.py
+"""
+Validation results of attachments, memoised by file content.
+
+The outcome of validating an attachment depends only on its bytes
+(content_hash, taken at upload) and on what it is validated against: the
+ShipCatDocument's sample file, key fields and thresholds and the shipment
+category's document rules. Those are folded into sample_version(), so a
+re-upload of the same file against an unchanged sample reuses the stored
+result instead of being downloaded, OCR'd and validated again. Changing the
+sample or its settings changes the version, and older entries are no longer
+looked up; prune_validation_cache() (nightly) deletes entries not used for
+VALIDATION_CACHE_RETENTION_DAYS.
+"""
+import json
+import hashlib
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models.validation import ValidationResultCache
+
+# Attachment columns copied to and from a cached result
+RESULT_FIELDS = (
+    "ai_validated",
+    "validation_results",
+    "extracted_content",
+    "validation_percentage",
+    "document_similarity_percentage",
+    "similarity_message",
+)
+
+# Accepted, rejected and document type mismatch. Errors and failed text
+# extraction are not stored - they may not happen on the next attempt.
+CACHEABLE_STATUSES = (1, 2, 8)
+
+
+def sample_version(sample_document, sample_content_hash, rules):
+    """Digest of everything besides the submitted file that a validation result depends on"""
+    parts = [
+        sample_document.sample_file_path,
+        sample_content_hash,
+        sample_document.key_fields,
+        sample_document.confidence_level,
+        sample_document.content_similarity,
+        rules.version,
+    ]
+    return hashlib.sha256(json.dumps(parts, default=str).encode("utf-8")).hexdigest()
+
+
+def get_cached_validation(content_hash, ship_cat_document_id, version):
+    if not content_hash or not ship_cat_document_id:
+        return None
+    entry = ValidationResultCache.query.filter_by(
+        content_hash=content_hash, ship_cat_document_id=ship_cat_document_id, sample_version=version
+    ).first()
+    if entry:
+        entry.last_used_at = datetime.utcnow()
+    return entry
+
+
+def apply_cached_validation(document, entry):
+    for field in RESULT_FIELDS:
+        setattr(document, field, getattr(entry, field))
+
+
+def store_validation(document, version):
+    """Remember a finished validation of the document's content (commits)"""
+    if not document.content_hash or document.ai_validated not in CACHEABLE_STATUSES:
+        return
+    entry = ValidationResultCache(
+        content_hash=document.content_hash,
+        ship_cat_document_id=document.ship_cat_document_id,
+        sample_version=version,
+        **{field: getattr(document, field) for field in RESULT_FIELDS},
+    )
+    db.session.add(entry)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The same content was validated concurrently - keep the stored result
+        db.session.rollback()
+
+
+def prune_validation_cache(retention_days=None):
+    """Delete cached results not used for retention_days; returns the number deleted"""
+    if retention_days is None:
+        retention_days = current_app.config.get("VALIDATION_CACHE_RETENTION_DAYS", 90)
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    try:
+        deleted = ValidationResultCache.query.filter(
+            ValidationResultCache.last_used_at < cutoff
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        print(f"Validation result cache pruned: {deleted} entries")
+        return deleted
+    except Exception as e:
+        db.session.rollback()
+        print(f"ERROR pruning validation result cache: {str(e)}")
+        raise
@@ -7,12 +7,16 @@ import pytesseract
 from PIL import Image
 import spacy
 import re
+import threading
 import requests
+from collections import Counter
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from datetime import datetime
-from flask import current_app
+from app.document_rules import DEFAULT_DOCUMENT_RULES, get_document_rules
+from app.field_locator import FieldLocator
+from app.llm_client import get_llm_client
+from app.pdf_extraction import extract_pdf_text
+from app.similarity_index import SimilarityIndex, get_similarity_index, tokenize
 from flask import (
     Blueprint,
     render_template,
@@ -21,37 +25,37 @@ from flask import (
     flash,
     request,
     jsonify,
-    current_app,
     send_file,
     json
 )
 
 
-DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
-API_KEY = "sk-c32b5df704424ae5a520b73c53f9af22"  # Replace with your actual key
-
-HEADERS = {
-    "Content-Type": "application/json",
-    "Authorization": f"Bearer {API_KEY}"
-}
 
 
 
 
 def extract_text_from_pdf(file_path):
+    """
+    Extract text from a PDF with PyMuPDF, OCR'ing pages that have no text layer.
+    Falls back to PyPDF2 if PyMuPDF cannot open the file.
+    """
     print(f"Extracting text from PDF: {file_path}")
-    text = ""
+    try:
+        return extract_pdf_text(file_path)
+    except Exception as e:
+        print(f"PyMuPDF extraction failed, falling back to PyPDF2: {str(e)}")
+
+    page_texts = []
     try:
         with open(file_path, "rb") as file:
             pdf_reader = PyPDF2.PdfReader(file)
             for page_number, page in enumerate(pdf_reader.pages):
-                print(f"Extracting page {page_number + 1}")
                 page_text = page.extract_text()
                 if page_text:
-                    text += page_text
+                    page_texts.append(page_text)
     except Exception as e:
         print(f"Error reading PDF: {str(e)}")
-    return text
+    return "\n".join(page_texts)
 
 
 def extract_text_from_docx(file_path):
@@ -102,302 +106,138 @@ def extract_text_from_file(file_path):
         return ""
 
 
-def get_semantic_similarity(text1, text2):
+def get_semantic_similarity(text1, text2, index=None):
     """
     Get semantic similarity between two texts using TF-IDF and cosine similarity
-    Returns a similarity score between 0 and 1
+    Returns a similarity score between 0 and 1.
+    Pass a category SimilarityIndex to weight terms by its corpus IDF.
     """
     try:
-        # Create TF-IDF vectorizer
-        vectorizer = TfidfVectorizer()
-
-        # Fit and transform the texts
-        tfidf_matrix = vectorizer.fit_transform([text1, text2])
+        if index is None:
+            index = SimilarityIndex()
 
-        # Calculate cosine similarity
-        similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
-
-        return similarity
+        return float(
+            index.similarities(extract_text_features(text1), [extract_text_features(text2)])[0]
+        )
     except Exception as e:
         print(f"Error in semantic similarity: {str(e)}")
         return 0.0
 
 
-def get_document_type(text):
+def extract_text_features(text):
+    """
+    Term counts of a text using the same token pattern as TfidfVectorizer,
+    so they can be cached and reused as a precomputed feature vector
+    """
+    return dict(Counter(tokenize(text)))
+
+
+def get_document_type(text, rules=None):
     """
     Identify the type of document based on its content
     Returns a dictionary with document type and confidence score
     """
-    # Common document type keywords and patterns with weights
-    document_types = {
-        "invoice": {
-            "positive": {
-                "invoice": 5,
-                "bill": 3,
-                "payment": 2,
-                "amount due": 3,
-                "total amount": 2,
-                "invoice number": 3,
-                "invoice date": 3,
-                "due date": 2,
-                "tax": 2,
-                "subtotal": 2,
-                "balance due": 2,
-                "payment terms": 2,
-                "invoice to": 3,
-                "bill to": 3,
-                "customer": 1,
-                "client": 1,
-                "items": 1,
-                "quantity": 1,
-                "unit price": 2,
-                "total": 2,
-                "vat": 1,
-                "gst": 1,
-                "tax amount": 2,
-                "net amount": 2,
-                "grand total": 2,
-            },
-            "negative": [
-                "bill of lading",
-                "shipping",
-                "freight",
-                "cargo",
-                "vessel",
-                "port",
-                "consignee",
-                "shipper",
-                "carrier",
-                "voyage",
-                "container",
-                "seal",
-                "manifest",
-            ],
-        },
-        "bill of lading": {
-            "positive": {
-                "bill of lading": 5,
-                "shipping": 3,
-                "freight": 3,
-                "cargo": 3,
-                "vessel": 3,
-                "port": 3,
-                "consignee": 3,
-                "shipper": 3,
-                "carrier": 3,
-                "voyage": 3,
-                "container": 3,
-                "seal": 3,
-                "manifest": 3,
-                "loading": 2,
-                "discharge": 2,
-                "destination": 2,
-                "origin": 2,
-                "weight": 2,
-                "measurement": 2,
-                "packages": 2,
-                "description": 2,
-            },
-            "negative": [
-                "invoice",
-                "payment",
-                "amount due",
-                "tax",
-                "subtotal",
-                "balance due",
-                "payment terms",
-                "unit price",
-                "vat",
-                "gst",
-            ],
-        },
-        "receipt": {
-            "positive": {
-                "receipt": 5,
-                "payment received": 3,
-                "paid": 3,
-                "payment confirmation": 3,
-                "transaction": 2,
-                "payment date": 2,
-                "payment method": 2,
-                "reference number": 2,
-                "amount paid": 2,
-                "received by": 2,
-                "cash": 1,
-                "credit card": 1,
-                "debit card": 1,
-                "bank transfer": 1,
-            },
-            "negative": [
-                "bill of lading",
-                "shipping",
-                "freight",
-                "cargo",
-                "vessel",
-                "port",
-            ],
-        },
-    }
+    return (rules or DEFAULT_DOCUMENT_RULES).classify(text)
 
-    text = text.lower()
-    max_score = 0
-    detected_type = None
-
-    for doc_type, keywords in document_types.items():
-        score = 0
-        # Check positive keywords
-        for keyword, weight in keywords["positive"].items():
-            if keyword in text:
-                score += weight
-
-        # Check negative keywords
-        for keyword in keywords["negative"]:
-            if keyword in text:
-                score -= 1  # Reduced penalty for negative keywords
-
-        if score > max_score:
-            max_score = score
-            detected_type = doc_type
-
-    # Calculate confidence score
-    total_possible_score = (
-        sum(document_types[detected_type]["positive"].values()) if detected_type else 0
-    )
-    confidence = (
-        max_score / total_possible_score
-        if detected_type and total_possible_score > 0
-        else 0
-    )
 
-    return {"type": detected_type, "confidence": confidence}
+# spaCy pipeline shared by every extraction in this process.
+# Loaded lazily on first use; only the components needed for named entities run.
+SPACY_MODEL = "en_core_web_sm"
+SPACY_REQUIRED_COMPONENTS = ("tok2vec", "ner")
+NLP_ENTITY_LABELS = ("MONEY", "PERCENT", "DATE", "ORG", "PERSON")
+NLP_CHUNK_SIZE = 100000
+
+_nlp = None
+_nlp_loaded = False
+_nlp_lock = threading.Lock()
 
 
-def extract_content_from_text(text, field_name, section):
+def get_nlp():
     """
-    Extract specific content from text using advanced NLP and structured data extraction
+    Return the process-wide spaCy pipeline, loading it on first call.
+    Returns None if the model is not installed - extraction then falls back
+    to regex patterns only. Install it once with:
+        python -m spacy download en_core_web_sm
+    """
+    global _nlp, _nlp_loaded
+    if not _nlp_loaded:
+        with _nlp_lock:
+            if not _nlp_loaded:
+                try:
+                    nlp = spacy.load(SPACY_MODEL)
+                    nlp.select_pipes(
+                        enable=[name for name in nlp.pipe_names if name in SPACY_REQUIRED_COMPONENTS]
+                    )
+                    _nlp = nlp
+                    print(f"Loaded spaCy model {SPACY_MODEL} with components: {nlp.pipe_names}")
+                except OSError as e:
+                    print(f"spaCy model {SPACY_MODEL} not available, using pattern extraction only: {str(e)}")
+                    _nlp = None
+                _nlp_loaded = True
+    return _nlp
+
+
+def extract_entities(text):
+    """
+    Named entities of interest in a document as (text, label) tuples.
+    Long texts are split into chunks and run through nlp.pipe in one pass.
+    """
+    nlp = get_nlp()
+    if nlp is None or not text:
+        return []
+
+    chunks = [text[i:i + NLP_CHUNK_SIZE] for i in range(0, len(text), NLP_CHUNK_SIZE)]
+    entities = []
+    for doc in nlp.pipe(chunks):
+        entities.extend(
+            (ent.text, ent.label_) for ent in doc.ents if ent.label_ in NLP_ENTITY_LABELS
+        )
+    print(f"Found {len(entities)} entities in {len(chunks)} chunk(s)")
+    return entities
+
+
+def _preprocess_extraction_text(text):
+    return text.replace("\n", " ").replace("\r", " ")
+
+
+# Value patterns of extract_structured_data, compiled once per process
+MONEY_PATTERN = re.compile(r"\$\s*\d+(?:\.\d{2})?|\d+(?:\.\d{2})?\s*(?:USD|EUR|GBP)?")
+DATE_PATTERN = re.compile(
+    r"\d{1,2}[-/]\d{1,2}[-/]\d{2,4}|\d{1,2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{2,4}"
+)
+
+
+def extract_fields_from_text(text, fields, rules=None):
+    """
+    Extract several key fields from one document.
+    fields is a list of (field_name, section) tuples; the document goes through
+    the NLP pipeline once and the entities are shared by every field.
+    Returns {field_name: extracted value or None}
+    """
+    text = _preprocess_extraction_text(text)
+    entities = extract_entities(text)
+    return {
+        field_name: extract_content_from_text(text, field_name, section, entities=entities, rules=rules)
+        for field_name, section in fields
+    }
+
+
+def extract_content_from_text(text, field_name, section, entities=None, rules=None):
+    """
+    Extract specific content from text using advanced NLP and structured data extraction.
+    Pass entities (from extract_entities) to reuse an NLP pass across fields,
+    and rules (from get_document_rules) for a shipment category's field patterns.
     """
     print(f"Extracting '{field_name}' from '{section}' section")
-    
-    # Load English language model
-    try:
-        nlp = spacy.load("en_core_web_sm")
-        print("Successfully loaded spaCy model")
-    except:
-        # If model not found, download it
-        import subprocess
-        print("spaCy model not found, downloading...")
-        subprocess.run(["python", "-m", "spacy", "download", "en_core_web_sm"])
-        nlp = spacy.load("en_core_web_sm")
-        print("spaCy model downloaded and loaded")
 
     # Preprocess text
-    text = text.replace("\n", " ").replace("\r", " ")
+    text = _preprocess_extraction_text(text)
     print(f"Preprocessed text length: {len(text)} characters")
-    doc = nlp(text)
-    print(f"Created spaCy document with {len(doc)} tokens")
-
-    # Define advanced patterns for different sections
-    patterns = {
-        "header": {
-            "invoice": [
-                r"(?i)invoice\s*(?:number|no|#)?[:#]?\s*(\w+)",
-                r"(?i)inv\.?\s*(?:number|no|#)?[:#]?\s*(\w+)",
-                r"(?i)invoice\s*(?:number|no|#)?[:#]?\s*(\d+)",
-                r"(?i)invoice\s*(?:number|no|#)?[:#]?\s*([A-Z0-9-]+)",
-            ],
-            "date": [
-                r"(?i)(?:date|dated)[:#]?\s*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
-                r"(?i)(?:date|dated)[:#]?\s*(\d{1,2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{2,4})",
-                r"(?i)(?:date|dated)[:#]?\s*(\d{1,2}\s+\d{1,2}\s+\d{2,4})",
-                r"(?i)(?:date|dated)[:#]?\s*((?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{1,2},?\s+\d{2,4})",
-            ],
-            "from": [
-                r"(?i)from[:#]?\s*([^\n]+)",
-                r"(?i)sender[:#]?\s*([^\n]+)",
-                r"(?i)issued by[:#]?\s*([^\n]+)",
-                r"(?i)company[:#]?\s*([^\n]+)",
-            ],
-            "to": [
-                r"(?i)(?:to|bill to)[:#]?\s*([^\n]+)",
-                r"(?i)(?:recipient|client)[:#]?\s*([^\n]+)",
-                r"(?i)(?:customer|buyer)[:#]?\s*([^\n]+)",
-                r"(?i)(?:sold to|shipped to)[:#]?\s*([^\n]+)",
-            ],
-            "company": [
-                r"(?i)company[:#]?\s*([^\n]+)",
-                r"(?i)organization[:#]?\s*([^\n]+)",
-                r"(?i)business[:#]?\s*([^\n]+)",
-                r"(?i)vendor[:#]?\s*([^\n]+)",
-            ],
-        },
-        "body": {
-            "description": [
-                r"(?i)description[:#]?\s*([^\n]+)",
-                r"(?i)item[:#]?\s*([^\n]+)",
-                r"(?i)product[:#]?\s*([^\n]+)",
-                r"(?i)service[:#]?\s*([^\n]+)",
-                r"(?i)goods[:#]?\s*([^\n]+)",
-            ],
-            "quantity": [
-                r"(?i)quantity[:#]?\s*(\d+)",
-                r"(?i)qty[:#]?\s*(\d+)",
-                r"(?i)amount[:#]?\s*(\d+)",
-                r"(?i)units[:#]?\s*(\d+)",
-                r"(?i)number of[:#]?\s*(\d+)",
-            ],
-            "price": [
-                r"(?i)(?:price|rate)[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)(?:unit price|unit cost)[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)(?:cost|amount)[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)(?:price per unit)[:#]?\s*(\d+(?:\.\d{2})?)",
-            ],
-            "amount": [
-                r"(?i)amount[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)total[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)sum[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)(?:line total|item total)[:#]?\s*(\d+(?:\.\d{2})?)",
-            ],
-            "tax": [
-                r"(?i)(?:tax|vat|gst)[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)(?:tax rate|vat rate)[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)(?:tax amount|vat amount)[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)(?:sales tax|value added tax)[:#]?\s*(\d+(?:\.\d{2})?)",
-            ],
-        },
-        "footer": {
-            "total": [
-                r"(?i)total[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)grand total[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)final amount[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)(?:subtotal|net amount)[:#]?\s*(\d+(?:\.\d{2})?)",
-            ],
-            "tax": [
-                r"(?i)(?:tax|vat|gst)[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)(?:total tax|total vat)[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)(?:tax amount|vat amount)[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)(?:total tax amount|total vat amount)[:#]?\s*(\d+(?:\.\d{2})?)",
-            ],
-            "grand_total": [
-                r"(?i)(?:grand total|final amount)[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)(?:total amount|final total)[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)(?:amount due|balance due)[:#]?\s*(\d+(?:\.\d{2})?)",
-                r"(?i)(?:total payable|amount payable)[:#]?\s*(\d+(?:\.\d{2})?)",
-            ],
-            "payment_terms": [
-                r"(?i)payment terms[:#]?\s*([^\n]+)",
-                r"(?i)terms[:#]?\s*([^\n]+)",
-                r"(?i)payment conditions[:#]?\s*([^\n]+)",
-                r"(?i)(?:payment method|payment mode)[:#]?\s*([^\n]+)",
-            ],
-            "due_date": [
-                r"(?i)due date[:#]?\s*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
-                r"(?i)payment due[:#]?\s*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
-                r"(?i)due by[:#]?\s*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
-                r"(?i)payment date[:#]?\s*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
-            ],
-        },
-    }
-    print(f"Loaded {len(patterns)} sections with patterns")
+
+    if entities is None:
+        entities = extract_entities(text)
+
+    field_patterns = (rules or DEFAULT_DOCUMENT_RULES).field_regex(section, field_name)
 
     def clean_value(value):
         """Clean and normalize extracted values"""
@@ -413,26 +253,18 @@ def extract_content_from_text(text, field_name, section):
         print(f"Extracting structured data for {field_name} in {section}")
         results = []
 
-        # Process the text with spaCy
-        doc = nlp(text)
-
-        # Extract entities
-        for ent in doc.ents:
-            if ent.label_ in ["MONEY", "PERCENT", "DATE", "ORG", "PERSON"]:
-                results.append(ent.text)
-                print(f"Found entity: {ent.text} (type: {ent.label_})")
+        # Entities come from the shared NLP pass
+        results.extend(entity_text for entity_text, label in entities)
 
         # Extract numbers and amounts
         if field_name.lower() in ["price", "amount", "total", "tax"]:
-            money_pattern = r"\$\s*\d+(?:\.\d{2})?|\d+(?:\.\d{2})?\s*(?:USD|EUR|GBP)?"
-            money_matches = re.findall(money_pattern, text)
+            money_matches = MONEY_PATTERN.findall(text)
             results.extend(money_matches)
             print(f"Found money values: {money_matches}")
 
         # Extract dates
         if field_name.lower() in ["date", "due_date"]:
-            date_pattern = r"\d{1,2}[-/]\d{1,2}[-/]\d{2,4}|\d{1,2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{2,4}"
-            date_matches = re.findall(date_pattern, text)
+            date_matches = DATE_PATTERN.findall(text)
             results.extend(date_matches)
             print(f"Found date values: {date_matches}")
 
@@ -443,15 +275,12 @@ def extract_content_from_text(text, field_name, section):
         """Extract content using regex patterns"""
         print(f"Extracting with regex patterns for {field_name} in {section}")
         values = []
-        if section in patterns and field_name.lower() in patterns[section]:
-            for pattern in patterns[section][field_name.lower()]:
-                print(f"Trying pattern: {pattern}")
-                matches = re.finditer(pattern, text)
-                for match in matches:
-                    value = clean_value(match.group(1))
-                    print(f"Found match: {value}")
-                    if value and value not in values:
-                        values.append(value)
+        if field_patterns is not None:
+            for value in field_patterns.values(text):
+                value = clean_value(value)
+                print(f"Found match: {value}")
+                if value and value not in values:
+                    values.append(value)
         print(f"Pattern extraction results: {values}")
         return values
 
@@ -477,7 +306,7 @@ def extract_content_from_text(text, field_name, section):
     else:
         print(f"Processing {section} section - looking for first match")
         # For header and footer, we want the first match
-        if section in patterns and field_name.lower() in patterns[section]:
+        if field_patterns is not None:
             # Try structured data first
             structured_values = extract_structured_data(text, field_name, section)
             if structured_values:
@@ -485,19 +314,18 @@ def extract_content_from_text(text, field_name, section):
                 print(f"Found result from structured data: {result}")
                 return result
 
-            # Then try pattern matching
-            for pattern in patterns[section][field_name.lower()]:
-                match = re.search(pattern, text)
-                if match:
-                    result = clean_value(match.group(1))
-                    print(f"Found result from pattern matching: {result}")
-                    return result
+            # Then try pattern matching, the first listed pattern that matches wins
+            value = field_patterns.first_value(text)
+            if value:
+                result = clean_value(value)
+                print(f"Found result from pattern matching: {result}")
+                return result
 
     print(f"No results found for {field_name} in {section}")
     return None
 
 
-def validate_document(submitted_text, sample_text, sample_document):
+def validate_document(submitted_text, sample_text, sample_document, submitted_doc_type=None, sample_doc_type=None, sample_features=None):
     print(f"Starting document validation process")
     print(f"Sample document: {sample_document.sample_file_path}")
     print(f"Submitted text length: {len(submitted_text)} characters")
@@ -511,10 +339,16 @@ def validate_document(submitted_text, sample_text, sample_document):
     print(f"  - Confidence threshold: {confidence_threshold:.1%}")
     print(f"  - Content similarity threshold: {content_similarity_threshold}%")
 
+    # Classification keywords and field patterns of the shipment category
+    rules = get_document_rules(sample_document.shipCatid)
+
     # Identify document types
     print("Identifying document types...")
-    submitted_doc_type = get_document_type(submitted_text)
-    sample_doc_type = get_document_type(sample_text)
+    # Callers that already classified the texts (or hold a cached sample type) pass them in
+    if submitted_doc_type is None:
+        submitted_doc_type = get_document_type(submitted_text, rules)
+    if sample_doc_type is None:
+        sample_doc_type = get_document_type(sample_text, rules)
     
     print(f"Submitted document type: {submitted_doc_type['type']} with confidence {submitted_doc_type['confidence']:.2%}")
     print(f"Sample document type: {sample_doc_type['type']} with confidence {sample_doc_type['confidence']:.2%}")
@@ -544,39 +378,33 @@ def validate_document(submitted_text, sample_text, sample_document):
     
     validation_results = {}
     extracted_content = {}
+    matched_fields = []
     match_count = 0
 
+    # IDF of the shipment category's accepted documents, shared by all comparisons below
+    index = get_similarity_index(sample_document.shipCatid)
+
+    # Whole-document similarity against the sample
+    if sample_features is None:
+        sample_features = extract_text_features(sample_text)
+    document_similarity = float(
+        index.similarities(extract_text_features(submitted_text), [sample_features])[0]
+    )
+    print(f"Document similarity to sample: {document_similarity:.2%}")
+
+    # Score every key field against every 1-4 word span of the submitted text at once
+    print(f"Matching {len(key_fields)} key fields against the submitted text")
+    field_matches = FieldLocator(submitted_text, index).locate([field["name"] for field in key_fields])
+
     for i, field in enumerate(key_fields):
         field_name = field["name"]
         field_section = field.get("section", "body")
-        print(f"\nProcessing field {i+1}/{len(key_fields)}: '{field_name}' in section '{field_section}'")
-
-        # Find the most similar field in the submitted text
-        best_similarity = 0
-        best_match = None
+        best_match, best_similarity = field_matches[i].text, field_matches[i].similarity
 
-        # Split submitted text into words and create potential field names
-        words = submitted_text.lower().split()
-        print(f"Generating potential matches from {len(words)} words")
-        
-        potential_matches_checked = 0
-        for i in range(len(words)):
-            for j in range(i + 1, min(i + 5, len(words) + 1)):
-                potential_field = " ".join(words[i:j])
-                potential_matches_checked += 1
-                
-                if potential_matches_checked % 1000 == 0:
-                    print(f"Checked {potential_matches_checked} potential matches...")
-                
-                similarity = get_semantic_similarity(
-                    field_name.lower(), potential_field
-                )
-                if similarity > best_similarity:
-                    best_similarity = similarity
-                    best_match = potential_field
-                    print(f"New best match: '{best_match}' with similarity {best_similarity:.2%}")
-
-        print(f"Best match for '{field_name}': '{best_match}' with similarity {best_similarity:.2%}")
+        print(
+            f"Best match for '{field_name}': '{best_match}' with similarity {best_similarity:.2%}"
+            f" at {field_matches[i].start}-{field_matches[i].end}"
+        )
         
         # Consider it a match if similarity is above threshold
         # Still using 0.5 threshold for individual field matching as this is different from overall content similarity
@@ -588,19 +416,8 @@ def validate_document(submitted_text, sample_text, sample_document):
                 "matched_with": best_match,
                 "section": field_section,
             }
-            # Extract the actual content
-            print(f"Extracting content for '{field_name}' in section '{field_section}'")
-            content = extract_content_from_text(
-                submitted_text, field_name, field_section
-            )
-            if content:
-                print(f"Extracted content: {content}")
-                extracted_content[field_name] = {
-                    "value": content,
-                    "section": field_section,
-                }
-            else:
-                print(f"No content extracted for '{field_name}'")
+            # Content is extracted for all matched fields together below
+            matched_fields.append((field_name, field_section))
             match_count += 1
         else:
             print(f"NO MATCH: Similarity below threshold (0.5)")
@@ -611,13 +428,28 @@ def validate_document(submitted_text, sample_text, sample_document):
                 "section": field_section,
             }
 
+    # Extract the actual content of every matched field in one NLP pass
+    if matched_fields:
+        print(f"Extracting content for {len(matched_fields)} matched fields")
+        field_values = extract_fields_from_text(submitted_text, matched_fields, rules=rules)
+        for field_name, field_section in matched_fields:
+            content = field_values.get(field_name)
+            if content:
+                print(f"Extracted content for '{field_name}': {content}")
+                extracted_content[field_name] = {
+                    "value": content,
+                    "section": field_section,
+                }
+            else:
+                print(f"No content extracted for '{field_name}'")
+
     match_percentage = (match_count / len(key_fields)) * 100
     print(f"\nValidation complete: {match_count}/{len(key_fields)} fields matched ({match_percentage:.1f}%)")
     print(f"Content similarity threshold: {content_similarity_threshold}%")
     
     return {
         "error": False,
-        "document_similarity": 1.0,
+        "document_similarity": document_similarity,
         "validation_results": validation_results,
         "extracted_content": extracted_content,
         "match_percentage": match_percentage,
@@ -628,6 +460,20 @@ def validate_document(submitted_text, sample_text, sample_document):
     }
 
 
+# Patterns of extract_invoice_json, compiled once per process
+INVOICE_PATTERNS = {
+    "from": re.compile(r"From:(.*?)Invoice Number:", re.DOTALL),
+    "to": re.compile(r"To:(.*?)Service Description:", re.DOTALL),
+    "invoice_number": re.compile(r"Invoice Number[:\s]+([A-Za-z0-9-]+)"),
+    "service": re.compile(r"Service Description:(.*?)€", re.DOTALL),
+    "total": re.compile(r"Total[:\s]+([0-9\.,]+ €)"),
+    "alt_from": re.compile(r"(?:From|Sender|Company):(.*?)(?:To|Bill To|Invoice)", re.DOTALL),
+    "alt_to": re.compile(r"(?:To|Bill To|Recipient):(.*?)(?:Service|Description|Date)", re.DOTALL),
+    "alt_invoice_number": re.compile(r"(?:Invoice|INV)[.\s#:]+([A-Za-z0-9-]+)", re.IGNORECASE),
+    "alt_total": re.compile(r"(?:Total Amount|Grand Total|Amount Due)[:\s]+([0-9\.,]+\s*[€$£])", re.IGNORECASE),
+}
+
+
 def extract_invoice_json(text):
     print(f"Starting invoice JSON extraction")
     print(f"Text length: {len(text)} characters")
@@ -638,7 +484,7 @@ def extract_invoice_json(text):
 
     # Extract sender (from)
     print("Extracting sender information...")
-    from_block = re.search(r"From:(.*?)Invoice Number:", text, re.DOTALL)
+    from_block = INVOICE_PATTERNS["from"].search(text)
     if from_block:
         invoice["from"] = from_block.group(1).strip()
         print(f"Found sender: {invoice['from']}")
@@ -648,7 +494,7 @@ def extract_invoice_json(text):
 
     # Extract recipient (to)
     print("Extracting recipient information...")
-    to_block = re.search(r"To:(.*?)Service Description:", text, re.DOTALL)
+    to_block = INVOICE_PATTERNS["to"].search(text)
     if to_block:
         invoice["to"] = to_block.group(1).strip()
         print(f"Found recipient: {invoice['to']}")
@@ -658,7 +504,7 @@ def extract_invoice_json(text):
 
     # Extract invoice details
     print("Extracting invoice number...")
-    invoice_number = re.search(r"Invoice Number[:\s]+([A-Za-z0-9-]+)", text)
+    invoice_number = INVOICE_PATTERNS["invoice_number"].search(text)
     if invoice_number:
         invoice["invoice_number"] = invoice_number.group(1)
         print(f"Found invoice number: {invoice['invoice_number']}")
@@ -669,7 +515,7 @@ def extract_invoice_json(text):
     # Extract line items (services)
     print("Extracting line items (services)...")
     services = []
-    service_matches = list(re.finditer(r"Service Description:(.*?)€", text, re.DOTALL))
+    service_matches = list(INVOICE_PATTERNS["service"].finditer(text))
     print(f"Found {len(service_matches)} potential service descriptions")
     
     for i, match in enumerate(service_matches):
@@ -681,7 +527,7 @@ def extract_invoice_json(text):
 
     # Extract totals
     print("Extracting total amount...")
-    total = re.search(r"Total[:\s]+([0-9\.,]+ €)", text)
+    total = INVOICE_PATTERNS["total"].search(text)
     if total:
         invoice["total"] = total.group(1)
         print(f"Found total: {invoice['total']}")
@@ -692,7 +538,7 @@ def extract_invoice_json(text):
     # Try alternative patterns if main patterns failed
     if not invoice["from"]:
         print("Trying alternative pattern for sender...")
-        alt_from = re.search(r"(?:From|Sender|Company):(.*?)(?:To|Bill To|Invoice)", text, re.DOTALL)
+        alt_from = INVOICE_PATTERNS["alt_from"].search(text)
         if alt_from:
             invoice["from"] = alt_from.group(1).strip()
             print(f"Found sender with alternative pattern: {invoice['from']}")
@@ -701,7 +547,7 @@ def extract_invoice_json(text):
     
     if not invoice["to"]:
         print("Trying alternative pattern for recipient...")
-        alt_to = re.search(r"(?:To|Bill To|Recipient):(.*?)(?:Service|Description|Date)", text, re.DOTALL)
+        alt_to = INVOICE_PATTERNS["alt_to"].search(text)
         if alt_to:
             invoice["to"] = alt_to.group(1).strip()
             print(f"Found recipient with alternative pattern: {invoice['to']}")
@@ -710,7 +556,7 @@ def extract_invoice_json(text):
     
     if not invoice["invoice_number"]:
         print("Trying alternative pattern for invoice number...")
-        alt_invoice = re.search(r"(?:Invoice|INV)[.\s#:]+([A-Za-z0-9-]+)", text, re.IGNORECASE)
+        alt_invoice = INVOICE_PATTERNS["alt_invoice_number"].search(text)
         if alt_invoice:
             invoice["invoice_number"] = alt_invoice.group(1)
             print(f"Found invoice number with alternative pattern: {invoice['invoice_number']}")
@@ -719,7 +565,7 @@ def extract_invoice_json(text):
     
     if not invoice["total"]:
         print("Trying alternative pattern for total amount...")
-        alt_total = re.search(r"(?:Total Amount|Grand Total|Amount Due)[:\s]+([0-9\.,]+\s*[€$£])", text, re.IGNORECASE)
+        alt_total = INVOICE_PATTERNS["alt_total"].search(text)
         if alt_total:
             invoice["total"] = alt_total.group(1)
             print(f"Found total with alternative pattern: {invoice['total']}")
@@ -756,32 +602,20 @@ def validate_using_ai(submitted_text, sample_text, key_fields):
     extracted_content = {}
     
     try:
-        # API configuration (validate these values!)
-        api_key = current_app.config.get("DEEPSEEK_API_KEY") 
-        api_url = current_app.config.get("DEEPSEEK_API_URL")
-        
-        if not api_key:
+        client = get_llm_client()
+        if not client.api_key:
             raise ValueError("DeepSeek API key not configured")
 
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-
-        # --- Document-level embeddings ---
-        def get_embedding(text):
-            """Helper function to get embeddings."""
-            data = {
-                "input": text[:2000],  # Safer truncation
-                "model": "deepseek-chat"  # Verify model name!
-            }
-            response = requests.post(api_url, headers=headers, json=data)
-            response.raise_for_status()  # Raises HTTPError for bad responses
-            return response.json()["data"][0]["embedding"]  # Adjust if structure differs
-
-        print("Getting document-level embeddings...")
-        submitted_embedding = get_embedding(submitted_text)
-        sample_embedding = get_embedding(sample_text)
+        # --- Document-level and field prompt embeddings, requested concurrently ---
+        prompts = [
+            f"Extract the '{field['name']}' field from: {submitted_text[:1000]}"
+            for field in key_fields
+        ]
+        print(f"Getting {len(prompts) + 2} embeddings...")
+        embeddings = client.embedding_many(
+            [submitted_text[:2000], sample_text[:2000]] + [prompt[:2000] for prompt in prompts]
+        )
+        submitted_embedding, sample_embedding = embeddings[0], embeddings[1]
         
         # Calculate similarity
         document_similarity = calculate_cosine_similarity(submitted_embedding, sample_embedding)
@@ -789,13 +623,10 @@ def validate_using_ai(submitted_text, sample_text, key_fields):
 
         # --- Field-level validation ---
         match_count = 0
-        for field in key_fields:
+        for field, field_embedding in zip(key_fields, embeddings[2:]):
             field_name = field["name"]
             print(f"Processing field: {field_name}")
 
-            # Simulate field extraction (replace with actual logic)
-            prompt = f"Extract the '{field_name}' field from: {submitted_text[:1000]}"
-            field_embedding = get_embedding(prompt)
             field_similarity = calculate_cosine_similarity(field_embedding, submitted_embedding)
             
             is_match = field_similarity >= 0.5
@@ -844,19 +675,12 @@ Text:
 {text}
 """
 
-    payload = {
-        "model": "deepseek-chat",
-        "messages": [
-            {"role": "system", "content": "You are an intelligent document parser."},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.2
-    }
-
-    response = requests.post(DEEPSEEK_API_URL, headers=HEADERS, json=payload)
-    response.raise_for_status()
+    messages = [
+        {"role": "system", "content": "You are an intelligent document parser."},
+        {"role": "user", "content": prompt}
+    ]
 
-    content = response.json()["choices"][0]["message"]["content"]
+    content = get_llm_client().chat(messages, temperature=0.2)
 
     # Remove markdown code blocks like ```python ... ```
     cleaned_content = re.sub(r"```(?:python)?(.*?)```", r"\1", content, flags=re.DOTALL).strip()
@@ -0,0 +1,184 @@
+# working_calendar.py
+"""
+In-memory working-day calendars built from NonWorkingDay.
+
+A country's active non-working days (weekends and public holidays as
+configured in the masters) are held as a sorted list of date ordinals, so
+"is this a working day" and "Nth working day after X" are answered with a
+bisect instead of a query per calendar day. Chargeable demurrage days use a
+closed-form Saturday/Sunday count plus the country's public holidays.
+
+get_working_calendars() caches the calendars per process; they are rebuilt
+when the non_working_days table changes (row count or latest updated_at),
+which is checked once per request.
+"""
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+
+from flask import g, has_request_context
+from sqlalchemy import func
+
+from app.extensions import db
+from app.models.demurrage import NonWorkingDay
+
+
+_calendars = None  # (signature, {country_id: WorkingCalendar})
+_calendars_lock = threading.Lock()
+
+
+def _ordinal(value):
+    if isinstance(value, int):
+        return value
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.toordinal()
+
+
+def _is_weekend(ordinal):
+    # date.fromordinal(1) is a Monday
+    return (ordinal - 1) % 7 >= 5
+
+
+def _weekend_days_through(ordinal):
+    """Saturdays and Sundays in ordinals 1..ordinal"""
+    return 2 * (ordinal // 7) + max(0, ordinal % 7 - 5)
+
+
+def weekend_days_between(start, end):
+    """Number of Saturdays and Sundays in (start, end]"""
+    return max(0, _weekend_days_through(_ordinal(end)) - _weekend_days_through(_ordinal(start)))
+
+
+class WorkingCalendar:
+    def __init__(self, non_working_days=(), holidays=()):
+        self.days = sorted({_ordinal(d) for d in non_working_days})
+        # days[j] - j never decreases, which lets add_working_days bisect over it
+        self._shifted = [day - j for j, day in enumerate(self.days)]
+        # Public holidays, and those of them that fall on a weekday (so they are
+        # not counted twice when weekends are excluded as well)
+        self.holidays = sorted({_ordinal(d) for d in holidays})
+        self.weekday_holidays = [day for day in self.holidays if not _is_weekend(day)]
+
+    def is_working_day(self, value):
+        ordinal = _ordinal(value)
+        i = bisect_left(self.days, ordinal)
+        return i == len(self.days) or self.days[i] != ordinal
+
+    def non_working_days_between(self, start, end):
+        """Number of non-working days in (start, end]"""
+        return bisect_right(self.days, _ordinal(end)) - bisect_right(self.days, _ordinal(start))
+
+    def add_working_days(self, start, n):
+        """The n-th working day after start (n >= 1), as a date"""
+        start_ordinal = _ordinal(start)
+        first = bisect_right(self.days, start_ordinal)
+        # Non-working days skipped are those with days[j] - j <= start + n - first
+        skipped = bisect_right(self._shifted, start_ordinal + n - first) - first
+        return date.fromordinal(start_ordinal + n + skipped)
+
+    def holidays_between(self, start, end, weekdays_only=False):
+        """Number of public holidays in (start, end]"""
+        days = self.weekday_holidays if weekdays_only else self.holidays
+        return max(0, bisect_right(days, _ordinal(end)) - bisect_right(days, _ordinal(start)))
+
+    def chargeable_days(self, start, end, exclude_weekends=False, exclude_holidays=False):
+        """
+        {'total_days', 'chargeable_days', 'excluded_days'} for the days in (start, end],
+        leaving out Saturdays/Sundays and/or public holidays.
+        """
+        if _ordinal(end) <= _ordinal(start):
+            return {'total_days': 0, 'chargeable_days': 0, 'excluded_days': 0}
+
+        total_days = _ordinal(end) - _ordinal(start)
+        excluded_days = 0
+        if exclude_weekends:
+            excluded_days += weekend_days_between(start, end)
+        if exclude_holidays:
+            excluded_days += self.holidays_between(start, end, weekdays_only=exclude_weekends)
+
+        return {
+            'total_days': total_days,
+            'chargeable_days': max(0, total_days - excluded_days),
+            'excluded_days': excluded_days,
+        }
+
+    def nth_chargeable_day(self, start, n, exclude_weekends=False, exclude_holidays=False):
+        """
+        The date of the n-th chargeable day after start (n >= 1), counted as
+        chargeable_days() counts them, so day ranges shown for a charge cover
+        exactly the days charged
+        """
+        start_ordinal = _ordinal(start)
+        if not exclude_weekends and not exclude_holidays:
+            return date.fromordinal(start_ordinal + n)
+
+        def chargeable_through(ordinal):
+            return self.chargeable_days(start_ordinal, ordinal, exclude_weekends, exclude_holidays)['chargeable_days']
+
+        # Smallest end with n chargeable days in (start, end]: at most 2 of every
+        # 7 days are weekend days, plus every holiday
+        low = start_ordinal + n
+        high = start_ordinal + 2 * n + len(self.holidays) + 7
+        while low < high:
+            middle = (low + high) // 2
+            if chargeable_through(middle) >= n:
+                high = middle
+            else:
+                low = middle + 1
+        return date.fromordinal(low)
+
+
+def load_working_calendars(country_ids=None):
+    """{country_id: WorkingCalendar} from active NonWorkingDay rows, in one query"""
+    query = db.session.query(NonWorkingDay.country_id, NonWorkingDay.date, NonWorkingDay.type).filter(
+        NonWorkingDay.is_active == True
+    )
+    if country_ids is not None:
+        query = query.filter(NonWorkingDay.country_id.in_(list(country_ids)))
+
+    days_by_country = {}
+    holidays_by_country = {}
+    for country_id, day, day_type in query:
+        days_by_country.setdefault(country_id, []).append(day)
+        if day_type == 'PUBLIC_HOLIDAY':
+            holidays_by_country.setdefault(country_id, []).append(day)
+
+    calendars = {
+        country_id: WorkingCalendar(days, holidays_by_country.get(country_id, ()))
+        for country_id, days in days_by_country.items()
+    }
+    for country_id in country_ids or ():
+        calendars.setdefault(country_id, WorkingCalendar())
+    return calendars
+
+
+def _signature():
+    return tuple(db.session.query(func.count(NonWorkingDay.id), func.max(NonWorkingDay.updated_at)).one())
+
+
+def get_working_calendars():
+    """{country_id: WorkingCalendar} for every country, cached per process"""
+    global _calendars
+
+    if has_request_context() and "_working_calendars" in g:
+        return g._working_calendars
+
+    signature = _signature()
+    with _calendars_lock:
+        cached = _calendars
+    if cached and cached[0] == signature:
+        calendars = cached[1]
+    else:
+        calendars = load_working_calendars()
+        with _calendars_lock:
+            _calendars = (signature, calendars)
+
+    if has_request_context():
+        g._working_calendars = calendars
+    return calendars
+
+
+def get_working_calendar(country_id):
+    """The cached WorkingCalendar of a country (empty if it has no non-working days)"""
+    return get_working_calendars().get(country_id) or WorkingCalendar()
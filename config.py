@@ -60,7 +60,91 @@ class Config:
     AWS_REGION = os.getenv("AWS_REGION")
     S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
     S3_BASE_FOLDER = os.getenv("S3_BASE_FOLDER")     
-    S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") 
+    S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+    S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 50))  # shared client's connection pool
+    S3_STREAM_CHUNK_BYTES = int(os.getenv("S3_STREAM_CHUNK_BYTES", 65536))
+
+    # Multipart transfers: files above the threshold go up in parts, several at a time.
+    # Parallel batch uploads use S3_UPLOAD_WORKERS threads; keep workers x concurrency
+    # within S3_MAX_POOL_CONNECTIONS.
+    S3_MULTIPART_THRESHOLD_BYTES = int(os.getenv("S3_MULTIPART_THRESHOLD_BYTES", 8 * 1024 * 1024))
+    S3_MULTIPART_CHUNK_BYTES = int(os.getenv("S3_MULTIPART_CHUNK_BYTES", 8 * 1024 * 1024))
+    S3_TRANSFER_CONCURRENCY = int(os.getenv("S3_TRANSFER_CONCURRENCY", 4))
+    S3_UPLOAD_WORKERS = int(os.getenv("S3_UPLOAD_WORKERS", 8))
+
+    # Nightly sweep deletes content-addressed attachment files no attachment has used for this long
+    ATTACHMENT_SWEEP_GRACE_HOURS = int(os.getenv("ATTACHMENT_SWEEP_GRACE_HOURS", 24))
+
+    # Cached validation results not re-used for this many days are deleted nightly
+    VALIDATION_CACHE_RETENTION_DAYS = int(os.getenv("VALIDATION_CACHE_RETENTION_DAYS", 90))
+
+    # Disk LRU cache of served documents (0 = disabled); larger objects are streamed from S3
+    S3_CACHE_DIR = os.getenv("S3_CACHE_DIR", "")  # default: app/instance/s3_cache
+    S3_CACHE_MAX_BYTES = int(os.getenv("S3_CACHE_MAX_BYTES", 512 * 1024 * 1024))  # whole directory, all workers
+    S3_CACHE_MAX_OBJECT_BYTES = int(os.getenv("S3_CACHE_MAX_OBJECT_BYTES", 25 * 1024 * 1024))
+    S3_CACHE_REVALIDATE_SECONDS = int(os.getenv("S3_CACHE_REVALIDATE_SECONDS", 300))
+
+    # Redirect documents of at least this size to a presigned S3 URL (0 = always proxy)
+    S3_SIGNED_REDIRECT_MIN_BYTES = int(os.getenv("S3_SIGNED_REDIRECT_MIN_BYTES", 0))
+    S3_SIGNED_REDIRECT_SECONDS = int(os.getenv("S3_SIGNED_REDIRECT_SECONDS", 60))
+
+    # Background schedulers (disabled in standalone worker processes)
+    ENABLE_SCHEDULERS = os.getenv("ENABLE_SCHEDULERS", "true").lower() == "true"
+
+    # AI validation job queue
+    VALIDATION_WORKER_PROCESSES = int(os.getenv("VALIDATION_WORKER_PROCESSES", 2))
+    VALIDATION_WORKER_POLL_SECONDS = float(os.getenv("VALIDATION_WORKER_POLL_SECONDS", 2))
+    VALIDATION_WORKER_BATCH_SIZE = int(os.getenv("VALIDATION_WORKER_BATCH_SIZE", 1))
+    VALIDATION_LEASE_SECONDS = int(os.getenv("VALIDATION_LEASE_SECONDS", 600))
+    VALIDATION_MAX_ATTEMPTS = int(os.getenv("VALIDATION_MAX_ATTEMPTS", 5))
+    VALIDATION_RETRY_BASE_SECONDS = int(os.getenv("VALIDATION_RETRY_BASE_SECONDS", 30))
+    VALIDATION_RETRY_MAX_SECONDS = int(os.getenv("VALIDATION_RETRY_MAX_SECONDS", 3600))
+
+    # PDF text extraction / OCR
+    PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", 200))
+    PDF_EXTRACTION_TIMEOUT = int(os.getenv("PDF_EXTRACTION_TIMEOUT", 120))  # seconds per document
+    PDF_OCR_PROCESSES = int(os.getenv("PDF_OCR_PROCESSES", 0))  # 0 = CPU cores / VALIDATION_WORKER_PROCESSES
+    PDF_OCR_DPI = int(os.getenv("PDF_OCR_DPI", 300))
+    PDF_MIN_TEXT_CHARS = int(os.getenv("PDF_MIN_TEXT_CHARS", 20))  # pages with less text are OCR'd
+
+    # DeepSeek / LLM client
+    LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+    LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", 60))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+    LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", 3600))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1024))
+
+    # Seconds a worker may use its copy of a category's similarity index before checking for new documents
+    SIMILARITY_INDEX_REFRESH_SECONDS = int(os.getenv("SIMILARITY_INDEX_REFRESH_SECONDS", 300))
+
+    # Report exports larger than this many rows are built in the background (0 = never)
+    EXPORT_BACKGROUND_ROW_THRESHOLD = int(os.getenv("EXPORT_BACKGROUND_ROW_THRESHOLD", 50000))
+    # Background exports still queued/running after this long are reported as failed (their worker died)
+    EXPORT_JOB_TIMEOUT_MINUTES = int(os.getenv("EXPORT_JOB_TIMEOUT_MINUTES", 120))
+    # Same for background PO Excel imports
+    PO_IMPORT_JOB_TIMEOUT_MINUTES = int(os.getenv("PO_IMPORT_JOB_TIMEOUT_MINUTES", 60))
+
+    # Seconds a worker may serve a user's notifications from its local cache
+    NOTIFICATION_CACHE_TTL_SECONDS = int(os.getenv("NOTIFICATION_CACHE_TTL_SECONDS", 15))
+
+    # Serve document-expiry row alerts from the nightly entry_document_alerts snapshot
+    DOCUMENT_ALERTS_MATERIALIZED = os.getenv("DOCUMENT_ALERTS_MATERIALIZED", "false").lower() == "true"
+
+    # Keep shipment_monthly_rollup current and serve the dashboard's unfiltered and month/year views from it
+    DASHBOARD_ROLLUPS = os.getenv("DASHBOARD_ROLLUPS", "false").lower() == "true"
+
+    # Live chat/notification events: "" = in-process broker, or a Redis URL shared by all workers.
+    # The in-process broker only reaches streams of the worker that published the event, so with more
+    # than one web worker (gunicorn -w / WEB_CONCURRENCY) chat and notification updates go missing.
+    EVENT_BROKER_URL = os.getenv("EVENT_BROKER_URL", "")
+    # Web worker processes serving the app; set it with gunicorn's worker count (gunicorn reads it too)
+    WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+    EVENT_STREAM_HEARTBEAT_SECONDS = int(os.getenv("EVENT_STREAM_HEARTBEAT_SECONDS", 20))
+    EVENT_STREAM_MAX_SECONDS = int(os.getenv("EVENT_STREAM_MAX_SECONDS", 300))  # clients reconnect after this
+
+    # Search index backend: "" = search_documents table (MySQL FULLTEXT), or "sqlite:////path/search.db" (FTS5 sidecar)
+    SEARCH_INDEX_URL = os.getenv("SEARCH_INDEX_URL", "")
 
 
 class DevelopmentConfig(Config):
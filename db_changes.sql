@@ -94,3 +94,245 @@ ADD COLUMN content_similarity FLOAT NOT NULL DEFAULT 0.0,
 ADD COLUMN ai_validate INT NOT NULL DEFAULT 0,
 ADD COLUMN multiple_document INT NOT NULL DEFAULT 0;
 
+
+
+18/10/2026
+
+CREATE TABLE validation_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    attachment_id INT NOT NULL UNIQUE,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    attempts INT NOT NULL DEFAULT 0,
+    run_after DATETIME NOT NULL,
+    locked_by VARCHAR(100) NULL,
+    locked_until DATETIME NULL,
+    last_error TEXT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX ix_validation_jobs_status_run_after (status, run_after),
+    FOREIGN KEY (attachment_id) REFERENCES ship_document_entry_attachement(id) ON DELETE CASCADE
+);
+
+CREATE TABLE sample_extraction_cache (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    s3_key VARCHAR(512) NOT NULL,
+    etag VARCHAR(128) NOT NULL,
+    content_hash VARCHAR(64) NOT NULL,
+    extracted_text LONGTEXT NOT NULL,
+    document_type TEXT NULL,
+    features LONGTEXT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    last_used_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_sample_extraction_key_etag (s3_key, etag),
+    INDEX ix_sample_extraction_cache_content_hash (content_hash)
+);
+
+CREATE TABLE ship_category_similarity_index (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    ship_category_id INT NOT NULL UNIQUE,
+    document_count INT NOT NULL DEFAULT 0,
+    version INT NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (ship_category_id) REFERENCES ship_category(id)
+);
+
+CREATE TABLE ship_category_term_frequencies (
+    ship_category_id INT NOT NULL,
+    term VARCHAR(100) COLLATE utf8mb4_bin NOT NULL,
+    document_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (ship_category_id, term),
+    FOREIGN KEY (ship_category_id) REFERENCES ship_category(id)
+);
+
+CREATE TABLE report_export_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    company_id INT NOT NULL,
+    report VARCHAR(50) NOT NULL,
+    export_format VARCHAR(10) NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    request_data TEXT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    row_count INT NULL,
+    s3_key VARCHAR(512) NULL,
+    error TEXT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    completed_at DATETIME NULL,
+    INDEX ix_report_export_jobs_user_id (user_id),
+    FOREIGN KEY (user_id) REFERENCES user(id),
+    FOREIGN KEY (company_id) REFERENCES company_info(id)
+);
+
+-- Versions of cached reference datasets (app/reference_cache.py); company_id 0 = global
+CREATE TABLE reference_data_versions (
+    name VARCHAR(50) NOT NULL,
+    company_id INT NOT NULL DEFAULT 0,
+    version INT NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (name, company_id)
+);
+
+-- Unread chat messages per user and thread (app/notification_store.py)
+CREATE TABLE chat_unread_counters (
+    user_id INT NOT NULL,
+    thread_id INT NOT NULL,
+    unread_count INT NOT NULL DEFAULT 0,
+    last_message_id INT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, thread_id),
+    KEY idx_chat_unread_counters_thread (thread_id),
+    CONSTRAINT fk_chat_unread_counters_user FOREIGN KEY (user_id) REFERENCES user(id) ON DELETE CASCADE,
+    CONSTRAINT fk_chat_unread_counters_thread FOREIGN KEY (thread_id) REFERENCES chat_threads(id) ON DELETE CASCADE
+);
+
+-- Backfill from the existing unread messages
+INSERT INTO chat_unread_counters (user_id, thread_id, unread_count, last_message_id)
+SELECT p.user_id, p.thread_id, COUNT(DISTINCT m.id), MAX(m.id)
+FROM chat_participants p
+JOIN user r ON r.id = p.user_id
+JOIN chat_threads t ON t.id = p.thread_id
+JOIN ship_document_entry_master e ON e.id = t.reference_id
+JOIN chat_messages m ON m.thread_id = p.thread_id AND m.is_read = 0 AND m.sender_id <> p.user_id
+JOIN user s ON s.id = m.sender_id
+WHERE ((r.role = 'customer' AND e.company_id = r.company_id)
+       OR (r.role <> 'customer' AND e.assigned_clearing_company_id = r.company_id))
+  AND ((r.role = 'customer' AND s.role IN ('user', 'base_user'))
+       OR (r.role <> 'customer' AND s.role = 'customer'))
+GROUP BY p.user_id, p.thread_id;
+
+-- Paged chat history (chat.get_messages filters on reference_id, orders and pages by created_at, id)
+CREATE INDEX idx_chat_messages_reference_created ON chat_messages (reference_id, created_at, id);
+
+-- Nightly document-expiry alert snapshot (DOCUMENT_ALERTS_MATERIALIZED)
+CREATE TABLE entry_document_alerts (
+    entry_id INT NOT NULL PRIMARY KEY,
+    company_id INT NULL,
+    has_alerts TINYINT(1) NOT NULL DEFAULT 0,
+    has_company_alerts TINYINT(1) NOT NULL DEFAULT 0,
+    refreshed_at DATETIME NULL,
+    KEY idx_entry_document_alerts_company (company_id),
+    CONSTRAINT fk_entry_document_alerts_entry FOREIGN KEY (entry_id) REFERENCES ship_document_entry_master(id) ON DELETE CASCADE
+);
+
+-- Lookups used by the alert EXISTS query
+CREATE INDEX idx_shipment_items_shipment ON shipment_items (shipment_id, po_detail_id);
+CREATE INDEX idx_material_hs_documents_material_expiry ON material_hs_documents (material_id, expiry_date);
+
+-- Background Excel purchase order imports (app/po/excel_import.py)
+CREATE TABLE po_import_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    company_id INT NOT NULL,
+    user_role VARCHAR(50) NULL,
+    filename VARCHAR(255) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    stage VARCHAR(20) NULL,
+    total_rows INT NULL,
+    processed_rows INT DEFAULT 0,
+    stats TEXT NULL,
+    error TEXT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME NULL,
+    completed_at DATETIME NULL,
+    INDEX ix_po_import_jobs_user_id (user_id),
+    FOREIGN KEY (user_id) REFERENCES user(id),
+    FOREIGN KEY (company_id) REFERENCES company_info(id)
+);
+
+-- Masters list search (app/pagination.py search_filter): B-tree indexes for
+-- prefix LIKE columns, FULLTEXT indexes for MATCH ... AGAINST columns
+CREATE INDEX idx_customer_email ON customer (email);
+CREATE INDEX idx_customer_telephone ON customer (telephone);
+CREATE FULLTEXT INDEX ft_customer_customer_name ON customer (customer_name);
+CREATE FULLTEXT INDEX ft_customer_address ON customer (address);
+CREATE FULLTEXT INDEX ft_company_info_company_name ON company_info (company_name);
+CREATE INDEX idx_user_contact_number ON user (contact_number);
+CREATE FULLTEXT INDEX ft_user_name ON user (name);
+CREATE INDEX idx_ship_document_entry_master_docserial ON ship_document_entry_master (docserial);
+CREATE INDEX idx_ship_category_catname ON ship_category (catname);
+CREATE INDEX idx_shipment_type_base_shipment_name ON shipment_type_base (shipment_name);
+CREATE FULLTEXT INDEX ft_po_suppliers_supplier_name ON po_suppliers (supplier_name);
+CREATE FULLTEXT INDEX ft_po_materials_material_name ON po_materials (material_name);
+CREATE INDEX idx_hs_code_code ON hs_code (code);
+CREATE INDEX idx_container_documents_code ON container_documents (document_code);
+CREATE INDEX idx_container_documents_name ON container_documents (document_name);
+CREATE INDEX idx_container_deposit_workflows_code ON container_deposit_workflows (workflow_code);
+CREATE INDEX idx_container_deposit_workflows_name ON container_deposit_workflows (workflow_name);
+CREATE INDEX idx_income_expense_gl_code ON income_expense (gl_code);
+CREATE FULLTEXT INDEX ft_income_expense_description ON income_expense (description);
+CREATE INDEX idx_demurrage_reasons_reason_name ON demurrage_reasons (reason_name);
+CREATE FULLTEXT INDEX ft_demurrage_reasons_description ON demurrage_reasons (description);
+
+-- Search index kept up to date from model events (app/search_index.py)
+CREATE TABLE search_documents (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    entity_type VARCHAR(20) NOT NULL,
+    entity_id INT NOT NULL,
+    company_id INT NULL,
+    entry_id INT NULL,
+    title VARCHAR(255) NULL,
+    keywords TEXT NULL,
+    body TEXT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_search_documents_entity (entity_type, entity_id),
+    KEY ix_search_documents_company_id (company_id),
+    FULLTEXT KEY ft_search_documents_text (title, keywords, body)
+);
+
+CREATE TABLE ship_category_document_rules (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    ship_category_id INT NOT NULL UNIQUE,
+    document_types TEXT NULL,
+    field_patterns TEXT NULL,
+    version INT NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (ship_category_id) REFERENCES ship_category(id)
+);
+
+ALTER TABLE ship_document_entry_attachement
+    ADD COLUMN content_hash VARCHAR(64) NULL AFTER attachement_path,
+    ADD INDEX ix_ship_document_entry_attachement_content_hash (content_hash),
+    ADD INDEX ix_ship_document_entry_attachement_attachement_path (attachement_path);
+
+CREATE TABLE validation_result_cache (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    content_hash VARCHAR(64) NOT NULL,
+    ship_cat_document_id INT NOT NULL,
+    sample_version VARCHAR(64) NOT NULL,
+    ai_validated INT NOT NULL,
+    validation_results TEXT NULL,
+    extracted_content TEXT NULL,
+    validation_percentage FLOAT NULL,
+    document_similarity_percentage FLOAT NULL,
+    similarity_message VARCHAR(500) NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    last_used_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_validation_result_cache_key (content_hash, ship_cat_document_id, sample_version),
+    FOREIGN KEY (ship_cat_document_id) REFERENCES ship_cat_document(id) ON DELETE CASCADE
+);
+
+CREATE TABLE shipment_monthly_rollup (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    company_id INT NOT NULL,
+    customer_id INT NOT NULL DEFAULT 0,
+    period_year INT NOT NULL,
+    period_month INT NOT NULL,
+    job_type INT NOT NULL,
+    on_time_count INT NOT NULL DEFAULT 0,
+    demurrage_count INT NOT NULL DEFAULT 0,
+    UNIQUE KEY uq_shipment_monthly_rollup_key (company_id, customer_id, period_year, period_month, job_type),
+    KEY ix_shipment_monthly_rollup_customer (customer_id, period_year, period_month)
+);
+
+ALTER TABLE order_shipment
+    ADD INDEX ix_order_shipment_company_created (company_id, created_at),
+    ADD INDEX ix_order_shipment_customer_created (customer_id, created_at);
+
+ALTER TABLE validation_result_cache
+    ADD INDEX ix_validation_result_cache_last_used_at (last_used_at);
+
+CREATE TABLE shipment_rollup_state (
+    id INT PRIMARY KEY,
+    rebuilt_at DATETIME NULL,
+    stale_at DATETIME NULL
+);
@@ -0,0 +1,4 @@
+import os
+
+# Importing the app package creates the app: keep its background schedulers off
+os.environ.setdefault("ENABLE_SCHEDULERS", "false")
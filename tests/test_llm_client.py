@@ -0,0 +1,179 @@
+"""
+LLMClient against a local stub of the DeepSeek (OpenAI-compatible) API:
+retries with backoff, timeouts, response caching and coalescing of
+identical requests made at the same time.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from app.llm_client import LLMClient
+
+
+MESSAGES = [{"role": "user", "content": "Which document is this?"}]
+
+
+def completion(content):
+    return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+
+class StubAPI:
+    """
+    Replies to POSTs from a script of (status, body, delay) responses, the
+    last one repeating, and records each request body
+    """
+
+    def __init__(self):
+        self.responses = [(200, completion("invoice"), 0)]
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def reply_with(self, *responses):
+        self.responses = list(responses)
+
+    def next_response(self, body):
+        with self.lock:
+            self.requests.append(body)
+            if len(self.responses) > 1:
+                return self.responses.pop(0)
+            return self.responses[0]
+
+
+@pytest.fixture
+def stub():
+    api = StubAPI()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            status, response, delay = api.next_response(body)
+            time.sleep(delay)
+            data = json.dumps(response).encode("utf-8")
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client timed out
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    api.url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    yield api
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(stub, **settings):
+    settings = dict({"api_key": "sk-test", "read_timeout": 5, "max_retries": 2}, **settings)
+    return LLMClient(stub.url, **settings)
+
+
+def test_retries_server_errors_with_backoff(stub):
+    stub.reply_with((503, {}, 0), (502, {}, 0), (200, completion("invoice"), 0))
+    client = make_client(stub)
+
+    started = time.monotonic()
+    assert client.chat(MESSAGES) == "invoice"
+
+    assert len(stub.requests) == 3
+    # No wait before the first retry, backoff_factor * 2 before the second
+    assert time.monotonic() - started >= 0.9
+
+
+def test_gives_up_after_max_retries(stub):
+    stub.reply_with((503, {}, 0))
+    client = make_client(stub, max_retries=1)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.chat(MESSAGES)
+    assert len(stub.requests) == 2
+
+
+def test_slow_response_times_out(stub):
+    stub.reply_with((200, completion("too late"), 1.0))
+    client = make_client(stub, read_timeout=0.2, max_retries=0)
+
+    started = time.monotonic()
+    # urllib3 reports the read timeout through its retry handling, so requests
+    # raises Timeout or ConnectionError depending on the version
+    with pytest.raises(requests.exceptions.RequestException):
+        client.chat(MESSAGES)
+    assert time.monotonic() - started < 1.0
+    assert len(stub.requests) == 1
+
+
+def test_identical_requests_are_served_from_the_cache(stub):
+    client = make_client(stub)
+
+    assert client.chat(MESSAGES) == "invoice"
+    assert client.chat(MESSAGES) == "invoice"
+    assert len(stub.requests) == 1
+
+    # Other payloads, and callers opting out, go to the API
+    client.chat(MESSAGES, temperature=0.7)
+    client.chat(MESSAGES, use_cache=False)
+    assert len(stub.requests) == 3
+
+
+def test_cached_responses_expire(stub):
+    client = make_client(stub, cache_ttl=0.2)
+
+    client.chat(MESSAGES)
+    time.sleep(0.3)
+    client.chat(MESSAGES)
+
+    assert len(stub.requests) == 2
+
+
+def test_failed_responses_are_not_cached(stub):
+    stub.reply_with((400, {"error": "bad request"}, 0), (200, completion("invoice"), 0))
+    client = make_client(stub)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.chat(MESSAGES)
+    assert client.chat(MESSAGES) == "invoice"
+    assert len(stub.requests) == 2
+
+
+def test_concurrent_identical_requests_are_coalesced(stub):
+    stub.reply_with((200, completion("bill of lading"), 0.3))
+    client = make_client(stub)
+    results = []
+    barrier = threading.Barrier(5)
+
+    def ask():
+        barrier.wait()
+        results.append(client.chat(MESSAGES))
+
+    threads = [threading.Thread(target=ask) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["bill of lading"] * 5
+    assert len(stub.requests) == 1
+
+
+def test_chat_many_runs_different_prompts_concurrently(stub):
+    stub.reply_with((200, completion("invoice"), 0.3))
+    client = make_client(stub, max_concurrency=4)
+    prompts = [[{"role": "user", "content": f"Document {i}"}] for i in range(4)]
+
+    started = time.monotonic()
+    assert client.chat_many(prompts) == ["invoice"] * 4
+
+    assert len(stub.requests) == 4
+    assert time.monotonic() - started < 1.0
+    client.close()
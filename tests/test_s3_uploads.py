@@ -0,0 +1,174 @@
+"""
+Parallel S3 uploads (upload_files_to_s3 / upload_batch_to_s3) and
+content-addressed attachment storage (store_attachment_files), against
+moto's in-memory S3, and serving cached documents (serve_s3_file).
+"""
+import io
+import os
+
+import boto3
+import pytest
+from flask import Flask
+from moto import mock_aws
+from werkzeug.datastructures import FileStorage
+
+from app.utils_cha import s3_utils
+from app.utils_cha.s3_utils import upload_batch_to_s3, upload_files_to_s3
+from app.attachment_store import store_attachment_files
+
+
+BUCKET = "docs-bucket"
+
+
+class BrokenStream(io.BytesIO):
+    """An upload whose body cannot be read, e.g. a client that disconnected"""
+
+    def read(self, *args):
+        raise IOError("connection reset while reading upload")
+
+
+class FailsAfterHashing(io.BytesIO):
+    """An upload that reads fine once (for its hash) and fails when sent to S3"""
+
+    read_to_end = False
+
+    def read(self, *args):
+        if self.read_to_end:
+            raise IOError("connection reset while reading upload")
+        data = super().read(*args)
+        if not data:
+            self.read_to_end = True
+        return data
+
+
+def upload(content, filename, content_type="application/pdf"):
+    return FileStorage(stream=io.BytesIO(content), filename=filename, content_type=content_type)
+
+
+def stored_keys(prefix=""):
+    response = boto3.client("s3", region_name="us-east-1").list_objects_v2(Bucket=BUCKET, Prefix=prefix)
+    return sorted(item["Key"] for item in response.get("Contents", []))
+
+
+@pytest.fixture
+def app():
+    flask_app = Flask(__name__)
+    flask_app.config.update(
+        AWS_ACCESS_KEY_ID="testing",
+        AWS_SECRET_ACCESS_KEY="testing",
+        AWS_REGION="us-east-1",
+        S3_ENDPOINT_URL=None,
+        S3_BUCKET_NAME=BUCKET,
+        S3_BASE_FOLDER="test",
+        S3_UPLOAD_WORKERS=4,
+    )
+    with mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+        s3_utils._clients.clear()
+        with flask_app.app_context():
+            yield flask_app
+        s3_utils._clients.clear()
+
+
+@pytest.fixture
+def put_object_calls(app):
+    """Keys of the PutObject requests sent by the shared client"""
+    keys = []
+    s3_utils.get_s3_client().meta.events.register(
+        "before-parameter-build.s3.PutObject", lambda params, **kwargs: keys.append(params["Key"])
+    )
+    return keys
+
+
+def test_parallel_uploads_report_each_result(app):
+    uploads = [
+        (upload(b"first", "a.pdf"), "hs_documents/a.pdf"),
+        (FileStorage(stream=BrokenStream(), filename="b.pdf"), "hs_documents/b.pdf"),
+        (upload(b"third", "c.pdf"), "hs_documents/c.pdf"),
+    ]
+
+    assert upload_files_to_s3(uploads, BUCKET) == [True, False, True]
+    assert stored_keys() == ["hs_documents/a.pdf", "hs_documents/c.pdf"]
+
+
+def test_failed_batch_removes_the_files_that_uploaded(app):
+    uploads = [
+        (upload(b"first", "a.pdf"), "customer_attachments/1/a.pdf"),
+        (FileStorage(stream=BrokenStream(), filename="b.pdf"), "customer_attachments/1/b.pdf"),
+        (upload(b"third", "c.pdf"), "customer_attachments/1/c.pdf"),
+    ]
+
+    assert upload_batch_to_s3(uploads, BUCKET) is False
+    assert stored_keys() == []
+
+
+def test_batch_uploads_every_file(app):
+    uploads = [(upload(f"file {i}".encode(), f"{i}.pdf"), f"hs_documents/{i}.pdf") for i in range(5)]
+
+    assert upload_batch_to_s3(uploads, BUCKET) is True
+    assert stored_keys() == [f"hs_documents/{i}.pdf" for i in range(5)]
+
+
+def test_duplicate_content_is_uploaded_once(app, put_object_calls):
+    files = [
+        (upload(b"same bill of lading", "bl.pdf"), "bl.pdf"),
+        (upload(b"same bill of lading", "BL copy.PDF"), "BL copy.PDF"),
+        (upload(b"an invoice", "invoice.pdf"), "invoice.pdf"),
+    ]
+
+    stored = store_attachment_files(files)
+
+    (bl_key, bl_hash), (copy_key, copy_hash), (invoice_key, _) = stored
+    assert bl_key == copy_key and bl_hash == copy_hash
+    assert invoice_key != bl_key
+    assert sorted(put_object_calls) == sorted([bl_key, invoice_key])
+    assert stored_keys("test/documents/sha256/") == sorted([bl_key, invoice_key])
+
+
+def test_content_already_stored_is_not_uploaded_again(app, put_object_calls):
+    (first_key, _), = store_attachment_files([(upload(b"packing list", "packing.pdf"), "packing.pdf")])
+    del put_object_calls[:]
+
+    (second_key, _), = store_attachment_files([(upload(b"packing list", "packing-2.pdf"), "packing-2.pdf")])
+
+    assert second_key == first_key
+    assert put_object_calls == []
+    assert stored_keys("test/documents/sha256/") == [first_key]
+
+
+def test_failed_upload_is_reported_per_file(app):
+    files = [
+        (upload(b"customs declaration", "cusdec.pdf"), "cusdec.pdf"),
+        (FileStorage(stream=FailsAfterHashing(b"delivery order"), filename="do.pdf"), "do.pdf"),
+    ]
+
+    (cusdec_key, cusdec_hash), failed = store_attachment_files(files)
+
+    assert failed == (None, None)
+    assert cusdec_key and cusdec_hash
+    # Possibly shared with other attachments, so left for sweep_orphaned_attachments()
+    assert stored_keys("test/documents/sha256/") == [cusdec_key]
+
+
+def test_cached_file_evicted_before_sending_is_fetched_again(app, tmp_path, monkeypatch):
+    app.config.update(S3_CACHE_MAX_BYTES=1 << 20, S3_CACHE_MAX_OBJECT_BYTES=1 << 20, S3_CACHE_DIR=str(tmp_path))
+    boto3.client("s3", region_name="us-east-1").put_object(Bucket=BUCKET, Key="test/a.pdf", Body=b"%PDF-1.4 cached")
+    with app.test_request_context():
+        assert s3_utils.serve_s3_file("test/a.pdf").status_code == 200
+
+    cache = s3_utils.get_document_cache()
+    cache_get = cache.get
+
+    def get_then_evicted(bucket, key):
+        # Another worker evicts the file between cache.get() and send_file()
+        cached = cache_get(bucket, key)
+        if cached:
+            os.remove(cached[0])
+        return cached
+
+    monkeypatch.setattr(cache, "get", get_then_evicted)
+    with app.test_request_context():
+        response = s3_utils.serve_s3_file("test/a.pdf")
+        response.direct_passthrough = False
+        assert response.status_code == 200
+        assert response.get_data() == b"%PDF-1.4 cached"
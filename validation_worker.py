@@ -0,0 +1,38 @@
+"""
+Standalone AI document validation worker.
+
+Usage:
+    python validation_worker.py                 # pool size from VALIDATION_WORKER_PROCESSES
+    python validation_worker.py --processes 4
+    python validation_worker.py --once          # drain the queue and exit
+"""
+import argparse
+import os
+
+# Workers must not start the web process schedulers
+os.environ["ENABLE_SCHEDULERS"] = "false"
+
+from app import app
+from app.validation_queue import run_worker_pool, worker_loop
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run AI document validation workers")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=app.config["VALIDATION_WORKER_PROCESSES"],
+        help="Number of worker processes",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Process the queued jobs in this process and exit",
+    )
+    args = parser.parse_args()
+
+    if args.once:
+        processed = worker_loop(app, run_once=True)
+        print(f"Processed {processed} validation jobs")
+    else:
+        run_worker_pool(args.processes)